@@ -25,6 +25,43 @@ def setting():
 
     return dict()
 
+# -----------------------------------------------------------------------------
+@auth.s3_requires_membership(1)
+def instrument():
+    """
+        Aggregated request instrumentation counters of this process
+        as JSON (settings.base.instrument), ?reset=1 to reset them
+    """
+
+    reset = request.get_vars.get("reset") == "1"
+    stats = s3base.S3Instrument.stats(reset=reset)
+    response.headers["Content-Type"] = "application/json"
+    return json.dumps(stats)
+
+# -----------------------------------------------------------------------------
+@auth.s3_requires_membership(1)
+def indexes():
+    """
+        Database index advisor as JSON: declared indexes missing in the
+        database, and suggestions for further indexes from the queries
+        sampled by the request instrumentation (settings.base.instrument),
+        ?reset=1 to reset the samples
+    """
+
+    s3db.load_all_models()
+    S3Index = s3base.S3Index
+    missing = [{"table": tablename,
+                "sql": S3Index.sql(tablename, spec),
+                } for tablename, spec in S3Index.missing()]
+
+    reset = request.get_vars.get("reset") == "1"
+    suggestions = s3base.S3IndexAdvisor.suggest(reset=reset)
+
+    response.headers["Content-Type"] = "application/json"
+    return json.dumps({"missing": missing,
+                       "suggestions": suggestions,
+                       })
+
 # =============================================================================
 # AAA
 # =============================================================================
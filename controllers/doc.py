@@ -160,6 +160,66 @@ def image():
     output = s3_rest_controller()
     return output
 
+# =============================================================================
+def fulltext():
+    """
+        Full-text search in documents and images (JSON)
+
+        ?q=search string, in double quotes for an exact phrase
+        ?limit=maximum number of results (default 20)
+    """
+
+    index = s3db.doc_index()
+    if not index:
+        raise HTTP(501, body="Full-text index not configured")
+
+    get_vars = request.get_vars
+    try:
+        limit = int(get_vars.get("limit", 20))
+    except ValueError:
+        limit = 20
+    text = get_vars.get("q")
+
+    # Only return records which the user is permitted to see, so fetch
+    # more results from the index until the limit is reached after the
+    # permission filter, or there are no more results
+    records = {}
+    checked = set()
+    size = limit
+    while True:
+        results = index.search(text, limit=size)
+        record_ids = {}
+        for tablename, record_id, rank in results:
+            key = (tablename, record_id)
+            if key not in checked:
+                checked.add(key)
+                record_ids.setdefault(tablename, []).append(record_id)
+        for tablename, ids in record_ids.items():
+            resource = s3db.resource(tablename, id=ids)
+            rows = resource.select(["id", "name"], limit=None, as_rows=True)
+            for row in rows:
+                records[(tablename, row.id)] = row.name
+        if len(records) >= limit or len(results) < size:
+            break
+        size *= 4
+
+    output = []
+    for tablename, record_id, rank in results:
+        key = (tablename, record_id)
+        if key not in records:
+            continue
+        f = "document" if tablename == "doc_document" else "image"
+        output.append({"table": tablename,
+                       "id": record_id,
+                       "name": records[key],
+                       "rank": round(rank, 4),
+                       "url": URL(f=f, args=[record_id]),
+                       })
+        if len(output) == limit:
+            break
+
+    response.headers["Content-Type"] = "application/json"
+    return json.dumps(output)
 
 # =============================================================================
 def bulk_upload():
@@ -485,6 +485,14 @@ def ldata():
 
     id = args[0]
 
+    S3LocationData = s3base.S3LocationData
+    if S3LocationData.enabled():
+        # Read from the precomputed store
+        output, version = S3LocationData.get(id)
+        if output is None:
+            return ""
+        return S3LocationData.serve('''n=%s\n''' % output, version)
+
     # Translate options using gis_location_name?
     translate = settings.get_L10n_translate_gis_location()
     if translate:
@@ -569,8 +577,7 @@ def ldata():
                                                     )
 
     script = '''n=%s\n''' % json.dumps(location_dict)
-    response.headers["Content-Type"] = "application/json"
-    return script
+    return S3LocationData.serve(script)
 
 # -----------------------------------------------------------------------------
 def hdata():
@@ -619,8 +626,7 @@ def hdata():
             hdict[int(l[1:])] = row[l]
 
     script = '''n=%s\n''' % json.dumps(hdict)
-    response.headers["Content-Type"] = "application/json"
-    return script
+    return s3base.S3LocationData.serve(script)
 
 # -----------------------------------------------------------------------------
 def s3_gis_location_parents(r, **attr):
@@ -1205,11 +1205,19 @@ def recv_process():
     db(tracktable.recv_id == recv_id).update(status = 3)
     # Move each item to the site
     track_rows = db(tracktable.recv_id == recv_id).select()
+    # Load all item packs at once
+    s3db.supply_item_pack_quantities([row.item_pack_id for row in track_rows])
+    # Update the request status once for the whole shipment
+    use_req = settings.has_module("req")
+    if use_req:
+        deferred = s3db.req_update_status_defer()
     for track_item in track_rows:
         row = Storage(track_item)
         s3.inv_track_item_onaccept(Storage(vars=Storage(id=row.id),
                                            record = row,
                                            ))
+    if use_req and deferred:
+        s3db.req_update_status_flush()
 
     session.confirmation = T("Shipment Items Received")
     redirect(URL(c="inv", f="recv",
@@ -1245,7 +1253,6 @@ def recv_cancel():
     tracktable = s3db.inv_track_item
     inv_item_table = s3db.inv_inv_item
     ritable = s3db.req_req_item
-    siptable = s3db.supply_item_pack
 
     # Go through each item in the shipment remove them from the site store
     # and put them back in the track item record
@@ -1272,29 +1279,36 @@ def recv_cancel():
                                                           tracktable.item_pack_id,
                                                           tracktable.recv_quantity,
                                                           )
+    # Look up all request items and item packs at once
+    req_item_ids = [row.req_item_id for row in track_rows if row.req_item_id]
+    if req_item_ids:
+        rows = db(ritable.id.belongs(req_item_ids)).select(ritable.id,
+                                                           ritable.req_id,
+                                                           ritable.item_pack_id)
+        req_items = dict((row.id, row) for row in rows)
+        pack_ids = [row.item_pack_id for row in rows] + \
+                   [row.item_pack_id for row in track_rows]
+        packs = s3db.supply_item_pack_quantities(pack_ids)
+    # Sum up the quantities to remove from fulfil per request item
+    fulfil = {}
     for track_item in track_rows:
         # If this is linked to a request
         # then remove these items from the quantity in fulfil
-        if track_item.req_item_id:
-            req_id = track_item.req_item_id
-            req_item = db(ritable.id == req_id).select(ritable.quantity_fulfil,
-                                                       ritable.item_pack_id,
-                                                       limitby=(0, 1)).first()
-            req_quantity = req_item.quantity_fulfil
-            # @ToDo: Optimise by reading these 2 in a single DB query
-            req_pack_quantity = db(siptable.id == req_item.item_pack_id).select(siptable.quantity,
-                                                                                limitby=(0, 1)
-                                                                                ).first().quantity
-            track_pack_quantity = db(siptable.id == track_item.item_pack_id).select(siptable.quantity,
-                                                                                    limitby=(0, 1)
-                                                                                    ).first().quantity
-            quantity_fulfil = s3db.supply_item_add(req_quantity,
-                                                   req_pack_quantity,
-                                                   - track_item.recv_quantity,
-                                                   track_pack_quantity
-                                                  )
-            db(ritable.id == req_id).update(quantity_fulfil = quantity_fulfil)
-            s3db.req_update_status(req_id)
+        req_item_id = track_item.req_item_id
+        if req_item_id:
+            req_item = req_items[req_item_id]
+            quantity = s3db.supply_item_add(0,
+                                            packs[req_item.item_pack_id],
+                                            - track_item.recv_quantity,
+                                            packs[track_item.item_pack_id]
+                                            )
+            fulfil[req_item_id] = fulfil.get(req_item_id, 0) + quantity
+    if fulfil:
+        for req_item_id, quantity in fulfil.items():
+            db(ritable.id == req_item_id).update(quantity_fulfil = ritable.quantity_fulfil + quantity)
+        # Update the request status once per request
+        s3db.req_update_statuses(list(set(req_items[req_item_id].req_id
+                                          for req_item_id in fulfil)))
     # Now set the recv record to cancelled and the send record to sent
     db(rtable.id == recv_id).update(date = request.utcnow,
                                     status = inv_ship_status["CANCEL"],
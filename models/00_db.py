@@ -125,6 +125,9 @@ else:
 # Set up logger (before any module attempts to use it!)
 import s3log
 s3log.S3Log.setup()
+
+# Request instrumentation (if enabled)
+s3base.S3Instrument.start(db)
     
 # AAA
 current.auth = auth = s3base.AuthS3()
@@ -411,6 +411,7 @@ def s3_rest_controller(prefix=None, resourcename=None, **attr):
 
     output = s3_guided_tour(output)
 
+    s3base.S3Instrument.mark("controller")
     return output
 
 # Enable access to this function from modules
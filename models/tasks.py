@@ -51,91 +51,63 @@ if settings.has_module("doc"):
 
     # -----------------------------------------------------------------------------
     def document_create_index(document, user_id=None):
+        """
+            Add a document to the full-text index
+            (settings.doc.index_backend)
 
-        import os
-        from xlrd import open_workbook
-        from pyth.plugins.rtf15.reader import Rtf15Reader
-        from pyth.plugins.plaintext.writer import PlaintextWriter
-        import sunburnt
+            @param document: the document (in JSON format)
+            @param user_id: calling request's auth.user.id or None
+        """
 
         document = json.loads(document)
-        table = s3db.doc_document
-        id = document["id"]
-
-        name = document["name"]
-        filename = document["filename"]
-
-        filename = "%s/%s/uploads/%s" % (os.path.abspath("applications"), \
-                                        request.application, filename)
-
-        si = sunburnt.SolrInterface(settings.get_base_solr_url())
-
-        extension = os.path.splitext(filename)[1][1:]
-
-        if extension == "pdf":
-            data = os.popen("pdf2txt.py " + filename).read()
-        elif extension == "doc":
-            data = os.popen("antiword " + filename).read()
-        elif extension == "xls":
-            wb = open_workbook(filename)
-            data=" "
-            for s in wb.sheets():
-                for row in range(s.nrows):
-                    values = []
-                    for col in range(s.ncols):
-                        values.append(str(s.cell(row, col).value))
-                    data = data + ",".join(values) + "\n"
-        elif extension == "rtf":
-            doct = Rtf15Reader.read(open(filename))
-            data = PlaintextWriter.write(doct).getvalue()
-        else:
-            data = os.popen("strings " + filename).read()
-
-        # The text needs to be in unicode or ascii, with no contol characters
-        data = str(unicode(data, errors="ignore"))
-        data = "".join(c if ord(c) >= 32 else " " for c in data)
-
-        # Put the data according to the Multiple Fields
-        # @ToDo: Also, would change this according to requirement of Eden
-        document = {"id": str(id), # doc_document.id
-                    "name": data, # the data of the file
-                    "url": filename, # the encoded file name stored in uploads/
-                    "filename": name, # the filename actually uploaded by the user
-                    "filetype": extension  # x.pdf -> pdf is the extension of the file
-                    }
-
-        # Add and commit Indices
-        si.add(document)
-        si.commit()
-        # After Indexing, set the value for has_been_indexed to True in the database
-        db(table.id == id).update(has_been_indexed = True)
-
+        s3db.doc_index_record("doc_document", document["id"])
         db.commit()
 
     tasks["document_create_index"] = document_create_index
 
     # -----------------------------------------------------------------------------
     def document_delete_index(document, user_id=None):
+        """
+            Remove a document from the full-text index
+            (settings.doc.index_backend)
 
-        import sunburnt
+            @param document: the document (in JSON format)
+            @param user_id: calling request's auth.user.id or None
+        """
 
         document = json.loads(document)
-        table = s3db.doc_document
         id = document["id"]
-        filename = document["filename"]
 
-        si = sunburnt.SolrInterface(settings.get_base_solr_url())
+        index = s3db.doc_index()
+        if index:
+            index.delete("doc_document", id)
 
-        # Delete and Commit the indicies of the deleted document
-        si.delete(id)
-        si.commit()
         # After removing the index, set has_been_indexed value to False in the database
+        table = s3db.doc_document
         db(table.id == id).update(has_been_indexed = False)
 
         db.commit()
 
     tasks["document_delete_index"] = document_delete_index
 
+    # -----------------------------------------------------------------------------
+    def document_index(rebuild=False, user_id=None):
+        """
+            Add all documents and images to the full-text index which
+            have not been indexed yet
+            - to be scheduled e.g. nightly, or run once after enabling
+              the full-text index
+
+            @param rebuild: re-index all documents and images
+            @param user_id: calling request's auth.user.id or None
+        """
+
+        result = s3db.doc_index_update(rebuild=rebuild)
+        db.commit()
+        return result
+
+    tasks["document_index"] = document_index
+
 # -----------------------------------------------------------------------------
 def gis_download_kml(record_id, filename, session_id_name, session_id,
                      user_id=None):
@@ -179,6 +151,89 @@ def gis_update_location_tree(feature, user_id=None):
 
 tasks["gis_update_location_tree"] = gis_update_location_tree
 
+# -----------------------------------------------------------------------------
+def s3_filter_index_refresh(tablename=None, user_id=None):
+    """
+        Rebuild dirty entries of the filter options index
+
+        @param tablename: limit the refresh to this table
+        @param user_id: calling request's auth.user.id or None
+    """
+    if user_id:
+        # Authenticate
+        auth.s3_impersonate(user_id)
+    # Run the Task & return the result
+    result = s3base.S3FilterIndex.refresh(tablename)
+    db.commit()
+    return result
+
+tasks["s3_filter_index_refresh"] = s3_filter_index_refresh
+
+# -----------------------------------------------------------------------------
+def s3_name_index_rebuild(tablename=None, user_id=None):
+    """
+        (Re-)Build the name search indexes of all tables configured for
+        name indexing (autocomplete searches don't use an index before
+        it has been built by this task)
+
+        @param tablename: limit the rebuild to this table
+        @param user_id: calling request's auth.user.id or None
+    """
+    if user_id:
+        # Authenticate
+        auth.s3_impersonate(user_id)
+    # Run the Task & return the result
+    result = s3base.S3NameIndex.rebuild(tablename)
+    db.commit()
+    return result
+
+tasks["s3_name_index_rebuild"] = s3_name_index_rebuild
+
+# -----------------------------------------------------------------------------
+def audit_ingest(user_id=None):
+    """
+        Ingest the audit log file into the database
+        (settings.security.audit_log)
+
+        @param user_id: calling request's auth.user.id or None
+    """
+    if user_id:
+        # Authenticate
+        auth.s3_impersonate(user_id)
+    # Run the Task & return the result
+    result = s3base.S3Audit.ingest()
+    db.commit()
+    return result
+
+tasks["audit_ingest"] = audit_ingest
+
+# -----------------------------------------------------------------------------
+def auth_realm_rebuild(pe_id, user_id=None):
+    """
+        Re-calculate the realm entity of all records in the realm of an
+        entity or its descendants, e.g. after changes in the organisation
+        structure
+
+        @param pe_id: the pe_id of the entity
+        @param user_id: calling request's auth.user.id or None
+    """
+    if user_id:
+        # Authenticate
+        auth.s3_impersonate(user_id)
+
+    def progress(done, total):
+        # Commit each batch, and report the progress in the task's
+        # run_output (the scheduler replaces output before "!clear!")
+        db.commit()
+        print("!clear!%s/%s records updated" % (done, total))
+
+    # Run the Task & return the result
+    result = s3base.S3RealmUpdate.rebuild(pe_id, progress=progress)
+    db.commit()
+    return result
+
+tasks["auth_realm_rebuild"] = auth_realm_rebuild
+
 # -----------------------------------------------------------------------------
 def org_facility_geojson(user_id=None):
     """
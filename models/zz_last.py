@@ -44,3 +44,6 @@ if auth.permission.format in ("html"):
 
     # Add breadcrumbs
     menu.breadcrumbs = S3OptionsMenu.breadcrumbs
+
+# Model loading complete
+s3base.S3Instrument.mark("models")
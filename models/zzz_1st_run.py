@@ -127,6 +127,31 @@ if len(pop_list) > 0:
                          repeats=0     # unlimited
                          )
 
+    if settings.get_security_audit_log():
+        # Ingest the audit log file into the database
+        s3task.schedule_task("audit_ingest",
+                             period=300,  # seconds
+                             timeout=300, # seconds
+                             repeats=0    # unlimited
+                             )
+
+    # Rebuild dirty filter options indexes (scheduled even if the
+    # search.filter_index setting is off, because filter widgets can
+    # be indexed individually; does nothing if there is no index)
+    s3task.schedule_task("s3_filter_index_refresh",
+                         period=300,  # seconds
+                         timeout=300, # seconds
+                         repeats=0    # unlimited
+                         )
+
+    if settings.get_search_name_index():
+        # Rebuild the name search indexes
+        s3task.schedule_task("s3_name_index_rebuild",
+                             period=86400, # seconds, so 1/day
+                             timeout=600,  # seconds
+                             repeats=0     # unlimited
+                             )
+
     # =========================================================================
     # Import PrePopulate data
     #
@@ -149,23 +174,9 @@ if len(pop_list) > 0:
     # Synchronisation
     db.sync_config.insert() # Defaults are fine
 
-    # Person Registry
-    tablename = "pr_person"
-    # Add extra indexes on search fields
-    # Should work for our 3 supported databases: sqlite, MySQL & PostgreSQL
-    field = "first_name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-    field = "middle_name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-    field = "last_name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-
-    # GIS
-    # Add extra index on search field
+    # Add the indexes declared in the models (configure(indexes=...))
     # Should work for our 3 supported databases: sqlite, MySQL & PostgreSQL
-    tablename = "gis_location"
-    field = "name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
+    s3base.S3Index.create()
 
     # Messaging Module
     if has_module("msg"):
@@ -43,6 +43,7 @@
 #
 # These names are also imported into the global namespace in
 # 00_db.py in order to access them without the s3base prefix:
+from s3instrument import *
 from s3validators import *
 from s3utils import *
 from s3widgets import *
@@ -66,6 +67,15 @@ from s3task import *
 # Hierarchy Handling
 from s3hierarchy import *
 
+# Name Search Index
+from s3nameindex import *
+
+# Widget Render Cache
+from s3widgetcache import *
+
+# Database Indexes
+from s3index import *
+
 # Core Framework ==============================================================
 
 # Model Extensions
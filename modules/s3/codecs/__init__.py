@@ -32,3 +32,4 @@ from pdf import *
 from shp import *
 from svg import *
 from xls import *
+from xlsx import *
@@ -30,14 +30,12 @@
 
 __all__ = ["S3XLS"]
 
-try:
-    from cStringIO import StringIO    # Faster, where available
-except:
-    from StringIO import StringIO
+from tempfile import TemporaryFile
 
 from gluon import *
 from gluon.contenttype import contenttype
 from gluon.storage import Storage
+from gluon.streamer import DEFAULT_CHUNK_SIZE
 
 from ..s3codec import S3Codec
 from ..s3utils import s3_unicode, s3_strip_markup
@@ -55,6 +53,12 @@ class S3XLS(S3Codec):
     SUB_HEADER_COLOUR = 0x18
     ROW_ALTERNATING_COLOURS = [0x2A, 0x2B]
 
+    # Maximum number of rows per sheet (continue in a new sheet beyond)
+    MAX_ROWS = 65535
+
+    # Number of rows after which to serialize the row data
+    FLUSH_ROWS = 1000
+
     # -------------------------------------------------------------------------
     def __init__(self):
         """
@@ -75,6 +79,10 @@ class S3XLS(S3Codec):
 
             @param resource: the resource
             @param list_fields: fields to include in list views
+
+            @return: tuple (title, types, lfields, heading, rows), where
+                     rows is an iterator over the represented rows which
+                     retrieves them from the resource page by page
         """
 
         title = self.crud_string(resource.tablename, "title_list")
@@ -87,17 +95,9 @@ class S3XLS(S3Codec):
         if orderby is None:
             orderby = resource.get_config("orderby", None)
 
-        result = resource.select(list_fields,
-                                 left=left,
-                                 limit=None,
-                                 count=True,
-                                 getids=True,
-                                 orderby=orderby,
-                                 represent=True,
-                                 show_links=False)
-
-        rfields = result["rfields"]
-        rows = result["rows"]
+        # Resolve the columns
+        rfields = resource.resolve_selectors(list_fields,
+                                             extra_fields=False)[0]
         
         types = []
         lfields = []
@@ -111,8 +111,43 @@ class S3XLS(S3Codec):
                 else:
                     types.append(rfield.ftype)
 
+        rows = self.pages(resource,
+                          list_fields,
+                          left=left,
+                          orderby=orderby)
+
         return (title, types, lfields, heading, rows)
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def pages(resource, list_fields, left=None, orderby=None, pagesize=None):
+        """
+            Generator to select and represent the rows of a resource
+            page by page, so that exports of large resources do not need
+            to hold all rows in memory at once
+
+            @param resource: the resource
+            @param list_fields: the fields to extract
+            @param left: left joins for the filter
+            @param orderby: the orderby expression
+            @param pagesize: the number of rows per page (defaults to
+                             S3Codec.PAGESIZE)
+        """
+
+        pkey = str(resource.table._id)
+        for page, ids in S3Codec.paginate(resource,
+                                          left=left,
+                                          orderby=orderby,
+                                          pagesize=pagesize):
+            result = page.select(list_fields,
+                                 represent=True,
+                                 show_links=False,
+                                 raw_data=True)
+            rows = dict((row["_row"][pkey], row) for row in result["rows"])
+            for record_id in ids:
+                if record_id in rows:
+                    yield rows[record_id]
+
     # -------------------------------------------------------------------------
     def encode(self, data_source, **attr):
         """
@@ -181,7 +216,8 @@ class S3XLS(S3Codec):
             (title, types, lfields, headers, rows) = self.extractResource(data_source,
                                                                           list_fields)
         report_groupby = lfields[group] if group else None
-        if len(rows) > 0 and len(headers) != len(rows[0]):
+        if isinstance(rows, (list, tuple)) and \
+           len(rows) > 0 and len(headers) != len(rows[0]):
             msg = """modules/s3/codecs/xls: There is an error in the list_items, a field doesn't exist"
 requesting url %s
 Headers = %d, Data Items = %d
@@ -201,13 +237,11 @@ List Fields %s""" % (request.url, len(headers), len(items[0]), headers, list_fie
         # Create the workbook
         book = xlwt.Workbook(encoding="utf-8")
 
-        # Add a sheet
         # Can't have a / in the sheet_name, so replace any with a space
         sheet_name = str(title.replace("/", " "))
         # sheet_name cannot be over 31 chars
         if len(sheet_name) > 31:
             sheet_name = sheet_name[:31]
-        sheet1 = book.add_sheet(sheet_name)
 
         # Styles
         styleLargeHeader = xlwt.XFStyle()
@@ -247,9 +281,6 @@ List Fields %s""" % (request.url, len(headers), len(items[0]), headers, list_fie
             styleEven.pattern.pattern_fore_colour = S3XLS.ROW_ALTERNATING_COLOURS[1]
 
         # Header row
-        colCnt = 0
-        #headerRow = sheet1.row(2)
-        headerRow = sheet1.row(0)
         fieldWidths = []
         id = False
         for selector in lfields:
@@ -260,21 +291,11 @@ List Fields %s""" % (request.url, len(headers), len(items[0]), headers, list_fie
                 # Indicate to adjust colCnt when writing out
                 id = True
                 fieldWidths.append(0)
-                colCnt += 1
                 continue
             if label == "Sort":
                 continue
-            if id:
-                # Adjust for the skipped column
-                writeCol = colCnt - 1
-            else:
-                writeCol = colCnt
-            headerRow.write(writeCol, str(label), styleHeader)
             width = max(len(label) * COL_WIDTH_MULTIPLIER, 2000)
-            #width = len(label) * COL_WIDTH_MULTIPLIER
             fieldWidths.append(width)
-            sheet1.col(writeCol).width = width
-            colCnt += 1
         # Title row
         # - has been removed to allow columns to be easily sorted post-export.
         # - add deployment_setting if an Org wishes a Title Row
@@ -290,15 +311,67 @@ List Fields %s""" % (request.url, len(headers), len(items[0]), headers, list_fie
         #if 16 * COL_WIDTH_MULTIPLIER > width:
         #    sheet1.col(colCnt).width = 16 * COL_WIDTH_MULTIPLIER
 
+        sheets = []
+        def add_sheet():
+            """
+                Add a new sheet with a header row to the workbook
+                (large exports are split across multiple sheets)
+            """
+
+            number = len(sheets) + 1
+            if number > 1:
+                suffix = " (%s)" % number
+                name = "%s%s" % (sheet_name[:31 - len(suffix)], suffix)
+            else:
+                name = sheet_name
+            sheet = book.add_sheet(name)
+            headerRow = sheet.row(0)
+            colCnt = 0
+            for selector in lfields:
+                if selector == report_groupby:
+                    continue
+                label = headers[selector]
+                if label == "Id":
+                    colCnt += 1
+                    continue
+                if label == "Sort":
+                    continue
+                if id:
+                    # Adjust for the skipped column
+                    writeCol = colCnt - 1
+                else:
+                    writeCol = colCnt
+                headerRow.write(writeCol, str(label), styleHeader)
+                sheet.col(writeCol).width = fieldWidths[colCnt]
+                colCnt += 1
+            sheet.panes_frozen = True
+            #sheet.horz_split_pos = 3
+            sheet.horz_split_pos = 1
+            sheets.append(sheet)
+            return sheet, colCnt
+
+        sheet1, totalCols = add_sheet()
+
         # Initialize counters
-        totalCols = colCnt
         #rowCnt = 2
         rowCnt = 0
 
+        # Maximum number of rows per sheet (XLS limit)
+        MAX_ROWS = self.MAX_ROWS
+
         subheading = None
         for row in rows:
             # Item details
             rowCnt += 1
+            if rowCnt >= MAX_ROWS:
+                # Continue in a new sheet
+                sheet1.flush_row_data()
+                sheet1 = add_sheet()[0]
+                rowCnt = 1
+                subheading = None
+            elif rowCnt % self.FLUSH_ROWS == 0:
+                # Serialize the completed rows to save memory
+                sheet1.flush_row_data()
             currentRow = sheet1.row(rowCnt)
             colCnt = 0
             if rowCnt % 2 == 0:
@@ -317,7 +390,6 @@ List Fields %s""" % (request.url, len(headers), len(items[0]), headers, list_fie
                         style = styleEven
                     else:
                         style = styleOdd
-
             for field in lfields:
                 label = headers[field]
                 if label == groupby_label:
@@ -392,11 +464,8 @@ List Fields %s""" % (request.url, len(headers), len(items[0]), headers, list_fie
                     fieldWidths[colCnt] = width
                     sheet1.col(writeCol).width = width
                 colCnt += 1
-        sheet1.panes_frozen = True
-        #sheet1.horz_split_pos = 3
-        sheet1.horz_split_pos = 1
 
-        output = StringIO()
+        output = TemporaryFile()
         book.save(output)
 
         # Response headers
@@ -407,7 +476,8 @@ List Fields %s""" % (request.url, len(headers), len(items[0]), headers, list_fie
         response.headers["Content-disposition"] = disposition
 
         output.seek(0)
-        return output.read()
+        return response.stream(output, chunk_size=DEFAULT_CHUNK_SIZE,
+                               request=request)
 
     # -------------------------------------------------------------------------
     @staticmethod
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+    S3 Microsoft Excel 2007+ (XLSX) codec
+
+    @copyright: 2014 (c) Sahana Software Foundation
+    @license: MIT
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ["S3XLSX"]
+
+import datetime
+import os
+import tempfile
+
+from gluon import *
+from gluon.contenttype import contenttype
+from gluon.storage import Storage
+from gluon.streamer import DEFAULT_CHUNK_SIZE
+
+from ..s3utils import s3_unicode, s3_strip_markup
+from .xls import S3XLS
+
+# =============================================================================
+class S3XLSX(S3XLS):
+    """
+        Microsoft Excel 2007+ format codec, writes the spreadsheet row
+        by row in constant memory (requires xlsxwriter), suitable for
+        exports of large resources
+    """
+
+    # Maximum number of rows per sheet (continue in a new sheet beyond)
+    MAX_ROWS = 1048575
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        """
+            Constructor
+        """
+
+        # Error codes
+        self.ERROR = Storage(
+            XLSXWRITER_ERROR = "Python needs the xlsxwriter module installed for XLSX export"
+        )
+
+    # -------------------------------------------------------------------------
+    def encode(self, resource, **attr):
+        """
+            Export data as a Microsoft Excel 2007+ spreadsheet
+
+            @param resource: the resource
+            @param attr: dictionary of parameters:
+                 * title:          The main title of the report
+                 * list_fields:    Fields to include in list views
+                 * dt_group:       Index of the column to group by
+        """
+
+        request = current.request
+
+        try:
+            import xlsxwriter
+        except ImportError:
+            error = self.ERROR.XLSXWRITER_ERROR
+            if current.auth.permission.format in request.INTERACTIVE_FORMATS:
+                current.session.error = error
+                redirect(URL(extension=""))
+            else:
+                current.log.error(error)
+                return error
+
+        COL_WIDTH_MULTIPLIER = S3XLS.COL_WIDTH_MULTIPLIER
+
+        # Get the attributes
+        list_fields = attr.get("list_fields")
+        if not list_fields:
+            list_fields = resource.list_fields()
+        group = attr.get("dt_group")
+
+        # Extract the data (rows are retrieved page by page)
+        (title, types, lfields, headers, rows) = self.extractResource(resource,
+                                                                      list_fields)
+        title = attr.get("title") or title
+        report_groupby = lfields[group] if group else None
+
+        # Skip ID, Sort and group-by columns
+        columns = []
+        for index, colname in enumerate(lfields):
+            label = headers[colname]
+            if colname == report_groupby or label in ("Id", "Sort"):
+                continue
+            columns.append((colname, types[index], label))
+
+        # Date/Time formats from L10N deployment settings
+        settings = current.deployment_settings
+        date_format_str = str(settings.get_L10n_date_format())
+        date_format = self.dt_format_translate(date_format_str)
+        datetime_format_str = str(settings.get_L10n_datetime_format())
+        datetime_format = self.dt_format_translate(datetime_format_str)
+
+        # Create the workbook in a temporary file, rows get flushed
+        # to disk as they are written ("constant_memory" mode)
+        handle, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(handle)
+        book = xlsxwriter.Workbook(path, {"constant_memory": True,
+                                          "strings_to_numbers": False,
+                                          })
+
+        # Styles
+        styleHeader = book.add_format({"bold": True})
+        styleSubHeader = book.add_format({"bold": True})
+        styles = {"date": book.add_format({"num_format": date_format}),
+                  "datetime": book.add_format({"num_format": datetime_format}),
+                  "integer": book.add_format({"num_format": "0"}),
+                  "double": book.add_format({"num_format": "0.00"}),
+                  }
+
+        # Sheet name can't have a /, and must not be over 31 chars
+        sheet_name = s3_unicode(title).replace("/", " ")[:31]
+
+        widths = [max(len(label) * COL_WIDTH_MULTIPLIER, 2000)
+                  for colname, coltype, label in columns]
+
+        sheets = []
+        def add_sheet():
+            """
+                Add a new sheet with a header row to the workbook
+                (large exports are split across multiple sheets)
+            """
+
+            number = len(sheets) + 1
+            if number > 1:
+                suffix = " (%s)" % number
+                name = "%s%s" % (sheet_name[:31 - len(suffix)], suffix)
+            else:
+                name = sheet_name
+            sheet = book.add_worksheet(name)
+            for col, (colname, coltype, label) in enumerate(columns):
+                sheet.write_string(0, col, s3_unicode(label), styleHeader)
+                # Column widths must be set before writing any data
+                # rows in constant_memory mode (Excel units ~ 256 twips)
+                sheet.set_column(col, col, widths[col] / 256.0)
+            sheet.freeze_panes(1, 0)
+            sheets.append(sheet)
+            return sheet
+
+        sheet = add_sheet()
+        strptime = datetime.datetime.strptime
+        MAX_ROWS = self.MAX_ROWS
+        max_cell_size = 32767
+
+        rowCnt = 0
+        subheading = None
+        for row in rows:
+            rowCnt += 1
+            if rowCnt >= MAX_ROWS:
+                # Continue in a new sheet
+                sheet = add_sheet()
+                rowCnt = 1
+                subheading = None
+            if report_groupby:
+                represent = s3_strip_markup(s3_unicode(row[report_groupby]))
+                if subheading != represent:
+                    subheading = represent
+                    sheet.write_string(rowCnt, 0, subheading, styleSubHeader)
+                    rowCnt += 1
+            for col, (colname, coltype, label) in enumerate(columns):
+                value = s3_strip_markup(s3_unicode(row[colname]))
+                if len(value) > max_cell_size:
+                    value = value[:max_cell_size]
+                if not value:
+                    continue
+                try:
+                    if coltype == "date":
+                        dt = strptime(value, date_format_str).date()
+                        sheet.write_datetime(rowCnt, col, dt, styles["date"])
+                        continue
+                    elif coltype == "datetime":
+                        dt = strptime(value, datetime_format_str)
+                        sheet.write_datetime(rowCnt, col, dt, styles["datetime"])
+                        continue
+                    elif coltype == "integer":
+                        sheet.write_number(rowCnt, col, int(value), styles["integer"])
+                        continue
+                    elif coltype == "double":
+                        sheet.write_number(rowCnt, col, float(value), styles["double"])
+                        continue
+                except ValueError:
+                    pass
+                sheet.write_string(rowCnt, col, value)
+        book.close()
+
+        # Response headers
+        filename = "%s_%s.xlsx" % (request.env.server_name, str(title))
+        disposition = "attachment; filename=\"%s\"" % filename
+        response = current.response
+        response.headers["Content-Type"] = contenttype(".xlsx")
+        response.headers["Content-disposition"] = disposition
+
+        stream = open(path, "rb")
+        try:
+            # Remove the file once the stream is closed
+            os.unlink(path)
+        except OSError:
+            pass
+        return response.stream(stream, chunk_size=DEFAULT_CHUNK_SIZE,
+                               request=request)
+
+# End =========================================================================
@@ -32,15 +32,26 @@
 __all__ = ["AuthS3",
            "S3Permission",
            "S3Audit",
+           "S3RealmUpdate",
            "S3RoleManager",
            "S3OrgRoleManager",
            "S3PersonRoleManager",
            ]
 
+import atexit
 import datetime
+import hashlib
+import os
+import threading
 #import re
 from uuid import uuid4
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
 try:
     import json # try stdlib (Python 2.6)
 except ImportError:
@@ -65,6 +76,7 @@ from gluon.utils import web2py_uuid
 
 from s3error import S3PermissionError
 from s3fields import S3Represent, s3_uid, s3_timestamp, s3_deletion_status, s3_comments
+from s3instrument import S3Instrument
 from s3rest import S3Method
 from s3track import S3Tracker
 from s3utils import s3_mark_required
@@ -2839,6 +2851,8 @@ S3OptionsFilter({
             del s3["permissions"]
         if "restricted_tables" in s3:
             del s3["restricted_tables"]
+        if "page_permissions" in s3:
+            del s3["page_permissions"]
 
         system_roles = self.get_system_roles()
         ANONYMOUS = system_roles.ANONYMOUS
@@ -3500,6 +3514,7 @@ S3OptionsFilter({
                         atable.insert(role_id=role_id,
                                       pe_id=pe_id)
                         pr_rebuild_path(pe_id, clear=True)
+                    s3db.pr_update_ancestry(receivers)
                 roles.append(role_id)
 
         for role_id in roles:
@@ -4281,6 +4296,9 @@ S3OptionsFilter({
             @param entity: - an entity ID
                            - a tuple (table, instance_id)
                            - 0 for default lookup
+
+            @note: record sets (lists, Rows or queries) are updated in
+                   bulk, see S3RealmUpdate
         """
 
         db = current.db
@@ -4327,16 +4345,28 @@ S3OptionsFilter({
             self.update_shared_fields(table, query, **data)
             return
 
-        # Find the records
+        # Record sets => bulk update
+        if query is None and isinstance(records, (list, Rows)):
+            pkey = table._id.name
+            record_ids = []
+            for record in records:
+                if isinstance(record, (Row, Storage)):
+                    if pkey in record:
+                        record_ids.append(record[pkey])
+                else:
+                    record_ids.append(record)
+            if not record_ids:
+                return
+            query = (table._id.belongs(record_ids))
         if query is not None:
-            if not force_update:
-                query &= (table[REALM] == None)
-            records = db(query).select(*fields_to_load)
-        elif not isinstance(records, (list, Rows)):
-            records = [records]
-        if not records:
+            S3RealmUpdate(table,
+                          entity = realm_entity,
+                          force_update = force_update,
+                          )(query)
             return
 
+        records = [records]
+
         # Update record by record
         get_realm_entity = self.get_realm_entity
         s3_update_record_owner = self.s3_update_record_owner
@@ -4658,6 +4688,326 @@ S3OptionsFilter({
         else:
             return (table.organisation_id == None)
 
+# =============================================================================
+class S3RealmUpdate(object):
+    """
+        Bulk update of the realm entity in large record sets, e.g. after
+        imports or changes in the organisation structure.
+
+        Records are processed in batches: the deployment/table-specific
+        realm_entity handlers (if any) are called per record, while the
+        standard lookup cascade (pe_id, organisation_id, site_id, group_id)
+        is resolved with one query per batch, and the records are updated
+        with one query per batch and realm entity (including the realm
+        components and the super-entity records).
+    """
+
+    # Number of records per batch
+    BATCH_SIZE = 500
+
+    REALM = "realm_entity"
+
+    # Standard lookup cascade: (field, instance table of the entity)
+    CASCADE = (("pe_id", None),
+               ("organisation_id", "org_organisation"),
+               ("site_id", "org_site"),
+               ("group_id", "pr_group"),
+               )
+
+    # -------------------------------------------------------------------------
+    def __init__(self, table, entity=0, force_update=False):
+        """
+            Constructor
+
+            @param table: the Table (or tablename)
+            @param entity: the realm entity (pe_id) to set, or 0 to
+                           look up the realm entity for each record
+            @param force_update: update records which already have a
+                                 realm entity, and their realm components
+        """
+
+        s3db = current.s3db
+
+        if not hasattr(table, "_tablename"):
+            table = s3db.table(table)
+        self.table = table
+        self.entity = entity
+        self.force_update = force_update
+
+        if table is None or self.REALM not in table.fields:
+            self.fields = None
+            return
+
+        # Fields to load
+        fields = [table._id.name, self.REALM]
+        fields.extend(fn for fn, tn in self.CASCADE if fn in table.fields)
+        self.fields = fields
+
+        # The field to resolve the standard cascade
+        tablename = table._tablename
+        self.key = None
+        for fn, tn in self.CASCADE:
+            if fn == "pe_id" and tablename in ("pr_person", "dvi_body"):
+                continue
+            if fn in table.fields:
+                self.key = (fn, tn)
+                break
+
+    # -------------------------------------------------------------------------
+    def __call__(self, query=None, progress=None):
+        """
+            Update the realm entity in all matching records
+
+            @param query: the query for the records (default: all records)
+            @param progress: callback function(done, total) to report the
+                             progress after each batch
+
+            @return: the number of updated records
+        """
+
+        fields = self.fields
+        if not fields:
+            return 0
+
+        db = current.db
+        table = self.table
+        pkey = table._id
+
+        if query is None:
+            query = (pkey > 0)
+        if not self.force_update:
+            query &= (table[self.REALM] == None)
+
+        total = db(query).count() if progress else None
+        fields = [table[fn] for fn in fields]
+
+        done = 0
+        last = None
+        batch_size = self.BATCH_SIZE
+        while True:
+            q = query if last is None else query & (pkey > last)
+            rows = db(q).select(orderby=pkey,
+                                limitby=(0, batch_size),
+                                *fields)
+            if not rows:
+                break
+            last = rows.last()[pkey.name]
+
+            self.update(self.lookup(rows))
+
+            done += len(rows)
+            if progress:
+                progress(done, total)
+            if len(rows) < batch_size:
+                break
+
+        return done
+
+    # -------------------------------------------------------------------------
+    def lookup(self, rows):
+        """
+            Look up the realm entities for records
+
+            @param rows: the records (with the fields in self.fields)
+
+            @return: dict {record_id: realm_entity}
+        """
+
+        table = self.table
+        pkey = table._id.name
+
+        entity = self.entity
+        if isinstance(entity, tuple):
+            entity = current.s3db.pr_get_pe_id(entity)
+        if entity != 0:
+            return dict((row[pkey], entity) for row in rows)
+
+        # Deployment-global and table-specific handlers
+        handlers = []
+        handler = current.deployment_settings.get_auth_realm_entity()
+        if callable(handler):
+            handlers.append(handler)
+        handler = current.s3db.get_config(table, "realm_entity")
+        if callable(handler):
+            handlers.append(handler)
+
+        realms = {}
+        pending = []
+        for row in rows:
+            realm_entity = 0
+            for handler in handlers:
+                realm_entity = handler(table, row)
+                if realm_entity != 0:
+                    break
+            if realm_entity == 0:
+                pending.append(row)
+            else:
+                realms[row[pkey]] = realm_entity
+
+        # Standard lookup cascade
+        if pending:
+            key = self.key
+            if key is None:
+                for row in pending:
+                    realms[row[pkey]] = None
+            else:
+                fn, tn = key
+                if tn is None:
+                    pe_ids = None
+                else:
+                    pe_ids = self.pe_ids(tn, set(row[fn] for row in pending))
+                for row in pending:
+                    value = row[fn]
+                    if pe_ids is not None:
+                        value = pe_ids.get(value)
+                    realms[row[pkey]] = value
+
+        return realms
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def pe_ids(tablename, record_ids):
+        """
+            Look up the PE-IDs of instance records (bulk version of
+            pr_get_pe_id)
+
+            @param tablename: the instance (or super-entity) tablename
+            @param record_ids: the record IDs
+
+            @return: dict {record_id: pe_id}
+        """
+
+        record_ids = [i for i in record_ids if i]
+        if not record_ids:
+            return {}
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.table(tablename)
+        if table is None:
+            return {}
+        key = table._id
+        pkey = key.name
+
+        if "pe_id" in table.fields:
+            rows = db(key.belongs(record_ids)).select(key, table.pe_id)
+            return dict((row[pkey], row.pe_id) for row in rows)
+
+        if "instance_type" not in table.fields:
+            return {}
+
+        # Super-entity without pe_id => look up from the instances
+        rows = db(key.belongs(record_ids)).select(key, table.instance_type)
+        types = {}
+        for row in rows:
+            types.setdefault(row.instance_type, []).append(row[pkey])
+        pe_ids = {}
+        for instance_type, ids in types.items():
+            itable = s3db.table(instance_type)
+            if itable is None or "pe_id" not in itable.fields:
+                continue
+            ikey = itable[pkey]
+            rows = db(ikey.belongs(ids)).select(ikey, itable.pe_id)
+            for row in rows:
+                pe_ids[row[pkey]] = row.pe_id
+        return pe_ids
+
+    # -------------------------------------------------------------------------
+    def update(self, realms):
+        """
+            Write the realm entities, grouping the records by realm entity
+
+            @param realms: dict {record_id: realm_entity}
+        """
+
+        db = current.db
+        s3db = current.s3db
+        auth = current.auth
+
+        REALM = self.REALM
+        table = self.table
+        pkey = table._id
+
+        groups = {}
+        for record_id, realm_entity in realms.items():
+            groups.setdefault(realm_entity, []).append(record_id)
+
+        components = None
+        if self.force_update:
+            rc = s3db.get_config(table, "realm_components", [])
+            if rc:
+                resource = s3db.resource(table, components=rc)
+                components = [c for c in resource.components.values()
+                                if REALM in c.table.fields]
+
+        for realm_entity, record_ids in groups.items():
+            data = {REALM: realm_entity}
+            query = (pkey.belongs(record_ids))
+            db(query).update(**data)
+
+            # Update realm-components
+            if components:
+                for component in components:
+                    ctable = component.table
+                    cquery = component.get_join() & query
+                    rows = db(cquery).select(ctable._id)
+                    ids = list(set(row[ctable._id] for row in rows))
+                    if ids:
+                        db(ctable._id.belongs(ids)).update(**data)
+
+            # Update super-entities
+            auth.update_shared_fields(table, query, **data)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def rebuild(cls, entity, progress=None):
+        """
+            Re-calculate the realm entity in all records which currently
+            belong to the realm of an entity or any of its descendants
+            in the OU hierarchy, in all tables
+
+            @param entity: the pe_id of the entity
+            @param progress: callback function(done, total) to report
+                             the progress
+
+            @return: the number of updated records
+        """
+
+        db = current.db
+        s3db = current.s3db
+
+        REALM = cls.REALM
+
+        realms = [entity] + list(s3db.pr_get_descendants(entity))
+
+        # All instance tables with realm entity
+        s3db.load_all_models()
+        queries = []
+        for tablename in db.tables:
+            table = db[tablename]
+            if REALM not in table.fields or \
+               "instance_type" in table.fields:
+                continue
+            query = (table[REALM].belongs(realms))
+            if "deleted" in table.fields:
+                query &= (table.deleted != True)
+            count = db(query).count()
+            if count:
+                queries.append((table, query, count))
+
+        total = sum(count for table, query, count in queries)
+        done = 0
+        updated = 0
+        for table, query, count in queries:
+            if progress:
+                callback = lambda n, t, offset=done: progress(offset + n, total)
+            else:
+                callback = None
+            updated += cls(table, force_update=True)(query, progress=callback)
+            done += count
+        return updated
+
 # =============================================================================
 class S3Permission(object):
     """ S3 Class to handle permissions """
@@ -4877,6 +5227,7 @@ class S3Permission(object):
             del s3["permissions"]
         if "restricted_tables" in s3:
             del s3["restricted_tables"]
+        self.clear_page_permissions()
 
         if c is None and f is None and t is None:
             return None
@@ -5381,6 +5732,7 @@ class S3Permission(object):
     # -------------------------------------------------------------------------
     # Authorization
     # -------------------------------------------------------------------------
+    @S3Instrument.trace("S3Permission")
     def has_permission(self, method, c=None, f=None, t=None, record=None):
         """
             Check permission to access a record with method
@@ -5802,15 +6154,10 @@ class S3Permission(object):
             if not settings.has_module(c):
                 return False
 
-        if t is None:
-            t = "%s_%s" % (c, f)
-            table = current.s3db.table(t)
-            if not table:
-                t = None
         if not p:
             p = "read"
 
-        permitted = self.has_permission(p, c=c, f=f, t=t)
+        permitted = self.page_permitted(p, c=c, f=f, t=t)
         if permitted:
             return URL(a=a,
                        c=c,
@@ -5823,6 +6170,110 @@ class S3Permission(object):
         else:
             return False
 
+    # -------------------------------------------------------------------------
+    def page_permitted(self, method, c=None, f=None, t=None):
+        """
+            Check permission to access a page (i.e. any record), for
+            navigation items - the result is cached across requests per
+            set of roles and version of the ACLs (settings.ui.menu_cache)
+
+            @param method: the access method
+            @param c: the controller name
+            @param f: the function name
+            @param t: the tablename (defaults to <c>_<f> if that exists)
+        """
+
+        if self.auth.override:
+            return True
+
+        key = (method, c, f, t)
+        cache = self.page_permissions()
+        if cache is not None and key in cache:
+            return cache[key]
+
+        if t is None:
+            t = "%s_%s" % (c, f)
+            table = current.s3db.table(t)
+            if not table:
+                t = None
+        permitted = self.has_permission(method, c=c, f=f, t=t)
+
+        if cache is not None:
+            cache[key] = permitted
+        return permitted
+
+    # -------------------------------------------------------------------------
+    def acl_version(self):
+        """
+            Get a version identifier of the ACLs, which changes whenever
+            ACLs are added, updated or removed (e.g. to key caches of
+            permission-dependent output)
+
+            @return: the version (string), or None if there is no
+                     permissions table
+        """
+
+        table = self.table
+        if table is None:
+            return None
+        count = table.id.count()
+        modified_on = table.modified_on.max()
+        row = current.db(table.id > 0).select(count, modified_on).first()
+        return "%s-%s" % (row[count], row[modified_on])
+
+    # -------------------------------------------------------------------------
+    def page_permissions(self):
+        """
+            Get the cache for page permissions of the current user,
+            shared by all users with the same roles and realms until
+            the ACLs change
+
+            @return: a dict {(method, c, f, t): permitted}, or None
+                     if caching is disabled
+        """
+
+        s3 = current.response.s3
+        cache = s3.page_permissions
+        if cache is not None:
+            return cache if cache is not False else None
+
+        expire = current.deployment_settings.get_ui_menu_cache()
+        if not expire:
+            s3.page_permissions = False
+            return None
+
+        auth = self.auth
+        if auth.s3_logged_in():
+            realms = auth.user.realms or {}
+            delegations = auth.user.delegations or {}
+        else:
+            sr = auth.get_system_roles()
+            realms = {sr.ANONYMOUS: None}
+            delegations = {}
+
+        version = self.acl_version()
+
+        roles = sorted((role, sorted(entities) if entities else entities)
+                       for role, entities in realms.items())
+        delegated = sorted((role, sorted(entities.items()) if entities else entities)
+                           for role, entities in delegations.items())
+        identity = repr((roles, delegated, version, self.policy))
+        key = "s3_page_permissions_%s" % hashlib.md5(identity).hexdigest()
+
+        cache = current.cache.ram(key, lambda: {}, time_expire=expire)
+        s3.page_permissions = cache
+        return cache
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def clear_page_permissions():
+        """
+            Remove all cached page permissions (after ACL changes)
+        """
+
+        current.response.s3.page_permissions = None
+        current.cache.ram.clear(regex="^s3_page_permissions_")
+
     # -------------------------------------------------------------------------
     def fail(self):
         """ Action upon insufficient permissions """
@@ -6312,7 +6763,39 @@ class S3Permission(object):
 
 # =============================================================================
 class S3Audit(object):
-    """ S3 Audit Trail Writer Class """
+    """
+        S3 Audit Trail Writer Class
+
+        Audit events are buffered and written with bulk inserts:
+
+            - at the end of the request (before the final commit), or
+              when the request buffer exceeds BUFFER_SIZE events
+            - optionally queued across requests (settings.security.audit_queue)
+              and written when the queue exceeds the size or time limit
+              (settings.security.audit_queue_time), or when the process
+              exits; the queue is written in a separate transaction, so
+              it doesn't depend on the outcome of the request which
+              happens to write it
+            - optionally appended to a log file instead of the database
+              (settings.security.audit_log), to be ingested into the
+              database periodically by the "audit_ingest" task; appends
+              are locked with fcntl.flock, so that multiple processes can
+              write to the same file
+
+        Outside of HTTP requests (scheduler, shell), events are written
+        immediately.
+    """
+
+    # Maximum number of events to buffer within a request
+    BUFFER_SIZE = 500
+
+    # Process-wide queue
+    _queue = []
+    _queue_start = None
+    _queue_target = None
+    _timer = None
+    _atexit = False
+    _lock = threading.Lock()
 
     def __init__(self,
                  tablename="s3_audit",
@@ -6359,6 +6842,19 @@ class S3Audit(object):
         else:
             self.user_id = None
 
+        # Buffer events in HTTP requests, flush before the final commit
+        self.buffer = []
+        request = current.request
+        if getattr(request, "is_scheduler", False) or \
+           getattr(request, "is_shell", False) or \
+           not request.env.request_method:
+            self.buffered = False
+        else:
+            self.buffered = True
+            response = current.response
+            self.custom_commit = response.custom_commit
+            response.custom_commit = self.commit
+
     # -------------------------------------------------------------------------
     def __call__(self, method, prefix, name,
                  form=None,
@@ -6423,34 +6919,30 @@ class S3Audit(object):
             audit_write = audit_write(method, tablename, form, record,
                                       representation)
 
+        event = {"timestmp": now,
+                 "user_id": self.user_id,
+                 "method": method,
+                 "tablename": tablename,
+                 "record_id": record,
+                 "representation": representation,
+                 }
+
         if method in ("list", "read"):
             if audit_read:
-                table.insert(timestmp = now,
-                             user_id = self.user_id,
-                             method = method,
-                             tablename = tablename,
-                             record_id = record,
-                             representation = representation,
-                             )
+                self.write(event)
 
         elif method == "create":
             if audit_write:
                 if form:
                     form_vars = form.vars
                     if not record:
-                        record = form_vars["id"]
+                        event["record_id"] = form_vars["id"]
                     new_value = ["%s:%s" % (var, str(form_vars[var]))
                                  for var in form_vars if form_vars[var]]
                 else:
                     new_value = []
-                table.insert(timestmp = now,
-                             user_id = self.user_id,
-                             method = method,
-                             tablename = tablename,
-                             record_id = record,
-                             representation = representation,
-                             new_value = new_value,
-                             )
+                event["new_value"] = new_value
+                self.write(event)
 
         elif method == "update":
             if audit_write:
@@ -6463,21 +6955,15 @@ class S3Audit(object):
                         old_value = []
                     fvars = form.vars
                     if not record:
-                        record = fvars["id"]
+                        event["record_id"] = fvars["id"]
                     new_value = ["%s:%s" % (var, str(fvars[var]))
                                  for var in fvars]
                 else:
                     new_value = []
                     old_value = []
-                table.insert(timestmp = now,
-                             user_id = self.user_id,
-                             method = method,
-                             tablename = tablename,
-                             record_id = record,
-                             representation = representation,
-                             old_value = old_value,
-                             new_value = new_value,
-                             )
+                event["old_value"] = old_value
+                event["new_value"] = new_value
+                self.write(event)
 
         elif method == "delete":
             if audit_write:
@@ -6488,17 +6974,321 @@ class S3Audit(object):
                 if row:
                     old_value = ["%s:%s" % (field, row[field])
                                  for field in row]
-                table.insert(timestmp = now,
-                             user_id = self.user_id,
-                             method = method,
-                             tablename = tablename,
-                             record_id = record,
-                             representation = representation,
-                             old_value = old_value,
-                             )
+                event["old_value"] = old_value
+                self.write(event)
 
         return True
 
+    # -------------------------------------------------------------------------
+    def write(self, event):
+        """
+            Buffer an audit event, write the buffer if it is full or
+            if not buffering
+
+            @param event: the event (dict of s3_audit field values)
+        """
+
+        # Lists of Key:Values are stored in their string representation
+        for fn in ("old_value", "new_value"):
+            value = event.get(fn)
+            if isinstance(value, list):
+                event[fn] = str(value)
+
+        buffer = self.buffer
+        buffer.append(event)
+        if not self.buffered or len(buffer) >= self.BUFFER_SIZE:
+            self.flush()
+
+    # -------------------------------------------------------------------------
+    def flush(self, force=False):
+        """
+            Write the buffered events of this request (or queue them if
+            configured), and the process-wide queue if it exceeds its
+            size or time limit
+
+            @param force: write the process-wide queue regardless of limits
+        """
+
+        if not self.table:
+            return
+
+        events = self.buffer
+        self.buffer = []
+
+        settings = current.deployment_settings
+        queue_size = settings.get_security_audit_queue() if self.buffered else 0
+        if not queue_size:
+            if events:
+                self.store(events)
+            if not force:
+                return
+            events = []
+
+        cls = self.__class__
+        timer = None
+        with cls._lock:
+            queue = cls._queue
+            queue.extend(events)
+            if events:
+                # Where to write the queue (outside of the request)
+                db = current.db
+                cls._queue_target = (self.log_path(),
+                                     db._uri,
+                                     db._folder,
+                                     self.table._tablename,
+                                     )
+            now = datetime.datetime.utcnow()
+            if cls._queue_start is None:
+                cls._queue_start = now
+            age = (now - cls._queue_start).total_seconds()
+            queue_time = settings.get_security_audit_queue_time()
+            if force or \
+               len(queue) >= queue_size or \
+               age >= queue_time:
+                events = queue[:]
+                del queue[:]
+                cls._queue_start = None
+                target = cls._queue_target
+                timer, cls._timer = cls._timer, None
+            else:
+                events = None
+                if queue and cls._timer is None:
+                    # Write the queue when it reaches the time limit
+                    # even if there are no further requests
+                    timer = threading.Timer(queue_time - age,
+                                            cls.flush_queue)
+                    timer.daemon = True
+                    timer.start()
+                    cls._timer = timer
+                    timer = None
+                if not cls._atexit:
+                    atexit.register(cls.flush_queue)
+                    cls._atexit = True
+        if timer is not None:
+            timer.cancel()
+        if events and target:
+            cls.store_queue(events, target)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def flush_queue(cls):
+        """
+            Write the process-wide queue regardless of limits (called
+            by the timer and at exit of the process, i.e. outside of
+            requests)
+        """
+
+        with cls._lock:
+            events = cls._queue[:]
+            del cls._queue[:]
+            cls._queue_start = None
+            target = cls._queue_target
+            timer, cls._timer = cls._timer, None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        if events and target:
+            cls.store_queue(events, target)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def store_queue(cls, events, target):
+        """
+            Write queued events in a separate transaction (with a separate
+            DB connection), so that they are neither rolled back with nor
+            committed by the request which happens to write them, and can
+            be written outside of requests
+
+            @param events: list of events
+            @param target: tuple (log_path, db_uri, db_folder, tablename)
+        """
+
+        path, uri, folder, tablename = target
+        if path:
+            cls.append(path, events)
+            return
+
+        db = DAL(uri,
+                 folder = folder,
+                 db_uid = "s3_audit_queue",
+                 migrate_enabled = False,
+                 )
+        try:
+            table = db.define_table(tablename,
+                                    Field("timestmp", "datetime"),
+                                    Field("user_id", "integer"),
+                                    Field("method"),
+                                    Field("tablename"),
+                                    Field("record_id", "integer"),
+                                    Field("representation"),
+                                    Field("old_value", "text"),
+                                    Field("new_value", "text"),
+                                    migrate = False,
+                                    )
+            table.bulk_insert(events)
+            db.commit()
+        except:
+            db.rollback()
+            # Re-queue the events for the next attempt
+            with cls._lock:
+                cls._queue[:0] = events
+            raise
+        finally:
+            db.close()
+
+    # -------------------------------------------------------------------------
+    def store(self, events):
+        """
+            Store audit events in the database, or append them to the
+            log file (settings.security.audit_log)
+
+            @param events: list of events
+        """
+
+        path = self.log_path()
+        if path:
+            self.append(path, events)
+        else:
+            self.table.bulk_insert(events)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def append(cls, path, events):
+        """
+            Append audit events to the log file, locked against concurrent
+            appends from other processes and against ingestion
+
+            @param path: the log file path
+            @param events: list of events
+        """
+
+        lines = []
+        for event in events:
+            event = dict(event)
+            event["timestmp"] = event["timestmp"].isoformat()
+            lines.append(json.dumps(event, separators=(",", ":")))
+        data = "\n".join(lines) + "\n"
+
+        with cls._lock:
+            while True:
+                logfile = open(path, "a")
+                try:
+                    if fcntl:
+                        fcntl.flock(logfile.fileno(), fcntl.LOCK_EX)
+                        # The file may have been renamed for ingestion
+                        # while waiting for the lock => re-open
+                        try:
+                            inode = os.stat(path).st_ino
+                        except OSError:
+                            inode = None
+                        if inode != os.fstat(logfile.fileno()).st_ino:
+                            continue
+                    logfile.write(data)
+                    logfile.flush()
+                    break
+                finally:
+                    # Releases the lock
+                    logfile.close()
+
+    # -------------------------------------------------------------------------
+    def commit(self, adapter=None):
+        """
+            Replacement for the final commit of the request (as
+            response.custom_commit): flush the buffered events, then
+            commit
+
+            @param adapter: the DB adapter to commit
+        """
+
+        try:
+            self.flush()
+        finally:
+            custom_commit = self.custom_commit
+            if custom_commit is not None:
+                custom_commit(adapter)
+            elif adapter is not None:
+                adapter.commit()
+            else:
+                current.db.commit()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def log_path():
+        """
+            Get the path of the audit log file (settings.security.audit_log)
+
+            @return: the absolute path, or None if not configured
+        """
+
+        path = current.deployment_settings.get_security_audit_log()
+        if path and not os.path.isabs(path):
+            path = os.path.join(current.request.folder, path)
+        return path
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def ingest(cls, path=None, tablename="s3_audit", chunk_size=1000):
+        """
+            Ingest the audit log file into the database (the file gets
+            renamed before reading, so writing can continue meanwhile)
+
+            @param path: the log file path (default: settings.security.audit_log)
+            @param tablename: the name of the audit table
+            @param chunk_size: number of events to insert at a time
+
+            @return: the number of ingested events
+        """
+
+        if path is None:
+            path = cls.log_path()
+        if not path or not os.path.exists(path):
+            return 0
+
+        ingest_path = "%s.%s.ingest" % (path, os.getpid())
+        with cls._lock:
+            try:
+                os.rename(path, ingest_path)
+            except OSError:
+                return 0
+
+        table = current.db[tablename]
+        strptime = datetime.datetime.strptime
+
+        count = 0
+        events = []
+        logfile = open(ingest_path, "r")
+        try:
+            if fcntl:
+                # Wait for appends in progress
+                fcntl.flock(logfile.fileno(), fcntl.LOCK_EX)
+            for line in logfile:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                timestmp = event.get("timestmp")
+                if timestmp:
+                    try:
+                        event["timestmp"] = strptime(timestmp,
+                                                     "%Y-%m-%dT%H:%M:%S.%f")
+                    except ValueError:
+                        event["timestmp"] = strptime(timestmp,
+                                                     "%Y-%m-%dT%H:%M:%S")
+                events.append(event)
+                if len(events) >= chunk_size:
+                    table.bulk_insert(events)
+                    count += len(events)
+                    events = []
+            if events:
+                table.bulk_insert(events)
+                count += len(events)
+        finally:
+            logfile.close()
+        os.unlink(ingest_path)
+        return count
+
     # -------------------------------------------------------------------------
     def represent(self, records):
         """
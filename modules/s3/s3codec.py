@@ -64,6 +64,9 @@ class S3Codec(object):
     # A list of fields which should be skipped from PDF/XLS exports
     indices = ["id", "pe_id", "site_id", "sit_id", "item_entity_id"]
 
+    # Number of records to retrieve at a time in streaming exports
+    PAGESIZE = 1000
+
     # -------------------------------------------------------------------------
     @staticmethod
     def get_codec(format):
@@ -72,6 +75,7 @@ class S3Codec(object):
         from codecs import S3SHP
         from codecs import S3SVG
         from codecs import S3XLS
+        from codecs import S3XLSX
         from codecs import S3RL_PDF
 
         # Register the codec classes
@@ -80,6 +84,7 @@ class S3Codec(object):
             shp = S3SHP,
             svg = S3SVG,
             xls = S3XLS,
+            xlsx = S3XLSX,
         )
 
         if format in CODECS:
@@ -87,6 +92,110 @@ class S3Codec(object):
         else:
             return S3Codec()
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def paginate(cls, resource, left=None, orderby=None, pagesize=None):
+        """
+            Generator to page through the records of a resource in exports,
+            so that exports of large resources do not need to hold all rows
+            in memory at once
+
+            Without orderby, pages are selected by record ID (keyset
+            pagination: id > last ID of the previous page, ordered by ID).
+            Otherwise, the record IDs are retrieved once in the requested
+            order (with the record ID as tie-breaker, so the order is
+            stable). Either way, the filter joins are only applied to
+            look up the record IDs, not again for every page.
+
+            @param resource: the S3Resource
+            @param left: left joins required for the filter
+            @param orderby: the orderby expression
+            @param pagesize: the number of records per page (defaults to
+                             PAGESIZE)
+
+            @return: generator of tuples (page, ids), where page is an
+                     S3Resource for the records with these IDs, and ids
+                     is the list of record IDs in order
+        """
+
+        if not pagesize:
+            pagesize = cls.PAGESIZE
+
+        db = current.db
+        table = resource.table
+        pkey = str(table._id)
+
+        def page(ids):
+            return current.s3db.resource(resource.tablename,
+                                         id = ids,
+                                         approved = resource._approved,
+                                         unapproved = resource._unapproved,
+                                         include_deleted = resource.include_deleted,
+                                         )
+
+        query = resource.get_query()
+        vfltr = resource.get_filter()
+
+        if orderby is None and vfltr is None:
+            # Keyset pagination by record ID
+            from s3resource import S3LeftJoins
+            left_joins = S3LeftJoins(resource.tablename)
+            left_joins.add(resource.rfilter.get_left_joins())
+            left_joins.add(left)
+            joins = left_joins.as_list()
+
+            last = 0
+            while True:
+                rows = db(query & (table._id > last)).select(table._id,
+                                                             left = joins,
+                                                             groupby = table._id,
+                                                             orderby = table._id,
+                                                             limitby = (0, pagesize),
+                                                             )
+                ids = [row[pkey] for row in rows]
+                if ids:
+                    yield page(ids), ids
+                if len(ids) < pagesize:
+                    break
+                last = ids[-1]
+            return
+
+        # Look up the ordered record IDs once
+        if orderby is None:
+            orderby = [table._id]
+        elif isinstance(orderby, str):
+            orderby = "%s,%s" % (orderby, pkey)
+        elif isinstance(orderby, (list, tuple)):
+            orderby = list(orderby) + [table._id]
+        else:
+            orderby = [orderby, table._id]
+        if vfltr is None:
+            data = resource.select(["id"],
+                                   left = left,
+                                   orderby = orderby,
+                                   limit = 1,
+                                   getids = True,
+                                   )
+            record_ids = data["ids"] or []
+        else:
+            # Virtual filter, must filter the rows
+            rows = resource.select(["id"],
+                                   left = left,
+                                   orderby = orderby,
+                                   as_rows = True,
+                                   )
+            record_ids = []
+            seen = set()
+            for row in rows:
+                record_id = row[pkey]
+                if record_id not in seen:
+                    seen.add(record_id)
+                    record_ids.append(record_id)
+
+        for index in xrange(0, len(record_ids), pagesize):
+            ids = record_ids[index:index + pagesize]
+            yield page(ids), ids
+
     # -------------------------------------------------------------------------
     # API
     #--------------------------------------------------------------------------
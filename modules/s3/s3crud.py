@@ -703,9 +703,10 @@ class S3CRUD(S3Method):
                             list_fields=list_fields,
                             **attr)
 
-        elif representation == "xls":
+        elif representation in ("xls", "xlsx"):
             list_fields = _config("list_fields")
-            exporter = S3Exporter().xls
+            exporter = S3Exporter().xls if representation == "xls" \
+                                        else S3Exporter().xlsx
             return exporter(resource, list_fields=list_fields)
 
         elif representation == "json":
@@ -1205,9 +1206,10 @@ class S3CRUD(S3Method):
                             list_fields=list_fields,
                             **attr)
 
-        elif representation == "xls":
+        elif representation in ("xls", "xlsx"):
             report_groupby = get_config("report_groupby", None)
-            exporter = S3Exporter().xls
+            exporter = S3Exporter().xls if representation == "xls" \
+                                        else S3Exporter().xlsx
             return exporter(resource,
                             list_fields=list_fields,
                             report_groupby=report_groupby,
@@ -520,6 +520,12 @@ class S3DataTable(object):
                                     _onclick="S3.dataTables.formatRequest('xls','%s','%s');" % (id, url),
                                     _title=EXPORT % dict(format="XLS"),
                                     ))
+            if "xlsx" in export_formats:
+                url = formats.xlsx if formats.xlsx else default_url
+                iconList.append(DIV(_class="export_xls",
+                                    _onclick="S3.dataTables.formatRequest('xlsx','%s','%s');" % (id, url),
+                                    _title=EXPORT % dict(format="XLSX"),
+                                    ))
             if "pdf" in export_formats:
                 url = formats.pdf if formats.pdf else default_url
                 iconList.append(DIV(_class="export_pdf",
@@ -931,6 +937,12 @@ class S3DataList(object):
                            (list_id, item_id, resource, rfields, record)
             @param row_layout: row renderer (optional) as
                                function(list_id, resource, rowsize, items)
+
+            @note: if the item renderer has a "prefetch" attribute, this
+                   gets called as function(resource, records, rfields)
+                   with all records of the page before rendering them,
+                   to look up related data in bulk and add them to the
+                   records (see S3DataListLayout.prefetch)
         """
 
         self.resource = resource
@@ -992,6 +1004,11 @@ class S3DataList(object):
 
         records = self.records
         if records is not None:
+            # Look up related data for all items of the page at once
+            prefetch = getattr(render, "prefetch", None)
+            if prefetch is not None and records:
+                prefetch(resource, records, rfields)
+
             items = [
                 DIV(T("Total Records: %(numrows)s") % {"numrows": self.total},
                     _class="dl-header",
@@ -1104,6 +1121,11 @@ class S3DataListLayout(object):
 
     item_class = "thumbnail"
 
+    # Tables the layout renders data from besides the list fields, so
+    # that cached datalists get invalidated when these tables are written
+    # (see S3WidgetCache) - None means undeclared, i.e. not cacheable
+    cache_tables = None
+
     # ---------------------------------------------------------------------
     def __call__(self, list_id, item_id, resource, rfields, record):
         """
@@ -1136,7 +1158,29 @@ class S3DataListLayout(object):
             item.append(body)
 
         return item
-        
+
+    # ---------------------------------------------------------------------
+    def prefetch(self, resource, records, rfields):
+        """
+            Look up related data which the layout needs for the items
+            (e.g. images, tags, counts) for all records of the page at
+            once (called by S3DataList.html before rendering the items),
+            and add them to the records, so that the render methods do
+            not need to query them for every single item.
+
+            To be implemented in subclasses, which should use keys
+            starting with an underscore (like "_row") for the data
+            they add, and fall back to looking up the data for the
+            record if they are missing (e.g. when rendered outside of
+            S3DataList).
+
+            @param resource: the S3Resource to render
+            @param records: the records (list of dicts)
+            @param rfields: the S3ResourceFields to render
+        """
+
+        return
+
     # ---------------------------------------------------------------------
     def render_header(self, list_id, item_id, resource, rfields, record):
         """
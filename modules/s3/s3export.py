@@ -33,8 +33,11 @@
 
 __all__ = ["S3Exporter"]
 
+from tempfile import TemporaryFile
+
 from gluon import current
 from gluon.storage import Storage
+from gluon.streamer import DEFAULT_CHUNK_SIZE
 
 from s3codec import S3Codec
 
@@ -59,15 +62,30 @@ class S3Exporter(object):
         request = current.request
         response = current.response
 
+        # Write the rows page by page into a temporary file
+        output = TemporaryFile()
+        orderby = resource.table._id
+        first = True
+        for page, ids in S3Codec.paginate(resource):
+            rows = page.select(None, orderby=orderby, as_rows=True)
+            rows.export_to_csv_file(output, write_colnames=first)
+            first = False
+        if first:
+            # No records: write the column names only
+            rows = resource.select(None, limit=1, as_rows=True)
+            rows.export_to_csv_file(output)
+        output.seek(0)
+
         if response:
             servername = request and "%s_" % request.env.server_name or ""
             filename = "%s%s.csv" % (servername, resource.tablename)
             from gluon.contenttype import contenttype
             response.headers["Content-Type"] = contenttype(".csv")
             response.headers["Content-disposition"] = "attachment; filename=%s" % filename
-
-        rows = resource.select(None, as_rows=True)
-        return str(rows)
+            return response.stream(output, chunk_size=DEFAULT_CHUNK_SIZE,
+                                   request=request)
+        else:
+            return output.read()
 
     # -------------------------------------------------------------------------
     def json(self, resource,
@@ -126,4 +144,10 @@ class S3Exporter(object):
         codec = S3Codec.get_codec("xls").encode
         return codec(*args, **kwargs)
 
+    # -------------------------------------------------------------------------
+    def xlsx(self, *args, **kwargs):
+
+        codec = S3Codec.get_codec("xlsx").encode
+        return codec(*args, **kwargs)
+
 # End =========================================================================
@@ -44,6 +44,7 @@ from gluon.dal import Query, SQLCustomType
 from gluon.storage import Storage
 from gluon.languages import lazyT
 
+from s3instrument import S3Instrument
 from s3navigation import S3ScriptItem
 from s3utils import S3DateTime, s3_auth_user_represent, s3_auth_user_represent_name, s3_unicode, S3MarkupStripper
 from s3validators import IS_ONE_OF, IS_UTC_DATETIME
@@ -450,6 +451,7 @@ class S3Represent(object):
         return self.none
 
     # -------------------------------------------------------------------------
+    @S3Instrument.trace("S3Represent")
     def bulk(self, values, rows=None, list_type=True, show_link=True):
         """
             Represent multiple values as dict {value: representation}
@@ -592,6 +594,7 @@ class S3Represent(object):
         return
 
     # -------------------------------------------------------------------------
+    @S3Instrument.trace("S3Represent")
     def _lookup(self, values, rows=None):
         """
             Lazy lookup values.
@@ -231,6 +231,11 @@ class S3FilterWidget(object):
                                 use for context or virtual fields
                                 (L{S3DateFilter})
             @keyword hide_time: don't show time selector (L{S3DateFilter})
+            @keyword index: use the stored filter options index (default
+                            from settings.search.filter_index)
+                            (L{S3OptionsFilter}, L{S3LocationFilter})
+            @keyword counts: show the number of matching records with
+                             each option, where known (L{S3OptionsFilter})
 
         """
 
@@ -955,10 +960,28 @@ class S3LocationFilter(S3FilterWidget):
             if not rfield.field or rfield.ftype != ftype:
                 # Must be a real reference to gis_location
                 return default
-            fields = [selector] + ["%s$%s" % (selector, l) for l in levels]
-            if translate:
-                fields.append("%s$path" % selector)
-            joined = True
+
+            # Try the filter options index first
+            counts = None
+            if S3FilterIndex.indexable(resource):
+                index = self.index(resource, selector)
+                if index is not None:
+                    counts = index.options()
+
+            if counts is not None:
+                # Look up the indexed locations
+                location_ids = [k for k in counts if k]
+                resource = current.s3db.resource("gis_location",
+                                                 id=location_ids)
+                fields = ["id"] + [l for l in levels]
+                if translate:
+                    fields.append("path")
+                joined = False
+            else:
+                fields = [selector] + ["%s$%s" % (selector, l) for l in levels]
+                if translate:
+                    fields.append("%s$path" % selector)
+                joined = True
             # Filter out old Locations
             # @ToDo: Allow override
             resource.add_filter(current.s3db.gis_location.end_date == None)
@@ -1017,19 +1040,27 @@ class S3LocationFilter(S3FilterWidget):
                     ids |= set(path)
             # Build lookup table for name_l10n
             name_l10n = {}
-            s3db = current.s3db
-            table = s3db.gis_location
-            ntable = s3db.gis_location_name
-            query = (table.id.belongs(ids)) & \
-                    (ntable.deleted == False) & \
-                    (ntable.location_id == table.id) & \
-                    (ntable.language == current.session.s3.language)
-            nrows = current.db(query).select(table.name,
-                                             ntable.name_l10n,
-                                             limitby=(0, len(ids)),
-                                             )
-            for row in nrows:
-                name_l10n[row["gis_location.name"]] = row["gis_location_name.name_l10n"]
+            from s3gis import S3LocationData
+            if S3LocationData.enabled():
+                # Use the precomputed names
+                names = S3LocationData.names(ids, language="")
+                for location_id, name in S3LocationData.names(ids).items():
+                    if location_id in names:
+                        name_l10n[names[location_id]] = name
+            else:
+                s3db = current.s3db
+                table = s3db.gis_location
+                ntable = s3db.gis_location_name
+                query = (table.id.belongs(ids)) & \
+                        (ntable.deleted == False) & \
+                        (ntable.location_id == table.id) & \
+                        (ntable.language == current.session.s3.language)
+                nrows = current.db(query).select(table.name,
+                                                 ntable.name_l10n,
+                                                 limitby=(0, len(ids)),
+                                                 )
+                for row in nrows:
+                    name_l10n[row["gis_location.name"]] = row["gis_location_name.name_l10n"]
 
         # Populate the Options and the Hierarchy
         for row in rows:
@@ -1116,6 +1147,32 @@ class S3LocationFilter(S3FilterWidget):
 
         return (ftype, levels, None)
 
+    # -------------------------------------------------------------------------
+    def index(self, resource, selector=None):
+        """
+            Get the filter options index for this widget
+
+            @param resource: the S3Resource
+            @param selector: the field selector (defaults to self.field)
+            @return: the S3FilterIndex, or None if the options of this
+                     widget can not be indexed
+        """
+
+        opts = self.opts
+        if not S3FilterIndex.enabled(opts) or opts.get("options"):
+            return None
+
+        if selector is None:
+            selector = self.field
+        try:
+            rfield = S3ResourceField(resource, selector)
+        except (AttributeError, TypeError):
+            return None
+        if not rfield.field or rfield.ftype != "reference gis_location":
+            return None
+
+        return S3FilterIndex(resource, rfield, "location")
+
     # -------------------------------------------------------------------------
     def _selector(self, resource, fields):
         """
@@ -1350,6 +1407,7 @@ class S3OptionsFilter(S3FilterWidget):
 
         # Find the options
         opt_keys = []
+        counts = None
 
         multiple = ftype[:5] == "list:"
         if opts.options is not None:
@@ -1371,12 +1429,21 @@ class S3OptionsFilter(S3FilterWidget):
                 groupby = field if field and not multiple else None
                 virtual = field is None
 
+                # Try the filter options index first
+                rows = None
+                if not virtual and S3FilterIndex.indexable(resource):
+                    index = self.index(resource)
+                    if index is not None:
+                        counts = index.options()
+                        if counts is not None:
+                            opt_keys = counts.keys()
+                            rows = False
+
                 # If the search field is a foreign key, then try to perform
                 # a reverse lookup of primary IDs in the lookup table which
                 # are linked to at least one record in the resource => better
                 # scalability.
-                rows = None
-                if field:
+                if rows is None and field:
                     ktablename, key, multiple = s3_get_foreign_key(field, m2m=False)
                     if ktablename:
 
@@ -1415,10 +1482,13 @@ class S3OptionsFilter(S3FilterWidget):
                         # in records he's not permitted to see:
                         query &= accessible_query("read", resource.table)
                         
+                        count = resource._id.count()
                         rows = current.db(query).select(key_field,
-                                                        resource._id.min(),
+                                                        count,
                                                         groupby=key_field,
                                                         left=left)
+                        counts = dict((row[colname], row[count])
+                                      for row in rows)
 
                 # If we can not perform a reverse lookup, then we need
                 # to do a forward lookup of all unique values of the
@@ -1432,8 +1502,8 @@ class S3OptionsFilter(S3FilterWidget):
                                            virtual=virtual,
                                            as_rows=True)
                                            
-                opt_keys = []
                 if rows:
+                    opt_keys = []
                     if multiple:
                         kextend = opt_keys.extend
                         for row in rows:
@@ -1551,9 +1621,46 @@ class S3OptionsFilter(S3FilterWidget):
             # Add the value anyway (e.g. not found via the reverse lookup)
             options.append((None, none))
 
+        if opts.counts and counts:
+            # Show the number of matching records with the option
+            options = [(k, "%s (%s)" % (s3_unicode(v), counts[k]))
+                       if k in counts else (k, v) for k, v in options]
+
         # Sort the options
         return (ftype, options, None)
 
+    # -------------------------------------------------------------------------
+    def index(self, resource):
+        """
+            Get the filter options index for this widget
+
+            @param resource: the S3Resource
+            @return: the S3FilterIndex, or None if the options of this
+                     widget can not be indexed
+        """
+
+        opts = self.opts
+        if not S3FilterIndex.enabled(opts) or opts.options is not None:
+            return None
+
+        selector = self.field
+        if isinstance(selector, (tuple, list)):
+            selector = selector[0]
+        try:
+            rfield = S3ResourceField(resource, selector)
+        except (AttributeError, TypeError):
+            return None
+        field = rfield.field
+        if not field:
+            return None
+        ftype = rfield.ftype
+        if ftype not in ("string", "integer") and \
+           ftype[:9] != "reference" and ftype[:5] != "list:":
+            # Values not JSON-serializable, or options not looked up
+            return None
+
+        return S3FilterIndex(resource, rfield, "options")
+
     # -------------------------------------------------------------------------
     @staticmethod
     def _values(get_vars, variable):
@@ -1630,6 +1737,328 @@ class S3HierarchyFilter(S3FilterWidget):
 
         return widget
 
+# =============================================================================
+class S3FilterIndex(object):
+    """
+        Stored index of filter widget options, holds the distinct values
+        of a filter selector with the number of matching records per
+        realm entity, so that filter widgets do not have to select over
+        the whole resource each time they are rendered
+
+        The index entries are marked as dirty when the indexed table
+        (or any table joined by the filter selector) gets updated, and
+        get rebuilt either on the next access, or by the periodic
+        s3_filter_index_refresh task.
+    """
+
+    TABLENAME = "s3_filter_index"
+
+    # -------------------------------------------------------------------------
+    def __init__(self, resource, rfield, prefix):
+        """
+            Constructor
+
+            @param resource: the S3Resource
+            @param rfield: the S3ResourceField for the filter selector
+            @param prefix: prefix for the index key (widget type)
+        """
+
+        self.resource = resource
+        self.tablename = resource.tablename
+        self.rfield = rfield
+        self.key = "%s:%s" % (prefix, rfield.selector)
+
+        # All tables the index depends on
+        tables = set([self.tablename])
+        tables |= set(rfield.join.keys())
+        self.tables = list(tables)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def enabled(cls, opts):
+        """
+            Check whether the filter options index shall be used for a
+            filter widget
+
+            @param opts: the widget options
+        """
+
+        index = opts.get("index")
+        if index is None:
+            index = current.deployment_settings.get_search_filter_index()
+        return bool(index)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def indexable(resource):
+        """
+            Check whether the index can represent the options for a
+            resource (=the resource is not filtered)
+
+            @param resource: the S3Resource
+        """
+
+        if resource is None or resource.parent is not None:
+            return False
+        rfilter = resource.rfilter
+        if rfilter is not None and (rfilter.queries or rfilter.filters):
+            return False
+        return True
+
+    # -------------------------------------------------------------------------
+    def realms(self):
+        """
+            Determine which realm entities the current user can read
+            records of in the resource table
+
+            @return: None for all realms, a set of realm entity pe_ids,
+                     or False if the accessible query can not be expressed
+                     as realm filter (=index not usable)
+        """
+
+        table = self.resource.table
+
+        auth = current.auth
+        query = auth.s3_accessible_query("read", table)
+        if str(query) == str(table._id > 0):
+            return None
+
+        if "realm_entity" in table.fields:
+            permission = auth.permission
+            entities = permission.permitted_realms(self.tablename, "read")
+            if entities:
+                rquery = permission.realm_query(table, entities)
+                if rquery is not None and str(rquery) == str(query):
+                    return set(entities)
+        return False
+
+    # -------------------------------------------------------------------------
+    def options(self):
+        """
+            Look up the filter options from the index, rebuilds the
+            index entry if it is missing or dirty
+
+            @return: dict {value: count} with the options available for
+                     the current user, or None if the index can not be
+                     used in the current context
+        """
+
+        realms = self.realms()
+        if realms is False:
+            return None
+
+        itable = current.s3db.table(self.TABLENAME)
+        if not itable:
+            return None
+        query = (itable.tablename == self.tablename) & \
+                (itable.selector == self.key)
+        row = current.db(query).select(itable.id,
+                                       itable.dirty,
+                                       itable.options,
+                                       limitby=(0, 1)).first()
+        if row and not row.dirty and row.options is not None:
+            items = row.options
+        else:
+            items = self.update(record_id=row.id if row else None)
+
+        options = {}
+        for value, realm, count in items:
+            if realms is None or realm is None or realm in realms:
+                if isinstance(value, list):
+                    value = tuple(value)
+                options[value] = options.get(value, 0) + count
+        return options
+
+    # -------------------------------------------------------------------------
+    def build(self):
+        """
+            Look up the distinct values of the filter field with the
+            number of matching records per realm entity (ignoring the
+            accessible query, which is applied when reading the index)
+
+            @return: the index items as list of [value, realm, count]
+
+            @note: counts are approximate if the selector involves
+                   one-to-many joins
+        """
+
+        rfield = self.rfield
+        field = rfield.field
+        ftype = rfield.ftype
+
+        table = self.resource.table
+        if "deleted" in table.fields:
+            query = (table.deleted != True)
+        else:
+            query = (table._id > 0)
+        joins = rfield.join
+        for tname in joins:
+            query &= joins[tname]
+
+        # Only values which actually exist in the referenced table
+        ktablename, key = s3_get_foreign_key(field, m2m=False)[:2]
+        if ktablename:
+            ktable = current.s3db.table(ktablename)
+            query &= (ktable[key] == field)
+
+        if "realm_entity" in table.fields:
+            realm = table.realm_entity
+        else:
+            realm = None
+
+        db = current.db
+        if ftype[:5] == "list:":
+            fields = [field, realm] if realm else [field]
+            rows = db(query).select(*fields)
+            items = {}
+            for row in rows:
+                values = row[str(field)]
+                if not values:
+                    continue
+                r = row[str(realm)] if realm else None
+                for v in values:
+                    k = (v, r)
+                    items[k] = items.get(k, 0) + 1
+            return [[v, r, c] for (v, r), c in items.items()]
+
+        count = table._id.count()
+        if realm:
+            rows = db(query).select(field, realm, count,
+                                    groupby=field|realm)
+            return [[row[str(field)], row[str(realm)], row[count]]
+                    for row in rows]
+        else:
+            rows = db(query).select(field, count, groupby=field)
+            return [[row[str(field)], None, row[count]] for row in rows]
+
+    # -------------------------------------------------------------------------
+    def update(self, record_id=None):
+        """
+            (Re-)build and store this index entry
+
+            @param record_id: the s3_filter_index record ID, if known
+
+            @return: the index items
+        """
+
+        items = self.build()
+
+        data = {"tablename": self.tablename,
+                "selector": self.key,
+                "tables": self.tables,
+                "dirty": False,
+                "options": items,
+                }
+
+        itable = current.s3db.table(self.TABLENAME)
+        if record_id is None:
+            query = (itable.tablename == self.tablename) & \
+                    (itable.selector == self.key)
+            row = current.db(query).select(itable.id,
+                                           limitby=(0, 1)).first()
+            if row:
+                record_id = row.id
+        if record_id:
+            current.db(itable.id == record_id).update(**data)
+        else:
+            itable.insert(**data)
+            indexed = current.model.get("filter_index")
+            if indexed is not None:
+                indexed |= set(self.tables)
+        return items
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def dirty(cls, tablename):
+        """
+            Mark all index entries depending on a table as dirty, to be
+            called when records in the table are created, updated or
+            deleted (can be called repeatedly)
+
+            @param tablename: the tablename, or a list of tablenames
+
+            @note: checks the stored index entries rather than the
+                   search.filter_index setting, since widgets can also
+                   be indexed individually (index=True)
+        """
+
+        if not tablename:
+            return
+
+        # Look up which tables are indexed (once per request)
+        model = current.model
+        indexed = model.get("filter_index")
+        if indexed is None:
+            itable = current.s3db.table(cls.TABLENAME)
+            indexed = set()
+            if itable:
+                rows = current.db(itable.id > 0).select(itable.tables)
+                for row in rows:
+                    if row.tables:
+                        indexed |= set(row.tables)
+            model.filter_index = indexed
+        if isinstance(tablename, (list, tuple, set)):
+            tablenames = [tn for tn in tablename if tn in indexed]
+        elif tablename in indexed:
+            tablenames = [tablename]
+        else:
+            tablenames = None
+        if not tablenames:
+            return
+
+        itable = current.s3db.table(cls.TABLENAME)
+        query = (itable.tables.contains(tablenames, all=False)) & \
+                (itable.dirty != True)
+        current.db(query).update(dirty=True)
+        return
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def refresh(cls, tablename=None):
+        """
+            Rebuild all dirty index entries (e.g. in a scheduled task),
+            looks up the filter widgets from the "filter_widgets" setting
+            of the indexed tables
+
+            @param tablename: limit the refresh to this table
+
+            @return: the number of rebuilt index entries
+        """
+
+        s3db = current.s3db
+        itable = s3db.table(cls.TABLENAME)
+        if not itable:
+            return 0
+
+        query = (itable.dirty == True)
+        if tablename:
+            query &= (itable.tablename == tablename)
+        rows = current.db(query).select(itable.id,
+                                        itable.tablename,
+                                        itable.selector)
+        dirty = {}
+        for row in rows:
+            tn = row.tablename
+            if tn not in dirty:
+                dirty[tn] = {}
+            dirty[tn][row.selector] = row.id
+
+        updated = 0
+        for tn, keys in dirty.items():
+            widgets = s3db.get_config(tn, "filter_widgets")
+            if not widgets:
+                continue
+            resource = s3db.resource(tn)
+            for widget in widgets:
+                get_index = getattr(widget, "index", None)
+                if not get_index:
+                    continue
+                index = get_index(resource)
+                if index is not None and index.key in keys:
+                    index.update(record_id=keys[index.key])
+                    updated += 1
+        return updated
+
 # =============================================================================
 class S3FilterForm(object):
     """ Helper class to construct and render a filter form for a resource """
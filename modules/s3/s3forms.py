@@ -1551,6 +1551,9 @@ class S3SQLInlineComponent(S3SQLSubForm):
 
     prefix = "sub"
 
+    # Reduced filterby-options per field name
+    _filterby_cache = None
+
     # -------------------------------------------------------------------------
     def resolve(self, resource):
         """
@@ -1617,6 +1620,8 @@ class S3SQLInlineComponent(S3SQLSubForm):
         """
 
         self.resource = resource
+        self._filterby_cache = None
+
         component_name = self.selector
         if component_name in resource.components:
 
@@ -1712,17 +1717,21 @@ class S3SQLInlineComponent(S3SQLSubForm):
                         "label": s3_unicode(rfield.label)}
                         for rfield in rfields if rfield.fname != pkey]
 
+            # Check update-permission for all records at once
+            idcol = str(table._id)
+            updateable = self._permitted("update", tablename,
+                                         [record["_row"][idcol]
+                                          for record in records])
+
             items = []
-            has_permission = current.auth.s3_has_permission
             for record in records:
 
                 row = record["_row"]
-                row_id = row[str(table._id)]
+                row_id = row[idcol]
 
                 item = {"_id": row_id}
 
-                permitted = has_permission("update", tablename, row_id)
-                if not permitted:
+                if row_id not in updateable:
                     item["_readonly"] = True
 
                 for rfield in rfields:
@@ -1870,21 +1879,22 @@ class S3SQLInlineComponent(S3SQLSubForm):
         if not multiple:
             # Mark to client-side JS that we should open Edit Row
             _class = "%s single" % _class
+
+        # Check permissions to edit/delete the existing items
+        record_ids = [item["_id"] for item in items if "_id" in item]
+        if _editable:
+            updateable = self._permitted("update", tablename, record_ids)
+        if _deletable:
+            deleteable = self._permitted("delete", tablename, record_ids)
+
         for i in xrange(len(items)):
             has_rows = True
             item = items[i]
             # Get the item record ID
             if "_id" in item:
                 record_id = item["_id"]
-                # Check permissions to edit this item
-                if _editable:
-                    editable = has_permission("update", tablename, record_id)
-                else:
-                    editable = False
-                if _deletable:
-                    deletable = has_permission("delete", tablename, record_id)
-                else:
-                    deletable = False
+                editable = _editable and record_id in updateable
+                deletable = _deletable and record_id in deleteable
             else:
                 record_id = None
                 if _editable:
@@ -2145,14 +2155,34 @@ class S3SQLInlineComponent(S3SQLSubForm):
             s3db = current.s3db
             auth = current.auth
 
+            # Check permissions for all existing items at once
+            deleted = [item["_id"] for item in data
+                       if "_id" in item and "_delete" in item]
+            updated = [item["_id"] for item in data
+                       if "_id" in item and "_changed" in item and
+                          "_delete" not in item]
+            updateable = self._permitted("update", tablename, updated)
+
+            # Delete items in one go
+            deleteable = self._permitted("delete", tablename, deleted)
+            if deleteable:
+                c = s3db.resource(tablename, id=list(deleteable))
+                # Audit happens inside .delete()
+                # Use cascade=True so that the deletion gets
+                # rolled back in case subsequent items fail:
+                c.delete(cascade=True, format="html")
+
             # Process each item
             has_permission = current.auth.s3_has_permission
             audit = current.audit
             onaccept = s3db.onaccept
+            update_realm = s3db.get_config(table, "update_realm")
+            realm_update = []
+            insertable = master = None
             for item in data:
 
-                if not "_changed" in item and not "_delete" in item:
-                    # No changes made to this item - skip
+                if not "_changed" in item or "_delete" in item:
+                    # No changes made to this item, or deleted - skip
                     continue
 
                 # Get the values
@@ -2184,58 +2214,43 @@ class S3SQLInlineComponent(S3SQLSubForm):
                                 values[f] = value
 
                 if "_id" in item:
+                    # Update
                     record_id = item["_id"]
+                    if record_id not in updateable:
+                        continue
+                    values[table._id.name] = record_id
+                    query = (table._id == record_id)
+                    success = db(query).update(**values)
 
-                    # Delete..?
-                    if "_delete" in item:
-                        authorized = has_permission("delete", tablename, record_id)
-                        if not authorized:
-                            continue
-                        c = s3db.resource(tablename, id=record_id)
-                        # Audit happens inside .delete()
-                        # Use cascade=True so that the deletion gets
-                        # rolled back in case subsequent items fail:
-                        success = c.delete(cascade=True, format="html")
-
-                    # ...or update?
-                    else:
-                        authorized = has_permission("update", tablename, record_id)
-                        if not authorized:
-                            continue
-                        values[table._id.name] = record_id
-                        query = (table._id == record_id)
-                        success = db(query).update(**values)
-
-                        # Post-process update
-                        if success:
-                            audit("update", prefix, name,
-                                  record=record_id, representation=format)
-                            # Update super entity links
-                            s3db.update_super(table, values)
-                            # Update realm
-                            update_realm = s3db.get_config(table, "update_realm")
-                            if update_realm:
-                                auth.set_realm_entity(table, values,
-                                                      force_update=True)
-                            # Onaccept
-                            onaccept(table, Storage(vars=values), method="update")
+                    # Post-process update
+                    if success:
+                        audit("update", prefix, name,
+                              record=record_id, representation=format)
+                        # Update super entity links
+                        s3db.update_super(table, values)
+                        # Onaccept
+                        onaccept(table, Storage(vars=values), method="update")
+                        if update_realm:
+                            realm_update.append(record_id)
                 else:
                     # Create a new record
-                    authorized = has_permission("create", tablename)
-                    if not authorized:
+                    if insertable is None:
+                        insertable = has_permission("create", tablename)
+                    if not insertable:
                         continue
 
-                    # Get master record ID
+                    # Get master record ID (once for all items)
                     pkey = component.pkey
-                    mastertable = resource.table
-                    if pkey != mastertable._id.name:
-                        query = (mastertable._id == master_id)
-                        master = db(query).select(mastertable[pkey],
-                                                  limitby=(0, 1)).first()
-                        if not master:
-                            return
-                    else:
-                        master = Storage({pkey: master_id})
+                    if master is None:
+                        mastertable = resource.table
+                        if pkey != mastertable._id.name:
+                            query = (mastertable._id == master_id)
+                            master = db(query).select(mastertable[pkey],
+                                                      limitby=(0, 1)).first()
+                            if not master:
+                                return
+                        else:
+                            master = Storage({pkey: master_id})
 
                     if not actuate_link or not link:
                         # Add master record ID as linked directly
@@ -2274,6 +2289,11 @@ class S3SQLInlineComponent(S3SQLSubForm):
                         # onaccept
                         onaccept(table, Storage(vars=values), method="create")
 
+            # Update the realms of all updated items in one pass
+            if realm_update:
+                auth.set_realm_entity(tablename, realm_update,
+                                      force_update=True)
+
             # Success
             return True
         else:
@@ -2384,6 +2404,10 @@ class S3SQLInlineComponent(S3SQLSubForm):
         data = dict()
         formfields = []
         formname = self._formname()
+
+        # Get filterby-defaults
+        defaults = self._filterby_defaults()
+
         for f in fields:
             fname = f["name"]
             idxname = "%s_i_%s_%s_%s" % (formname, fname, rowtype, index)
@@ -2406,8 +2430,7 @@ class S3SQLInlineComponent(S3SQLSubForm):
                 else:
                     formfield.requires = IS_IN_SET(options)
 
-            # Get filterby-default
-            defaults = self._filterby_defaults()
+            # Apply filterby-default
             if defaults and fname in defaults:
                 default = defaults[fname]["value"]
                 formfield.default = default
@@ -2480,6 +2503,52 @@ class S3SQLInlineComponent(S3SQLSubForm):
 
         return TR(columns, **attributes)
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _permitted(method, tablename, record_ids):
+        """
+            Check the permission for a method on multiple records of the
+            same table, using a single accessible-query where ACLs are
+            in use (rather than one permission check per record)
+
+            @param method: the method, e.g. "update"
+            @param tablename: the table name
+            @param record_ids: the record IDs
+
+            @return: set of the permitted record IDs (as passed in)
+        """
+
+        permitted = set()
+        if not record_ids:
+            return permitted
+
+        auth = current.auth
+        policy = current.deployment_settings.get_security_policy()
+        if auth.override:
+            permitted.update(record_ids)
+
+        elif policy in (3, 4, 5, 6, 7, 8):
+            keys = {}
+            for record_id in record_ids:
+                try:
+                    keys[long(record_id)] = record_id
+                except (ValueError, TypeError):
+                    continue
+            if keys:
+                table = current.s3db.table(tablename)
+                query = auth.s3_accessible_query(method, table) & \
+                        table._id.belongs(keys.keys())
+                rows = current.db(query).select(table._id)
+                pkey = table._id.name
+                permitted.update(keys[row[pkey]] for row in rows)
+        else:
+            # Simple policies => check per record
+            has_permission = auth.s3_has_permission
+            permitted.update(record_id for record_id in record_ids
+                             if has_permission(method, tablename, record_id))
+
+        return permitted
+
     # -------------------------------------------------------------------------
     def _filterby_query(self):
         """
@@ -2577,7 +2646,23 @@ class S3SQLInlineComponent(S3SQLSubForm):
     def _filterby_options(self, fieldname):
         """
             Re-render the options list for a field if there is a
-            filterby-restriction.
+            filterby-restriction, cached for all rows of the subform
+
+            @param fieldname: the name of the field
+        """
+
+        cache = self._filterby_cache
+        if cache is None:
+            cache = self._filterby_cache = {}
+        if fieldname not in cache:
+            cache[fieldname] = self._filterby_subset(fieldname)
+        return cache[fieldname]
+
+    # -------------------------------------------------------------------------
+    def _filterby_subset(self, fieldname):
+        """
+            Compute the reduced options list for a field with a
+            filterby-restriction
 
             @param fieldname: the name of the field
         """
@@ -3095,18 +3180,25 @@ class S3SQLInlineComponentCheckbox(S3SQLInlineComponent):
                 # Get the rows:
                 rows = current.db(query).select(*qfields)
 
+                # Check permissions for all rows at once
+                row_ids = [row[pkey] for row in rows]
+                readable = self._permitted("read", tablename, row_ids)
+                updateable = self._permitted("update", tablename, row_ids)
+
+                # Bulk-represent the values (fills the represent cache)
+                represent = field.represent
+                if hasattr(represent, "bulk"):
+                    represent.bulk([row[fieldname] for row in rows
+                                    if row[pkey] in readable])
+
                 iappend = items.append
-                has_permission = current.auth.s3_has_permission
                 for row in rows:
                     row_id = row[pkey]
                     item = {"_id": row_id}
 
-                    #cid = row[component.table._id]
-                    permitted = has_permission("read", tablename, row_id)
-                    if not permitted:
+                    if row_id not in readable:
                         continue
-                    permitted = has_permission("update", tablename, row_id)
-                    if not permitted:
+                    if row_id not in updateable:
                         item["_readonly"] = True
 
                     if fieldname in row:
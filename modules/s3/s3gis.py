@@ -30,6 +30,8 @@
 """
 
 __all__ = ["GIS",
+           "S3FeatureCache",
+           "S3LocationData",
            "S3Map",
            "S3ExportPOI",
            "S3ImportPOI",
@@ -5962,6 +5964,478 @@ class GIS(object):
                    plugins = plugins,
                    )
 
+# =============================================================================
+class S3FeatureCache(object):
+    """
+        Cache for the GeoJSON output of Feature Layer requests, so that
+        repeated requests for the same layer (e.g. on every map pan) can
+        be served without re-computing locations, geometries, markers and
+        tooltips for every feature.
+
+        Entries are keyed by the request (URL + vars), the user (ID,
+        realms and delegations) and the language, and get removed when records in any of the
+        tables the output depends upon are written (see invalidate()),
+        or when they are older than the configured expiry time.
+    """
+
+    TABLENAME = "gis_feature_cache"
+
+    # -------------------------------------------------------------------------
+    def __init__(self, r):
+        """
+            Constructor
+
+            @param r: the S3Request
+        """
+
+        self.r = r
+        try:
+            self.layer_id = int(r.get_vars.get("layer"))
+        except (TypeError, ValueError):
+            self.layer_id = None
+        self.key = self.cache_key(r)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def enabled(r):
+        """
+            Check whether the cache can be used for a request
+
+            @param r: the S3Request
+        """
+
+        if not current.deployment_settings.get_gis_feature_cache():
+            return False
+        get_vars = r.get_vars
+        return r.representation == "geojson" and \
+               r.http == "GET" and \
+               "layer" in get_vars and \
+               "msince" not in get_vars
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def cache_key(r):
+        """
+            Generate the cache key for a request
+
+            @param r: the S3Request
+        """
+
+        import hashlib
+
+        get_vars = r.get_vars
+        items = ["%s=%s" % (k, get_vars[k])
+                 for k in sorted(get_vars.keys()) if k != "_"]
+
+        # Realms and delegations of the user (= the records the user can
+        # see), and the user ID for records which are accessible because
+        # the user owns them
+        auth = current.auth
+        if auth.override:
+            realms = "override"
+        elif auth.user:
+            user = auth.user
+            realms = []
+            for group_id, entities in (user.realms or {}).items():
+                if entities is not None:
+                    entities = sorted(entities)
+                realms.append((group_id, entities))
+            delegations = []
+            for group_id, partners in (user.delegations or {}).items():
+                partners = sorted((pe_id, sorted(entities))
+                                  for pe_id, entities in partners.items())
+                delegations.append((group_id, partners))
+            realms = "%s:%s:%s" % (user.id, sorted(realms), sorted(delegations))
+        else:
+            realms = "anonymous"
+
+        request = current.request
+        language = current.session.s3.language
+        key = "%s/%s/%s|%s|%s|%s" % (request.controller,
+                                     request.function,
+                                     "/".join(request.args),
+                                     "&".join(items),
+                                     realms,
+                                     language)
+        return hashlib.md5(key).hexdigest()
+
+    # -------------------------------------------------------------------------
+    def get(self):
+        """
+            Get the cached GeoJSON for this request
+
+            @return: the GeoJSON (string), or None if not cached
+        """
+
+        db = current.db
+        table = current.s3db[self.TABLENAME]
+        query = (table.layer_id == self.layer_id) & \
+                (table.cache_key == self.key)
+        expiry = current.deployment_settings.get_gis_feature_cache()
+        if expiry is not True:
+            earliest = current.request.utcnow - timedelta(seconds=expiry)
+            query &= (table.created_on > earliest)
+        row = db(query).select(table.geojson, limitby=(0, 1)).first()
+        return row.geojson if row else None
+
+    # -------------------------------------------------------------------------
+    def store(self, geojson):
+        """
+            Store the GeoJSON for this request in the cache
+
+            @param geojson: the GeoJSON (string)
+        """
+
+        db = current.db
+        table = current.s3db[self.TABLENAME]
+        query = (table.layer_id == self.layer_id) & \
+                (table.cache_key == self.key)
+        db(query).delete()
+        table.insert(layer_id=self.layer_id,
+                     cache_key=self.key,
+                     tables=list(self.tables()),
+                     geojson=geojson)
+
+    # -------------------------------------------------------------------------
+    def tables(self):
+        """
+            Determine the tables the output for this request depends on
+
+            @return: set of tablenames
+        """
+
+        resource = self.r.resource
+        table = resource.table
+        tables = set([resource.tablename,
+                      "gis_location",
+                      "gis_layer_feature",
+                      ])
+        if "site_id" in table.fields:
+            tables.add("org_site")
+
+        # Tables of the popup/attribute fields
+        ftable = current.s3db.gis_layer_feature
+        layer = current.db(ftable.id == self.layer_id).select(
+                                            ftable.popup_fields,
+                                            ftable.attr_fields,
+                                            limitby=(0, 1)).first()
+        selectors = []
+        if layer:
+            selectors.extend(layer.popup_fields or [])
+            selectors.extend(layer.attr_fields or [])
+        get_vars = self.r.get_vars
+        for var in ("popup", "attr"):
+            if var in get_vars:
+                selectors.extend(get_vars[var].split(","))
+        for selector in selectors:
+            try:
+                rfield = resource.resolve_selector(selector)
+            except (AttributeError, SyntaxError):
+                continue
+            tables.add(rfield.tname)
+            if rfield.join:
+                tables |= set(rfield.join.keys())
+        return tables
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, tablename):
+        """
+            Remove all cache entries which depend on a table, to be called
+            after writing records in that table
+
+            @param tablename: the tablename, or a list of tablenames
+        """
+
+        if not tablename or \
+           not current.deployment_settings.get_gis_feature_cache():
+            return
+        if not isinstance(tablename, (list, tuple, set)):
+            tablename = [tablename]
+        table = current.s3db[cls.TABLENAME]
+        current.db(table.tables.contains(list(tablename), all=False)).delete()
+
+# =============================================================================
+class S3LocationData(object):
+    """
+        Precomputed store for the location hierarchy data used by
+        S3LocationSelectorWidget2 (gis/ldata) and S3LocationFilter, so
+        that expanding a dropdown doesn't need to query (and translate)
+        the child locations every time.
+
+        For every parent location and language, the store holds the
+        JSON of the child locations in the format of gis/ldata:
+
+            {id: {"n": name,
+                  "l": level,
+                  "f": parent,
+                  "b": [lon_min, lat_min, lon_max, lat_max],
+                  }}
+
+        together with a version key (hash of the JSON), which is used
+        as ETag so that browsers can cache the data. Parent 0 holds the
+        top-level (L0) locations.
+
+        Entries are built on first access, and removed when any of the
+        locations they depend on are written (see invalidate()), so that
+        only the affected parents get rebuilt.
+    """
+
+    TABLENAME = "gis_location_data"
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def enabled():
+        """ Check whether the store is enabled """
+
+        return current.deployment_settings.get_gis_location_data_store()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def language():
+        """
+            The language for location names in the current request
+
+            @return: the language code, or None for the untranslated names
+        """
+
+        settings = current.deployment_settings
+        if settings.get_L10n_translate_gis_location():
+            language = current.session.s3.language
+            if language != settings.get_L10n_default_language():
+                return language
+        return None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def build(parent_id, language=None):
+        """
+            Look up the child locations of a parent
+
+            @param parent_id: the parent location ID (0 for L0 locations)
+            @param language: the language to translate the names into
+
+            @return: dict {location_id: data}, or None if the parent
+                     does not exist or is not part of the hierarchy
+        """
+
+        db = current.db
+        s3db = current.s3db
+        table = s3db.gis_location
+
+        if parent_id:
+            parent = db(table.id == parent_id).select(table.level,
+                                                      limitby=(0, 1)
+                                                      ).first()
+            if not parent or not parent.level:
+                return None
+            try:
+                level = int(parent.level[1:]) + 1
+            except ValueError:
+                return None
+            query = (table.parent == parent_id)
+        else:
+            level = 0
+            query = (table.parent == None)
+        query &= (table.level == "L%s" % level) & \
+                 (table.deleted == False) & \
+                 (table.end_date == None)
+
+        fields = [table.id,
+                  table.name,
+                  table.lon_min,
+                  table.lat_min,
+                  table.lon_max,
+                  table.lat_max,
+                  ]
+        if language:
+            ntable = s3db.gis_location_name
+            fields.append(ntable.name_l10n)
+            left = ntable.on((ntable.deleted == False) & \
+                             (ntable.language == language) & \
+                             (ntable.location_id == table.id))
+        else:
+            left = None
+        rows = db(query).select(left=left, *fields)
+
+        data = {}
+        for row in rows:
+            if language:
+                location = row.gis_location
+                name = row["gis_location_name.name_l10n"] or location.name
+            else:
+                location = row
+                name = location.name
+            item = {"n": name, "l": level}
+            if parent_id:
+                item["f"] = int(parent_id)
+            if location.lon_min is not None:
+                item["b"] = [location.lon_min,
+                             location.lat_min,
+                             location.lon_max,
+                             location.lat_max,
+                             ]
+            data[int(location.id)] = item
+        return data
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get(cls, parent_id, language=None):
+        """
+            Get the JSON of the child locations of a parent, build and
+            store it if not available yet
+
+            @param parent_id: the parent location ID (0 for L0 locations)
+            @param language: the language (default: current language,
+                             "" for the untranslated names)
+
+            @return: tuple (JSON, version), or (None, None) if the parent
+                     does not exist or is not part of the hierarchy
+        """
+
+        try:
+            parent_id = int(parent_id)
+        except (TypeError, ValueError):
+            return None, None
+        if language is None:
+            language = cls.language()
+        key = language or ""
+
+        db = current.db
+        table = current.s3db[cls.TABLENAME]
+        query = (table.location_id == parent_id) & \
+                (table.language == key)
+        row = db(query).select(table.data,
+                               table.version,
+                               limitby=(0, 1)).first()
+        if row:
+            return row.data, row.version
+
+        data = cls.build(parent_id, language)
+        if data is None:
+            return None, None
+
+        import hashlib
+        output = json.dumps(data, separators=SEPARATORS)
+        version = hashlib.md5(output).hexdigest()
+        table.insert(location_id = parent_id,
+                     language = key,
+                     children = data.keys(),
+                     data = output,
+                     version = version,
+                     )
+        return output, version
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def children(cls, parent_id, language=None):
+        """
+            Get the child locations of a parent
+
+            @param parent_id: the parent location ID (0 for L0 locations)
+            @param language: the language (default: current language)
+
+            @return: dict {location_id: data}
+        """
+
+        output = cls.get(parent_id, language=language)[0]
+        if not output:
+            return {}
+        return dict((int(k), v) for k, v in json.loads(output).items())
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def names(cls, location_ids, language=None):
+        """
+            Look up the (translated) names of locations from the entries
+            of their parents
+
+            @param location_ids: the location IDs
+            @param language: the language (default: current language)
+
+            @return: dict {location_id: name}
+        """
+
+        if not location_ids:
+            return {}
+        location_ids = set(int(i) for i in location_ids)
+
+        table = current.s3db.gis_location
+        rows = current.db(table.id.belongs(location_ids)).select(table.parent)
+        parents = set(row.parent or 0 for row in rows)
+
+        names = {}
+        for parent_id in parents:
+            for location_id, item in cls.children(parent_id,
+                                                  language=language).items():
+                if location_id in location_ids:
+                    names[location_id] = item["n"]
+        return names
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def serve(output, version=None):
+        """
+            Serve hierarchy data with an ETag, so that browsers can cache
+            it and revalidate with If-None-Match
+
+            @param output: the response body
+            @param version: the version key (default: hash of the output)
+
+            @return: the response body
+
+            @raise: HTTP 304 if the client already has this version
+        """
+
+        if version is None:
+            import hashlib
+            version = hashlib.md5(output).hexdigest()
+        etag = '"%s"' % version
+
+        headers = {"ETag": etag,
+                   # Cache, but revalidate with the server every time
+                   "Cache-Control": "private, no-cache",
+                   }
+        if current.request.env.http_if_none_match == etag:
+            raise HTTP(304, **headers)
+
+        response = current.response
+        response.headers.update(headers)
+        response.headers["Content-Type"] = "application/json"
+        return output
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, location_ids):
+        """
+            Remove all entries which depend on locations, to be called
+            after writing these locations or their names
+
+            @param location_ids: the location IDs (list or single ID)
+        """
+
+        if not cls.enabled() or not location_ids:
+            return
+        if not isinstance(location_ids, (list, tuple, set)):
+            location_ids = [location_ids]
+        location_ids = [int(i) for i in location_ids if i]
+        if not location_ids:
+            return
+
+        db = current.db
+        s3db = current.s3db
+
+        # The entries of the current parents (new children)
+        table = s3db.gis_location
+        rows = db(table.id.belongs(location_ids)).select(table.parent)
+        keys = set(location_ids) | set(row.parent or 0 for row in rows)
+
+        # ...and of the previous parents (moved or renamed children)
+        dtable = s3db[cls.TABLENAME]
+        query = (dtable.location_id.belongs(keys)) | \
+                (dtable.children.contains(location_ids, all=False))
+        db(query).delete()
+
 # =============================================================================
 class MAP(DIV):
     """
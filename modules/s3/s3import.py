@@ -68,6 +68,7 @@ from gluon.tools import callback, fetch
 from s3rest import S3Method
 from s3resource import S3Resource
 from s3utils import s3_mark_required, s3_has_foreign_key, s3_get_foreign_key, s3_unicode
+from s3validators import IS_ONE_OF_EMPTY
 from s3xml import S3XML
 
 DEBUG = False
@@ -1834,7 +1835,8 @@ class S3ImportItem(object):
         data = xml.record(table, element,
                           files=files,
                           original=original,
-                          postprocess=postprocess)
+                          postprocess=postprocess,
+                          valid_keys=self.job.valid_keys(table))
 
         if data is None:
             self.error = current.ERROR.VALIDATION_ERROR
@@ -2825,7 +2827,8 @@ class S3ImportJob():
                  update_policy=None,
                  conflict_policy=None,
                  last_sync=None,
-                 onconflict=None):
+                 onconflict=None,
+                 directory=None):
         """
             Constructor
 
@@ -2837,6 +2840,8 @@ class S3ImportJob():
             @param conflict_policy: the conflict resolution policy
             @param last_sync: the last synchronization time stamp (datetime)
             @param onconflict: custom conflict resolver function
+            @param directory: directory of records committed by previous
+                              jobs of the same import (see tuid_directory)
         """
 
         self.error = None # the last error
@@ -2845,7 +2850,7 @@ class S3ImportJob():
         self.table = table
         self.tree = tree
         self.files = files
-        self.directory = Storage()
+        self.directory = Storage(directory) if directory else Storage()
 
         # Mandatory fields
         self.mandatory_fields = Storage()
@@ -2854,6 +2859,9 @@ class S3ImportJob():
         self.items = Storage()
         self.references = []
 
+        # Pre-validated foreign keys
+        self.keys = {}
+
         self.job_table = None
         self.item_table = None
 
@@ -2861,6 +2869,7 @@ class S3ImportJob():
         self.created = [] # IDs of created records
         self.updated = [] # IDs of updated records
         self.deleted = [] # IDs of deleted records
+        self.failed = False # whether the commit has failed
 
         self.log = None
 
@@ -2913,6 +2922,88 @@ class S3ImportJob():
         else:
             self.job_id = uuid.uuid4() # unique ID for this job
 
+    # -------------------------------------------------------------------------
+    def valid_keys(self, table):
+        """
+            Validate the foreign keys in all elements of a table in the
+            tree at once, to avoid a validator query per field and item
+
+            - applies to <data> of single-value reference fields with an
+              IS_ONE_OF validator only (not to <reference>s, which are
+              resolved during the import)
+            - values not found valid are left to the per-item validation
+              (so that they receive the validator's error message)
+
+            @param table: the table
+            @return: dict {fieldname: set of valid values}
+        """
+
+        tablename = table._tablename
+        keys = self.keys
+        if tablename in keys:
+            return keys[tablename]
+        valid = keys[tablename] = {}
+
+        tree = self.tree
+        if tree is None:
+            return valid
+
+        # Find the reference fields with IS_ONE_OF validators
+        validators = {}
+        for field in table:
+            if str(field.type)[:10] != "reference ":
+                continue
+            requires = field.requires
+            if isinstance(requires, (list, tuple)):
+                if len(requires) != 1:
+                    continue
+                requires = requires[0]
+            if isinstance(requires, IS_EMPTY_OR):
+                requires = requires.other
+            if isinstance(requires, IS_ONE_OF_EMPTY) and \
+               not requires.multiple and not requires._and:
+                validators[field.name] = requires
+        if not validators:
+            return valid
+
+        # Collect the values
+        xml = current.xml
+        ATTRIBUTE = xml.ATTRIBUTE
+        NAME = ATTRIBUTE.name
+        FIELD = ATTRIBUTE.field
+        VALUE = ATTRIBUTE.value
+        if hasattr(tree, "getroot"):
+            tree = tree.getroot()
+        values = dict((fieldname, set()) for fieldname in validators)
+        for element in tree.iter(xml.TAG.resource):
+            if element.get(NAME) != tablename:
+                continue
+            for child in element.findall(xml.TAG.data):
+                fieldname = child.get(FIELD)
+                if fieldname not in values:
+                    continue
+                value = child.get(VALUE)
+                if value is not None:
+                    try:
+                        value = json.loads(value)
+                    except ValueError:
+                        continue
+                else:
+                    value = child.text
+                if value is not None and value != "":
+                    values[fieldname].add(s3_unicode(value).encode("utf-8"))
+
+        # One lookup per field
+        for fieldname, keys in values.items():
+            if keys:
+                keys = list(keys)
+                found = set()
+                requires = validators[fieldname]
+                for i in xrange(0, len(keys), 500):
+                    found |= requires.valid_keys(keys[i:i+500])
+                valid[fieldname] = found
+        return valid
+
     # -------------------------------------------------------------------------
     def add_item(self,
                  element=None,
@@ -3380,7 +3471,23 @@ class S3ImportJob():
                         updated.append(item.id)
                     elif item.method in (METHOD.MERGE, METHOD.DELETE):
                         deleted.append(item.id)
-                        
+
+        # Post-process the items of all tables (e.g. bulk updates which
+        # onaccept has deferred during the import), once per onimport hook;
+        # the hooks must clear their deferred state even if the job failed
+        self.failed = failed
+        s3db = current.s3db
+        hooks = []
+        for tn in set(items[item_id].tablename for item_id in import_list):
+            onimport = s3db.get_config(tn, "onimport")
+            if onimport and onimport not in hooks:
+                hooks.append(onimport)
+                callback(onimport, self, tablename=tn)
+
+        # Invalidate the caches depending on the written tables
+        # (once per table and job, see S3Model.onwrite)
+        current.s3db.onwrite_flush()
+
         if failed:
             return False
             
@@ -3472,6 +3579,33 @@ class S3ImportJob():
         _debug("Job record ID=%s" % record_id)
         return record_id
 
+    # -------------------------------------------------------------------------
+    def tuid_directory(self):
+        """
+            Directory of the records committed by this job which have
+            a tuid, to resolve tuid references in subsequent jobs of the
+            same import (batch imports)
+
+            @return: dict {(tablename, "tuid", tuid): entry}
+        """
+
+        TUID = current.xml.ATTRIBUTE.tuid
+
+        directory = {}
+        for item in self.items.values():
+            element = item.element
+            if not item.id or element is None:
+                continue
+            tuid = element.get(TUID, None)
+            if tuid:
+                tablename = item.tablename
+                directory[(tablename, TUID, tuid)] = Storage(tablename=tablename,
+                                                             element=None,
+                                                             uid=tuid,
+                                                             id=item.id,
+                                                             item_id=None)
+        return directory
+
     # -------------------------------------------------------------------------
     def get_tree(self):
         """
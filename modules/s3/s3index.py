@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+
+""" S3 Database Index Registry and Advisor
+
+    @copyright: 2014 (c) Sahana Software Foundation
+    @license: MIT
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+
+    @status: experimental
+"""
+
+__all__ = ["S3Index",
+           "S3IndexAdvisor",
+           ]
+
+import hashlib
+import re
+import threading
+
+from gluon import current
+
+LOWER = re.compile(r"^\s*lower\(\s*(\w+)\s*\)\s*$", re.IGNORECASE)
+
+# =============================================================================
+class S3Index(object):
+    """
+        Registry of database indexes declared by the models, and the
+        migration step to create missing indexes (SQLite, MySQL and
+        PostgreSQL)
+
+        Indexes are declared alongside the table definition like:
+
+            configure(tablename,
+                      indexes = ["name",                # single column
+                                 ("tablename", "term"), # composite
+                                 "lower(name)",         # lower()-expression
+                                 ],
+                      )
+
+        ...and get created with:
+
+            s3db.load_all_models()
+            S3Index.create()
+
+        which is done in the first run (models/zzz_1st_run.py), and
+        as part of the upgrade cycle (static/scripts/tools/indexes.py).
+
+        Declared indexes are skipped if the table already has an index
+        on the same columns (e.g. one created manually under a different
+        name). lower()-expressions are created as plain indexes on MySQL
+        (which doesn't support expression indexes, and compares strings
+        case-insensitively anyway).
+    """
+
+    # Maximum length of index names (PostgreSQL: 63, MySQL: 64)
+    MAXLEN = 63
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def parse(spec):
+        """
+            Parse an index declaration
+
+            @param spec: the declaration, column name, tuple of column
+                         names, or "lower(column)"
+
+            @return: tuple (columns, lower)
+        """
+
+        if isinstance(spec, (list, tuple)):
+            return tuple(spec), False
+        match = LOWER.match(spec)
+        if match:
+            return (match.group(1),), True
+        return (spec.strip(),), False
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def name(cls, tablename, spec):
+        """
+            Get the name of a declared index
+
+            @param tablename: the table name
+            @param spec: the declaration
+
+            @return: the index name
+        """
+
+        columns, lower = cls.parse(spec)
+        name = "%s_%s%s__idx" % (tablename,
+                                 "_".join(columns),
+                                 "_lower" if lower else "")
+        maxlen = cls.MAXLEN
+        if len(name) > maxlen:
+            # Shorten, and make unique with a hash of the full name
+            digest = hashlib.md5(name).hexdigest()[:8]
+            name = "%s_%s__idx" % (name[:maxlen - 14], digest)
+        return name
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def key(cls, spec, engine=None):
+        """
+            Get the columns key of a declared index, to compare it
+            with existing indexes
+
+            @param spec: the declaration
+            @param engine: the database engine (default: current)
+
+            @return: tuple of (lowercase) column names, expressions
+                     as "lower(column)"
+        """
+
+        if engine is None:
+            engine = current.db._dbname
+
+        columns, lower = cls.parse(spec)
+        if lower and engine != "mysql":
+            return ("lower(%s)" % columns[0].lower(),)
+        return tuple(c.lower() for c in columns)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def sql(cls, tablename, spec, engine=None):
+        """
+            Get the SQL to create a declared index
+
+            @param tablename: the table name
+            @param spec: the declaration
+            @param engine: the database engine (default: current)
+
+            @return: the SQL statement
+        """
+
+        if engine is None:
+            engine = current.db._dbname
+
+        columns, lower = cls.parse(spec)
+        if lower and engine != "mysql":
+            expression = "LOWER(%s)" % columns[0]
+        else:
+            expression = ", ".join(columns)
+        return "CREATE INDEX %s ON %s (%s);" % (cls.name(tablename, spec),
+                                                tablename,
+                                                expression)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def declared(tablenames=None):
+        """
+            Get all declared indexes of the currently loaded models
+
+            @param tablenames: list of table names to limit the result to
+
+            @return: list of tuples (tablename, spec)
+        """
+
+        config = current.model.config
+
+        result = []
+        for tablename in sorted(config.keys()):
+            if tablenames is not None and tablename not in tablenames:
+                continue
+            indexes = config[tablename].get("indexes")
+            if not indexes:
+                continue
+            for spec in indexes:
+                result.append((tablename, spec))
+        return result
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def existing(tablename):
+        """
+            Get the existing indexes of a table from the database
+
+            @param tablename: the table name
+
+            @return: dict {index name: tuple of (lowercase) column names},
+                     expressions as "lower(column)" where detectable
+        """
+
+        db = current.db
+        engine = db._dbname
+
+        indexes = {}
+        if engine == "sqlite":
+            for row in db.executesql("PRAGMA index_list(%s);" % tablename):
+                name = row[1]
+                info = db.executesql("PRAGMA index_info(%s);" % name)
+                # Expression columns have no name
+                indexes[name] = tuple((c[2] or "?").lower()
+                                      for c in sorted(info))
+
+        elif engine == "postgres":
+            sql = "SELECT indexname, indexdef FROM pg_indexes " \
+                  "WHERE tablename='%s';" % tablename
+            for name, definition in db.executesql(sql):
+                match = re.search(r"\((.*)\)\s*$", definition)
+                if not match:
+                    continue
+                columns = []
+                for column in match.group(1).split(","):
+                    column = re.sub(r"[\"()]|::\w+", " ", column).split()
+                    if not column:
+                        continue
+                    if column[0].lower() == "lower" and len(column) > 1:
+                        columns.append("lower(%s)" % column[1].lower())
+                    else:
+                        columns.append(column[0].lower())
+                indexes[name] = tuple(columns)
+
+        elif engine == "mysql":
+            rows = db.executesql("SHOW INDEX FROM %s;" % tablename)
+            keys = {}
+            for row in rows:
+                # Key_name, Seq_in_index, Column_name
+                keys.setdefault(row[2], []).append((row[3], row[4].lower()))
+            for name, columns in keys.items():
+                indexes[name] = tuple(c for seq, c in sorted(columns))
+
+        return indexes
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def covered(key, indexes):
+        """
+            Check whether there is an index with these leading columns
+
+            @param key: the columns key (see key())
+            @param indexes: the existing indexes (see existing())
+        """
+
+        length = len(key)
+        for columns in indexes.values():
+            if columns[:length] == key:
+                return True
+        return False
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def missing(cls, tablenames=None):
+        """
+            Get all declared indexes which do not exist in the database
+
+            @param tablenames: list of table names to limit the check to
+
+            @return: list of tuples (tablename, spec)
+        """
+
+        db = current.db
+        engine = db._dbname
+
+        existing = {}
+        result = []
+        for tablename, spec in cls.declared(tablenames):
+            if tablename not in db.tables:
+                continue
+            if tablename not in existing:
+                existing[tablename] = cls.existing(tablename)
+            indexes = existing[tablename]
+            if cls.name(tablename, spec) in indexes or \
+               cls.covered(cls.key(spec, engine), indexes):
+                continue
+            result.append((tablename, spec))
+        return result
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def create(cls, tablenames=None):
+        """
+            Create all missing declared indexes (migration step, all
+            relevant models must be loaded)
+
+            @param tablenames: list of table names to limit the migration to
+
+            @return: list of names of the created indexes
+        """
+
+        db = current.db
+        engine = db._dbname
+
+        created = []
+        for tablename, spec in cls.missing(tablenames):
+            name = cls.name(tablename, spec)
+            try:
+                db.executesql(cls.sql(tablename, spec, engine))
+            except Exception, e:
+                # Roll back the failed statement (PostgreSQL would
+                # reject all further statements in this transaction)
+                db.rollback()
+                current.log.error("Could not create index %s: %s" % (name, e))
+            else:
+                # Commit each index separately so that a failure
+                # does not roll back previously created indexes
+                db.commit()
+                created.append(name)
+        return created
+
+# =============================================================================
+class S3IndexAdvisor(object):
+    """
+        Index advisor: samples the queries executed by the DAL (recorded
+        by S3Instrument if settings.base.instrument is enabled), and
+        suggests indexes for columns which are frequently used in WHERE
+        and JOIN conditions, but neither have an index in the database
+        nor are declared in the models.
+    """
+
+    # Column references (with optional LOWER())
+    COLUMN = re.compile(r"(LOWER\(\s*)?\"?([A-Za-z_]\w*)\"?\.\"?([A-Za-z_]\w*)\"?",
+                        re.IGNORECASE)
+    # String literals
+    LITERAL = re.compile(r"'(?:[^']|'')*'")
+    # End of the conditions
+    END = re.compile(r"\s(ORDER BY|GROUP BY|HAVING|LIMIT)\s", re.IGNORECASE)
+
+    # Columns not to suggest indexes for (low selectivity)
+    SKIP = ("deleted",)
+
+    # Process-wide samples {(tablename, column, lower): [count, time]}
+    _samples = {}
+    _lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def conditions(cls, sql):
+        """
+            Extract the columns used in the conditions of a query
+
+            @param sql: the SQL statement
+
+            @return: set of tuples (tablename, column, lower)
+        """
+
+        if not sql or sql.lstrip()[:6].upper() != "SELECT":
+            return set()
+        start = sql.upper().find(" FROM ")
+        if start < 0:
+            return set()
+        conditions = cls.LITERAL.sub("''", sql[start:])
+        match = cls.END.search(conditions)
+        if match:
+            conditions = conditions[:match.start()]
+        return set((tablename, column, bool(lower))
+                   for lower, tablename, column
+                   in cls.COLUMN.findall(conditions))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def sample(cls, queries):
+        """
+            Add queries to the samples
+
+            @param queries: iterable of tuples (sql, duration)
+        """
+
+        conditions = cls.conditions
+        with cls._lock:
+            samples = cls._samples
+            for sql, duration in queries:
+                for key in conditions(sql):
+                    if key in samples:
+                        sample = samples[key]
+                        sample[0] += 1
+                        sample[1] += duration
+                    else:
+                        samples[key] = [1, duration]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def suggest(cls, min_count=1, reset=False):
+        """
+            Suggest indexes from the samples
+
+            @param min_count: minimum number of sampled queries using
+                              a column
+            @param reset: reset the samples
+
+            @return: list of suggestions (dicts, JSON-serializable),
+                     the most time-consuming first
+        """
+
+        with cls._lock:
+            samples = dict(cls._samples)
+            if reset:
+                cls._samples = {}
+
+        db = current.db
+        engine = db._dbname
+
+        declared = {}
+        for tablename, spec in S3Index.declared():
+            key = S3Index.key(spec, engine)
+            declared.setdefault(tablename, []).append(key)
+
+        existing = {}
+        suggestions = []
+        for (tablename, column, lower), (count, duration) in samples.items():
+            if count < min_count or column in cls.SKIP:
+                continue
+            if tablename not in db.tables:
+                # Alias or unknown table
+                continue
+            table = db[tablename]
+            if column not in table.fields or column == table._id.name:
+                continue
+
+            spec = "lower(%s)" % column if lower else column
+            key = S3Index.key(spec, engine)
+            if tablename not in existing:
+                existing[tablename] = S3Index.existing(tablename)
+            indexes = existing[tablename]
+            if S3Index.name(tablename, spec) in indexes or \
+               S3Index.covered(key, indexes):
+                continue
+
+            suggestions.append({"table": tablename,
+                                "column": column,
+                                "lower": lower,
+                                "queries": count,
+                                "time": duration,
+                                "declared": key in declared.get(tablename, ()),
+                                "sql": S3Index.sql(tablename, spec, engine),
+                                })
+
+        suggestions.sort(key=lambda s: s["time"], reverse=True)
+        return suggestions
+
+# END =========================================================================
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+""" S3 Request Instrumentation
+
+    @copyright: 2014 (c) Sahana Software Foundation
+    @license: MIT
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+
+    @status: experimental
+"""
+
+__all__ = ["S3Instrument"]
+
+import datetime
+import threading
+import time
+
+from functools import wraps
+
+from gluon import current
+
+from s3index import S3IndexAdvisor
+
+# =============================================================================
+class S3Instrument(object):
+    """
+        Opt-in per-request instrumentation (settings.base.instrument):
+
+            - records all DAL queries of the request with their execution
+              time and the S3 component they were issued from (the
+              innermost active span, e.g. "S3Resource.select")
+            - records timing spans for core components, model loading
+              and controller/view
+            - logs slow requests with their top queries
+              (settings.base.instrument_slow)
+            - feeds the queries into the index advisor (S3IndexAdvisor)
+            - aggregates process-wide counters which can be exported
+              as JSON (stats()), e.g. for monitoring
+
+        Components are instrumented like:
+
+            @S3Instrument.trace("S3Resource.select")
+            def select(self, ...):
+
+        or:
+
+            with S3Instrument.span("onaccept"):
+                ...
+
+        which does nothing unless the instrumentation is active for
+        the current request.
+    """
+
+    # Number of queries to report for slow requests
+    TOP_QUERIES = 5
+
+    # Process-wide counters
+    _stats = None
+    _lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def start(cls, db):
+        """
+            Start the instrumentation of the current request (called
+            in models/00_db.py)
+
+            @param db: the database
+        """
+
+        if not current.deployment_settings.get_base_instrument():
+            return
+
+        state = {"start": time.time(),
+                 "mark": None,
+                 "stack": [],
+                 "queries": [],
+                 "spans": {},
+                 }
+        response = current.response
+        response.s3.instrument = state
+
+        # Record all queries with the currently active component
+        adapter = db._adapter
+        log_execute = adapter.log_execute
+        stack = state["stack"]
+        append = state["queries"].append
+        def instrumented(*args, **kwargs):
+            start = time.time()
+            try:
+                return log_execute(*args, **kwargs)
+            finally:
+                append((args[0] if args else None,
+                        time.time() - start,
+                        stack[-1] if stack else None))
+        adapter.log_execute = instrumented
+
+        # Finish after view rendering, before the final commit
+        response.custom_commit = cls.commit
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def active():
+        """
+            Get the instrumentation state of the current request
+
+            @return: the state dict, or None if not instrumented
+        """
+
+        response = getattr(current, "response", None)
+        if response is None:
+            return None
+        return response.s3.instrument
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def span(cls, name):
+        """
+            Context manager for a timing span
+
+            @param name: the span name
+        """
+
+        return S3InstrumentSpan(name)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def trace(cls, name):
+        """
+            Decorator to record all calls of a function as timing span
+
+            @param name: the span name
+        """
+
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not cls.active():
+                    return f(*args, **kwargs)
+                with S3InstrumentSpan(name):
+                    return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def mark(cls, name):
+        """
+            Record the time since the previous mark (or the start of the
+            request) as span, e.g. "models"
+
+            @param name: the span name
+        """
+
+        state = cls.active()
+        if not state:
+            return
+        now = time.time()
+        last = state["mark"]
+        start = last[1] if last else state["start"]
+        cls.add_span(state, name, now - start)
+        state["mark"] = (name, now)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def add_span(state, name, duration, calls=1):
+        """
+            Add time to a span
+
+            @param state: the instrumentation state
+            @param name: the span name
+            @param duration: the duration (seconds)
+            @param calls: the number of calls
+        """
+
+        spans = state["spans"]
+        if name in spans:
+            span = spans[name]
+            span[0] += calls
+            span[1] += duration
+        else:
+            spans[name] = [calls, duration]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def report(cls, state=None):
+        """
+            Summarize the instrumentation data of the current request
+
+            @param state: the instrumentation state (default: current)
+            @return: dict with the summary, or None if not instrumented
+        """
+
+        if state is None:
+            state = cls.active()
+            if not state:
+                return None
+
+        components = {}
+        for name, (calls, duration) in state["spans"].items():
+            components[name] = {"calls": calls,
+                                "time": duration,
+                                "queries": 0,
+                                "query_time": 0.0,
+                                }
+
+        queries = state["queries"]
+        query_time = 0.0
+        for sql, duration, name in queries:
+            query_time += duration
+            if name is None:
+                name = "other"
+            if name not in components:
+                components[name] = {"calls": 0,
+                                    "time": 0.0,
+                                    "queries": 0,
+                                    "query_time": 0.0,
+                                    }
+            component = components[name]
+            component["queries"] += 1
+            component["query_time"] += duration
+
+        top = sorted(queries, key=lambda q: q[1], reverse=True)
+        return {"time": time.time() - state["start"],
+                "queries": len(queries),
+                "query_time": query_time,
+                "components": components,
+                "top_queries": [{"sql": sql,
+                                 "time": duration,
+                                 "component": name or "other",
+                                 } for sql, duration, name
+                                   in top[:cls.TOP_QUERIES]],
+                }
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def commit(cls, adapter=None):
+        """
+            Replacement for the final commit of the request (as
+            response.custom_commit): finish the instrumentation, then
+            commit
+
+            @param adapter: the DB adapter to commit
+        """
+
+        try:
+            cls.finish()
+        finally:
+            if adapter is not None:
+                adapter.commit()
+            else:
+                current.db.commit()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def finish(cls):
+        """
+            Finish the instrumentation of the current request, add
+            the data to the process-wide counters and log slow requests
+        """
+
+        state = cls.active()
+        if not state:
+            return
+        current.response.s3.instrument = None
+
+        # Time since the last mark is controller and/or view
+        last = state["mark"]
+        if last and last[0] == "controller":
+            name = "view"
+        else:
+            name = "controller+view"
+        cls.add_span(state, name, time.time() - (last[1] if last else state["start"]))
+
+        report = cls.report(state)
+        duration = report["time"]
+
+        # Sample the queries for the index advisor
+        S3IndexAdvisor.sample((sql, t) for sql, t, name in state["queries"])
+
+        threshold = current.deployment_settings.get_base_instrument_slow()
+        slow = threshold and duration > threshold
+
+        # Update process-wide counters
+        with cls._lock:
+            stats = cls._stats
+            if stats is None:
+                stats = cls._stats = cls._empty()
+            stats["requests"] += 1
+            if slow:
+                stats["slow_requests"] += 1
+            stats["time"] += duration
+            stats["queries"] += report["queries"]
+            stats["query_time"] += report["query_time"]
+            components = stats["components"]
+            for name, data in report["components"].items():
+                if name in components:
+                    counters = components[name]
+                    for key, value in data.items():
+                        counters[key] += value
+                else:
+                    components[name] = dict(data)
+
+        # Slow request log
+        if slow:
+            request = current.request
+            log = current.log
+            log.warning("Slow request",
+                        "%s %s: %.3fs, %s queries (%.3fs)" % \
+                            (request.env.request_method,
+                             request.env.path_info,
+                             duration,
+                             report["queries"],
+                             report["query_time"]))
+            for query in report["top_queries"]:
+                log.warning("Slow request query",
+                            "%.3fs (%s): %s" % (query["time"],
+                                                query["component"],
+                                                query["sql"]))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _empty():
+        """ Empty set of process-wide counters """
+
+        return {"since": datetime.datetime.utcnow().isoformat(),
+                "requests": 0,
+                "slow_requests": 0,
+                "time": 0.0,
+                "queries": 0,
+                "query_time": 0.0,
+                "components": {},
+                }
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def stats(cls, reset=False):
+        """
+            Get the process-wide counters
+
+            @param reset: reset the counters
+            @return: JSON-serializable dict with the counters
+        """
+
+        import copy
+        with cls._lock:
+            stats = cls._stats
+            if stats is None:
+                stats = cls._empty()
+            else:
+                stats = copy.deepcopy(stats)
+            if reset:
+                cls._stats = None
+        return stats
+
+# =============================================================================
+class S3InstrumentSpan(object):
+    """ Context manager for instrumentation timing spans """
+
+    def __init__(self, name):
+        """
+            Constructor
+
+            @param name: the span name
+        """
+
+        self.name = name
+        self.state = None
+        self.start = None
+
+    # -------------------------------------------------------------------------
+    def __enter__(self):
+
+        state = S3Instrument.active()
+        if state:
+            self.state = state
+            state["stack"].append(self.name)
+            self.start = time.time()
+        return self
+
+    # -------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, tb):
+
+        state = self.state
+        if state:
+            duration = time.time() - self.start
+            stack = state["stack"]
+            name = stack.pop()
+            # Count the time only for the outermost of nested
+            # calls of the same component (e.g. recursive select)
+            if name in stack:
+                duration = 0.0
+            S3Instrument.add_span(state, name, duration)
+        return False
+
+# END =========================================================================
@@ -38,6 +38,7 @@ from gluon.dal import Table
 from gluon.storage import Storage
 from gluon.tools import callback
 
+from s3instrument import S3Instrument
 from s3navigation import S3ScriptItem
 from s3resource import S3Resource
 from s3validators import IS_ONE_OF
@@ -294,6 +295,7 @@ class S3Model(object):
 
     # -------------------------------------------------------------------------
     @classmethod
+    @S3Instrument.trace("S3Model.load")
     def load(cls, name):
         """
             Helper function to load a model by its name (=prefix)
@@ -352,8 +354,168 @@ class S3Model(object):
             table = ogetattr(db, tablename)
         else:
             table = db.define_table(tablename, *fields, **args)
+            cls.track_writes(table)
         return table
 
+    # -------------------------------------------------------------------------
+    # Write tracking
+    # -------------------------------------------------------------------------
+    @classmethod
+    def track_writes(cls, table):
+        """
+            Install DAL callbacks to track all writes to a table (including
+            onaccept side-effects, raw DAL updates and bulk inserts), so
+            that dependent caches can be invalidated once per table at the
+            end of the request or import job (see onwrite)
+
+            @param table: the Table
+
+            @note: tables configured with track_writes=False are skipped
+                   (e.g. the cache tables themselves)
+        """
+
+        tablename = table._tablename
+        onwrite = cls.onwrite
+
+        def after_insert(fields, record_id):
+            onwrite(tablename, record_ids=[record_id])
+            # Must return a falsy value
+            return None
+
+        def before_update(dbset, fields):
+            onwrite(tablename, dbset=dbset, fields=fields)
+            # Returning True would cancel the update
+            return None
+
+        def after_delete(dbset):
+            onwrite(tablename)
+            return None
+
+        try:
+            table._after_insert.append(after_insert)
+            table._before_update.append(before_update)
+            table._after_delete.append(after_delete)
+        except AttributeError:
+            # DAL without table callbacks (web2py < 2.4.7)
+            pass
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def onwrite(cls, tablename, record_ids=None, dbset=None, fields=None):
+        """
+            Register a write to a table, to invalidate the dependent
+            caches at the end of the request (before the final commit),
+            or at the end of the import job, or immediately outside of
+            HTTP requests (scheduler, shell)
+
+            @param tablename: the tablename
+            @param record_ids: the IDs of the written records (if known)
+            @param dbset: the Set of records to be updated
+            @param fields: the fields to be updated
+        """
+
+        if cls.get_config(tablename, "track_writes") is False:
+            return
+
+        s3 = current.response.s3
+        request = current.request
+        immediate = getattr(request, "is_scheduler", False) or \
+                    getattr(request, "is_shell", False) or \
+                    not request.env.request_method
+
+        written = s3.written
+        if written is None:
+            written = s3.written = {}
+            if not immediate:
+                cls._onwrite_commit()
+
+        if tablename in written:
+            ids = written[tablename]
+        else:
+            ids = written[tablename] = set()
+
+        if cls.get_config(tablename, "name_index") and \
+           current.deployment_settings.get_search_name_index():
+            # Collect the record IDs for the name index
+            if record_ids:
+                ids.update(record_ids)
+            elif dbset is not None:
+                if isinstance(fields, dict):
+                    updated = set(fields.keys())
+                elif fields:
+                    updated = set(getattr(f, "name", f) for f, v in fields)
+                else:
+                    updated = None
+                names = cls.get_config(tablename, "name_index")
+                if updated is None or updated & set(names):
+                    # Names updated: select the IDs before the update
+                    table = current.db[tablename]
+                    rows = dbset.select(table._id)
+                    pkey = table._id.name
+                    ids.update(row[pkey] for row in rows)
+
+        if immediate and not s3.bulk:
+            # No final commit to hook into
+            cls.onwrite_flush()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _onwrite_commit(cls):
+        """
+            Hook onwrite_flush into the final commit of the request
+            (response.custom_commit, once per request)
+        """
+
+        response = current.response
+        if response.s3.onwrite_commit:
+            return
+        response.s3.onwrite_commit = True
+
+        custom_commit = response.custom_commit
+
+        def commit(adapter=None):
+            try:
+                cls.onwrite_flush()
+            finally:
+                if custom_commit is not None:
+                    custom_commit(adapter)
+                elif adapter is not None:
+                    adapter.commit()
+                else:
+                    current.db.commit()
+        response.custom_commit = commit
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def onwrite_flush(cls):
+        """
+            Invalidate the caches which depend on the tables written
+            since the last flush: filter options indexes, cached feature
+            layers and cached widgets (once per table), and update the
+            name index for the written records
+        """
+
+        s3 = current.response.s3
+        written = s3.written
+        if not written:
+            return
+        s3.written = {}
+
+        tablenames = written.keys()
+
+        from s3filter import S3FilterIndex
+        S3FilterIndex.dirty(tablenames)
+
+        from s3gis import S3FeatureCache
+        S3FeatureCache.invalidate(tablenames)
+
+        from s3widgetcache import S3WidgetCache
+        S3WidgetCache.invalidate(tablenames)
+
+        from s3nameindex import S3NameIndex
+        for tablename, record_ids in written.items():
+            S3NameIndex.onwrite(tablename, record_ids)
+
     # -------------------------------------------------------------------------
     # Resource configuration
     # -------------------------------------------------------------------------
@@ -424,6 +586,7 @@ class S3Model(object):
 
     # -------------------------------------------------------------------------
     @classmethod
+    @S3Instrument.trace("onaccept")
     def onaccept(cls, table, record, method="create"):
         """
             Helper to run the onvalidation routine for a record
@@ -923,6 +1086,7 @@ class S3Model(object):
                                       writable=False),
                                 sequence_name=sequence_name,
                                 *fields, **args)
+        cls.track_writes(table)
 
         return table
 
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+
+""" S3 Name Search Index
+
+    @copyright: 2014 (c) Sahana Software Foundation
+    @license: MIT
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+
+    @status: experimental
+"""
+
+__all__ = ["S3NameIndex"]
+
+import re
+import unicodedata
+
+from gluon import current
+
+from s3utils import s3_unicode
+
+TOKENIZE = re.compile(r"[^\w]+", re.UNICODE)
+
+# =============================================================================
+class S3NameIndex(object):
+    """
+        Stored search index for the name fields of a table, to look up
+        candidate records for autocomplete searches without having to
+        scan the name fields with LIKE queries.
+
+        Name fields are normalized (lowercase, diacritics removed) and
+        split into tokens, and each record is indexed with:
+
+            - "w:<token>" for every complete token (exact word match)
+            - "p:<prefix>" for every prefix of a token (up to PREFIX_LENGTH)
+            - "g:<trigram>" for every trigram within a token (infix match)
+
+        Tables are configured for indexing like:
+
+            s3db.configure("pr_person",
+                           name_index = ["first_name",
+                                         "middle_name",
+                                         "last_name",
+                                         ],
+                           )
+
+        The index is built by the s3_name_index_rebuild task (until then,
+        lookups fall back to the caller's name query), and updated for the
+        written records whenever records are inserted, or their name fields
+        updated (S3Model.onwrite, also catching raw DAL writes). Index
+        entries of deleted records are left in place - they are filtered
+        out by the resource query. The index only narrows down the
+        candidates, so the caller should still apply its original name
+        query as well as the accessible-query (via the resource) to the
+        candidates.
+
+        Records with IDs higher than at the time the index was built are
+        always included as candidates, i.e. found by the caller's name
+        query, even if they have been written while the write tracking
+        was unavailable (e.g. tables defined outside of S3Model).
+
+        Search tokens shorter than MIN_LENGTH are not looked up in the
+        index (they would match too many candidates), but only matched
+        by the caller's name query.
+    """
+
+    TABLENAME = "s3_name_index"
+
+    # Maximum length of prefix keys
+    PREFIX_LENGTH = 16
+
+    # Minimum length of search tokens (and prefix keys)
+    MIN_LENGTH = 2
+
+    # Marker key for completely indexed tables
+    BUILT = "*"
+
+    # -------------------------------------------------------------------------
+    def __init__(self, tablename):
+        """
+            Constructor
+
+            @param tablename: the name of the indexed table
+        """
+
+        self.tablename = tablename
+        self.fields = current.s3db.get_config(tablename, "name_index")
+
+        # Highest record ID at the time the index was built
+        self.built = None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def enabled(tablename):
+        """
+            Check whether the name index is enabled for a table
+
+            @param tablename: the tablename
+        """
+
+        if not current.deployment_settings.get_search_name_index():
+            return False
+        return bool(current.s3db.get_config(tablename, "name_index"))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def tokens(text):
+        """
+            Normalize a text and split it into tokens
+
+            @param text: the text
+            @return: list of tokens
+        """
+
+        if not text:
+            return []
+        text = unicodedata.normalize("NFKD", s3_unicode(text).lower())
+        text = u"".join(c for c in text if not unicodedata.combining(c))
+        return [t.encode("utf-8") for t in TOKENIZE.split(text) if t]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def keys(cls, tokens):
+        """
+            Generate the index keys for a list of tokens
+
+            @param tokens: the tokens
+            @return: set of index keys
+        """
+
+        keys = set()
+        add = keys.add
+        minlen = cls.MIN_LENGTH
+        maxlen = cls.PREFIX_LENGTH
+        for token in tokens:
+            add("w:%s" % token[:maxlen])
+            for i in xrange(minlen, min(len(token), maxlen) + 1):
+                add("p:%s" % token[:i])
+            for i in xrange(len(token) - 2):
+                add("g:%s" % token[i:i+3])
+        return keys
+
+    # -------------------------------------------------------------------------
+    def update(self, record_ids):
+        """
+            Update the index entries for records
+
+            @param record_ids: the record ID, or a list of record IDs
+        """
+
+        fields = self.fields
+        if not fields or not record_ids:
+            return
+        if not isinstance(record_ids, (list, tuple, set)):
+            record_ids = [record_ids]
+        record_ids = list(record_ids)
+
+        db = current.db
+        table = current.s3db.table(self.tablename)
+        itable = current.s3db[self.TABLENAME]
+
+        tablename = self.tablename
+        query = (itable.tablename == tablename) & \
+                (itable.record_id.belongs(record_ids))
+        db(query).delete()
+
+        rows = db(table._id.belongs(record_ids)).select(table._id,
+                                                        *[table[f] for f in fields]
+                                                        )
+        pkey = table._id.name
+
+        tokens = self.tokens
+        keys = self.keys
+        items = []
+        append = items.append
+        for row in rows:
+            record_id = row[pkey]
+            names = []
+            for fn in fields:
+                names.extend(tokens(row[fn]))
+            for key in keys(names):
+                append({"tablename": tablename,
+                        "record_id": record_id,
+                        "term": key,
+                        })
+        if items:
+            itable.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    def build(self):
+        """ (Re-)Build the index for all records in the table """
+
+        fields = self.fields
+        if not fields:
+            return
+
+        db = current.db
+        s3db = current.s3db
+        table = s3db.table(self.tablename)
+        itable = s3db[self.TABLENAME]
+
+        tablename = self.tablename
+        db(itable.tablename == tablename).delete()
+
+        query = (table._id > 0)
+        if "deleted" in table.fields:
+            query &= (table.deleted != True)
+        rows = db(query).select(table._id, *[table[f] for f in fields])
+        pkey = table._id.name
+
+        # The marker holds the highest record ID at build time
+        built = max(row[pkey] for row in rows) if rows else 0
+        self.built = built
+
+        tokens = self.tokens
+        keys = self.keys
+        items = [{"tablename": tablename,
+                  "record_id": built,
+                  "term": self.BUILT,
+                  }]
+        append = items.append
+        for row in rows:
+            record_id = row[pkey]
+            names = []
+            for fn in fields:
+                names.extend(tokens(row[fn]))
+            for key in keys(names):
+                append({"tablename": tablename,
+                        "record_id": record_id,
+                        "term": key,
+                        })
+        itable.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    def lookup(self, value, infix=False):
+        """
+            Look up candidate records matching a search string
+
+            @param value: the search string, every token in it must match
+                          the beginning of a token in the record's names
+            @param infix: match the tokens anywhere within the names
+                          (requires at least 3 characters per token)
+            @return: dict {record_id: rank}, or None if the index can
+                     not be used for this search string (or has not
+                     been built yet)
+        """
+
+        minlen = self.MIN_LENGTH
+        search = [t for t in self.tokens(value) if len(t) >= minlen]
+        if not search or not self.fields:
+            return None
+
+        maxlen = self.PREFIX_LENGTH
+
+        # Required keys per search token
+        required = []
+        for token in search:
+            if infix:
+                if len(token) < 3:
+                    return None
+                required.append(set("g:%s" % token[i:i+3]
+                                    for i in xrange(len(token) - 2)))
+            else:
+                required.append(set(["p:%s" % token[:maxlen]]))
+        words = set("w:%s" % token[:maxlen] for token in search)
+
+        keys = set(words)
+        for k in required:
+            keys |= k
+
+        db = current.db
+        itable = current.s3db[self.TABLENAME]
+        tablename = self.tablename
+
+        # The index is built by the s3_name_index_rebuild task, not
+        # in the request
+        query = (itable.tablename == tablename) & \
+                (itable.term == self.BUILT)
+        row = db(query).select(itable.record_id, limitby=(0, 1)).first()
+        if not row:
+            return None
+        self.built = row.record_id or 0
+
+        query = (itable.tablename == tablename) & \
+                (itable.term.belongs(keys))
+        rows = db(query).select(itable.record_id, itable.term)
+
+        matches = {}
+        for row in rows:
+            record_id = row.record_id
+            if record_id in matches:
+                matches[record_id].add(row.term)
+            else:
+                matches[record_id] = set([row.term])
+
+        # Rank = number of exact word matches
+        result = {}
+        for record_id, found in matches.iteritems():
+            if all(k <= found for k in required):
+                result[record_id] = len(words & found)
+        return result
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def apply(cls, resource, value, tablename=None, selectors=None, infix=False):
+        """
+            Restrict a resource to the candidates from the name index of
+            a table, if enabled for that table
+
+            @param resource: the S3Resource
+            @param value: the search string
+            @param tablename: the indexed table (defaults to resource table)
+            @param selectors: list of field selectors for the keys of the
+                              indexed table in the resource (matched
+                              alternatively), defaults to the record ID
+            @param infix: match the tokens anywhere within the names
+
+            @return: dict {record_id: rank} for the candidates, or None
+                     if the index is not enabled or can not be used
+
+            @note: records inserted after the index was built are always
+                   included (not ranked), since they may not be indexed
+        """
+
+        if tablename is None:
+            tablename = resource.tablename
+        if not cls.enabled(tablename):
+            return None
+
+        index = cls(tablename)
+        ranks = index.lookup(value, infix=infix)
+        if ranks is None:
+            return None
+
+        from s3resource import S3FieldSelector
+        if not selectors:
+            selectors = ["id"]
+        ids = ranks.keys() or [0]
+        built = index.built or 0
+        query = None
+        for selector in selectors:
+            field = S3FieldSelector(selector)
+            q = (field.belongs(ids)) | (field > built)
+            query = q if query is None else query | q
+        resource.add_filter(query)
+        return ranks
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def rank(rows, ranks, colname):
+        """
+            Sort rows by rank (stable, i.e. rows with equal rank retain
+            their order)
+
+            @param rows: the rows (list)
+            @param ranks: dict {record_id: rank} as returned from apply()
+            @param colname: the column name of the record ID in the rows,
+                            or a function to extract the record ID from
+                            a row
+            @return: the sorted list of rows
+        """
+
+        if not ranks:
+            return rows
+        get = ranks.get
+        if callable(colname):
+            record_id = colname
+        else:
+            record_id = lambda row: row[colname]
+        return sorted(rows, key=lambda row: -get(record_id(row), 0))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def onwrite(cls, tablename, record_ids):
+        """
+            Update the index entries for records after they have been
+            inserted or their names updated (called from S3Model.onwrite_flush;
+            super-entity records are written, and hence updated, separately)
+
+            @param tablename: the tablename
+            @param record_ids: the record IDs
+        """
+
+        if record_ids and cls.enabled(tablename):
+            cls(tablename).update(record_ids)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def rebuild(cls, tablename=None):
+        """
+            (Re-)Build the indexes of all tables configured for name
+            indexing, to be run in the s3_name_index_rebuild task
+
+            @param tablename: limit the rebuild to this table
+
+            @return: the number of rebuilt indexes
+        """
+
+        s3db = current.s3db
+        itable = s3db.table(cls.TABLENAME)
+        if not itable:
+            return 0
+
+        if tablename:
+            # Load the model
+            s3db.table(tablename)
+            tablenames = [tablename]
+        else:
+            s3db.load_all_models()
+            config = current.model.config
+            tablenames = [tn for tn in config
+                          if config[tn].get("name_index")]
+
+        rebuilt = 0
+        for tn in tablenames:
+            if s3db.get_config(tn, "name_index"):
+                cls(tn).build()
+                rebuilt += 1
+        return rebuilt
+
+# END =========================================================================
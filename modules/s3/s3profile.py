@@ -35,6 +35,7 @@ from gluon.storage import Storage
 from s3crud import S3CRUD
 from s3report import S3Report
 from s3resource import S3FieldSelector
+from s3widgetcache import S3WidgetCache
 
 # =============================================================================
 class S3Profile(S3CRUD):
@@ -125,7 +126,18 @@ class S3Profile(S3CRUD):
                 else:
                     # @ToDo: Check permissions to the Resource & do
                     # something different if no permission
-                    datalist = self._datalist(r, widgets[index], **attr)
+                    widget = widgets[index]
+                    renderer = lambda: self._datalist(r, widget, **attr)
+                    if S3WidgetCache.enabled(r, "datalist", widget):
+                        # Ajax-refresh: revalidate with ETag
+                        cache = S3WidgetCache(r, "profile-%s" % index,
+                                              "datalist",
+                                              tablename=widget.get("tablename"),
+                                              config=widget)
+                        datalist = cache.render(renderer, etag=True)
+                        current.response.view = "plain.html"
+                    else:
+                        datalist = renderer()
             output["item"] = datalist
 
         elif r.representation == "aadata":
@@ -156,25 +168,18 @@ class S3Profile(S3CRUD):
 
                 # Render the widget
                 w_type = widget["type"]
-                if w_type == "comments":
-                    w = self._comments(r, widget, **attr)
-                elif w_type == "datalist":
-                    w = self._datalist(r, widget, **attr)
-                elif w_type == "datatable":
-                    w = self._datatable(r, widget, **attr)
-                elif w_type == "form":
-                    w = self._form(r, widget, **attr)
-                elif w_type == "map":
-                    w = self._map(r, widget, **attr)
-                elif w_type == "report":
-                    w = self._report(r, widget, **attr)
+                if S3WidgetCache.enabled(r, w_type, widget):
+                    cache = S3WidgetCache(r, "profile-%s" % widget["index"],
+                                          w_type,
+                                          tablename=widget.get("tablename"),
+                                          config=widget)
+                    w = cache.render(lambda: self._render_widget(r, widget,
+                                                                 **attr))
                 else:
-                    if response.s3.debug:
-                        raise SyntaxError("Unsupported widget type %s" %
-                                          w_type)
-                    else:
-                        # ignore
-                        continue
+                    w = self._render_widget(r, widget, **attr)
+                if w is None:
+                    # ignore
+                    continue
 
                 if row is None:
                     # Start new row
@@ -198,6 +203,35 @@ class S3Profile(S3CRUD):
 
         return output
 
+    # -------------------------------------------------------------------------
+    def _render_widget(self, r, widget, **attr):
+        """
+            Render a widget for the page-load
+
+            @param r: the S3Request instance
+            @param widget: the widget definition as dict
+            @param attr: controller attributes for the request
+
+            @return: the widget, or None for unsupported widget types
+        """
+
+        w_type = widget["type"]
+        if w_type == "comments":
+            return self._comments(r, widget, **attr)
+        elif w_type == "datalist":
+            return self._datalist(r, widget, **attr)
+        elif w_type == "datatable":
+            return self._datatable(r, widget, **attr)
+        elif w_type == "form":
+            return self._form(r, widget, **attr)
+        elif w_type == "map":
+            return self._map(r, widget, **attr)
+        elif w_type == "report":
+            return self._report(r, widget, **attr)
+        elif current.response.s3.debug:
+            raise SyntaxError("Unsupported widget type %s" % w_type)
+        return None
+
     # -------------------------------------------------------------------------
     @staticmethod
     def _resolve_context(r, tablename, context):
@@ -76,8 +76,9 @@ from gluon.tools import callback
 
 from s3data import S3DataTable, S3DataList, S3PivotTable
 from s3fields import S3Represent, S3RepresentLazy, s3_all_meta_field_names
-from s3utils import s3_has_foreign_key, s3_get_foreign_key, s3_unicode, S3TypeConverter, s3_get_last_record_id, s3_remove_last_record_id
-from s3validators import IS_ONE_OF
+from s3instrument import S3Instrument
+from s3utils import s3_has_foreign_key, s3_get_foreign_key, s3_unicode, s3_strip_markup, S3TypeConverter, s3_get_last_record_id, s3_remove_last_record_id
+from s3validators import IS_ONE_OF, IS_ONE_OF_EMPTY
 from s3xml import S3XMLFormat
 
 DEBUG = False
@@ -514,6 +515,7 @@ class S3Resource(object):
         return self._length
 
     # -------------------------------------------------------------------------
+    @S3Instrument.trace("S3Resource.select")
     def select(self,
                fields,
                start=0,
@@ -2993,6 +2995,7 @@ class S3Resource(object):
                    conflict_policy=None,
                    last_sync=None,
                    onconflict=None,
+                   batch_size=None,
                    **args):
         """
             XML Importer
@@ -3014,7 +3017,17 @@ class S3Resource(object):
             @param conflict_policy: policy for conflict resolution (sync)
             @param last_sync: last synchronization datetime (sync)
             @param onconflict: callback hook for conflict resolution (sync)
+            @param batch_size: for CSV/XLS imports, number of rows to
+                               transform and import at a time (default
+                               from deployment settings, 0 or None to
+                               import the whole source at once)
             @param args: parameters to pass to the transformation stylesheet
+
+            @note: in batch mode, tuid references to records of previous
+                   batches are resolved, but forward references (to records
+                   in later batches of the source) can not be resolved and
+                   are dropped - sources with such references must be
+                   imported with batch_size=0
         """
 
         # Check permission for the resource
@@ -3045,69 +3058,96 @@ class S3Resource(object):
                         name=name,
                         utcnow=utcnow)
 
-            # Build import tree
+            # Import CSV/XLS sources batch-wise?
+            if batch_size is None:
+                batch_size = current.deployment_settings \
+                                    .get_base_import_batch_size()
+            if not batch_size or not commit_job or id or \
+               format not in ("csv", "xls"):
+                batch_size = None
+            elif stylesheet is not None and \
+                 not (isinstance(stylesheet, basestring) and \
+                      stylesheet.endswith(".json")):
+                # Compile the stylesheet only once for all batches
+                # (column mappings are cached by S3XML.transform)
+                stylesheet = xml.cached(stylesheet, "xslt", xml.compile)
+                if stylesheet is None:
+                    raise SyntaxError(xml.error)
+
+            # Build import trees
             if not isinstance(source, (list, tuple)):
                 source = [source]
-            for item in source:
-                if isinstance(item, (list, tuple)):
-                    resourcename, s = item[:2]
-                else:
-                    resourcename, s = None, item
-                if isinstance(s, etree._ElementTree):
-                    t = s
-                elif format == "json":
-                    if isinstance(s, basestring):
-                        source = StringIO(s)
-                        t = xml.json2tree(s)
-                    else:
-                        t = xml.json2tree(s)
-                elif format == "csv":
-                    t = xml.csv2tree(s,
-                                     resourcename=resourcename,
-                                     extra_data=extra_data)
-                elif format == "xls":
-                    t = xml.xls2tree(s,
-                                     resourcename=resourcename,
-                                     extra_data=extra_data)
-                else:
-                    t = xml.parse(s)
-                if not t:
-                    if xml.error:
-                        raise SyntaxError(xml.error)
+            trees = self._import_trees(source,
+                                       format=format,
+                                       stylesheet=stylesheet,
+                                       extra_data=extra_data,
+                                       batch_size=batch_size,
+                                       **args)
+            if not batch_size:
+                for t in trees:
+                    if not tree:
+                        tree = t.getroot()
                     else:
-                        raise SyntaxError("Invalid source")
-
-                if stylesheet is not None:
-                    t = xml.transform(t, stylesheet, **args)
-                    _debug(t)
-                    if not t:
-                        raise SyntaxError(xml.error)
-
-                if not tree:
-                    tree = t.getroot()
-                else:
-                    tree.extend(list(t.getroot()))
+                        tree.extend(list(t.getroot()))
 
             if files is not None and isinstance(files, dict):
                 self.files = Storage(files)
 
         else:
             # job ID given
-            pass
+            batch_size = None
         
         response = current.response
         # Flag to let onvalidation/onaccept know this is coming from a Bulk Import
         response.s3.bulk = True
-        success = self.import_tree(id, tree,
-                                   ignore_errors=ignore_errors,
-                                   job_id=job_id,
-                                   commit_job=commit_job,
-                                   delete_job=delete_job,
-                                   strategy=strategy,
-                                   update_policy=update_policy,
-                                   conflict_policy=conflict_policy,
-                                   last_sync=last_sync,
-                                   onconflict=onconflict)
+        if batch_size:
+            # Transform and import the source batch by batch, all
+            # batches being written within the same transaction
+            error = None
+            error_tree = None
+            success = True
+            # Records committed by previous batches, to resolve
+            # tuid references across batches
+            directory = {}
+            try:
+                for t in trees:
+                    success = self.import_tree(None, t.getroot(),
+                                               ignore_errors=ignore_errors,
+                                               strategy=strategy,
+                                               update_policy=update_policy,
+                                               conflict_policy=conflict_policy,
+                                               last_sync=last_sync,
+                                               onconflict=onconflict,
+                                               directory=directory)
+                    if self.error:
+                        error = self.error
+                    if self.error_tree is not None:
+                        if error_tree is None:
+                            error_tree = self.error_tree
+                        else:
+                            error_tree.extend(list(self.error_tree))
+                    if not success:
+                        # Roll back all previous batches
+                        current.db.rollback()
+                        break
+            except SyntaxError:
+                current.db.rollback()
+                response.s3.bulk = False
+                self.files = Storage()
+                raise
+            self.error = error
+            self.error_tree = error_tree
+        else:
+            success = self.import_tree(id, tree,
+                                       ignore_errors=ignore_errors,
+                                       job_id=job_id,
+                                       commit_job=commit_job,
+                                       delete_job=delete_job,
+                                       strategy=strategy,
+                                       update_policy=update_policy,
+                                       conflict_policy=conflict_policy,
+                                       last_sync=last_sync,
+                                       onconflict=onconflict)
         response.s3.bulk = False
 
         self.files = Storage()
@@ -3144,6 +3184,66 @@ class S3Resource(object):
             return xml.json_message(False, 400,
                                     message=self.error, tree=tree)
 
+    # -------------------------------------------------------------------------
+    def _import_trees(self, source,
+                      format="xml",
+                      stylesheet=None,
+                      extra_data=None,
+                      batch_size=None,
+                      **args):
+        """
+            Generator to convert and transform the import sources into
+            S3XML element trees (helper for import_xml)
+
+            @param source: list of sources, see import_xml
+            @param format: type of the sources
+            @param stylesheet: stylesheet to use for transformation
+            @param extra_data: for CSV imports, dict of extra cols to
+                               add to each row
+            @param batch_size: for CSV/XLS sources, yield a separate
+                               tree for every batch_size rows
+            @param args: parameters to pass to the transformation stylesheet
+        """
+
+        xml = current.xml
+
+        for item in source:
+            if isinstance(item, (list, tuple)):
+                resourcename, s = item[:2]
+            else:
+                resourcename, s = None, item
+            if isinstance(s, etree._ElementTree):
+                trees = [s]
+            elif format == "json":
+                trees = [xml.json2tree(s)]
+            elif format == "csv":
+                trees = xml.csv2trees(s,
+                                      resourcename=resourcename,
+                                      extra_data=extra_data,
+                                      batch_size=batch_size)
+            elif format == "xls":
+                trees = xml.xls2trees(s,
+                                      resourcename=resourcename,
+                                      extra_data=extra_data,
+                                      batch_size=batch_size)
+            else:
+                trees = [xml.parse(s)]
+
+            for t in trees:
+                if not t:
+                    if xml.error:
+                        raise SyntaxError(xml.error)
+                    else:
+                        raise SyntaxError("Invalid source")
+
+                if stylesheet is not None:
+                    t = xml.transform(t, stylesheet, **args)
+                    _debug(t)
+                    if not t:
+                        raise SyntaxError(xml.error)
+
+                yield t
+
     # -------------------------------------------------------------------------
     def import_tree(self, id, tree,
                     job_id=None,
@@ -3154,7 +3254,8 @@ class S3Resource(object):
                     update_policy=None,
                     conflict_policy=None,
                     last_sync=None,
-                    onconflict=None):
+                    onconflict=None,
+                    directory=None):
         """
             Import data from an S3XML element tree.
 
@@ -3165,6 +3266,10 @@ class S3Resource(object):
             @param job_id: restore a job from the job table (ID or UID)
             @param delete_job: delete the import job from the job table
             @param commit_job: commit the job (default)
+            @param directory: dict of records committed by previous jobs
+                              of the same import (batch mode) to resolve
+                              tuid references, will be updated with the
+                              records committed by this job
 
             @todo: update for link table support
         """
@@ -3303,7 +3408,8 @@ class S3Resource(object):
                                      update_policy=update_policy,
                                      conflict_policy=conflict_policy,
                                      last_sync=last_sync,
-                                     onconflict=onconflict)
+                                     onconflict=onconflict,
+                                     directory=directory)
             add_item = import_job.add_item
             for element in elements:
                 success = add_item(element=element,
@@ -3347,6 +3453,8 @@ class S3Resource(object):
             # Remove the job when committed
             if job_id is not None:
                 import_job.delete()
+            if success and directory is not None:
+                directory.update(import_job.tuid_directory())
 
         return self.error is None or ignore_errors
 
@@ -3358,7 +3466,10 @@ class S3Resource(object):
                        fields=None,
                        only_last=False,
                        show_uids=False,
-                       as_json=False):
+                       as_json=False,
+                       search=None,
+                       start=0,
+                       limit=None):
         """
             Export field options of this resource as element tree
 
@@ -3369,6 +3480,10 @@ class S3Resource(object):
             @param as_json: convert the output into JSON
             @param only_last: Obtain the latest record (performance bug fix,
                 timeout at s3_tb_refresh for non-dropdown form fields)
+            @param search: search string to filter the options by (lazy
+                lookup of a single IS_ONE_OF field, see S3LazyOptionsWidget)
+            @param start: index of the first option (lazy lookup)
+            @param limit: maximum number of options (lazy lookup)
         """
 
         if component is not None:
@@ -3377,11 +3492,36 @@ class S3Resource(object):
                 tree = c.export_options(fields=fields,
                                         only_last=only_last,
                                         show_uids=show_uids,
-                                        as_json=as_json)
+                                        as_json=as_json,
+                                        search=search,
+                                        start=start,
+                                        limit=limit)
                 return tree
             else:
                 raise AttributeError
         else:
+            if as_json and (search is not None or limit) and \
+               fields and len(fields) == 1:
+                # Lazy lookup, returns a JSON list as expected by
+                # S3.autocomplete.generic
+                table = self.table
+                if fields[0] not in table.fields:
+                    raise AttributeError
+                req = table[fields[0]].requires
+                if isinstance(req, (list, tuple)):
+                    req = req[0] if req else None
+                if isinstance(req, IS_EMPTY_OR):
+                    req = req.other
+                if not isinstance(req, IS_ONE_OF_EMPTY):
+                    raise RuntimeError, "not isinstance(req, IS_ONE_OF)"
+                res = []
+                for key, label in req.lookup(search=search,
+                                             start=start,
+                                             limit=limit):
+                    label = s3_strip_markup(s3_unicode(label))
+                    res.append({"id": key, "name": label, "label": label})
+                return json.dumps(res)
+
             if as_json and only_last and len(fields) == 1:
                 db = current.db
                 component_tablename = "%s_%s" % (self.prefix, self.name)
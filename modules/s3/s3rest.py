@@ -905,6 +905,16 @@ class S3Request(object):
         headers["Content-Type"] = s3.content_type.get(representation,
                                                       default)
 
+        # Serve Feature Layer GeoJSON from cache if possible
+        from s3gis import S3FeatureCache
+        if S3FeatureCache.enabled(r):
+            cache = S3FeatureCache(r)
+            output = cache.get()
+            if output is not None:
+                return output
+        else:
+            cache = None
+
         # Export the resource
         output = r.resource.export_xml(start=start,
                                        limit=limit,
@@ -923,6 +933,9 @@ class S3Request(object):
         if not output:
             r.error(400, "XSLT Transformation Error: %s " % current.xml.error)
 
+        if cache:
+            cache.store(output)
+
         return output
 
     # -------------------------------------------------------------------------
@@ -1142,6 +1155,13 @@ class S3Request(object):
                 v = v[-1]
             if v.lower() == "true":
                 show_uids = True
+        # Lazy lookup (S3LazyOptionsWidget)
+        search = _vars.get("term")
+        try:
+            start = int(_vars.get("start", 0))
+            limit = int(_vars.get("limit", 0)) or None
+        except ValueError:
+            r.error(400, "Invalid start/limit")
         component = r.component_name
         representation = r.representation
         if representation == "xml":
@@ -1153,7 +1173,10 @@ class S3Request(object):
             output = r.resource.export_options(component=component,
                                                fields=fields,
                                                only_last=only_last,
-                                               as_json=True)
+                                               as_json=True,
+                                               search=search,
+                                               start=start,
+                                               limit=limit)
             content_type = "application/json"
         else:
             r.error(501, current.ERROR.BAD_FORMAT)
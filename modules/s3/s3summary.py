@@ -35,6 +35,7 @@ from gluon.storage import Storage
 from s3filter import S3FilterForm
 from s3gis import MAP
 from s3rest import S3Method
+from s3widgetcache import S3WidgetCache
 
 # =============================================================================
 class S3Summary(S3Method):
@@ -168,11 +169,19 @@ class S3Summary(S3Method):
                             dtargs = attr.get("dtargs", {})
                             dtargs["dt_bFilter"] = "false"
                             attr["dtargs"] = dtargs
-                        content = handler(r,
-                                          method=method,
-                                          widget_id=widget_id,
-                                          visible=visible,
-                                          **attr)
+                        renderer = lambda: handler(r,
+                                                   method=method,
+                                                   widget_id=widget_id,
+                                                   visible=visible,
+                                                   **attr)
+                        if S3WidgetCache.enabled(r, method, widget):
+                            cache = S3WidgetCache(r, widget_id, method,
+                                                  tablename=resource.tablename,
+                                                  config=widget,
+                                                  visible=visible)
+                            content = cache.render(renderer)
+                        else:
+                            content = renderer()
                     else:
                         r.error(405, current.ERROR.BAD_METHOD)
 
@@ -312,10 +321,18 @@ class S3Summary(S3Method):
                     else:
                         handler = r.get_widget_handler(method)
                         if handler is not None:
-                            output = handler(r,
-                                             method=method,
-                                             widget_id=widget_id,
-                                             **attr)
+                            renderer = lambda: handler(r,
+                                                       method=method,
+                                                       widget_id=widget_id,
+                                                       **attr)
+                            if S3WidgetCache.enabled(r, method, widget):
+                                # Ajax-refresh: revalidate with ETag
+                                cache = S3WidgetCache(r, widget_id, method,
+                                                      tablename=self.tablename,
+                                                      config=widget)
+                                output = cache.render(renderer, etag=True)
+                            else:
+                                output = renderer()
                         else:
                             r.error(405, current.ERROR.BAD_METHOD)
                     return output
@@ -249,56 +249,105 @@ class S3Trackable(object):
             @param exclude: interlocks to break at (avoids circular check-ins)
 
             @return: a location record, or a list of location records (if multiple)
+
+            @note: the locations of all instances are resolved in bulk, i.e.
+                   with one query for the latest presences (per level of
+                   interlocks), one query for the base locations (per
+                   instance type) and one query for the location records
         """
 
         db = current.db
         s3db = current.s3db
 
-        ptable = s3db[PRESENCE]
         ltable = s3db[LOCATION]
 
         if timestmp is None:
             timestmp = datetime.utcnow()
 
+        records = self.records
+
+        # Latest presences of all trackables, including those
+        # the instances are checked-in to (interlocks)
+        presences = {}
+        targets = {}
+        pending = set(r[TRACK_ID] for r in records
+                                  if TRACK_ID in r and r[TRACK_ID])
+        while pending:
+            latest = self.__get_presences(list(pending), timestmp)
+            presences.update(latest)
+            interlocks = set(p.interlock for p in latest.values()
+                                         if p and p.interlock)
+            targets.update(self.__get_interlocks(interlocks - set(targets)))
+            pending = set(t[TRACK_ID] for t in targets.values()
+                                      if t[TRACK_ID]) - set(presences)
+
+        # Base locations of instances without location_id field
+        track_ids = set([r[TRACK_ID] for r in records
+                                     if LOCATION_ID not in r and \
+                                        TRACK_ID in r and r[TRACK_ID]])
+        base = self.__get_base_locations(list(track_ids))
+
+        def candidates(track_id, location_id, exclude):
+            """
+                Resolve the location of an instance in memory
+
+                @param track_id: the track ID of the instance
+                @param location_id: the base location of the instance
+                @param exclude: interlocks to break at
+
+                @return: list of location IDs in order of preference
+            """
+
+            presence = presences.get(track_id) if track_id else None
+            if presence:
+                if presence.interlock:
+                    exclude = [track_id] + exclude
+                    target = targets.get(presence.interlock)
+                    if target and target[TRACK_ID] not in exclude:
+                        # Location of the instance checked-in to, falling
+                        # back to the base location of this instance
+                        return candidates(target[TRACK_ID],
+                                          target[LOCATION_ID],
+                                          exclude) + [location_id]
+                elif presence.location_id:
+                    return [presence.location_id, location_id]
+            return [location_id]
+
+        resolved = []
+        location_ids = set()
+        for r in records:
+            track_id = r[TRACK_ID] if TRACK_ID in r else None
+            if LOCATION_ID in r:
+                location_id = r[LOCATION_ID]
+            else:
+                location_id = base.get(track_id)
+            ids = [i for i in candidates(track_id, location_id, exclude) if i]
+            location_ids.update(ids)
+            resolved.append(ids)
+
+        # Look up all locations at once
+        found = {}
+        if location_ids:
+            query = (ltable.id.belongs(location_ids))
+            if _filter is not None:
+                query &= _filter
+            if _fields is None:
+                fields = [ltable.ALL]
+            else:
+                fields = list(_fields)
+                if not [f for f in fields if str(f) == str(ltable.id)]:
+                    fields.insert(0, ltable.id)
+            rows = db(query).select(*fields)
+            for row in rows:
+                found[row.id] = row
+
         locations = []
-        for r in self.records:
+        for ids in resolved:
             location = None
-            if TRACK_ID in r:
-                query = ((ptable.deleted == False) & \
-                         (ptable[TRACK_ID] == r[TRACK_ID]) & \
-                         (ptable.timestmp <= timestmp))
-                presence = db(query).select(orderby=~ptable.timestmp,
-                                            limitby=(0, 1)).first()
-                if presence:
-                    if presence.interlock:
-                        exclude = [r[TRACK_ID]] + exclude
-                        tablename, record_id = presence.interlock.split(",", 1)
-                        trackable = S3Trackable(tablename=tablename, record_id=record_id)
-                        record = trackable.records.first()
-                        if TRACK_ID not in record or \
-                           record[TRACK_ID] not in exclude:
-                            location = trackable.get_location(timestmp=timestmp,
-                                                              exclude=exclude,
-                                                              _fields=_fields,
-                                                              as_rows=True).first()
-                    elif presence.location_id:
-                        query = (ltable.id == presence.location_id)
-                        if _filter is not None:
-                            query = query & _filter
-                        if _fields is None:
-                            location = db(query).select(ltable.ALL,
-                                                        limitby=(0, 1)).first()
-                        else:
-                            location = db(query).select(limitby=(0, 1),
-                                                        *_fields).first()
-
-            if not location:
-                if len(self.records) > 1:
-                    trackable = S3Trackable(record=r, rtable=self.rtable)
-                else:
-                    trackable = self
-                location = trackable.get_base_location(_fields=_fields)
-
+            for location_id in ids:
+                if location_id in found:
+                    location = found[location_id]
+                    break
             if location:
                 locations.append(location)
             else:
@@ -313,6 +362,120 @@ class S3Trackable(object):
         else:
             return locations
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def __get_presences(track_ids, timestmp):
+        """
+            Get the latest presence records of trackables before a date/time
+
+            @param track_ids: the track IDs
+            @param timestmp: the date/time
+
+            @return: dict {track_id: presence Row or None}
+        """
+
+        db = current.db
+        ptable = current.s3db[PRESENCE]
+
+        # Latest = no later presence before timestmp
+        later = ptable.with_alias("sit_presence_later")
+        left = later.on((later[TRACK_ID] == ptable[TRACK_ID]) & \
+                        (later.deleted == False) & \
+                        (later.timestmp <= timestmp) & \
+                        (later.timestmp > ptable.timestmp))
+        query = (ptable[TRACK_ID].belongs(track_ids)) & \
+                (ptable.deleted == False) & \
+                (ptable.timestmp <= timestmp) & \
+                (later.id == None)
+        rows = db(query).select(ptable.id,
+                                ptable[TRACK_ID],
+                                ptable.location_id,
+                                ptable.interlock,
+                                left=left,
+                                orderby=ptable.id,
+                                )
+
+        presences = dict((track_id, None) for track_id in track_ids)
+        for row in rows:
+            # Same timestmp => the last recorded wins
+            presences[row[TRACK_ID]] = row
+        return presences
+
+    # -------------------------------------------------------------------------
+    def __get_interlocks(self, interlocks):
+        """
+            Look up the instances the trackables are checked-in to
+
+            @param interlocks: the interlocks ("tablename,record_id")
+
+            @return: dict {interlock: {TRACK_ID: track_id,
+                                       LOCATION_ID: location_id}}
+        """
+
+        db = current.db
+        s3db = current.s3db
+
+        record_ids = {}
+        for interlock in interlocks:
+            tablename, record_id = interlock.split(",", 1)
+            try:
+                record_ids.setdefault(tablename, []).append(long(record_id))
+            except ValueError:
+                continue
+
+        targets = {}
+        for tablename, ids in record_ids.items():
+            table = s3db.table(tablename)
+            if table is None:
+                continue
+            fields = self.__get_fields(table, super_entity=False)
+            if fields is None:
+                continue
+            rows = db(table._id.belongs(ids)).select(table._id,
+                                                     *[table[f] for f in fields])
+            for row in rows:
+                interlock = "%s,%s" % (tablename, row[table._id.name])
+                targets[interlock] = {TRACK_ID: row[TRACK_ID] \
+                                                if TRACK_ID in row else None,
+                                      LOCATION_ID: row[LOCATION_ID] \
+                                                   if LOCATION_ID in row else None,
+                                      }
+        return targets
+
+    # -------------------------------------------------------------------------
+    def __get_base_locations(self, track_ids):
+        """
+            Look up the base locations of trackables from their instances
+
+            @param track_ids: the track IDs
+
+            @return: dict {track_id: location_id}
+        """
+
+        if not track_ids:
+            return {}
+
+        db = current.db
+        s3db = current.s3db
+
+        table = self.table
+        rows = db(table[TRACK_ID].belongs(track_ids)).select(table[TRACK_ID],
+                                                             table.instance_type)
+        types = {}
+        for row in rows:
+            types.setdefault(row.instance_type, []).append(row[TRACK_ID])
+
+        base = {}
+        for instance_type, ids in types.items():
+            itable = s3db.table(instance_type)
+            if itable is None or LOCATION_ID not in itable.fields:
+                continue
+            rows = db(itable[TRACK_ID].belongs(ids)).select(itable[TRACK_ID],
+                                                            itable[LOCATION_ID])
+            for row in rows:
+                base[row[TRACK_ID]] = row[LOCATION_ID]
+        return base
+
     # -------------------------------------------------------------------------
     def set_location(self, location, timestmp=None):
         """
@@ -366,6 +366,42 @@ def s3_dev_toolbar():
 
     u = web2py_uuid()
     backtotop = A("Back to top", _href="#totop-%s" % u)
+
+    # Instrumentation data (settings.base.instrument)
+    from s3instrument import S3Instrument
+    report = S3Instrument.report()
+    if report:
+        components = report["components"]
+        timing = TABLE(THEAD(TR(TH("component"),
+                                TH("calls"),
+                                TH("time"),
+                                TH("queries"),
+                                TH("query time"),
+                                )),
+                       TBODY([TR(name,
+                                 data["calls"],
+                                 "%.2fms" % (data["time"] * 1000),
+                                 data["queries"],
+                                 "%.2fms" % (data["query_time"] * 1000),
+                                 )
+                              for name, data in sorted(components.items())]),
+                       TFOOT(TR("total",
+                                "",
+                                "%.2fms" % (report["time"] * 1000),
+                                report["queries"],
+                                "%.2fms" % (report["query_time"] * 1000),
+                                )),
+                       )
+        top_queries = TABLE([TR(PRE(q["sql"]),
+                                q["component"],
+                                "%.2fms" % (q["time"] * 1000))
+                             for q in report["top_queries"]])
+        timing_button = BUTTON("timing",
+                               _onclick="$('#timing-%s').slideToggle().removeClass('hide')" % u)
+        timing = DIV(timing, top_queries, backtotop,
+                     _class="hide", _id="timing-%s" % u)
+    else:
+        timing_button = timing = ""
     # Convert lazy request.vars from property to Storage so they
     # will be displayed in the toolbar.
     request = copy.copy(current.request)
@@ -384,6 +420,7 @@ def s3_dev_toolbar():
                _onclick="$('#db-tables-%s').slideToggle().removeClass('hide')" % u),
         BUTTON("db stats",
                _onclick="$('#db-stats-%s').slideToggle().removeClass('hide')" % u),
+        timing_button,
         DIV(BEAUTIFY(request), backtotop,
             _class="hide", _id="request-%s" % u),
         #DIV(BEAUTIFY(current.response), backtotop,
@@ -394,6 +431,7 @@ def s3_dev_toolbar():
             _class="hide", _id="db-tables-%s" % u),
         DIV(BEAUTIFY(dbstats), backtotop,
             _class="hide", _id="db-stats-%s" % u),
+        timing,
         _id="totop-%s" % u
     )
 
@@ -697,12 +735,16 @@ def s3_URLise(text):
     return output
     
 # =============================================================================
-def s3_avatar_represent(id, tablename="auth_user", gravatar=False, **attr):
+def s3_avatar_represent(id, tablename="auth_user", gravatar=False,
+                        image=None, **attr):
     """
         Represent a User as their profile picture or Gravatar
 
         @param tablename: either "auth_user" or "pr_person" depending on which
                           table the 'id' refers to
+        @param image: the profile image if already looked up (e.g. in bulk
+                      for a data list), or False if there is none, to skip
+                      the lookup (unless using Gravatar)
         @param attr: additional HTML attributes for the IMG(), such as _class
     """
 
@@ -713,9 +755,11 @@ def s3_avatar_represent(id, tablename="auth_user", gravatar=False, **attr):
     table = s3db[tablename]
 
     email = None
-    image = None
 
-    if tablename == "auth_user":
+    if image is not None and not gravatar:
+        # Profile image already known
+        pass
+    elif tablename == "auth_user":
         user = db(table.id == id).select(table.email,
                                          limitby=(0, 1),
                                          cache=cache).first()
@@ -80,6 +80,7 @@ from gluon.languages import lazyT
 from gluon.storage import Storage
 from gluon.validators import Validator
 
+from s3instrument import S3Instrument
 from s3utils import S3DateTime, s3_orderby_fields, s3_unicode, s3_validate
     
 def translate(text):
@@ -506,8 +507,20 @@ class IS_ONE_OF_EMPTY(Validator):
             No 'options' method as designed to be called next to an
             Autocomplete field so don't download a large dropdown
             unnecessarily.
+
+        For large lookup tables, the validator can be set "lazy": it will
+        then never retrieve the complete set of options, but validate by
+        key lookup (applying the same rules as for the options), and
+        deliver options only page-wise/by search string (lookup method,
+        see S3LazyOptionsWidget) - as long as the table is small, the
+        complete set of options is still available for dropdowns.
     """
 
+    # Maximum number of records in lookup tables for which the option
+    # lists can be cached (settings.ui.options_cache), or built for
+    # lazy validators
+    CACHE_MAX = 1000
+
     def __init__(self,
                  dbset,
                  field,
@@ -526,6 +539,7 @@ class IS_ONE_OF_EMPTY(Validator):
                  multiple=False,
                  zero="",
                  sort=True,
+                 lazy=False,
                  _and=None,
                  ):
         """
@@ -559,6 +573,10 @@ class IS_ONE_OF_EMPTY(Validator):
             @param multiple: allow multiple values (for list:reference types)
             @param zero: add this as label for the None-option (allow selection of "None")
             @param sort: sort options alphabetically by their label
+            @param lazy: never build the complete set of options, but
+                         validate by key lookup and provide options only
+                         via the lookup method (unless the lookup table
+                         is small, see is_lazy)
             @param _and: internal use
         """
 
@@ -623,6 +641,8 @@ class IS_ONE_OF_EMPTY(Validator):
         self.multiple = multiple
         self.zero = zero
         self.sort = sort
+        self.lazy = lazy
+        self._lazy = None
         self._and = _and
 
         self.filterby = filterby
@@ -659,53 +679,38 @@ class IS_ONE_OF_EMPTY(Validator):
             self.not_filter_opts = not_filter_opts
 
     # -------------------------------------------------------------------------
+    @S3Instrument.trace("IS_ONE_OF")
     def build_set(self):
 
         dbset = self.dbset
         db = dbset._db
 
-        ktablename = self.ktable
-        if ktablename not in db:
-            table = current.s3db.table(ktablename, db_only=True)
-        else:
-            table = db[ktablename]
+        table = self.lookup_table()
         if table:
-            if self.fields == "all":
-                fields = [table[f] for f in table.fields if f not in ("wkt", "the_geom")]
-            else:
-                fieldnames = [f.split(".")[1] if "." in f else f for f in self.fields]
-                fields = [table[k] for k in fieldnames if k in table.fields]
+            fields = self.lookup_fields(table)
             if db._dbname not in ("gql", "gae"):
-                orderby = self.orderby or reduce(lambda a, b: a|b, fields)
-                groupby = self.groupby
-                
-                dd = dict(orderby=orderby, groupby=groupby)
-                query, left = self.query(table, fields=fields, dd=dd)
-
-                if left is not None:
-                    if self.left is not None:
-                        if not isinstance(left, list):
-                            left = [left]
-                        ljoins = [str(join) for join in self.left]
-                        for join in left:
-                            ljoin = str(join)
-                            if ljoin not in ljoins:
-                                self.left.append(join)
-                                ljoins.append(ljoin)
+                dd = {}
+                query, left = self.lookup_query(table, fields, dd)
+                dbset = dbset(query)
+
+                def build():
+                    records = dbset.select(distinct=True, *fields, **dd)
+                    theset = [str(r[self.kfield]) for r in records]
+                    labels = self.represent_rows(table, records)
+                    return theset, labels
+
+                # Cache the options of small tables?
+                expire = current.deployment_settings.get_ui_options_cache()
+                if expire:
+                    key = self.cache_key(table, dbset, fields, dd)
+                    if key:
+                        theset, labels = current.cache.ram(key, build,
+                                                           time_expire=expire)
                     else:
-                        self.left = left
-                if self.left is not None:
-                    dd.update(left=self.left)
-                    
-                # Make sure we have all ORDERBY fields in the query
-                # (otherwise postgresql will complain)
-                fieldnames = [str(f) for f in fields]
-                for f in s3_orderby_fields(table, dd.get("orderby")):
-                    if str(f) not in fieldnames:
-                        fields.append(f)
-                        fieldnames.append(str(f))
-
-                records = dbset(query).select(distinct=True, *fields, **dd)
+                        theset, labels = build()
+                else:
+                    theset, labels = build()
+                self.theset, self.labels = list(theset), list(labels)
             else:
                 # Note this does not support filtering.
                 orderby = self.orderby or \
@@ -715,34 +720,10 @@ class IS_ONE_OF_EMPTY(Validator):
                 #dd = dict(orderby=orderby, cache=(current.cache.ram, 60))
                 dd = dict(orderby=orderby)
                 records = dbset.select(db[self.ktable].ALL, **dd)
-            self.theset = [str(r[self.kfield]) for r in records]
-            label = self.label
-            try:
-                # Is callable
-                if hasattr(label, "bulk"):
-                    # S3Represent => use bulk option
-                    d = label.bulk(None,
-                                   rows=records,
-                                   list_type=False,
-                                   show_link=False)
-                    labels = [d.get(r[self.kfield], d[None]) for r in records]
-                else:
-                    # Standard representation function
-                    labels = map(label, records)
-            except TypeError:
-                if isinstance(label, str):
-                    labels = map(lambda r: label % dict(r), records)
-                elif isinstance(label, (list, tuple)):
-                    labels = map(lambda r: \
-                                 " ".join([r[l] for l in label if l in r]),
-                                 records)
-                elif "name" in table:
-                    labels = map(lambda r: r.name, records)
-                else:
-                    labels = map(lambda r: r[self.kfield], records)
-            self.labels = labels
+                self.theset = [str(r[self.kfield]) for r in records]
+                self.labels = self.represent_rows(table, records)
 
-            if labels and self.sort:
+            if self.labels and self.sort:
 
                 items = zip(self.theset, self.labels)
                 
@@ -767,6 +748,268 @@ class IS_ONE_OF_EMPTY(Validator):
             self.theset = None
             self.labels = None
 
+    # -------------------------------------------------------------------------
+    def is_lazy(self):
+        """
+            Check whether the options must be looked up lazily, i.e. the
+            validator is lazy and the lookup table is too large to build
+            the complete set of options (more than CACHE_MAX records) -
+            otherwise dropdowns can still show all options
+
+            @return: True|False
+        """
+
+        if not self.lazy:
+            return False
+        if self._lazy is None:
+            table = self.lookup_table()
+            if table:
+                count = self.dbset._db(table._id > 0).count()
+                self._lazy = count > self.CACHE_MAX
+            else:
+                self._lazy = False
+        return self._lazy
+
+    # -------------------------------------------------------------------------
+    def lookup_table(self):
+        """ Get the lookup table (None if not available) """
+
+        db = self.dbset._db
+        ktablename = self.ktable
+        if ktablename not in db:
+            return current.s3db.table(ktablename, db_only=True)
+        else:
+            return db[ktablename]
+
+    # -------------------------------------------------------------------------
+    def lookup_fields(self, table):
+        """
+            Get the fields to retrieve from the lookup table
+
+            @param table: the lookup table
+        """
+
+        if self.fields == "all":
+            fields = [table[f] for f in table.fields if f not in ("wkt", "the_geom")]
+        else:
+            fieldnames = [f.split(".")[1] if "." in f else f for f in self.fields]
+            fields = [table[k] for k in fieldnames if k in table.fields]
+        return fields
+
+    # -------------------------------------------------------------------------
+    def lookup_query(self, table, fields, dd):
+        """
+            Get the query for the options lookup, with orderby, groupby
+            and left joins
+
+            @param table: the lookup table
+            @param fields: the fields to retrieve (updatable list)
+            @param dd: the select options (updatable dict)
+        """
+
+        orderby = self.orderby or reduce(lambda a, b: a|b, fields)
+        dd.update(orderby=orderby, groupby=self.groupby)
+        query, left = self.query(table, fields=fields, dd=dd)
+
+        if left is not None:
+            if self.left is not None:
+                if not isinstance(left, list):
+                    left = [left]
+                ljoins = [str(join) for join in self.left]
+                for join in left:
+                    ljoin = str(join)
+                    if ljoin not in ljoins:
+                        self.left.append(join)
+                        ljoins.append(ljoin)
+            else:
+                self.left = left
+        if self.left is not None:
+            dd.update(left=self.left)
+
+        # Make sure we have all ORDERBY fields in the query
+        # (otherwise postgresql will complain)
+        fieldnames = [str(f) for f in fields]
+        for f in s3_orderby_fields(table, dd.get("orderby")):
+            if str(f) not in fieldnames:
+                fields.append(f)
+                fieldnames.append(str(f))
+
+        return query, left
+
+    # -------------------------------------------------------------------------
+    def represent_rows(self, table, records):
+        """
+            Get the option labels for records from the lookup table
+
+            @param table: the lookup table
+            @param records: the records
+            @return: list of labels, in the order of the records
+        """
+
+        label = self.label
+        kfield = self.kfield
+        try:
+            # Is callable
+            if hasattr(label, "bulk"):
+                # S3Represent => use bulk option
+                d = label.bulk(None,
+                               rows=records,
+                               list_type=False,
+                               show_link=False)
+                labels = [d.get(r[kfield], d[None]) for r in records]
+            else:
+                # Standard representation function
+                labels = map(label, records)
+        except TypeError:
+            if isinstance(label, str):
+                labels = map(lambda r: label % dict(r), records)
+            elif isinstance(label, (list, tuple)):
+                labels = map(lambda r: \
+                             " ".join([r[l] for l in label if l in r]),
+                             records)
+            elif "name" in table:
+                labels = map(lambda r: r.name, records)
+            else:
+                labels = map(lambda r: r[kfield], records)
+        return labels
+
+    # -------------------------------------------------------------------------
+    def cache_key(self, table, dbset, fields, dd):
+        """
+            Get the key to cache the options in RAM, which depends on the
+            SQL (including the user's accessible-query), the language and
+            the current version of the lookup table
+
+            @param table: the lookup table
+            @param dbset: the Set of options
+            @param fields: the fields to retrieve
+            @param dd: the select options
+
+            @return: the cache key, or None if the table is too large
+        """
+
+        left = dd.get("left")
+        if left is not None and not isinstance(left, (list, tuple)):
+            left = [left]
+
+        # Left joins can multiply the rows
+        count = table._id.count(distinct=True) if left else table._id.count()
+        aggregates = [count]
+
+        # Latest modification of the lookup table and the joined tables
+        # (which can be used in the labels)
+        tables = [table]
+        if left:
+            for join in left:
+                ktable = getattr(join, "first", None)
+                if ktable is not None and ktable not in tables:
+                    tables.append(ktable)
+        modified = []
+        for t in tables:
+            if "modified_on" in getattr(t, "fields", ()):
+                modified.append(t.modified_on.max())
+        aggregates.extend(modified)
+
+        row = dbset.select(left=left, *aggregates).first()
+        if not row or row[count] > self.CACHE_MAX:
+            return None
+        version = "-".join([str(row[count])] +
+                           [str(row[m]) for m in modified])
+
+        import hashlib
+        sql = dbset._select(distinct=True, *fields, **dd)
+        language = current.T.accepted_language
+        key = hashlib.md5("%s|%s|%s" % (sql, language, version)).hexdigest()
+        return "%s_options_%s" % (table._tablename, key)
+
+    # -------------------------------------------------------------------------
+    @S3Instrument.trace("IS_ONE_OF")
+    def lookup(self, search=None, start=0, limit=None):
+        """
+            Lazy options lookup: retrieve a page of options, optionally
+            filtered by a search string, applying the same rules as for
+            the complete set of options
+
+            @param search: search string to match against the label
+                           fields (requires a string template or
+                           a standard-lookup S3Represent as label)
+            @param start: index of the first option
+            @param limit: maximum number of options
+
+            @return: list of tuples (key, label)
+        """
+
+        table = self.lookup_table()
+        if not table:
+            return []
+
+        fields = self.lookup_fields(table)
+        dd = {}
+        query, left = self.lookup_query(table, fields, dd)
+
+        if search:
+            search = s3_unicode(search).lower().encode("utf-8")
+            subquery = None
+            for field in fields:
+                if field.name == self.kfield or \
+                   field.type not in ("string", "text"):
+                    continue
+                q = field.lower().like("%%%s%%" % search)
+                subquery = q if subquery is None else subquery | q
+            if subquery is None:
+                return []
+            query &= subquery
+
+        if limit:
+            dd["limitby"] = (start, start + limit)
+        records = self.dbset(query).select(distinct=True, *fields, **dd)
+
+        keys = [str(r[self.kfield]) for r in records]
+        labels = self.represent_rows(table, records)
+        items = zip(keys, labels)
+        if self.sort:
+            items.sort(key=lambda item: s3_unicode(item[1]).lower())
+        return items
+
+    # -------------------------------------------------------------------------
+    @S3Instrument.trace("IS_ONE_OF")
+    def valid_keys(self, values):
+        """
+            Find out which of the values are keys of records in the lookup
+            table that match the rules for the options, by indexed key
+            lookup (one query for all values)
+
+            @param values: list of values
+            @return: set of the valid values (as strings)
+        """
+
+        table = self.lookup_table()
+        if not table or not values:
+            return set()
+
+        query, left = self.query(table)
+        if self.left is not None:
+            left = self.left
+        field = table[self.kfield]
+        query &= field.belongs(values)
+        rows = self.dbset(query).select(field, left=left, distinct=True)
+        return set(str(row[self.kfield]) for row in rows)
+
+    # -------------------------------------------------------------------------
+    def validate_keys(self, values):
+        """
+            Lazy validation: verify that all values are keys of records
+            in the lookup table which match the rules for the options
+
+            @param values: list of values
+            @return: True if all values are valid options, else False
+        """
+
+        if not values:
+            return False
+        found = self.valid_keys(values)
+        return all(str(v) in found for v in values)
+
     # -------------------------------------------------------------------------
     def query(self, table, fields=None, dd=None):
         """
@@ -951,6 +1194,10 @@ class IS_ONE_OF_EMPTY(Validator):
                         return (values, None)
                     else:
                         return (value, self.error_message)
+                elif self.lazy:
+                    if values and not self.validate_keys(values):
+                        return (value, self.error_message)
+                    return (values, None)
                 else:
                     field = table[self.kfield]
                     query = None
@@ -972,6 +1219,12 @@ class IS_ONE_OF_EMPTY(Validator):
                         return self._and(value)
                     else:
                         return (value, None)
+            elif self.lazy:
+                if self.validate_keys([value]):
+                    if self._and:
+                        return self._and(value)
+                    else:
+                        return (value, None)
             else:
                 values = [value]
                 query = None
@@ -1003,6 +1256,13 @@ class IS_ONE_OF(IS_ONE_OF_EMPTY):
 
     def options(self, zero=True):
 
+        if self.is_lazy():
+            # Options are provided via lookup()
+            items = []
+            if zero and self.zero is not None and not self.multiple:
+                items.insert(0, ("", self.zero))
+            return items
+
         self.build_set()
         theset, labels = self.theset, self.labels
         if theset is None or labels is None:
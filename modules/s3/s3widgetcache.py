@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+
+""" S3 Widget Render Cache
+
+    @copyright: 2014 (c) Sahana Software Foundation
+    @license: MIT
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+
+    @status: experimental
+"""
+
+__all__ = ["S3WidgetCache"]
+
+import hashlib
+import re
+from datetime import timedelta
+
+try:
+    import json # try stdlib (Python 2.6)
+except ImportError:
+    try:
+        import simplejson as json # try external module
+    except:
+        import gluon.contrib.simplejson as json # fallback to pure-Python module
+
+from gluon import current, HTTP, XML
+from gluon.storage import Storage
+
+from s3utils import s3_get_foreign_key
+
+AGGREGATE = re.compile("([a-zA-Z]+)\((.*)\)\Z")
+
+# =============================================================================
+class S3WidgetCache(object):
+    """
+        Render cache for the data widgets of summary and profile pages
+        (settings.ui.widget_cache), so that page loads and Ajax-refreshes
+        of these pages do not need to extract and represent the same
+        records again as long as they haven't changed.
+
+        Entries are keyed by the request (URL + vars), the widget, the
+        user (realms, delegations and user ID, because layouts can depend
+        on record ownership), the version of the ACLs and the language,
+        and get removed when records in any of the tables the widget
+        depends upon are written (see invalidate()), or when they are
+        older than the configured expiry time.
+
+        Widgets often register scripts or session data while rendering
+        (e.g. S3DataTable, S3ReportForm), so the additions to the top-level
+        attributes of response.s3 and session.s3 are stored with the HTML,
+        and replayed when serving from the cache. Widgets with additions
+        which can not be stored as JSON are not cached.
+
+        Only datatable, datalist and report widgets are cached, widgets
+        can opt out with "cache": False in their config, and can declare
+        further tables they depend on with "cache_tables": [tablename, ...].
+
+        Datalists with a custom list_layout are only cached if the layout
+        declares the tables it renders data from besides the list fields
+        (layout.cache_tables, like layout.prefetch), because the layout
+        can look up anything.
+    """
+
+    TABLENAME = "s3_widget_cache"
+
+    # Widget methods which can be cached
+    CACHEABLE = ("datatable", "datalist", "report")
+
+    # -------------------------------------------------------------------------
+    def __init__(self, r, widget_id, method, tablename=None, config=None,
+                 visible=True):
+        """
+            Constructor
+
+            @param r: the S3Request
+            @param widget_id: the widget ID
+            @param method: the widget method/type
+            @param tablename: the table of the widget resource
+                              (default: r.tablename)
+            @param config: the widget configuration (dict)
+            @param visible: whether the widget is initially visible
+        """
+
+        self.r = r
+        self.widget_id = widget_id
+        self.method = method
+        self.tablename = tablename or r.tablename
+        self.config = config or {}
+        self.visible = visible
+
+        self.key = self.cache_key(r, "%s|%s|%s|%s" % (widget_id,
+                                                      method,
+                                                      self.tablename,
+                                                      visible))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def enabled(cls, r, method, config=None):
+        """
+            Check whether the cache can be used for a widget
+
+            @param r: the S3Request
+            @param method: the widget method/type
+            @param config: the widget configuration (dict)
+        """
+
+        if not current.deployment_settings.get_ui_widget_cache():
+            return False
+        if config and config.get("cache") is False:
+            return False
+        return method in cls.CACHEABLE and \
+               r.http == "GET" and \
+               r.representation in ("html", "iframe", "dl")
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def cache_key(r, widget):
+        """
+            Generate the cache key for a widget
+
+            @param r: the S3Request
+            @param widget: the widget identifier (string)
+        """
+
+        get_vars = r.get_vars
+        items = ["%s=%s" % (k, get_vars[k])
+                 for k in sorted(get_vars.keys()) if k != "_"]
+
+        # Realms and delegations of the user (= the records the user can
+        # see), and the version of the ACLs (= what the user can do with
+        # them, e.g. action buttons)
+        auth = current.auth
+        if auth.override:
+            realms = "override"
+        else:
+            if auth.user:
+                realms = []
+                for group_id, entities in (auth.user.realms or {}).items():
+                    if entities is not None:
+                        entities = sorted(entities)
+                    realms.append((group_id, entities))
+                delegations = []
+                for group_id, entities in \
+                    (auth.user.delegations or {}).items():
+                    if entities is not None:
+                        entities = sorted(entities.items())
+                    delegations.append((group_id, entities))
+                realms = "%s:%s:%s" % (auth.user.id,
+                                       sorted(realms),
+                                       sorted(delegations))
+            else:
+                realms = "anonymous"
+            realms = "%s:%s" % (realms, auth.permission.acl_version())
+
+        request = current.request
+        language = current.session.s3.language
+        key = "%s/%s/%s.%s|%s|%s|%s|%s" % (request.controller,
+                                           request.function,
+                                           "/".join(request.args),
+                                           r.representation,
+                                           "&".join(items),
+                                           widget,
+                                           realms,
+                                           language)
+        return hashlib.md5(key).hexdigest()
+
+    # -------------------------------------------------------------------------
+    def render(self, renderer, etag=False):
+        """
+            Render the widget, or serve it from the cache
+
+            @param renderer: function to render the widget (no arguments)
+            @param etag: send an ETag and respond with 304 Not Modified
+                         if the client already has this version (for
+                         Ajax-requests which return only this widget)
+
+            @return: the widget (XML), or the output of the renderer
+                     if it can not be cached
+        """
+
+        if self.layout_tables() is None:
+            # Layout with undeclared dependencies
+            return renderer()
+
+        entry = self.get()
+        if entry:
+            self.replay(entry.effects)
+            if etag:
+                self.serve(entry.version)
+            return XML(entry.output)
+
+        before = self.snapshot()
+        output = renderer()
+        if output is None or isinstance(output, dict):
+            return output
+
+        effects = self.effects(before)
+        if effects is None:
+            return output
+
+        if hasattr(output, "xml"):
+            output = output.xml()
+        elif isinstance(output, unicode):
+            output = output.encode("utf-8")
+        else:
+            output = str(output)
+        version = self.store(output, effects)
+        if etag:
+            self.serve(version)
+        return XML(output)
+
+    # -------------------------------------------------------------------------
+    def get(self):
+        """
+            Get the cached entry for this widget
+
+            @return: the entry (Row with output, effects and version),
+                     or None if not cached
+        """
+
+        table = current.s3db[self.TABLENAME]
+        query = (table.cache_key == self.key)
+        expiry = current.deployment_settings.get_ui_widget_cache()
+        if expiry is not True:
+            earliest = current.request.utcnow - timedelta(seconds=expiry)
+            query &= (table.created_on > earliest)
+        return current.db(query).select(table.output,
+                                        table.effects,
+                                        table.version,
+                                        limitby=(0, 1)).first()
+
+    # -------------------------------------------------------------------------
+    def store(self, output, effects):
+        """
+            Store the rendered widget in the cache
+
+            @param output: the HTML (string)
+            @param effects: the additions to response.s3 and session.s3
+                            (see effects())
+
+            @return: the version hash of the entry
+        """
+
+        version = hashlib.md5(output)
+        version.update(json.dumps(effects, sort_keys=True))
+        version = version.hexdigest()
+
+        table = current.s3db[self.TABLENAME]
+        current.db(table.cache_key == self.key).delete()
+        table.insert(cache_key=self.key,
+                     tables=list(self.tables()),
+                     output=output,
+                     effects=effects,
+                     version=version)
+        return version
+
+    # -------------------------------------------------------------------------
+    def layout_tables(self):
+        """
+            Get the tables which the list layout of a datalist declares
+            to render data from (besides the list fields)
+
+            @return: list of tablenames, or None if the widget uses a
+                     custom layout which does not declare its tables
+        """
+
+        if self.method != "datalist":
+            return []
+        layout = self.config.get("list_layout") or \
+                 current.s3db.get_config(self.tablename, "list_layout")
+        if layout is None:
+            # Default layout renders only the list fields
+            return []
+        return getattr(layout, "cache_tables", None)
+
+    # -------------------------------------------------------------------------
+    def tables(self):
+        """
+            Determine the tables the widget depends on: the widget table,
+            the tables of its list fields or report axes, the tables which
+            these fields reference (for representation), and the tables
+            declared by the widget config or the list layout
+
+            @return: set of tablenames
+        """
+
+        r = self.r
+        config = self.config
+        tablename = self.tablename
+
+        tables = set([tablename, r.tablename])
+        tables |= set(config.get("cache_tables") or [])
+        tables |= set(self.layout_tables() or [])
+
+        resource = current.s3db.resource(tablename)
+        get_config = resource.get_config
+
+        selectors = []
+        if self.method == "report":
+            report_options = get_config("report_options") or {}
+            for key in ("rows", "cols", "fact"):
+                selectors.extend(self._selectors(report_options.get(key)))
+                selectors.extend(self._selectors(r.get_vars.get(key)))
+            defaults = report_options.get("defaults") or {}
+            for value in defaults.values():
+                selectors.extend(self._selectors(value))
+        else:
+            list_fields = config.get("list_fields") or \
+                          get_config("list_fields") or []
+            selectors.extend(self._selectors(list_fields))
+
+        for selector in selectors:
+            try:
+                rfield = resource.resolve_selector(selector)
+            except (AttributeError, KeyError, SyntaxError):
+                continue
+            tables.add(rfield.tname)
+            if rfield.join:
+                tables |= set(rfield.join.keys())
+            if rfield.field is not None:
+                ktablename = s3_get_foreign_key(rfield.field)[0]
+                if ktablename:
+                    tables.add(ktablename)
+        return tables
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _selectors(value):
+        """
+            Extract the field selectors from a list_fields or report
+            options value
+
+            @param value: the value (string, tuple or list)
+            @return: list of selectors
+        """
+
+        if not value:
+            return []
+        if isinstance(value, basestring):
+            selectors = []
+            for selector in value.split(","):
+                m = AGGREGATE.match(selector)
+                if m:
+                    selector = m.group(2)
+                selectors.append(selector)
+            return selectors
+        if isinstance(value, tuple):
+            # (label, selector)
+            return S3WidgetCache._selectors(value[-1])
+        if isinstance(value, list):
+            selectors = []
+            for item in value:
+                selectors.extend(S3WidgetCache._selectors(item))
+            return selectors
+        return []
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def snapshot():
+        """
+            Take a snapshot of the top-level attributes of response.s3
+            and session.s3 before rendering a widget
+
+            @return: tuple of dicts (response, session)
+        """
+
+        snapshot = lambda storage: dict((k, list(v) if type(v) is list else v)
+                                        for k, v in storage.items())
+        return (snapshot(current.response.s3),
+                snapshot(current.session.s3))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def effects(before):
+        """
+            Determine the additions to response.s3 and session.s3 since
+            a snapshot
+
+            @param before: the snapshot (see snapshot())
+            @return: dict {"response": {"append": {}, "set": {}},
+                           "session": {"append": {}, "set": {}}},
+                     or None if the additions can not be stored
+        """
+
+        effects = {}
+        for name, storage, old in (("response", current.response.s3, before[0]),
+                                   ("session", current.session.s3, before[1])):
+            append = {}
+            assign = {}
+            if set(old.keys()) - set(storage.keys()):
+                # Attribute removed
+                return None
+            for key, value in storage.items():
+                if key in old:
+                    previous = old[key]
+                    if type(value) is list and type(previous) is list:
+                        if value[:len(previous)] != previous:
+                            return None
+                        if len(value) > len(previous):
+                            append[key] = value[len(previous):]
+                        continue
+                    if value is previous or value == previous:
+                        continue
+                assign[key] = value
+            effects[name] = {"append": append, "set": assign}
+
+        try:
+            json.dumps(effects)
+        except (TypeError, ValueError):
+            return None
+        return effects
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def replay(effects):
+        """
+            Apply the stored additions to response.s3 and session.s3
+            when serving a widget from the cache
+
+            @param effects: the additions (see effects())
+        """
+
+        if not effects:
+            return
+        if isinstance(effects, basestring):
+            effects = json.loads(effects)
+        for name, storage in (("response", current.response.s3),
+                              ("session", current.session.s3)):
+            changes = effects.get(name)
+            if not changes:
+                continue
+            for key, items in changes["append"].items():
+                values = storage.get(key)
+                if type(values) is not list:
+                    values = storage[key] = []
+                values.extend(item for item in items if item not in values)
+            for key, value in changes["set"].items():
+                if type(value) is dict:
+                    value = Storage(value)
+                storage[key] = value
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def serve(version):
+        """
+            Set the ETag for a widget version, so that browsers can
+            revalidate Ajax-refreshes with If-None-Match
+
+            @param version: the version hash
+
+            @raise: HTTP 304 if the client already has this version
+        """
+
+        etag = '"%s"' % version
+        headers = {"ETag": etag,
+                   # Cache, but revalidate with the server every time
+                   "Cache-Control": "private, no-cache",
+                   }
+        if current.request.env.http_if_none_match == etag:
+            raise HTTP(304, **headers)
+        current.response.headers.update(headers)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, tablename):
+        """
+            Remove all cache entries which depend on a table, to be called
+            after writing records in that table
+
+            @param tablename: the tablename, or a list of tablenames
+        """
+
+        if not tablename or \
+           not current.deployment_settings.get_ui_widget_cache():
+            return
+        if not isinstance(tablename, (list, tuple, set)):
+            tablename = [tablename]
+        table = current.s3db[cls.TABLENAME]
+        current.db(table.tables.contains(list(tablename), all=False)).delete()
+
+# END =========================================================================
@@ -50,6 +50,7 @@ __all__ = ["S3ACLWidget",
            "S3ImageCropWidget",
            "S3InvBinWidget",
            "S3KeyValueWidget",
+           "S3LazyOptionsWidget",
            # Only used inside this module
            #"S3LatLonWidget",
            "S3LocationAutocompleteWidget",
@@ -1087,6 +1088,75 @@ class S3AutocompleteWidget(FormWidget):
                        requires = field.requires
                        )
 
+# =============================================================================
+class S3LazyOptionsWidget(FormWidget):
+    """
+        Renders a reference field with a lazy IS_ONE_OF validator as
+        an INPUT field with AJAX Autocomplete, retrieving the options
+        page by page from the options method of the resource, e.g.:
+
+        /org/office/options.s3json?field=organisation_id&term=red&limit=20
+
+        Falls back to a standard dropdown if the validator is not lazy,
+        or the lookup table is small enough to show all options.
+    """
+
+    def __init__(self,
+                 c = None,
+                 f = None,
+                 limit = 20,
+                 post_process = "",
+                 delay = 450,       # milliseconds
+                 min_length = 2):
+        """
+            Constructor
+
+            @param c: the controller for the options lookup (defaults
+                      to the prefix of the field's table)
+            @param f: the function for the options lookup (defaults
+                      to the name of the field's table)
+            @param limit: maximum number of options per lookup
+            @param post_process: JavaScript to run after a selection
+            @param delay: the delay before the lookup (milliseconds)
+            @param min_length: minimum number of characters to look up
+        """
+
+        self.c = c
+        self.f = f
+        self.limit = limit
+        self.post_process = post_process
+        self.delay = delay
+        self.min_length = min_length
+
+    def __call__(self, field, value, **attributes):
+
+        requires = field.requires
+        if isinstance(requires, (list, tuple)):
+            requires = requires[0] if requires else None
+        if isinstance(requires, IS_EMPTY_OR):
+            requires = requires.other
+        is_lazy = getattr(requires, "is_lazy", None)
+        if not is_lazy or not is_lazy():
+            return OptionsWidget.widget(field, value, **attributes)
+
+        prefix, name = field._tablename.split("_", 1)
+        source = URL(c = self.c or prefix,
+                     f = self.f or name,
+                     args = ["options.s3json"],
+                     vars = {"field": field.name,
+                             "limit": self.limit,
+                             },
+                     )
+
+        return S3GenericAutocompleteTemplate(self.post_process,
+                                             self.delay,
+                                             self.min_length,
+                                             field,
+                                             value,
+                                             attributes,
+                                             source = source,
+                                             )
+
 # =============================================================================
 class S3BooleanWidget(BooleanWidget):
     """
@@ -1831,7 +1901,7 @@ def S3GenericAutocompleteTemplate(post_process,
                  min_length = min_length,
                  )
     else:
-        # Currently unused
+        # S3LazyOptionsWidget
         script = \
 '''S3.autocomplete.generic('%(url)s','%(input)s',"%(postprocess)s",%(delay)s,%(min_length)s)''' % \
             dict(url = source,
@@ -4358,7 +4428,20 @@ class S3LocationSelectorWidget2(FormWidget):
 
         # Build initial location_dict
         # Read all visible levels
-        if "L0" in levels:
+        from s3gis import S3LocationData
+        use_store = S3LocationData.enabled()
+        if use_store:
+            # Only read the L0s here, children of the selected
+            # Lx are read from the precomputed store (see below)
+            query = None
+            if "L0" in levels:
+                query = (gtable.level == "L0")
+                if len(countries):
+                    ttable = s3db.gis_location_tag
+                    query &= ((ttable.tag == "ISO2") & \
+                              (ttable.value.belongs(countries)) & \
+                              (ttable.location_id == gtable.id))
+        elif "L0" in levels:
             query = (gtable.level == "L0")
             if len(countries):
                 ttable = s3db.gis_location_tag
@@ -4426,28 +4509,31 @@ class S3LocationSelectorWidget2(FormWidget):
             query = (gtable.level == "L5") & \
                     (gtable.parent == L4)
 
-        query &= (gtable.deleted == False)
-
-        fields = [gtable.id,
-                  gtable.name,
-                  gtable.level,
-                  gtable.parent,
-                  gtable.inherited,
-                  gtable.lat_min,
-                  gtable.lon_min,
-                  gtable.lat_max,
-                  gtable.lon_max,
-                  ]
-        if translate:
-            ntable = s3db.gis_location_name
-            fields.append(ntable.name_l10n)
-            left = ntable.on((ntable.deleted == False) & \
-                             (ntable.language == language) & \
-                             (ntable.location_id == gtable.id))
+        if query is not None:
+            query &= (gtable.deleted == False)
+
+            fields = [gtable.id,
+                      gtable.name,
+                      gtable.level,
+                      gtable.parent,
+                      gtable.inherited,
+                      gtable.lat_min,
+                      gtable.lon_min,
+                      gtable.lat_max,
+                      gtable.lon_max,
+                      ]
+            if translate:
+                ntable = s3db.gis_location_name
+                fields.append(ntable.name_l10n)
+                left = ntable.on((ntable.deleted == False) & \
+                                 (ntable.language == language) & \
+                                 (ntable.location_id == gtable.id))
+            else:
+                left = None
+            locations = db(query).select(*fields,
+                                         left=left)
         else:
-            left = None
-        locations = db(query).select(*fields,
-                                     left=left)
+            locations = []
 
         location_dict = {}
 
@@ -4533,6 +4619,16 @@ class S3LocationSelectorWidget2(FormWidget):
                                  ]
                 location_dict[int(l.id)] = data
 
+        if use_store:
+            for parent, level in ((L0, "L1"),
+                                  (L1, "L2"),
+                                  (L2, "L3"),
+                                  (L3, "L4"),
+                                  (L4, "L5"),
+                                  ):
+                if parent and level in levels:
+                    location_dict.update(S3LocationData.children(parent))
+
         if not location_selector_loaded:
             global_append = s3.js_global.append
             # @ToDo: Check whether relevant ls & ds in the previous instance of locationselector or need appending
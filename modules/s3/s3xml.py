@@ -38,6 +38,7 @@ import datetime
 import os
 import re
 import sys
+import threading
 import urllib2
 
 try:
@@ -203,6 +204,10 @@ class S3XML(S3Codec):
         text="$",
         )
 
+    # Compiled stylesheets and column mappings, per worker thread
+    # ({(kind, path): (mtime, object)})
+    _compiled = threading.local()
+
     # -------------------------------------------------------------------------
     def __init__(self):
         """ Constructor """
@@ -255,17 +260,27 @@ class S3XML(S3Codec):
             _args = dict([(k, "'%s'" % args[k]) for k in args])
         else:
             _args = None
-            
-        if isinstance(stylesheet_path, (etree._ElementTree, etree._Element)):
+
+        if isinstance(stylesheet_path, etree.XSLT):
+            # Compiled stylesheet
+            transformer = stylesheet_path
+        elif isinstance(stylesheet_path, (etree._ElementTree, etree._Element)):
             # Pre-parsed stylesheet
-            stylesheet = stylesheet_path
+            transformer = self.compile(stylesheet_path)
+        elif isinstance(stylesheet_path, basestring) and \
+             stylesheet_path.endswith(".json"):
+            # Column mapping => transform without XSLT
+            mapping = self.cached(stylesheet_path, "mapping",
+                                  S3CSVMapping.load)
+            if mapping is None:
+                self.error = "Invalid column mapping: %s" % stylesheet_path
+                return None
+            return mapping.transform(tree)
         else:
-            stylesheet = self.parse(stylesheet_path)
+            transformer = self.cached(stylesheet_path, "xslt", self.compile)
 
-        if stylesheet is not None:
+        if transformer is not None:
             try:
-                ac = etree.XSLTAccessControl(read_file=True, read_network=True)
-                transformer = etree.XSLT(stylesheet, access_control=ac)
                 if _args:
                     result = transformer(tree, **_args)
                 else:
@@ -276,9 +291,76 @@ class S3XML(S3Codec):
                 self.error = e
                 return None
         else:
-            # Error parsing the XSL stylesheet
+            # Error parsing/compiling the XSL stylesheet
+            return None
+
+    # -------------------------------------------------------------------------
+    def compile(self, stylesheet):
+        """
+            Compile an XSLT stylesheet
+
+            @param stylesheet: the stylesheet (element tree, pathname
+                               or stream)
+            @return: the compiled stylesheet (etree.XSLT), or None
+                     if the stylesheet cannot be parsed or compiled
+        """
+
+        if not isinstance(stylesheet, (etree._ElementTree, etree._Element)):
+            stylesheet = self.parse(stylesheet)
+            if stylesheet is None:
+                return None
+        try:
+            ac = etree.XSLTAccessControl(read_file=True, read_network=True)
+            return etree.XSLT(stylesheet, access_control=ac)
+        except:
+            e = sys.exc_info()[1]
+            self.error = e
             return None
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def cached(cls, path, kind, load):
+        """
+            Get an object loaded from a file (e.g. a compiled stylesheet)
+            from the cache, or load and cache it if the file has changed
+            since it was last loaded
+
+            @param path: the file path (or stream)
+            @param kind: the kind of object (cache key prefix)
+            @param load: function to load the object from path, returning
+                         None if the object cannot be loaded
+
+            @return: the object, or None if it cannot be loaded
+
+            @note: the cache is per worker thread (rather than shared
+                   between threads) as compiled XSLT can not safely be
+                   used concurrently; imported stylesheets are not checked
+                   for changes
+        """
+
+        try:
+            mtime = os.path.getmtime(path)
+        except (OSError, TypeError):
+            # Not a local file (stream or URL) => load without caching
+            return load(path)
+
+        compiled = cls._compiled
+        cache = getattr(compiled, "cache", None)
+        if cache is None:
+            cache = compiled.cache = {}
+
+        key = (kind, path)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        obj = load(path)
+        if obj is not None:
+            cache[key] = (mtime, obj)
+        else:
+            cache.pop(key, None)
+        return obj
+
     # -------------------------------------------------------------------------
     def envelope(self, tree, stylesheet_path, **args):
         """
@@ -1356,7 +1438,8 @@ class S3XML(S3Codec):
                original=None,
                files=[],
                skip=[],
-               postprocess=None):
+               postprocess=None,
+               valid_keys=None):
         """
             Creates a record (Storage) from a <resource> element and validates
             it
@@ -1368,6 +1451,9 @@ class S3XML(S3Codec):
             @param files: list of attached upload files
             @param postprocess: post-process hook (xml_post_parse)
             @param skip: fields to skip
+            @param valid_keys: dict {fieldname: set of values} of foreign
+                               keys which have already been validated
+                               (see S3ImportJob.valid_keys)
         """
 
         valid = True
@@ -1580,6 +1666,10 @@ class S3XML(S3Codec):
                         elif field_type == "password":
                             v = value
                             (value, error) = s3_validate(table, f, v)
+                        elif valid_keys and f in valid_keys and \
+                             v in valid_keys[f]:
+                            # Pre-validated foreign key
+                            value = v
                         else:
                             (value, error) = s3_validate(table, f, v, original)
                     except AttributeError:
@@ -2191,6 +2281,45 @@ class S3XML(S3Codec):
             The returned ElementTree can be imported using S3CSV
             stylesheets (through S3Resource.import_xml()).
 
+            @param source: the XLS source (stream, or XLRD book, or
+                           None if sheet is an open XLRD sheet)
+            @param resourcename: the resource name
+            @param extra_data: dict of extra cols to add to each row
+            @param sheet: sheet name or index, or an open XLRD sheet
+            @param rows: Rows range (see L{xls2trees})
+            @param cols: Columns range (see L{xls2trees})
+            @param fields: Field map (see L{xls2trees})
+            @param header_row: the first row contains column headers
+            @return: an etree.ElementTree representing the table
+        """
+
+        for tree in cls.xls2trees(source,
+                                  resourcename=resourcename,
+                                  extra_data=extra_data,
+                                  sheet=sheet,
+                                  rows=rows,
+                                  cols=cols,
+                                  fields=fields,
+                                  header_row=header_row):
+            return tree
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def xls2trees(cls, source,
+                  resourcename=None,
+                  extra_data=None,
+                  sheet=None,
+                  rows=None,
+                  cols=None,
+                  fields=None,
+                  header_row=True,
+                  batch_size=None):
+        """
+            Generator to convert a table in an XLS (MS Excel) sheet into
+            a sequence of ElementTrees of at most batch_size rows each,
+            so that large sheets can be transformed and imported batch
+            by batch (see: L{xls2tree}).
+
             @param source: the XLS source (stream, or XLRD book, or
                            None if sheet is an open XLRD sheet)
             @param resourcename: the resource name
@@ -2212,7 +2341,10 @@ class S3XML(S3Codec):
                                (if fields is None, they will be used
                                as field names in the output - otherwise
                                they will be ignored)
-            @return: an etree.ElementTree representing the table
+            @param batch_size: maximum number of rows per tree, None
+                               for a single tree with all rows
+            @return: a generator of etree.ElementTrees, yields at least
+                     one (possibly empty) tree
         """
 
         import xlrd
@@ -2226,10 +2358,15 @@ class S3XML(S3Codec):
 
         DEFAULT_SHEET_NAME = "SahanaData"
 
-        # Root element
-        root = etree.Element(TAG.table)
-        if resourcename is not None:
-            root.set(ATTRIBUTE.name, resourcename)
+        def new_root():
+            """ Create a new root element """
+            root = etree.Element(TAG.table)
+            if resourcename is not None:
+                root.set(ATTRIBUTE.name, resourcename)
+            return root
+        root = new_root()
+        batch = 0
+        yielded = False
 
         if isinstance(sheet, xlrd.sheet.Sheet):
             # Open work sheet passed as argument => use this
@@ -2376,9 +2513,17 @@ class S3XML(S3Codec):
                     if extra_fields:
                         for key in extra_fields:
                             add_col(orow, key, None, extra_data[key])
+
+                    batch += 1
+                    if batch_size and batch >= batch_size:
+                        yield etree.ElementTree(root)
+                        yielded = True
+                        root = new_root()
+                        batch = 0
                 record_idx += 1
 
-        return  etree.ElementTree(root)
+        if batch or not yielded:
+            yield etree.ElementTree(root)
         
     # -------------------------------------------------------------------------
     @classmethod
@@ -2400,6 +2545,39 @@ class S3XML(S3Codec):
             @todo: add a character encoding parameter to skip the guessing
         """
 
+        for tree in cls.csv2trees(source,
+                                  resourcename=resourcename,
+                                  extra_data=extra_data,
+                                  delimiter=delimiter,
+                                  quotechar=quotechar):
+            return tree
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def csv2trees(cls, source,
+                  resourcename=None,
+                  extra_data=None,
+                  delimiter=",",
+                  quotechar='"',
+                  batch_size=None):
+        """
+            Generator to convert a table-form CSV source into a sequence
+            of element trees of at most batch_size rows each (see:
+            L{csv2tree}), so that large files can be transformed and
+            imported batch by batch without holding the complete tree
+            in memory.
+
+            @param source: the source (file-like object)
+            @param resourcename: the resource name
+            @param extra_data: dict of extra cols to add to each row
+            @param delimiter: delimiter for values
+            @param quotechar: quotation character
+            @param batch_size: maximum number of rows per tree, None
+                               for a single tree with all rows
+            @return: a generator of etree.ElementTrees, yields at least
+                     one (possibly empty) tree
+        """
+
         import csv
 
         # Increase field sixe to be able to import WKTs
@@ -2412,9 +2590,15 @@ class S3XML(S3Codec):
         COL = TAG.col
         SubElement = etree.SubElement
 
-        root = etree.Element(TAG.table)
-        if resourcename is not None:
-            root.set(ATTRIBUTE.name, resourcename)
+        def new_root():
+            """ Create a new root element """
+            root = etree.Element(TAG.table)
+            if resourcename is not None:
+                root.set(ATTRIBUTE.name, resourcename)
+            return root
+        root = new_root()
+        batch = 0
+        yielded = False
 
         def add_col(row, key, value):
             col = SubElement(row, COL)
@@ -2468,6 +2652,12 @@ class S3XML(S3Codec):
                     for key in extra_data:
                         if key not in r:
                             add_col(row, key, extra_data[key])
+                batch += 1
+                if batch_size and batch >= batch_size:
+                    yield etree.ElementTree(root)
+                    yielded = True
+                    root = new_root()
+                    batch = 0
         except csv.Error:
             e = sys.exc_info()[1]
             raise HTTP(400, body=cls.json_message(False, 400, e))
@@ -2475,7 +2665,8 @@ class S3XML(S3Codec):
         # Use this to debug the source tree if needed:
         #print >>sys.stderr, cls.tostring(root, pretty_print=True)
 
-        return  etree.ElementTree(root)
+        if batch or not yielded:
+            yield etree.ElementTree(root)
 
 # =============================================================================
 class S3XMLFormat(object):
@@ -2488,14 +2679,34 @@ class S3XMLFormat(object):
             @param stylesheet: the stylesheet (pathname or stream)
         """
 
-        self.tree = current.xml.parse(stylesheet)
-        if not self.tree:
-            current.log.error("%s parse error: %s" %
-                              (stylesheet, current.xml.error))
-        
+        xml = current.xml
+        compiled = xml.cached(stylesheet, "format", self.load)
+        if compiled:
+            self.tree, self.transformer = compiled
+        else:
+            self.tree = self.transformer = None
+            current.log.error("%s parse error: %s" % (stylesheet, xml.error))
+
         self.select = None
         self.skip = None
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def load(stylesheet):
+        """
+            Parse and compile a stylesheet
+
+            @param stylesheet: the stylesheet (pathname or stream)
+            @return: tuple (tree, transformer), or None if the
+                     stylesheet cannot be parsed
+        """
+
+        xml = current.xml
+        tree = xml.parse(stylesheet)
+        if tree is None:
+            return None
+        return (tree, xml.compile(tree))
+
     # -------------------------------------------------------------------------
     def get_fields(self, tablename):
         """
@@ -2601,6 +2812,134 @@ class S3XMLFormat(object):
             current.log.error("XMLFormat: no stylesheet available")
             return tree
 
-        return current.xml.transform(tree, self.tree, **args)
+        transformer = self.transformer
+        if transformer is None:
+            # Stylesheet could not be compiled => report the error
+            transformer = self.tree
+        return current.xml.transform(tree, transformer, **args)
+
+# =============================================================================
+class S3CSVMapping(object):
+    """
+        Declarative column mapping for simple CSV imports, to transform
+        CSV trees (see S3XML.csv2tree) into S3XML without XSLT.
+
+        Mappings are JSON files with the extension .json which can be
+        used instead of an XSLT stylesheet (e.g. in tasks.cfg), like:
+
+            {"resource": "org_facility_type",
+             "columns": [["Name", "name"],
+                         ["Comments", "comments"]
+                         ],
+             "defaults": {"comments": "Imported"}
+             }
+
+        Each row produces one record of the resource, with the values
+        of the mapped columns (if present) as data fields - a column
+        mapped to "uuid" sets the record UID - and the defaults for all
+        fields which have no value in the row. References, components
+        and stylesheet parameters are not supported => use XSLT for
+        these.
+    """
+
+    def __init__(self, tablename, columns, defaults=None):
+        """
+            Constructor
+
+            @param tablename: the name of the target table
+            @param columns: list of tuples (column, fieldname), or a dict
+                            {column: fieldname}
+            @param defaults: dict of default values {fieldname: value}
+        """
+
+        self.tablename = tablename
+        if isinstance(columns, dict):
+            columns = columns.items()
+        self.columns = [(s3_unicode(c), str(f)) for c, f in columns]
+        if defaults:
+            self.defaults = dict((str(f), s3_unicode(v))
+                                 for f, v in defaults.items())
+        else:
+            self.defaults = {}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def load(cls, path):
+        """
+            Load a column mapping from a JSON file
+
+            @param path: the file path
+            @return: the S3CSVMapping, or None if the file cannot be
+                     read or is not a valid column mapping
+        """
+
+        try:
+            with open(path, "rb") as f:
+                spec = json.load(f)
+            return cls(spec["resource"],
+                       spec["columns"],
+                       defaults = spec.get("defaults"),
+                       )
+        except (IOError, ValueError, TypeError, KeyError):
+            current.log.error("Invalid column mapping: %s" % path)
+            return None
+
+    # -------------------------------------------------------------------------
+    def transform(self, tree):
+        """
+            Transform a CSV tree into S3XML
+
+            @param tree: the CSV tree (<table>, <row> and <col> elements)
+            @return: the S3XML element tree
+        """
+
+        TAG = S3XML.TAG
+        ATTRIBUTE = S3XML.ATTRIBUTE
+        FIELD = ATTRIBUTE.field
+        UID = S3XML.UID
+        SubElement = etree.SubElement
+
+        tablename = self.tablename
+        columns = self.columns
+        defaults = self.defaults
+
+        if isinstance(tree, etree._ElementTree):
+            table = tree.getroot()
+        else:
+            table = tree
+
+        root = etree.Element(TAG.root)
+        for row in table.iterchildren(tag=TAG.row):
+
+            values = dict((col.get(FIELD), col.text)
+                          for col in row.iterchildren(tag=TAG.col))
+
+            resource = SubElement(root, TAG.resource)
+            resource.set(ATTRIBUTE.name, tablename)
+
+            found = set()
+            for column, fieldname in columns:
+                if column not in values:
+                    continue
+                value = values[column]
+                if fieldname == UID:
+                    if value:
+                        resource.set(UID, value)
+                    continue
+                if value:
+                    found.add(fieldname)
+                elif fieldname in defaults:
+                    continue
+                data = SubElement(resource, TAG.data)
+                data.set(FIELD, fieldname)
+                data.text = value or ""
+
+            for fieldname, value in defaults.items():
+                if fieldname not in found:
+                    data = SubElement(resource, TAG.data)
+                    data.set(FIELD, fieldname)
+                    data.text = value
+
+        return etree.ElementTree(root)
 
 # End =========================================================================
@@ -91,6 +91,7 @@ class S3Config(Storage):
         self.cms = Storage()
         self.database = Storage()
         self.deploy = Storage()
+        self.doc = Storage()
         self.event = Storage()
         self.fin = Storage()
         # @ToDo: Move to self.ui
@@ -486,6 +487,25 @@ class S3Config(Storage):
         return self.security.get("audit_read", False)
     def get_security_audit_write(self):
         return self.security.get("audit_write", False)
+    def get_security_audit_queue(self):
+        """
+            Number of audit events to queue across requests before
+            writing them to the database (0 = write at the end of
+            each request)
+        """
+        return self.security.get("audit_queue", 0)
+    def get_security_audit_queue_time(self):
+        """
+            Maximum time (seconds) to queue audit events across requests
+        """
+        return self.security.get("audit_queue_time", 60)
+    def get_security_audit_log(self):
+        """
+            Append audit events to this log file (path relative to the
+            application folder) instead of writing them to the database,
+            to be ingested periodically by the audit_ingest task
+        """
+        return self.security.get("audit_log", None)
     def get_security_policy(self):
         " Default is Simple Security Policy "
         return self.security.get("policy", 1)
@@ -523,6 +543,20 @@ class S3Config(Storage):
         """
         return self.base.get("debug", False)
 
+    def get_base_instrument(self):
+        """
+            Record DB queries and timings of core components per request
+            (see S3Instrument)
+        """
+        return self.base.get("instrument", False)
+
+    def get_base_instrument_slow(self):
+        """
+            Threshold (in seconds) for instrumented requests to be logged
+            as slow requests (with their top queries), None to disable
+        """
+        return self.base.get("instrument_slow", 2.0)
+
     def get_base_migrate(self):
         """ Whether to allow Web2Py to migrate the SQL database to the new structure """
         return self.base.get("migrate", True)
@@ -563,6 +597,18 @@ class S3Config(Storage):
         """    
         return self.base.get("solr_url", False)
 
+    def get_base_import_batch_size(self):
+        """
+            Number of rows to transform and import at a time for
+            CSV/XLS imports (reduces memory use for large files),
+            0 to import the whole source at once
+
+            NB tuid references can only refer to rows in the same or
+               previous batches - sources with forward references must
+               be imported at once
+        """
+        return self.base.get("import_batch_size", 0)
+
     def get_import_callback(self, tablename, callback):
         """
             Lookup callback to use for imports in the following order:
@@ -835,6 +881,22 @@ class S3Config(Storage):
         """
         return self.gis.get("max_features", 1000)
 
+    def get_gis_feature_cache(self):
+        """
+            Cache the GeoJSON output of Feature Layers: False to disable,
+            True to cache until records in the layer tables are written,
+            or the maximum age of cache entries in seconds
+        """
+        return self.gis.get("feature_cache", False)
+
+    def get_gis_location_data_store(self):
+        """
+            Use a precomputed store of the child locations per parent
+            for the Location Selector and Location Filter (S3LocationData),
+            rather than querying them for every dropdown
+        """
+        return self.gis.get("location_data_store", False)
+
     def get_gis_legend(self):
         """
             Should we display a Legend on the Map?
@@ -1235,6 +1297,31 @@ class S3Config(Storage):
         """
         return self.ui.get("multiselect_widget", False)
 
+    def get_ui_options_cache(self):
+        """
+            Cache the option lists of IS_ONE_OF validators for small
+            lookup tables in RAM (until the table is written to, or the
+            given number of seconds expire), 0 to disable
+        """
+        return self.ui.get("options_cache", 0)
+
+    def get_ui_menu_cache(self):
+        """
+            Cache the permissions for menu items in RAM, per set of user
+            roles and until the ACLs change or the given number of
+            seconds expire, 0 to disable
+        """
+        return self.ui.get("menu_cache", 3600)
+
+    def get_ui_widget_cache(self):
+        """
+            Cache the rendered data widgets of summary and profile pages
+            (S3WidgetCache): False to disable, True to cache until records
+            in the widget tables are written, or the maximum age of cache
+            entries in seconds
+        """
+        return self.ui.get("widget_cache", False)
+
     def get_ui_navigate_away_confirm(self):
         """
             Whether to enable a warning when users navigate away from a page with unsaved changes
@@ -1419,6 +1506,22 @@ class S3Config(Storage):
         """
         return self.search.get("max_results", 200)
 
+    def get_search_filter_index(self):
+        """
+            Use a stored index of filter options for S3OptionsFilter and
+            S3LocationFilter widgets (can be overridden per widget with
+            the "index" option)
+        """
+        return self.search.get("filter_index", False)
+
+    def get_search_name_index(self):
+        """
+            Use a stored name search index (prefix and trigram keys) to
+            look up candidate records in autocomplete searches (built
+            by the s3_name_index_rebuild task)
+        """
+        return self.search.get("name_index", False)
+
     # -------------------------------------------------------------------------
     # Filter Manager Widget
     def get_search_filter_manager(self):
@@ -1635,6 +1738,26 @@ class S3Config(Storage):
         """
         return self.event.get("types_hierarchical", False)
 
+    # -------------------------------------------------------------------------
+    # Documents
+    #
+    def get_doc_index_backend(self):
+        """
+            Full-text index for documents:
+                * None = no full-text index
+                * "local" = built-in index in the database
+                * "solr" = Solr server (settings.base.solr_url)
+        """
+        return self.doc.get("index_backend",
+                            "solr" if self.get_base_solr_url() else None)
+
+    def get_doc_index_workers(self):
+        """
+            Number of parallel workers to extract the text from document
+            files when (re-)building the full-text index
+        """
+        return self.doc.get("index_workers", 4)
+
     # -------------------------------------------------------------------------
     # Deployments
     #
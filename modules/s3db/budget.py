@@ -31,6 +31,9 @@ __all__ = ["S3BudgetModel",
            "S3BudgetKitModel",
            "S3BudgetBundleModel",
            "budget_rheader",
+           "budget_update_totals",
+           "budget_update_totals_defer",
+           "budget_update_totals_flush",
           ]
 
 from gluon import *
@@ -147,7 +150,8 @@ class S3BudgetModel(S3Model):
 
         # Configuration
         configure(tablename,
-                  onaccept = self.budget_budget_onaccept)
+                  onaccept = self.budget_budget_onaccept,
+                  onimport = budget_update_totals_flush)
 
         # ---------------------------------------------------------------------
         # Parameters (currently unused)
@@ -256,7 +260,8 @@ class S3BudgetModel(S3Model):
 
         # Configuration
         configure(tablename,
-                  update_onaccept = self.budget_location_onaccept)
+                  update_onaccept = self.budget_location_onaccept,
+                  onimport = budget_update_totals_flush)
 
         # ---------------------------------------------------------------------
         # Staff Types
@@ -337,7 +342,8 @@ class S3BudgetModel(S3Model):
 
         # Configuration
         configure(tablename,
-                  update_onaccept = self.budget_staff_onaccept)
+                  update_onaccept = self.budget_staff_onaccept,
+                  onimport = budget_update_totals_flush)
 
         # ---------------------------------------------------------------------
         # Budget<>Staff Many2Many
@@ -365,6 +371,7 @@ class S3BudgetModel(S3Model):
         # Configuration
         configure(tablename,
                   onaccept = self.budget_budget_staff_onaccept,
+                  onimport = budget_update_totals_flush,
                   ondelete = self.budget_budget_staff_ondelete)
 
         # ---------------------------------------------------------------------
@@ -426,8 +433,7 @@ class S3BudgetModel(S3Model):
         budget_id = linktable.budget_id
         rows = current.db(linktable.staff_id == record_id).select(budget_id,
                                                           groupby=budget_id)
-        for row in rows:
-            budget_budget_totals(row.budget_id)
+        budget_update_totals(budget_ids=[row.budget_id for row in rows])
         return
 
     # -------------------------------------------------------------------------
@@ -446,8 +452,7 @@ class S3BudgetModel(S3Model):
         budget_id = linktable.budget_id
         rows = current.db(linktable.location_id == record_id).select(budget_id,
                                                              groupby=budget_id)
-        for row in rows:
-            budget_budget_totals(row.budget_id)
+        budget_update_totals(budget_ids=[row.budget_id for row in rows])
         return
 
     # -------------------------------------------------------------------------
@@ -464,7 +469,7 @@ class S3BudgetModel(S3Model):
         table = current.s3db.budget_budget_staff
         row = current.db(table.id == record_id).select(table.budget_id,
                                                        limitby=(0, 1)).first()
-        if record:
+        if row:
             budget_budget_totals(row.budget_id)
         return
 
@@ -592,6 +597,7 @@ class S3BudgetKitModel(S3Model):
         # Configuration
         configure(tablename,
                   onaccept = self.budget_kit_onaccept,
+                  onimport = budget_update_totals_flush,
                  )
 
         # Components
@@ -724,6 +730,7 @@ class S3BudgetKitModel(S3Model):
         # Configuration
         configure(tablename,
                   onaccept = self.budget_item_onaccept,
+                  onimport = budget_update_totals_flush,
                   main = "code",
                   extra = "description",
                   orderby = "budget_item.category_type",
@@ -746,6 +753,7 @@ class S3BudgetKitModel(S3Model):
 
         configure(tablename,
                   onaccept = self.budget_kit_item_onaccept,
+                  onimport = budget_update_totals_flush,
                   ondelete = self.budget_kit_item_ondelete,
                  )
 
@@ -800,36 +808,22 @@ class S3BudgetKitModel(S3Model):
         except:
             return
             
-        # Update totals of all kits with this item
+        # All kits with this item
         linktable = s3db.budget_kit_item
         kit_id = linktable.kit_id
         rows = db(linktable.item_id == item_id).select(kit_id,
                                                        groupby=kit_id)
-        kit_ids = set()
-        for row in rows:
-            kit_id = row.kit_id
-            budget_kit_totals(kit_id)
-            kit_ids.add(kit_id)
-
-        # Find all bundles which have just been updated by budget_kit_totals
-        if kit_ids:
-            linktable = s3db.budget_bundle_kit
-            bundle_id = linktable.bundle_id
-            rows = db(linktable.kit_id.belongs(kit_ids)).select(bundle_id,
-                                                                groupby=bundle_id)
-            already_updated = [row.bundle_id for row in rows]
-        else:
-            already_updated = None
-
-        # Update totals of all remaining bundles with this item
+        kit_ids = [row.kit_id for row in rows]
+
+        # All bundles with this item
         linktable = s3db.budget_bundle_item
         bundle_id = linktable.bundle_id
         query = (linktable.item_id == item_id)
-        if already_updated:
-            query &= ~(linktable.bundle_id.belongs(already_updated))
         rows = db(query).select(bundle_id, groupby=bundle_id)
-        for row in rows:
-            budget_bundle_totals(kit_id)
+        bundle_ids = [row.bundle_id for row in rows]
+
+        # Update totals (bundles using the kits are updated only once)
+        budget_update_totals(kit_ids=kit_ids, bundle_ids=bundle_ids)
         return
 
     # -------------------------------------------------------------------------
@@ -942,7 +936,8 @@ class S3BudgetBundleModel(S3Model):
 
         # Configuration
         configure(tablename,
-                  onaccept = self.budget_bundle_onaccept)
+                  onaccept = self.budget_bundle_onaccept,
+                  onimport = budget_update_totals_flush)
 
         # Components
         add_components(tablename,
@@ -1013,6 +1008,7 @@ class S3BudgetBundleModel(S3Model):
         # Configuration
         configure(tablename,
                   onaccept = self.budget_bundle_kit_onaccept,
+                  onimport = budget_update_totals_flush,
                   ondelete = self.budget_bundle_kit_ondelete)
         
         # ---------------------------------------------------------------------
@@ -1047,6 +1043,7 @@ class S3BudgetBundleModel(S3Model):
         # Configuration
         configure(tablename,
                   onaccept = self.budget_bundle_item_onaccept,
+                  onimport = budget_update_totals_flush,
                   ondelete = self.budget_bundle_item_ondelete)
 
         # ---------------------------------------------------------------------
@@ -1077,6 +1074,7 @@ class S3BudgetBundleModel(S3Model):
         # Configuration
         configure(tablename,
                   onaccept = self.budget_budget_bundle_onaccept,
+                  onimport = budget_update_totals_flush,
                   ondelete = self.budget_budget_bundle_ondelete)
 
         # ---------------------------------------------------------------------
@@ -1234,159 +1232,271 @@ class S3BudgetBundleModel(S3Model):
 # =============================================================================
 def budget_kit_totals(kit_id):
     """
-        Calculate Totals for a Kit
+        Calculate Totals for a Kit (and all bundles and budgets using it)
+    """
+
+    budget_update_totals(kit_ids=[kit_id])
+
+# =============================================================================
+def budget_bundle_totals(bundle_id):
+    """
+        Calculate Totals for a Bundle (and all budgets using it)
+    """
+
+    budget_update_totals(bundle_ids=[bundle_id])
+
+# =============================================================================
+def budget_budget_totals(budget_id):
+    """
+        Calculate Totals for a budget
+
+        @param budget_id: the budget_budget record ID
+    """
+
+    budget_update_totals(budget_ids=[budget_id])
+
+# =============================================================================
+def budget_update_totals(kit_ids=None, bundle_ids=None, budget_ids=None):
+    """
+        Update the totals of kits, bundles and budgets after changes,
+        and propagate the changes upwards the dependency graph
+        kit => bundle => budget:
+
+        - each affected kit, bundle and budget is calculated only once,
+          kits/bundles/budgets of the same level all at once
+        - only the kits/bundles/budgets depending on the changed records
+          are updated
+        - during bulk imports, the records are only marked for update,
+          and then updated once when the import job has been committed
+          (budget_update_totals_flush)
+
+        @param kit_ids: IDs of changed kits
+        @param bundle_ids: IDs of changed bundles
+        @param budget_ids: IDs of changed budgets
+    """
+
+    kit_ids = set(int(i) for i in kit_ids or [] if i)
+    bundle_ids = set(int(i) for i in bundle_ids or [] if i)
+    budget_ids = set(int(i) for i in budget_ids or [] if i)
+
+    s3 = current.response.s3
+    if s3.bulk:
+        budget_update_totals_defer()
+        deferred = s3.budget_update_totals_deferred
+        deferred["kit"] |= kit_ids
+        deferred["bundle"] |= bundle_ids
+        deferred["budget"] |= budget_ids
+        return
+
+    if kit_ids:
+        bundle_ids |= budget_kit_update_totals(kit_ids)
+    if bundle_ids:
+        budget_ids |= budget_bundle_update_totals(bundle_ids)
+    if budget_ids:
+        budget_budget_update_totals(budget_ids)
+
+# =============================================================================
+def budget_update_totals_defer():
+    """
+        Defer updates of totals until budget_update_totals_flush, e.g.
+        while importing many kit items/bundle items in one job
+
+        @return: True if this call started the deferral, else False
+    """
+
+    s3 = current.response.s3
+    if s3.budget_update_totals_deferred is None:
+        s3.budget_update_totals_deferred = {"kit": set(),
+                                            "bundle": set(),
+                                            "budget": set(),
+                                            }
+        return True
+    return False
+
+# =============================================================================
+def budget_update_totals_flush(import_job=None):
+    """
+        End the deferral of updates of totals, and update all kits,
+        bundles and budgets marked for update in the meantime;
+        onimport-hook for all budget tables (called once per import
+        job by S3ImportJob.commit)
+
+        @param import_job: the S3ImportJob, the updates are discarded
+                           if it has failed (will be rolled back)
+    """
+
+    s3 = current.response.s3
+    deferred = s3.budget_update_totals_deferred
+    s3.budget_update_totals_deferred = None
+    if not deferred or import_job is not None and import_job.failed:
+        return
+
+    # Not via budget_update_totals as this is still within the import
+    bundle_ids = deferred["bundle"]
+    budget_ids = deferred["budget"]
+    if deferred["kit"]:
+        bundle_ids |= budget_kit_update_totals(deferred["kit"])
+    if bundle_ids:
+        budget_ids |= budget_bundle_update_totals(bundle_ids)
+    if budget_ids:
+        budget_budget_update_totals(budget_ids)
+
+# =============================================================================
+def budget_kit_update_totals(kit_ids):
+    """
+        Calculate Totals for Kits
+
+        @param kit_ids: set of budget_kit record IDs
+        @return: set of IDs of the bundles using these kits
     """
 
     db = current.db
     s3db = current.s3db
 
-    # Lookup all item quantities in this kit
+    # Lookup all item quantities and costs in these kits
     ltable = s3db.budget_kit_item
-    query = (ltable.kit_id == kit_id) & \
-            (ltable.deleted == False)
-    items = db(query).select(ltable.item_id, ltable.quantity)
-    item_ids = set(item.item_id for item in items)
-
-    # Lookup the individual costs of each item
     itable = s3db.budget_item
-    query = (itable.id.belongs(item_ids))
-    costs = db(query).select(itable.id,
-                             itable.unit_cost,
-                             itable.monthly_cost,
-                             itable.minute_cost,
-                             itable.megabyte_cost).as_dict()
+    query = (ltable.kit_id.belongs(kit_ids)) & \
+            (ltable.deleted == False) & \
+            (itable.id == ltable.item_id)
+    rows = db(query).select(ltable.kit_id,
+                            ltable.quantity,
+                            itable.unit_cost,
+                            itable.monthly_cost,
+                            itable.minute_cost,
+                            itable.megabyte_cost)
 
     # Calculate the totals per cost category
-    total_unit_cost = 0
-    total_monthly_cost = 0
-    total_minute_cost = 0
-    total_megabyte_cost = 0
-
-    for item in items:
+    totals = dict((kit_id, [0, 0, 0, 0]) for kit_id in kit_ids)
+    for row in rows:
+        link = row[ltable]
+        item = row[itable]
+        quantity = link.quantity
+        total = totals[link.kit_id]
 
-        quantity = item.quantity
-        item_costs = costs[item.item_id]
-        
-        total_unit_cost += item_costs["unit_cost"] * quantity
-        total_monthly_cost += item_costs["monthly_cost"] * quantity
-        total_minute_cost += item_costs["minute_cost"] * quantity
-        total_megabyte_cost += item_costs["megabyte_cost"] * quantity
+        total[0] += item.unit_cost * quantity
+        total[1] += item.monthly_cost * quantity
+        total[2] += item.minute_cost * quantity
+        total[3] += item.megabyte_cost * quantity
 
-    # Update the kit
+    # Update the kits
     ktable = s3db.budget_kit
-    db(ktable.id == kit_id).update(total_unit_cost=total_unit_cost,
-                                   total_monthly_cost=total_monthly_cost,
-                                   total_minute_cost=total_minute_cost,
-                                   total_megabyte_cost=total_megabyte_cost)
-
-    # Update totals in all bundles with this kit
-    linktable = s3db.budget_bundle_kit
-    bundle_id = linktable.bundle_id
-    rows = db(linktable.kit_id == kit_id).select(bundle_id,
-                                                 groupby=bundle_id)
-    for row in rows:
-        budget_bundle_totals(row.bundle_id)
+    for kit_id, total in totals.items():
+        db(ktable.id == kit_id).update(total_unit_cost=total[0],
+                                       total_monthly_cost=total[1],
+                                       total_minute_cost=total[2],
+                                       total_megabyte_cost=total[3])
 
     # @todo: fix this
     #audit("update", module, "kit", record=kit, representation="html")
-    return
+
+    # Bundles with these kits
+    linktable = s3db.budget_bundle_kit
+    bundle_id = linktable.bundle_id
+    rows = db(linktable.kit_id.belongs(kit_ids)).select(bundle_id,
+                                                        groupby=bundle_id)
+    return set(row.bundle_id for row in rows)
 
 # =============================================================================
-def budget_bundle_totals(bundle_id):
+def budget_bundle_update_totals(bundle_ids):
     """
-        Calculate Totals for a Bundle
+        Calculate Totals for Bundles
+
+        @param bundle_ids: set of budget_bundle record IDs
+        @return: set of IDs of the budgets using these bundles
     """
 
     s3db = current.s3db
     db = current.db
-    
-    total_unit_cost = 0
-    total_monthly_cost = 0
+
+    totals = dict((bundle_id, [0, 0]) for bundle_id in bundle_ids)
 
     # Calculate costs of kits
     ktable = s3db.budget_kit
     linktable = s3db.budget_bundle_kit
-    left = [ktable.on(linktable.kit_id == ktable.id)]
-    query = (linktable.bundle_id == bundle_id)
-    rows = db(query).select(linktable.quantity,
+    query = (linktable.bundle_id.belongs(bundle_ids)) & \
+            (linktable.deleted == False) & \
+            (ktable.id == linktable.kit_id)
+    rows = db(query).select(linktable.bundle_id,
+                            linktable.quantity,
                             linktable.minutes,
                             linktable.megabytes,
                             ktable.total_unit_cost,
                             ktable.total_monthly_cost,
                             ktable.total_minute_cost,
-                            ktable.total_megabyte_cost,
-                            left=left)
+                            ktable.total_megabyte_cost)
     for row in rows:
         kit = row[ktable]
         link = row[linktable]
         quantity = link.quantity
+        total = totals[link.bundle_id]
 
         # One-time costs
-        total_unit_cost += kit.total_unit_cost * quantity
+        total[0] += kit.total_unit_cost * quantity
 
         # Monthly costs
         monthly_cost = kit.total_monthly_cost + \
                        kit.total_minute_cost * link.minutes + \
                        kit.total_megabyte_cost * link.megabytes
-        total_monthly_cost += monthly_cost * quantity
+        total[1] += monthly_cost * quantity
 
     # Calculate costs of items
     itable = s3db.budget_item
     linktable = s3db.budget_bundle_item
-    left = [itable.on(linktable.item_id == itable.id)]
-    query = (linktable.bundle_id == bundle_id)
-    rows = db(query).select(linktable.quantity,
+    query = (linktable.bundle_id.belongs(bundle_ids)) & \
+            (linktable.deleted == False) & \
+            (itable.id == linktable.item_id)
+    rows = db(query).select(linktable.bundle_id,
+                            linktable.quantity,
                             linktable.minutes,
                             linktable.megabytes,
                             itable.unit_cost,
                             itable.monthly_cost,
                             itable.minute_cost,
-                            itable.megabyte_cost,
-                            left=left)
+                            itable.megabyte_cost)
     for row in rows:
         item = row[itable]
         link = row[linktable]
         quantity = link.quantity
+        total = totals[link.bundle_id]
 
         # One-time costs
-        total_unit_cost += item.unit_cost * quantity
+        total[0] += item.unit_cost * quantity
 
         # Monthly costs
         monthly_cost = item.monthly_cost + \
                        item.minute_cost * link.minutes + \
                        item.megabyte_cost * link.megabytes
-        total_monthly_cost += monthly_cost * quantity
+        total[1] += monthly_cost * quantity
 
-    # Update the bundle
+    # Update the bundles
     btable = s3db.budget_bundle
-    db(btable.id == bundle_id).update(total_unit_cost=total_unit_cost,
-                                      total_monthly_cost=total_monthly_cost)
-
-    # Update totals of all budgets with this bundle
-    linktable = s3db.budget_budget_bundle
-    budget_id = linktable.budget_id
-    rows = db(linktable.bundle_id == bundle_id).select(budget_id,
-                                                       groupby=budget_id)
-    for row in rows:
-        budget_budget_totals(row.budget_id)
+    for bundle_id, total in totals.items():
+        db(btable.id == bundle_id).update(total_unit_cost=total[0],
+                                          total_monthly_cost=total[1])
 
     # @todo: fix this:
     #audit("update", module, "bundle", record=bundle, representation="html")
-    return
+
+    # Budgets with these bundles
+    linktable = s3db.budget_budget_bundle
+    budget_id = linktable.budget_id
+    rows = db(linktable.bundle_id.belongs(bundle_ids)).select(budget_id,
+                                                              groupby=budget_id)
+    return set(row.budget_id for row in rows)
 
 # =============================================================================
-def budget_budget_totals(budget_id):
+def budget_budget_update_totals(budget_ids):
     """
-        Calculate Totals for a budget
+        Calculate Totals for Budgets
 
-        @param budget_id: the budget_budget record ID
+        @param budget_ids: set of budget_budget record IDs
     """
 
     db = current.db
     s3db = current.s3db
 
-    total_onetime_cost = 0
-    total_recurring_cost = 0
+    totals = dict((budget_id, [0, 0]) for budget_id in budget_ids)
 
     # Calculate staff costs
     stable = s3db.budget_staff
@@ -1397,8 +1507,10 @@ def budget_budget_totals(budget_id):
     left = [stable.on(linktable.staff_id == stable.id),
             ltable.on(linktable.location_id == ltable.id),
            ]
-    query = (linktable.budget_id == budget_id)
-    rows = db(query).select(linktable.quantity,
+    query = (linktable.budget_id.belongs(budget_ids)) & \
+            (linktable.deleted == False)
+    rows = db(query).select(linktable.budget_id,
+                            linktable.quantity,
                             linktable.months,
                             stable.salary,
                             stable.travel,
@@ -1408,17 +1520,18 @@ def budget_budget_totals(budget_id):
 
     for row in rows:
         quantity = row[linktable.quantity]
+        total = totals[row[linktable.budget_id]]
 
         # Travel costs are one time
-        total_onetime_cost += row[stable.travel] * quantity
+        total[0] += row[stable.travel] * quantity
 
         # Recurring costs are monthly
         recurring_costs = row[stable.salary] + \
                           row[ltable.subsistence] + \
                           row[ltable.hazard_pay]
-        total_recurring_cost += recurring_costs * \
-                                quantity * \
-                                row[linktable.months]
+        total[1] += recurring_costs * \
+                    quantity * \
+                    row[linktable.months]
 
     # Calculate bundle costs
     btable = s3db.budget_bundle
@@ -1427,8 +1540,10 @@ def budget_budget_totals(budget_id):
 
     left = [btable.on(linktable.bundle_id == btable.id)]
 
-    query = (linktable.budget_id == budget_id)
-    rows = db(query).select(linktable.quantity,
+    query = (linktable.budget_id.belongs(budget_ids)) & \
+            (linktable.deleted == False)
+    rows = db(query).select(linktable.budget_id,
+                            linktable.quantity,
                             linktable.months,
                             btable.total_unit_cost,
                             btable.total_monthly_cost,
@@ -1436,16 +1551,18 @@ def budget_budget_totals(budget_id):
 
     for row in rows:
         quantity = row[linktable.quantity]
+        total = totals[row[linktable.budget_id]]
 
-        total_onetime_cost += row[btable.total_unit_cost] * \
-                              quantity
-        total_recurring_cost += row[btable.total_monthly_cost] * \
-                                quantity * \
-                                row[linktable.months]
+        total[0] += row[btable.total_unit_cost] * \
+                    quantity
+        total[1] += row[btable.total_monthly_cost] * \
+                    quantity * \
+                    row[linktable.months]
 
     table = s3db.budget_budget
-    db(table.id == budget_id).update(total_onetime_costs=total_onetime_cost,
-                                     total_recurring_costs=total_recurring_cost)
+    for budget_id, total in totals.items():
+        db(table.id == budget_id).update(total_onetime_costs=total[0],
+                                         total_recurring_costs=total[1])
 
     # @todo: fix this
     #audit("update", module, "budget", record=budget, representation="html")
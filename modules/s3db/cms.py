@@ -1297,18 +1297,21 @@ def cms_post_list_layout(list_id, item_id, resource, rfields, record):
         author_id = raw["cms_post.created_by"]
         person = record["cms_post.created_by"]
 
-        # @ToDo: Bulk lookup
-        ltable = s3db.pr_person_user
-        ptable = db.pr_person
-        query = (ltable.user_id == author_id) & \
-                (ltable.pe_id == ptable.pe_id)
-        row = db(query).select(ptable.id,
-                               limitby=(0, 1)
-                               ).first()
-        if row:
-            person_id = row.id
+        if "_person_id" in record:
+            # Looked up in bulk (cms_post_list_prefetch)
+            person_id = record["_person_id"]
         else:
-            person_id = None
+            ltable = s3db.pr_person_user
+            ptable = db.pr_person
+            query = (ltable.user_id == author_id) & \
+                    (ltable.pe_id == ptable.pe_id)
+            row = db(query).select(ptable.id,
+                                   limitby=(0, 1)
+                                   ).first()
+            if row:
+                person_id = row.id
+            else:
+                person_id = None
     elif contact_field == "person_id":
         person_id = raw["cms_post.person_id"]
         if person_id:
@@ -1341,12 +1344,16 @@ def cms_post_list_layout(list_id, item_id, resource, rfields, record):
 
             # Avatar
             # Try Organisation Logo
-            otable = db.org_organisation
-            row = db(otable.id == organisation_id).select(otable.logo,
-                                                          limitby=(0, 1)
-                                                          ).first()
-            if row and row.logo:
-                logo = URL(c="default", f="download", args=[row.logo])
+            if "_logo" in record:
+                logo = record["_logo"]
+            else:
+                otable = db.org_organisation
+                row = db(otable.id == organisation_id).select(otable.logo,
+                                                              limitby=(0, 1)
+                                                              ).first()
+                logo = row.logo if row else None
+            if logo:
+                logo = URL(c="default", f="download", args=[logo])
                 avatar = IMG(_src=logo,
                              _height=50,
                              _width=50,
@@ -1372,6 +1379,7 @@ def cms_post_list_layout(list_id, item_id, resource, rfields, record):
         # Personal Avatar
         avatar = s3_avatar_represent(person_id,
                                      tablename="pr_person",
+                                     image=record.get("_avatar"),
                                      _class="media-object")
 
         avatar = A(avatar,
@@ -1460,12 +1468,15 @@ def cms_post_list_layout(list_id, item_id, resource, rfields, record):
         delete_btn = ""
     user = current.auth.user
     if user and settings.get_cms_bookmarks():
-        ltable = s3db.cms_post_user
-        query = (ltable.post_id == record_id) & \
-                (ltable.user_id == user.id)
-        exists = db(query).select(ltable.id,
-                                  limitby=(0, 1)
-                                  ).first()
+        if "_bookmarked" in record:
+            exists = record["_bookmarked"]
+        else:
+            ltable = s3db.cms_post_user
+            query = (ltable.post_id == record_id) & \
+                    (ltable.user_id == user.id)
+            exists = db(query).select(ltable.id,
+                                      limitby=(0, 1)
+                                      ).first()
         if exists:
             bookmark_btn = A(I(" ", _class="icon icon-bookmark"),
                              _onclick="$.getS3('%s',function(){$('#%s').datalist('ajaxReloadItem',%s)})" %
@@ -1610,4 +1621,111 @@ def cms_post_list_layout(list_id, item_id, resource, rfields, record):
 
     return item
 
+# -----------------------------------------------------------------------------
+def cms_post_list_prefetch(resource, records, rfields):
+    """
+        Look up the authors, organisation logos, avatars and bookmarks
+        for all posts on a page of cms_post_list_layout at once, rather
+        than for every single item
+
+        @param resource: the S3Resource to render
+        @param records: the records (list of dicts)
+        @param rfields: the S3ResourceFields to render
+    """
+
+    db = current.db
+    s3db = current.s3db
+    settings = current.deployment_settings
+
+    rows = [record["_row"] for record in records]
+
+    # Authors
+    person_ids = {}
+    contact_field = settings.get_cms_person()
+    if contact_field == "created_by":
+        user_ids = set(row["cms_post.created_by"] for row in rows)
+        user_ids.discard(None)
+        authors = {}
+        if user_ids:
+            ltable = s3db.pr_person_user
+            ptable = db.pr_person
+            query = (ltable.user_id.belongs(user_ids)) & \
+                    (ltable.pe_id == ptable.pe_id)
+            for row in db(query).select(ltable.user_id, ptable.id):
+                authors[row[ltable.user_id]] = row[ptable.id]
+        for record in records:
+            person_id = authors.get(record["_row"]["cms_post.created_by"])
+            record["_person_id"] = person_id
+            if person_id:
+                person_ids[id(record)] = person_id
+    elif contact_field == "person_id":
+        for record in records:
+            person_id = record["_row"]["cms_post.person_id"]
+            if person_id:
+                person_ids[id(record)] = person_id
+
+    # Avatars (profile images of the persons)
+    if person_ids:
+        ptable = db.pr_person
+        itable = s3db.pr_image
+        query = (ptable.id.belongs(set(person_ids.values()))) & \
+                (itable.pe_id == ptable.pe_id) & \
+                (itable.profile == True)
+        images = dict((row[ptable.id], row[itable.image])
+                      for row in db(query).select(ptable.id, itable.image))
+        for record in records:
+            person_id = person_ids.get(id(record))
+            if person_id:
+                record["_avatar"] = images.get(person_id) or False
+
+    # Organisation logos
+    org_field = settings.get_cms_organisation()
+    if org_field == "created_by$organisation_id":
+        org_field = "auth_user.organisation_id"
+    elif org_field == "post_organisation.organisation_id":
+        org_field = "cms_post_organisation.organisation_id"
+    if org_field:
+        organisation_ids = set()
+        for row in rows:
+            organisation_id = row[org_field]
+            if organisation_id and not isinstance(organisation_id, list):
+                organisation_ids.add(organisation_id)
+        if organisation_ids:
+            otable = db.org_organisation
+            query = (otable.id.belongs(organisation_ids))
+            logos = dict((row.id, row.logo)
+                         for row in db(query).select(otable.id, otable.logo))
+            for record in records:
+                organisation_id = record["_row"][org_field]
+                if isinstance(organisation_id, list):
+                    continue
+                if organisation_id in logos:
+                    record["_logo"] = logos[organisation_id]
+
+    # Bookmarks of the current user
+    user = current.auth.user
+    if user and settings.get_cms_bookmarks():
+        # Use the raw IDs, record["cms_post.id"] is the represented ID
+        post_ids = [record["_row"]["cms_post.id"] for record in records]
+        ltable = s3db.cms_post_user
+        query = (ltable.post_id.belongs(post_ids)) & \
+                (ltable.user_id == user.id)
+        bookmarked = set(row.post_id
+                         for row in db(query).select(ltable.post_id))
+        for record in records:
+            record["_bookmarked"] = record["_row"]["cms_post.id"] in bookmarked
+
+# Look up related data for all items of a page before rendering
+cms_post_list_layout.prefetch = cms_post_list_prefetch
+
+# Tables the layout renders data from (for cached datalists)
+cms_post_list_layout.cache_tables = ["cms_post",
+                                     "cms_post_user",
+                                     "doc_document",
+                                     "org_organisation",
+                                     "pr_image",
+                                     "pr_person",
+                                     "pr_person_user",
+                                     ]
+
 # END =========================================================================
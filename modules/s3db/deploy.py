@@ -1899,6 +1899,81 @@ def deploy_response_select_mission(r, **attr):
 class deploy_MissionProfileLayout(S3DataListLayout):
     """ DataList layout for Mission Profile """
 
+    cache_tables = ["deploy_alert_recipient",
+                    "deploy_assignment",
+                    "deploy_assignment_appraisal",
+                    "doc_document",
+                    "hrm_appraisal",
+                    "hrm_human_resource",
+                    "org_organisation",
+                    ]
+
+    # -------------------------------------------------------------------------
+    def prefetch(self, resource, records, rfields):
+        """
+            Look up the recipients of all alerts on the page at once
+
+            @param resource: the S3Resource to render
+            @param records: the records (list of dicts)
+            @param rfields: the S3ResourceFields to render
+        """
+
+        if resource.tablename != "deploy_alert":
+            return
+
+        # Use the raw IDs, record[pkey] is the represented ID
+        pkey = str(resource._id)
+        alert_ids = [record["_row"][pkey] for record in records]
+        recipients = self.alert_recipients(alert_ids)
+        for record in records:
+            record["_recipients"] = recipients.get(record["_row"][pkey], [])
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def alert_recipients(alert_ids):
+        """
+            Count the recipients of alerts, aggregated by region
+
+            @param alert_ids: the deploy_alert record IDs
+
+            @return: dict {alert_id: [(region_id, region_name, number)]}
+        """
+
+        if not alert_ids:
+            return {}
+
+        s3db = current.s3db
+
+        rtable = s3db.deploy_alert_recipient
+        htable = s3db.hrm_human_resource
+        otable = s3db.org_organisation
+        left = [htable.on(htable.id==rtable.human_resource_id),
+                otable.on(otable.id==htable.organisation_id)]
+        if len(alert_ids) == 1:
+            query = (rtable.alert_id == alert_ids[0])
+        else:
+            query = (rtable.alert_id.belongs(alert_ids))
+        query &= (rtable.deleted != True)
+        alert_id = rtable.alert_id
+        region = otable.region_id
+        rcount = htable.id.count()
+        rows = current.db(query).select(alert_id,
+                                        region,
+                                        rcount,
+                                        left=left,
+                                        groupby=[alert_id, region])
+        if not rows:
+            return {}
+
+        represent = otable.region_id.represent
+        regions = represent.bulk([row[region] for row in rows])
+        recipients = {}
+        for row in rows:
+            region_id = row[region]
+            item = (region_id, regions.get(region_id), row[rcount])
+            recipients.setdefault(row[alert_id], []).append(item)
+        return recipients
+
     # -------------------------------------------------------------------------
     def render_header(self, list_id, item_id, resource, rfields, record):
         """
@@ -1946,19 +2021,11 @@ class deploy_MissionProfileLayout(S3DataListLayout):
             subject = record["deploy_alert.subject"]
 
             # Recipients, aggregated by region
-            rtable = s3db.deploy_alert_recipient
-            htable = s3db.hrm_human_resource
-            otable = s3db.org_organisation
-            left = [htable.on(htable.id==rtable.human_resource_id),
-                    otable.on(otable.id==htable.organisation_id)]
-            query = (rtable.alert_id == record_id) & \
-                    (rtable.deleted != True)
-            region = otable.region_id
-            rcount = htable.id.count()
-            rows = current.db(query).select(region,
-                                            rcount,
-                                            left=left,
-                                            groupby=region)
+            if "_recipients" in record:
+                rows = record["_recipients"]
+            else:
+                alert_id = raw[pkey]
+                rows = self.alert_recipients([alert_id]).get(alert_id, [])
 
             total_recipients = 0
             if rows:
@@ -1971,23 +2038,17 @@ class deploy_MissionProfileLayout(S3DataListLayout):
                     HRS_LABEL = HR_LABEL
                 elif hr_label == "Volunteer":
                     HRS_LABEL = T("Volunteers")
-                represent = otable.region_id.represent
-                regions = represent.bulk([row[region] for row in rows])
                 no_region = None
                 recipients = []
-                for row in rows:
+                for region_id, region_name, num in rows:
                     # Region
-                    region_id = row[region]
-                    if region_id:
-                        region_name = regions.get(region_id)
-                    else:
+                    if not region_id:
                         region_name = T("No Region")
                     region_filter = {
                         "recipient.human_resource_id$" \
                         "organisation_id$region_id__belongs": region_id
                     }
                     # Number of recipients
-                    num = row[rcount]
                     total_recipients += num
                     label = HR_LABEL if num == 1 else HRS_LABEL
                     # Link
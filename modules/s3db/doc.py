@@ -28,12 +28,27 @@
 """
 
 __all__ = ["S3DocumentLibrary",
+           "S3DocumentIndexModel",
            "doc_image_represent",
            "doc_document_list_layout",
+           "doc_extract_text",
+           "doc_index",
+           "doc_index_record",
+           "doc_index_update",
+           "doc_LocalIndex",
+           "doc_SolrIndex",
           ]
 
 import os
 
+try:
+    import json # try stdlib (Python 2.6)
+except ImportError:
+    try:
+        import simplejson as json # try external module
+    except:
+        import gluon.contrib.simplejson as json # fallback to pure-Python module
+
 from gluon import *
 from gluon.storage import Storage
 from ..s3 import *
@@ -194,7 +209,8 @@ class S3DocumentLibrary(S3Model):
         # Search Method
 
         # Resource Configuration
-        if settings.get_base_solr_url():
+        index = doc_index()
+        if index and "doc_document" in index.TABLES:
             onaccept = self.document_onaccept
             ondelete = self.document_ondelete
         else:
@@ -299,8 +315,17 @@ class S3DocumentLibrary(S3Model):
         # Search Method
 
         # Resource Configuration
+        if index and "doc_image" in index.TABLES:
+            onaccept = self.image_onaccept
+            ondelete = self.image_ondelete
+        else:
+            onaccept = None
+            ondelete = None
+
         configure(tablename,
                   deduplicate = self.document_duplicate,
+                  onaccept = onaccept,
+                  ondelete = ondelete,
                   onvalidation = lambda form: \
                             self.document_onvalidation(form, document=False)
                   )
@@ -455,8 +480,16 @@ class S3DocumentLibrary(S3Model):
        
         table = current.db.doc_document
 
+        if doc and isinstance(doc, basestring):
+            try:
+                name = table.file.retrieve(doc)[0]
+            except IOError:
+                name = None
+        else:
+            doc = name = None
+
         document = json.dumps(dict(filename=doc,
-                                   name=table.file.retrieve(doc)[0],
+                                   name=name,
                                    id=form_vars.id,
                                    ))
 
@@ -484,6 +517,69 @@ class S3DocumentLibrary(S3Model):
 
         return
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def image_onaccept(form):
+        """
+            Update the full-text index for an image (metadata only,
+            so this doesn't need to run asynchronously)
+        """
+
+        record_id = form.vars.id
+        if record_id:
+            doc_index_record("doc_image", record_id)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def image_ondelete(row):
+        """ Remove an image from the full-text index """
+
+        index = doc_index()
+        if index:
+            index.delete("doc_image", row.id)
+
+# =============================================================================
+class S3DocumentIndexModel(S3Model):
+    """ Model for the built-in full-text index for documents and images """
+
+    names = ["doc_index"]
+
+    def model(self):
+
+        # ---------------------------------------------------------------------
+        # Full-text Index (see doc_LocalIndex)
+        #
+        tablename = "doc_index"
+        self.define_table(tablename,
+                          Field("tablename",
+                                length=64),
+                          Field("record_id", "integer"),
+                          # Normalized term, or "*" for the document length
+                          Field("term",
+                                length=64),
+                          # Number of occurences of the term
+                          Field("count", "integer"),
+                          # Token positions of the term (for phrase search)
+                          Field("positions", "list:integer"),
+                          )
+
+        self.configure(tablename,
+                       indexes = [("tablename", "term"),
+                                  ("tablename", "record_id"),
+                                  ],
+                       )
+
+        # ---------------------------------------------------------------------
+        # Pass names back to global scope (s3.*)
+        #
+        return {}
+
+    # -------------------------------------------------------------------------
+    def defaults(self):
+        """ Safe defaults if module is disabled """
+
+        return {}
+
 # =============================================================================
 def doc_image_represent(filename):
     """
@@ -625,6 +721,472 @@ def doc_document_list_layout(list_id, item_id, resource, rfields, record):
 
     return item
 
+# =============================================================================
+def doc_index():
+    """
+        Get the full-text index backend for documents
+        (settings.doc.index_backend)
+
+        @return: the backend instance, or None if not configured
+    """
+
+    settings = current.deployment_settings
+    backend = settings.get_doc_index_backend()
+    if backend == "local":
+        return doc_LocalIndex()
+    elif backend == "solr":
+        return doc_SolrIndex(settings.get_base_solr_url())
+    return None
+
+# =============================================================================
+def doc_file_path(field, filename):
+    """
+        Get the file system path of an uploaded file
+
+        @param field: the upload Field
+        @param filename: the (encoded) file name as stored in the field
+    """
+
+    folder = field.uploadfolder or \
+             os.path.join(current.request.folder, "uploads")
+    return os.path.join(folder, filename)
+
+# =============================================================================
+def doc_extract_text(path):
+    """
+        Extract the text from a document file for the full-text index
+        - must not use current.*, as this can run in a worker thread
+
+        @param path: the file path
+        @return: the text (unicode), empty if not extractable
+    """
+
+    if not path or not os.path.exists(path):
+        return u""
+
+    import subprocess
+
+    extension = os.path.splitext(path)[1][1:].lower()
+    try:
+        if extension == "pdf":
+            data = subprocess.check_output(["pdf2txt.py", path])
+        elif extension == "doc":
+            data = subprocess.check_output(["antiword", path])
+        elif extension == "xls":
+            from xlrd import open_workbook
+            wb = open_workbook(path)
+            lines = []
+            for sheet in wb.sheets():
+                for row in xrange(sheet.nrows):
+                    values = [s3_unicode(sheet.cell(row, col).value)
+                              for col in xrange(sheet.ncols)]
+                    lines.append(",".join(values))
+            data = u"\n".join(lines)
+        elif extension == "rtf":
+            from pyth.plugins.rtf15.reader import Rtf15Reader
+            from pyth.plugins.plaintext.writer import PlaintextWriter
+            with open(path, "rb") as f:
+                doc = Rtf15Reader.read(f)
+            data = PlaintextWriter.write(doc).getvalue()
+        elif extension in ("txt", "csv", "htm", "html", "xml"):
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            data = subprocess.check_output(["strings", path])
+    except (ImportError, IOError, OSError, subprocess.CalledProcessError):
+        return u""
+
+    # Unicode without control characters
+    if not isinstance(data, unicode):
+        data = unicode(data, "utf-8", errors="ignore")
+    return u"".join(c if ord(c) >= 32 else u" " for c in data)
+
+# =============================================================================
+def doc_index_record(tablename, record_id, text=None):
+    """
+        Add or update a document or image in the full-text index
+
+        @param tablename: the tablename (doc_document or doc_image)
+        @param record_id: the record ID
+        @param text: the text of the file (if already extracted),
+                     otherwise extracted from the file of the document
+    """
+
+    index = doc_index()
+    if not index or tablename not in index.TABLES:
+        return
+
+    db = current.db
+    table = current.s3db[tablename]
+
+    record = db(table.id == record_id).select(table.id,
+                                              table.deleted,
+                                              table.file,
+                                              table.name,
+                                              table.url,
+                                              table.comments,
+                                              limitby=(0, 1)).first()
+    if not record or record.deleted:
+        index.delete(tablename, record_id)
+        return
+
+    meta = {"name": record.name,
+            "url": record.url,
+            "comments": record.comments,
+            }
+    if record.file:
+        try:
+            filename, stream = table.file.retrieve(record.file)
+            stream.close()
+        except IOError:
+            filename = None
+        path = doc_file_path(table.file, record.file)
+        meta["filename"] = filename
+        meta["filetype"] = os.path.splitext(record.file)[1][1:].lower()
+        meta["path"] = path
+        if text is None and tablename == "doc_document":
+            text = doc_extract_text(path)
+
+    index.add(tablename, record_id, text, meta)
+
+    if tablename == "doc_document":
+        db(table.id == record_id).update(has_been_indexed = True)
+
+# =============================================================================
+def doc_index_update(rebuild=False, chunk_size=50):
+    """
+        Add all documents and images to the full-text index which have
+        not been indexed yet; the text extraction from the files runs in
+        parallel workers (settings.doc.index_workers)
+
+        @param rebuild: re-index all documents and images
+        @param chunk_size: number of documents to extract at a time
+
+        @return: the number of indexed records
+    """
+
+    index = doc_index()
+    if not index:
+        return 0
+
+    db = current.db
+    s3db = current.s3db
+
+    count = 0
+
+    if "doc_document" in index.TABLES:
+        table = s3db.doc_document
+        query = (table.deleted != True)
+        if not rebuild:
+            query &= (table.has_been_indexed != True)
+        rows = db(query).select(table.id, table.file)
+
+        workers = current.deployment_settings.get_doc_index_workers()
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max(1, workers or 1))
+        try:
+            for i in xrange(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+                paths = [doc_file_path(table.file, row.file) if row.file else None
+                         for row in chunk]
+                texts = pool.map(doc_extract_text, paths)
+                for row, text in zip(chunk, texts):
+                    doc_index_record("doc_document", row.id, text=text)
+                    count += 1
+        finally:
+            pool.close()
+            pool.join()
+
+    if "doc_image" in index.TABLES:
+        table = s3db.doc_image
+        query = (table.deleted != True)
+        if not rebuild:
+            itable = s3db.doc_index
+            indexed = db((itable.tablename == "doc_image") & \
+                         (itable.term == doc_LocalIndex.LENGTH))._select(itable.record_id)
+            query &= ~(table.id.belongs(indexed))
+        rows = db(query).select(table.id)
+        for row in rows:
+            doc_index_record("doc_image", row.id)
+            count += 1
+
+    return count
+
+# =============================================================================
+class doc_LocalIndex(object):
+    """
+        Built-in full-text index in the database (doc_index table): an
+        inverted index of normalized terms with their positions in the
+        text, to find and rank documents without a Solr server
+    """
+
+    # Tables which can be indexed
+    TABLES = ("doc_document", "doc_image")
+
+    # Metadata to index along with the text
+    META = ("name", "filename", "comments", "url")
+
+    # Pseudo-term for the document length
+    LENGTH = "*"
+
+    # Maximum length of terms
+    TERM_LENGTH = 64
+
+    # Maximum number of tokens to index per document
+    MAX_TOKENS = 100000
+
+    # Rank multiplier for exact phrase matches
+    PHRASE_BOOST = 2.0
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def terms(cls, text):
+        """
+            Split a text into normalized terms
+
+            @param text: the text
+            @return: list of terms
+        """
+
+        maxlen = cls.TERM_LENGTH
+        terms = []
+        for token in S3NameIndex.tokens(text):
+            if len(token) > maxlen:
+                token = token[:maxlen].decode("utf-8", "ignore").encode("utf-8")
+            terms.append(token)
+        return terms
+
+    # -------------------------------------------------------------------------
+    def add(self, tablename, record_id, text, meta=None):
+        """
+            Add a record to the index (replaces any previous entries)
+
+            @param tablename: the tablename
+            @param record_id: the record ID
+            @param text: the text of the file
+            @param meta: dict with metadata of the record
+        """
+
+        self.delete(tablename, record_id)
+
+        texts = [text] if text else []
+        if meta:
+            texts.extend(s3_unicode(meta[k]) for k in self.META if meta.get(k))
+        terms = self.terms(u" ".join(texts))[:self.MAX_TOKENS]
+
+        positions = {}
+        for position, term in enumerate(terms):
+            if term in positions:
+                positions[term].append(position)
+            else:
+                positions[term] = [position]
+
+        items = [{"tablename": tablename,
+                  "record_id": record_id,
+                  "term": self.LENGTH,
+                  "count": len(terms),
+                  }]
+        for term, p in positions.iteritems():
+            items.append({"tablename": tablename,
+                          "record_id": record_id,
+                          "term": term,
+                          "count": len(p),
+                          "positions": p,
+                          })
+        current.s3db.doc_index.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    def delete(self, tablename, record_id):
+        """
+            Remove a record from the index
+
+            @param tablename: the tablename
+            @param record_id: the record ID
+        """
+
+        table = current.s3db.doc_index
+        query = (table.tablename == tablename) & \
+                (table.record_id == record_id)
+        current.db(query).delete()
+
+    # -------------------------------------------------------------------------
+    def search(self, text, tablenames=None, limit=50):
+        """
+            Search the index, all terms must match; records containing
+            the terms as exact phrase are ranked higher, and if the search
+            string is in double quotes, only exact phrase matches are
+            returned
+
+            @param text: the search string
+            @param tablenames: restrict the search to these tables
+            @param limit: the maximum number of results
+
+            @return: list of tuples (tablename, record_id, rank),
+                     ordered by rank (highest first)
+        """
+
+        text = s3_unicode(text or "").strip()
+        phrase = len(text) > 1 and text[0] == text[-1] == u'"'
+        terms = self.terms(text)
+        if not terms:
+            return []
+        unique = set(terms)
+
+        db = current.db
+        table = current.s3db.doc_index
+
+        base = (table.id > 0)
+        if tablenames:
+            base &= (table.tablename.belongs(tablenames))
+
+        rows = db(base & table.term.belongs(unique)).select(table.tablename,
+                                                            table.record_id,
+                                                            table.term,
+                                                            table.count,
+                                                            table.positions,
+                                                            )
+        matches = {}
+        frequency = {}
+        for row in rows:
+            key = (row.tablename, row.record_id)
+            if key in matches:
+                matches[key][row.term] = row
+            else:
+                matches[key] = {row.term: row}
+            frequency[row.term] = frequency.get(row.term, 0) + 1
+
+        candidates = [key for key, found in matches.iteritems()
+                      if len(found) == len(unique)]
+        if not candidates:
+            return []
+
+        # Document lengths and total number of documents
+        query = base & (table.term == self.LENGTH)
+        total = db(query).count()
+        record_ids = set(record_id for tn, record_id in candidates)
+        rows = db(query & table.record_id.belongs(record_ids)).select(
+                                                            table.tablename,
+                                                            table.record_id,
+                                                            table.count,
+                                                            )
+        lengths = dict(((row.tablename, row.record_id), row.count)
+                       for row in rows)
+
+        from math import log, sqrt
+        idf = dict((term, log(1.0 + float(total) / frequency[term]))
+                   for term in unique)
+
+        results = []
+        for key in candidates:
+            found = matches[key]
+            rank = sum(found[term].count * idf[term] for term in unique)
+            rank /= sqrt(lengths.get(key) or 1)
+            if len(terms) > 1:
+                if self.phrase_match(found, terms):
+                    rank *= self.PHRASE_BOOST
+                elif phrase:
+                    continue
+            results.append((key[0], key[1], rank))
+
+        results.sort(key=lambda item: item[2], reverse=True)
+        return results[:limit] if limit else results
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def phrase_match(found, terms):
+        """
+            Check whether the terms appear as consecutive phrase
+
+            @param found: dict {term: Row} with the index entries
+            @param terms: the terms in phrase order
+        """
+
+        positions = [set(found[term].positions or []) for term in terms]
+        for start in positions[0]:
+            if all(start + i in positions[i] for i in xrange(1, len(terms))):
+                return True
+        return False
+
+# =============================================================================
+class doc_SolrIndex(object):
+    """ Full-text index for documents on a Solr server """
+
+    # Tables which can be indexed
+    TABLES = ("doc_document",)
+
+    # -------------------------------------------------------------------------
+    def __init__(self, url):
+        """
+            Constructor
+
+            @param url: the Solr URL
+        """
+
+        self.url = url
+
+    # -------------------------------------------------------------------------
+    def interface(self):
+        """ Connect to the Solr server """
+
+        import sunburnt
+        return sunburnt.SolrInterface(self.url)
+
+    # -------------------------------------------------------------------------
+    def add(self, tablename, record_id, text, meta=None):
+        """
+            Add a document to the index
+
+            @param tablename: the tablename
+            @param record_id: the record ID
+            @param text: the text of the file
+            @param meta: dict with metadata of the record
+        """
+
+        if meta is None:
+            meta = {}
+        si = self.interface()
+        si.add({"id": str(record_id), # doc_document.id
+                "name": text or "", # the data of the file
+                "url": meta.get("path"), # the encoded file name stored in uploads/
+                "filename": meta.get("filename"), # the filename actually uploaded by the user
+                "filetype": meta.get("filetype"), # x.pdf -> pdf is the extension of the file
+                })
+        si.commit()
+
+    # -------------------------------------------------------------------------
+    def delete(self, tablename, record_id):
+        """
+            Remove a document from the index
+
+            @param tablename: the tablename
+            @param record_id: the record ID
+        """
+
+        si = self.interface()
+        si.delete(record_id)
+        si.commit()
+
+    # -------------------------------------------------------------------------
+    def search(self, text, tablenames=None, limit=50):
+        """
+            Search the index
+
+            @param text: the search string
+            @param tablenames: restrict the search to these tables
+            @param limit: the maximum number of results
+
+            @return: list of tuples (tablename, record_id, rank),
+                     ordered by rank (highest first)
+        """
+
+        if tablenames and "doc_document" not in tablenames:
+            return []
+        si = self.interface()
+        response = si.query(name=text).field_limit(["id"], score=True) \
+                                      .paginate(rows=limit).execute()
+        return [("doc_document", int(doc["id"]), doc.get("score", 0))
+                for doc in response]
+
 # =============================================================================
 class doc_DocumentRepresent(S3Represent):
     """ Representation of Documents """
@@ -74,6 +74,7 @@ class S3LocationModel(S3Model):
 
     names = ["gis_location",
              #"gis_location_error",
+             "gis_location_data",
              "gis_location_id",
              "gis_country_id",
              "gis_country_requires",
@@ -256,7 +257,9 @@ class S3LocationModel(S3Model):
                                               # If strict, filter on next higher level?
                                               filterby="level",
                                               filter_opts=hierarchy_level_keys,
-                                              orderby="gis_location.name"))
+                                              orderby="gis_location.name",
+                                              # Autocomplete widget
+                                              lazy=True))
 
         # CRUD Strings
         current.response.s3.crud_strings[tablename] = Storage(
@@ -330,9 +333,14 @@ class S3LocationModel(S3Model):
                        context = {"location": "parent",
                                   },
                        deduplicate = self.gis_location_duplicate,
+                       indexes = ["name",
+                                  "parent",
+                                  ],
                        list_fields = list_fields,
                        list_orderby = "gis_location.name",
+                       name_index = ["name"],
                        onaccept = self.gis_location_onaccept,
+                       ondelete = self.gis_location_ondelete,
                        onvalidation = self.gis_location_onvalidation,
                        )
 
@@ -360,6 +368,26 @@ class S3LocationModel(S3Model):
                        org_site="location_id",
                       )
 
+        # ---------------------------------------------------------------------
+        # Precomputed child locations per parent and language
+        # (see S3LocationData)
+        #
+        tablename = "gis_location_data"
+        self.define_table(tablename,
+                          # Parent location (0 = L0 locations)
+                          Field("location_id", "integer"),
+                          Field("language", length=8),
+                          Field("children", "list:integer"),
+                          Field("data", "text"),
+                          # Hash of the data, used as ETag
+                          Field("version", length=32),
+                          *s3_timestamp())
+
+        self.configure(tablename,
+                       indexes = [("location_id", "language")],
+                       track_writes = False,
+                       )
+
         # ---------------------------------------------------------------------
         # Error
         # - needed for COT support
@@ -425,8 +453,20 @@ class S3LocationModel(S3Model):
                                       ))
             current.s3task.async("gis_update_location_tree",
                                  args=[feature])
+
+        # Remove the precomputed hierarchy data for this location
+        S3LocationData.invalidate(id)
         return
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def gis_location_ondelete(row):
+        """
+            On Delete for GIS Locations
+        """
+
+        S3LocationData.invalidate(row.id)
+
     # -------------------------------------------------------------------------
     @staticmethod
     def gis_location_onvalidation(form):
@@ -895,6 +935,13 @@ class S3LocationModel(S3Model):
             query |= S3FieldSelector("name.name_l10n").lower().like(value + "%")
         resource.add_filter(query)
 
+        # Restrict to the candidates from the name index (if enabled,
+        # and not searching in any other fields)
+        if not field2 and not search_l10n:
+            ranks = S3NameIndex.apply(resource, value)
+        else:
+            ranks = None
+
         if level:
             # LocationSelector or Autocomplete
             if isinstance(level, list):
@@ -921,6 +968,7 @@ class S3LocationModel(S3Model):
 
         MAX_SEARCH_RESULTS = current.deployment_settings.get_search_max_results()
         if (not limit or limit > MAX_SEARCH_RESULTS) and \
+           (ranks is None or len(ranks) > MAX_SEARCH_RESULTS) and \
            resource.count() > MAX_SEARCH_RESULTS:
             output = json.dumps([
                 dict(label=str(current.T("There are more than %(max)s results, please input more characters.") % dict(max=MAX_SEARCH_RESULTS)))
@@ -941,6 +989,7 @@ class S3LocationModel(S3Model):
                                    start=0,
                                    limit=limit,
                                    orderby="gis_location.name")["rows"]
+            rows = S3NameIndex.rank(rows, ranks, "gis_location.id")
             if translate:
                 # Lookup Translations
                 s3db = current.s3db
@@ -1083,7 +1132,10 @@ class S3LocationNameModel(S3Model):
                           *s3_meta_fields())
 
         self.configure(tablename,
-                       deduplicate=self.gis_location_name_deduplicate)
+                       deduplicate=self.gis_location_name_deduplicate,
+                       onaccept=self.gis_location_name_onaccept,
+                       ondelete=self.gis_location_name_ondelete,
+                       )
 
         # Pass names back to global scope (s3.*)
         return dict()
@@ -1113,6 +1165,47 @@ class S3LocationNameModel(S3Model):
                 job.id = _duplicate.id
                 job.method = job.METHOD.UPDATE
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def gis_location_name_onaccept(form):
+        """
+            Remove the precomputed hierarchy data for the location
+        """
+
+        form_vars = form.vars
+        location_id = form_vars.get("location_id")
+        if not location_id and form_vars.id:
+            table = current.s3db.gis_location_name
+            row = current.db(table.id == form_vars.id).select(table.location_id,
+                                                              limitby=(0, 1)
+                                                              ).first()
+            if row:
+                location_id = row.location_id
+        S3LocationData.invalidate(location_id)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def gis_location_name_ondelete(row):
+        """
+            Remove the precomputed hierarchy data for the location
+        """
+
+        db = current.db
+        table = current.s3db.gis_location_name
+        try:
+            record_id = row.id
+        except:
+            return
+        record = db(table.id == record_id).select(table.location_id,
+                                                  table.deleted_fk,
+                                                  limitby=(0, 1)).first()
+        if record:
+            location_id = record.location_id
+            if not location_id and record.deleted_fk:
+                deleted_fk = json.loads(record.deleted_fk)
+                location_id = deleted_fk.get("location_id")
+            S3LocationData.invalidate(location_id)
+
 # =============================================================================
 class S3LocationTagModel(S3Model):
     """
@@ -2559,7 +2652,9 @@ class S3FeatureLayerModel(S3Model):
           (for transformation to GeoJSON/KML/GPX)
     """
 
-    names = ["gis_layer_feature"]
+    names = ["gis_layer_feature",
+             "gis_feature_cache",
+             ]
 
     def model(self):
 
@@ -2710,6 +2805,24 @@ class S3FeatureLayerModel(S3Model):
                                      },
                       )
 
+        # ---------------------------------------------------------------------
+        # Cached GeoJSON output of Feature Layers (see S3FeatureCache)
+        #
+        tablename = "gis_feature_cache"
+        self.define_table(tablename,
+                          Field("layer_id", "reference gis_layer_feature",
+                                ondelete = "CASCADE"),
+                          # Hash of the request (URL, vars, realms, language)
+                          Field("cache_key", length=64),
+                          # Tables the output depends on
+                          Field("tables", "list:string"),
+                          Field("geojson", "text"),
+                          *s3_timestamp())
+
+        self.configure(tablename,
+                       track_writes = False,
+                       )
+
         # Pass names back to global scope (s3.*)
         return dict()
 
@@ -986,15 +986,23 @@ class S3HRModel(S3Model):
 
         resource.add_filter(query)
 
+        # Restrict to the candidates from the name index (if enabled)
+        ranks = S3NameIndex.apply(resource, value,
+                                  tablename="pr_person",
+                                  selectors=["person_id"])
+
         settings = current.deployment_settings
         limit = int(_vars.limit or 0)
         MAX_SEARCH_RESULTS = settings.get_search_max_results()
-        if (not limit or limit > MAX_SEARCH_RESULTS) and resource.count() > MAX_SEARCH_RESULTS:
+        if (not limit or limit > MAX_SEARCH_RESULTS) and \
+           (ranks is None or len(ranks) > MAX_SEARCH_RESULTS) and \
+           resource.count() > MAX_SEARCH_RESULTS:
             output = json.dumps([
                 dict(label=str(current.T("There are more than %(max)s results, please input more characters.") % dict(max=MAX_SEARCH_RESULTS)))
                 ], separators=SEPARATORS)
         else:
             fields = ["id",
+                      "person_id",
                       "person_id$first_name",
                       "person_id$middle_name",
                       "person_id$last_name",
@@ -1012,6 +1020,8 @@ class S3HRModel(S3Model):
                                    start=0,
                                    limit=limit,
                                    orderby=orderby)["rows"]
+            rows = S3NameIndex.rank(rows, ranks,
+                                    "hrm_human_resource.person_id")
 
             items = []
             iappend = items.append
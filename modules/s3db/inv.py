@@ -2233,7 +2233,6 @@ S3OptionsFilter({
             session.error = T("This shipment has already been sent.")
 
         tracktable = db.inv_track_item
-        siptable = s3db.supply_item_pack
         rrtable = s3db.req_req
         ritable = s3db.req_req_item
 
@@ -2264,22 +2263,31 @@ S3OptionsFilter({
                                                         limitby=(0, 1)).first()
         if req_rec:
             req_id = req_rec.id
+            # Look up all request items and packs at once
+            req_item_ids = [t.req_item_id for t in track_items if t.req_item_id]
+            if req_item_ids:
+                rows = db(ritable.id.belongs(req_item_ids)).select(ritable.id,
+                                                                   ritable.item_pack_id)
+                req_packs = dict((row.id, row.item_pack_id) for row in rows)
+            else:
+                req_packs = {}
+            pack_ids = req_packs.values() + \
+                       [t.item_pack_id for t in track_items]
+            packs = s3db.supply_item_pack_quantities(pack_ids)
+
+            # Sum up the quantities in transit per request item
+            transit = {}
             for track_item in track_items:
                 req_item_id = track_item.req_item_id
                 if req_item_id:
-                    req_pack_id = db(ritable.id == req_item_id).select(ritable.item_pack_id,
-                                                                       limitby=(0, 1)
-                                                                       ).first().item_pack_id
-                    req_p_qnty = db(siptable.id == req_pack_id).select(siptable.quantity,
-                                                                       limitby=(0, 1)
-                                                                       ).first().quantity
+                    req_p_qnty = packs[req_packs[req_item_id]]
                     t_qnty = track_item.quantity
-                    t_pack_id = track_item.item_pack_id
-                    inv_p_qnty = db(siptable.id == t_pack_id).select(siptable.quantity,
-                                                                     limitby=(0, 1)
-                                                                     ).first().quantity
+                    inv_p_qnty = packs[track_item.item_pack_id]
                     transit_quantity = t_qnty * inv_p_qnty / req_p_qnty
-                    db(ritable.id == req_item_id).update(quantity_transit = ritable.quantity_transit + transit_quantity)
+                    transit[req_item_id] = transit.get(req_item_id, 0) + \
+                                           transit_quantity
+            for req_item_id, transit_quantity in transit.items():
+                db(ritable.id == req_item_id).update(quantity_transit = ritable.quantity_transit + transit_quantity)
             s3db.req_update_status(req_id)
 
         # Create a Receive record
@@ -2735,8 +2743,8 @@ S3OptionsFilter({
         inv_item_table = db.inv_inv_item
         stable = db.inv_send
         rtable = db.inv_recv
-        siptable = db.supply_item_pack
         supply_item_add = s3db.supply_item_add
+        supply_item_pack_quantities = s3db.supply_item_pack_quantities
         oldTotal = 0
         form_vars = form.vars
         id = form_vars.id
@@ -2759,26 +2767,23 @@ S3OptionsFilter({
         # It will be there on an import and so the value will be deducted correctly
         if form_vars.quantity and stock_item:
             stock_quantity = stock_item.quantity
-            stock_pack = db(siptable.id == stock_item.item_pack_id).select(siptable.quantity,
-                                                                           limitby=(0, 1)
-                                                                           ).first().quantity
+            pack_ids = [stock_item.item_pack_id, form_vars.item_pack_id]
+            if record:
+                pack_ids.append(record.item_pack_id)
+            packs = supply_item_pack_quantities(pack_ids)
+            stock_pack = packs[stock_item.item_pack_id]
             if record:
                 if record.send_inv_item_id != None:
                     # Items have already been removed from stock, so first put them back
-                    old_track_pack_quantity = db(siptable.id == record.item_pack_id).select(siptable.quantity,
-                                                                                            limitby=(0, 1)
-                                                                                            ).first().quantity
+                    old_track_pack_quantity = packs[record.item_pack_id]
                     stock_quantity = supply_item_add(stock_quantity,
                                                      stock_pack,
                                                      record.quantity,
                                                      old_track_pack_quantity
                                                      )
-            try:
-                new_track_pack_quantity = db(siptable.id == form_vars.item_pack_id).select(siptable.quantity,
-                                                                                           limitby=(0, 1)
-                                                                                           ).first().quantity
-            except:
-                new_track_pack_quantity = record.item_pack_id.quantity
+            new_track_pack_quantity = packs.get(form_vars.item_pack_id)
+            if new_track_pack_quantity is None:
+                new_track_pack_quantity = packs[record.item_pack_id]
             newTotal = supply_item_add(stock_quantity,
                                        stock_pack,
                                        - float(form_vars.quantity),
@@ -2802,9 +2807,11 @@ S3OptionsFilter({
         # If this item is linked to a request, then copy the req_ref to the send item
         if use_req and record and record.req_item_id:
             
-            req_id = db(ritable.id == record.req_item_id).select(ritable.req_id,
-                                                                 limitby=(0, 1)
-                                                                 ).first().req_id
+            req_item = db(ritable.id == record.req_item_id).select(ritable.req_id,
+                                                                   ritable.item_pack_id,
+                                                                   limitby=(0, 1)
+                                                                   ).first()
+            req_id = req_item.req_id
             req_ref = db(rrtable.id == req_id).select(rrtable.req_ref,
                                                       limitby=(0, 1)
                                                       ).first().req_ref
@@ -2868,23 +2875,15 @@ S3OptionsFilter({
                                                     )
             # If this item is linked to a request, then update the quantity fulfil
             if use_req and record.req_item_id:
-                req_item = db(ritable.id == record.req_item_id).select(ritable.quantity_fulfil,
-                                                                       ritable.item_pack_id,
-                                                                       limitby=(0, 1)
-                                                                       ).first()
-                req_quantity = req_item.quantity_fulfil
-                req_pack_quantity = db(siptable.id == req_item.item_pack_id).select(siptable.quantity,
-                                                                                    limitby=(0, 1)
-                                                                                    ).first().quantity
-                track_pack_quantity = db(siptable.id == record.item_pack_id).select(siptable.quantity,
-                                                                                    limitby=(0, 1)
-                                                                                    ).first().quantity
-                quantity_fulfil = supply_item_add(req_quantity,
-                                                  req_pack_quantity,
+                packs = supply_item_pack_quantities([req_item.item_pack_id,
+                                                     record.item_pack_id])
+                # Apply the delta in the DB (in request item packs)
+                fulfil_quantity = supply_item_add(0,
+                                                  packs[req_item.item_pack_id],
                                                   record.recv_quantity,
-                                                  track_pack_quantity
+                                                  packs[record.item_pack_id]
                                                   )
-                db(ritable.id == record.req_item_id).update(quantity_fulfil = quantity_fulfil)
+                db(ritable.id == record.req_item_id).update(quantity_fulfil = ritable.quantity_fulfil + fulfil_quantity)
                 s3db.req_update_status(req_id)
 
             db(tracktable.id == id).update(recv_inv_item_id = inv_item_id,
@@ -2950,25 +2949,26 @@ S3OptionsFilter({
         tracktable = db.inv_track_item
         inv_item_table = db.inv_inv_item
         ritable = s3db.req_req_item
-        siptable = db.supply_item_pack
         record = tracktable[id]
         if record.status != 1:
             return False
         # if this is linked to a request
         # then remove these items from the quantity in transit
         if record.req_item_id:
-            req_id = record.req_item_id
-            req_item = ritable[req_id]
-            req_quantity = req_item.quantity_transit
-            req_pack_quantity = siptable[req_item.item_pack_id].quantity
-            track_pack_quantity = siptable[record.item_pack_id].quantity
-            quantity_transit = s3db.supply_item_add(req_quantity,
-                                                   req_pack_quantity,
-                                                   - record.quantity,
-                                                   track_pack_quantity
-                                                  )
-            db(ritable.id == req_id).update(quantity_transit = quantity_transit)
-            s3db.req_update_status(req_id)
+            req_item_id = record.req_item_id
+            req_item = db(ritable.id == req_item_id).select(ritable.req_id,
+                                                            ritable.item_pack_id,
+                                                            limitby=(0, 1)
+                                                            ).first()
+            packs = s3db.supply_item_pack_quantities([req_item.item_pack_id,
+                                                      record.item_pack_id])
+            transit_quantity = s3db.supply_item_add(0,
+                                                    packs[req_item.item_pack_id],
+                                                    - record.quantity,
+                                                    packs[record.item_pack_id]
+                                                    )
+            db(ritable.id == req_item_id).update(quantity_transit = ritable.quantity_transit + transit_quantity)
+            s3db.req_update_status(req_item.req_id)
 
         # Check that we have a link to a warehouse
         if record.send_inv_item_id:
@@ -351,7 +351,8 @@ class S3OrganisationModel(S3Model):
             org_widget = S3OrganisationAutocompleteWidget()
         else:
             help = T("If you don't see the Organization in the list, you can add a new one by clicking link 'Create Organization'.")
-            org_widget = None
+            # Dropdown, or Autocomplete for large numbers of organisations
+            org_widget = S3LazyOptionsWidget()
 
         organisation_comment = S3AddResourceLink(c="org", f="organisation",
                                                  label=ADD_ORGANIZATION,
@@ -375,7 +376,7 @@ class S3OrganisationModel(S3Model):
                                           label = messages.ORGANISATION,
                                           ondelete = "RESTRICT",
                                           represent = org_organisation_represent,
-                                          requires = org_organisation_requires(),
+                                          requires = org_organisation_requires(lazy=True),
                                           sortby = "name",
                                           widget = org_widget,
                                           )
@@ -427,6 +428,7 @@ class S3OrganisationModel(S3Model):
                                  ],
                   list_layout = org_organisation_list_layout,
                   list_orderby = "org_organisation.name",
+                  name_index = ["name", "acronym"],
                   onaccept = self.org_organisation_onaccept,
                   ondelete = self.org_organisation_ondelete,
                   referenced_by = [(utablename, "organisation_id")],
@@ -803,9 +805,18 @@ class S3OrganisationModel(S3Model):
                      (S3FieldSelector("parent.acronym").lower().like(value + "%"))
         resource.add_filter(query)
 
+        # Restrict to the candidates from the name index (if enabled)
+        if use_branches:
+            selectors = ["id", "parent.id"]
+        else:
+            selectors = ["id"]
+        ranks = S3NameIndex.apply(resource, value, selectors=selectors)
+
         MAX_SEARCH_RESULTS = settings.get_search_max_results()
         limit = int(_vars.limit or MAX_SEARCH_RESULTS)
-        if (not limit or limit > MAX_SEARCH_RESULTS) and resource.count() > MAX_SEARCH_RESULTS:
+        if (not limit or limit > MAX_SEARCH_RESULTS) and \
+           (ranks is None or len(ranks) > MAX_SEARCH_RESULTS) and \
+           resource.count() > MAX_SEARCH_RESULTS:
             output = json.dumps([
                 dict(label=str(current.T("There are more than %(max)s results, please input more characters.") % dict(max=MAX_SEARCH_RESULTS)))
                 ], separators=SEPARATORS)
@@ -826,6 +837,11 @@ class S3OrganisationModel(S3Model):
                                    limit=limit,
                                    orderby=field,
                                    as_rows=True)
+            if use_branches:
+                record_id = lambda row: row[table].id
+            else:
+                record_id = lambda row: row.id
+            rows = S3NameIndex.rank(rows, ranks, record_id)
             output = []
             append = output.append
             for row in rows:
@@ -2240,6 +2256,7 @@ class S3SiteModel(S3Model):
                                       "organisation_id",
                                       "location_id",
                                       ],
+                       name_index = ["name"],
                        onaccept = self.org_site_onaccept,
                        ondelete_cascade = self.org_site_ondelete_cascade,
                        )
@@ -2508,9 +2525,19 @@ class S3SiteModel(S3Model):
 
         resource.add_filter(query)
 
+        # Restrict to the candidates from the name index (if enabled,
+        # and not searching in any extra fields)
+        if not extra_fields:
+            ranks = S3NameIndex.apply(resource, value,
+                                      selectors=["site_id"])
+        else:
+            ranks = None
+
         MAX_SEARCH_RESULTS = settings.get_search_max_results()
         limit = int(_vars.limit or MAX_SEARCH_RESULTS)
-        if (not limit or limit > MAX_SEARCH_RESULTS) and resource.count() > MAX_SEARCH_RESULTS:
+        if (not limit or limit > MAX_SEARCH_RESULTS) and \
+           (ranks is None or len(ranks) > MAX_SEARCH_RESULTS) and \
+           resource.count() > MAX_SEARCH_RESULTS:
             output = json.dumps([
                 dict(label=str(current.T("There are more than %(max)s results, please input more characters.") % dict(max=MAX_SEARCH_RESULTS)))
                 ], separators=SEPARATORS)
@@ -2531,6 +2558,8 @@ class S3SiteModel(S3Model):
                                    limit=limit,
                                    orderby="name",
                                    as_rows=True)
+            rows = S3NameIndex.rank(rows, ranks,
+                                    lambda row: row.get("org_site", row).site_id)
             output = []
             append = output.append
             for row in rows:
@@ -3977,7 +4006,8 @@ def org_root_organisation_name(organisation_id):
 # =============================================================================
 def org_organisation_requires(required = False,
                               realms = None,
-                              updateable = False
+                              updateable = False,
+                              lazy = False
                               ):
     """
         @param required: Whether the selection is optional or mandatory
@@ -3985,6 +4015,8 @@ def org_organisation_requires(required = False,
                        belonging to a list of realm entities
         @param updateable: Whether the list should be filtered to just those
                            which the user has Write access to
+        @param lazy: Whether to look up the options lazily (for widgets
+                     with Ajax lookup, see S3LazyOptionsWidget)
     """
 
     requires = IS_ONE_OF(current.db, "org_organisation.id",
@@ -3992,7 +4024,8 @@ def org_organisation_requires(required = False,
                          realms = realms,
                          updateable = updateable,
                          orderby = "org_organisation.name",
-                         sort = True)
+                         sort = True,
+                         lazy = lazy)
     if not required:
         requires = IS_NULL_OR(requires)
     return requires
@@ -79,6 +79,8 @@ __all__ = ["S3PersonEntity",
            # Internal Path Tools
            "pr_rebuild_path",
            "pr_role_rebuild_path",
+           "pr_update_ancestry",
+           "pr_rebuild_ancestry",
            # Helpers for ImageLibrary
            "pr_image_modify",
            "pr_image_resize",
@@ -120,6 +122,7 @@ class S3PersonEntity(S3Model):
 
     names = ["pr_pentity",
              "pr_affiliation",
+             "pr_ancestry",
              "pr_person_user",
              "pr_role",
              "pr_role_types",
@@ -315,6 +318,8 @@ class S3PersonEntity(S3Model):
 
         # Resource configuration
         configure(tablename,
+                  indexes = ["pe_id"],
+                  onaccept = self.pr_role_onaccept,
                   onvalidation = self.pr_role_onvalidation,
                   )
 
@@ -364,10 +369,35 @@ class S3PersonEntity(S3Model):
 
         # Resource configuration
         configure(tablename,
+                  indexes = ["pe_id",
+                             "role_id",
+                             ],
                   onaccept = self.pr_affiliation_onaccept,
                   ondelete = self.pr_affiliation_ondelete,
                   )
 
+        # ---------------------------------------------------------------------
+        # Ancestry (closure table of the OU hierarchy)
+        #
+        # - one row per entity and each of its OU ancestors, with the
+        #   shortest distance between them (depth 1 = immediate parent)
+        # - maintained by pr_update_ancestry whenever affiliations change,
+        #   do not edit manually
+        #
+        tablename = "pr_ancestry"
+        define_table(tablename,
+                     Field("pe_id", "integer"),
+                     Field("ancestor_pe_id", "integer"),
+                     Field("depth", "integer"),
+                     Field("role_type", "integer"),
+                     )
+
+        configure(tablename,
+                  indexes = ["pe_id",
+                             "ancestor_pe_id",
+                             ],
+                  )
+
         # ---------------------------------------------------------------------
         # Pass names back to global scope (s3.*)
         #
@@ -543,6 +573,28 @@ class S3PersonEntity(S3Model):
         except:
             return current.messages.UNKNOWN_OPT
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def pr_role_onaccept(form):
+        """
+            Update the ancestry of all affiliates of a role (the role
+            type or the role's entity may have changed)
+
+            @param form: the CRUD form
+        """
+
+        role_id = form.vars.id
+        if not role_id:
+            return
+        db = current.db
+        atable = db.pr_affiliation
+        query = (atable.role_id == role_id) & \
+                (atable.deleted != True)
+        rows = db(query).select(atable.pe_id)
+        if rows:
+            pr_update_ancestry([row.pe_id for row in rows])
+        return
+
     # -------------------------------------------------------------------------
     @staticmethod
     def pr_role_onvalidation(form):
@@ -628,6 +680,8 @@ class S3PersonEntity(S3Model):
             db(query).update(**data)
             # Clear descendant paths
             current.s3db.pr_rebuild_path(pe_id, clear=True)
+            # Update the ancestry
+            pr_update_ancestry(pe_id)
         return
 
     # -------------------------------------------------------------------------
@@ -653,6 +707,7 @@ class S3PersonEntity(S3Model):
             pe_id = data.get("pe_id", None)
             if pe_id:
                 current.s3db.pr_rebuild_path(pe_id, clear=True)
+                pr_update_ancestry(pe_id)
         return
 
 # =============================================================================
@@ -879,8 +934,16 @@ class S3PersonModel(S3Model):
                                       (messages.ORGANISATION, "human_resource.organisation_id"),
                                       ],
                        extra_fields = ["date_of_birth"],
+                       indexes = ["first_name",
+                                  "middle_name",
+                                  "last_name",
+                                  ],
                        main = "first_name",
                        extra = "last_name",
+                       name_index = ["first_name",
+                                     "middle_name",
+                                     "last_name",
+                                     ],
                        onaccept = self.pr_person_onaccept,
                        realm_components = ["presence"],
                        super_entity = ("pr_pentity", "sit_trackable"),
@@ -1290,10 +1353,15 @@ class S3PersonModel(S3Model):
 
         resource.add_filter(query)
 
+        # Restrict to the candidates from the name index (if enabled)
+        ranks = S3NameIndex.apply(resource, value)
+
         settings = current.deployment_settings
         limit = int(_vars.limit or 0)
         MAX_SEARCH_RESULTS = settings.get_search_max_results()
-        if (not limit or limit > MAX_SEARCH_RESULTS) and resource.count() > MAX_SEARCH_RESULTS:
+        if (not limit or limit > MAX_SEARCH_RESULTS) and \
+           (ranks is None or len(ranks) > MAX_SEARCH_RESULTS) and \
+           resource.count() > MAX_SEARCH_RESULTS:
             output = json.dumps([
                 dict(label=str(current.T("There are more than %(max)s results, please input more characters.") % dict(max=MAX_SEARCH_RESULTS)))
                 ], separators=SEPARATORS)
@@ -1319,6 +1387,7 @@ class S3PersonModel(S3Model):
                                    start=0,
                                    limit=limit,
                                    orderby=orderby)["rows"]
+            rows = S3NameIndex.rank(rows, ranks, "pr_person.id")
 
             items = []
             iappend = items.append
@@ -5368,13 +5437,21 @@ def pr_define_role(pe_id,
     else:
         duplicate = None
     if duplicate:
-        if duplicate.role_type != role_type:
+        type_changed = duplicate.role_type != role_type
+        if type_changed:
             # Clear paths if this changes the role type
             if str(role_type) != str(OU):
                 data["path"] = None
             s3db.pr_role_rebuild_path(duplicate.id, clear=True)
         duplicate.update_record(**data)
         record_id = duplicate.id
+        if type_changed:
+            # Update the ancestry of the affiliates
+            atable = s3db.pr_affiliation
+            query = (atable.role_id == record_id) & \
+                    (atable.deleted != True)
+            rows = current.db(query).select(atable.pe_id)
+            pr_update_ancestry([row.pe_id for row in rows])
     else:
         record_id = rtable.insert(**data)
     return record_id
@@ -5412,6 +5489,8 @@ def pr_add_to_role(role_id, pe_id):
         atable.insert(role_id=role_id, pe_id=pe_id)
         # Clear descendant paths (triggers lazy rebuild)
         pr_rebuild_path(pe_id, clear=True)
+        # Update the ancestry
+        pr_update_ancestry(pe_id)
     return
 
 # =============================================================================
@@ -5440,6 +5519,8 @@ def pr_remove_from_role(role_id, pe_id):
         affiliation.update_record(**data)
         # Clear descendant paths
         pr_rebuild_path(pe_id, clear=True)
+        # Update the ancestry
+        pr_update_ancestry(pe_id)
     return
 
 # =============================================================================
@@ -5596,40 +5677,22 @@ def pr_get_path(pe_id):
 def pr_get_ancestors(pe_id):
     """
         Find all ancestor entities of a person entity in the OU hierarchy
-        (performs a path lookup where paths are available, otherwise rebuilds
-        paths).
+        (performs a lookup in the ancestry table).
 
         @param pe_id: the person entity ID
 
-        @return: a list of PE-IDs
+        @return: a list of PE-IDs (as strings), closest ancestors first
     """
 
-    s3db = current.s3db
-    atable = s3db.pr_affiliation
-    rtable = s3db.pr_role
-    query = (atable.deleted != True) & \
-            (atable.role_id == rtable.id) & \
-            (atable.pe_id == pe_id) & \
-            (rtable.deleted != True) & \
-            (rtable.role_type == OU)
-
-    roles = current.db(query).select(rtable.id,
-                                     rtable.pe_id,
-                                     rtable.path,
-                                     rtable.role_type)
-    paths = []
-    append = paths.append
-    for role in roles:
-        path = S3MultiPath([role.pe_id])
-        if role.path is None:
-            ppath = pr_role_rebuild_path(role)
-        else:
-            ppath = S3MultiPath(role.path)
-        path.extend(role.pe_id, ppath, cut=pe_id)
-        append(path)
-    ancestors = S3MultiPath.all_nodes(paths)
+    if not pe_id:
+        return []
 
-    return ancestors
+    table = pr_ancestry_table()
+    query = (table.pe_id == pe_id) & \
+            (table.role_type == OU)
+    rows = current.db(query).select(table.ancestor_pe_id,
+                                    orderby=table.depth)
+    return [str(row.ancestor_pe_id) for row in rows]
 
 # =============================================================================
 def pr_realm(entity):
@@ -5707,59 +5770,48 @@ def pr_realm_users(realm, roles=None, role_types=OU):
 def pr_ancestors(entities):
     """
         Find all ancestor entities of the given entities in the
-        OU hierarchy.
+        OU hierarchy (performs a lookup in the ancestry table).
 
-        @param entities:
+        @param entities: list of PE-IDs
 
-        @return: Storage of lists of PE-IDs
+        @return: Storage of lists of PE-IDs (as strings)
     """
 
     if not entities:
         return Storage()
 
-    s3db = current.s3db
-    atable = s3db.pr_affiliation
-    rtable = s3db.pr_role
-    query = (atable.deleted != True) & \
-            (atable.role_id == rtable.id) & \
-            (atable.pe_id.belongs(entities)) & \
-            (rtable.deleted != True) & \
-            (rtable.role_type == OU)
-    rows = current.db(query).select(rtable.id,
-                                    rtable.pe_id,
-                                    rtable.path,
-                                    rtable.role_type,
-                                    atable.pe_id)
+    table = pr_ancestry_table()
+    if len(entities) > 1:
+        query = (table.pe_id.belongs(entities))
+    else:
+        query = (table.pe_id == list(entities)[0])
+    query &= (table.role_type == OU)
+    rows = current.db(query).select(table.pe_id,
+                                    table.ancestor_pe_id,
+                                    orderby=table.depth)
+
     ancestors = Storage([(pe_id, []) for pe_id in entities])
-    r = rtable._tablename
-    a = atable._tablename
     for row in rows:
-        pe_id = row[a].pe_id
-        paths = ancestors[pe_id]
-        role = row[r]
-        path = S3MultiPath([role.pe_id])
-        if role.path is None:
-            ppath = pr_role_rebuild_path(role)
-        else:
-            ppath = S3MultiPath(role.path)
-        path.extend(role.pe_id, ppath, cut=pe_id)
-        paths.append(path)
-    for pe_id in ancestors:
-        ancestors[pe_id] = S3MultiPath.all_nodes(ancestors[pe_id])
+        pe_id = row.pe_id
+        if pe_id not in ancestors:
+            # Entities given as strings
+            pe_id = str(pe_id)
+        ancestors[pe_id].append(str(row.ancestor_pe_id))
     return ancestors
 
 # =============================================================================
 def pr_descendants(pe_ids, skip=None, root=True):
     """
         Find descendant entities of a person entity in the OU hierarchy
-        (performs a real search, not a path lookup), grouped by root PE
+        (performs a lookup in the ancestry table), grouped by root PE
 
         @param pe_ids: set/list of pe_ids
-        @param skip: list of person entity IDs to skip during
-                     descending (internal)
-        @param root: this is the top-node (internal)
+        @param skip: list of person entity IDs to skip
+        @param root: not used (retained for backwards-compatibility)
 
-        @return: a dict of lists of descendant PEs per root PE
+        @return: a dict of lists of descendant PEs per root PE (not
+                 including persons, and only for root PEs which have
+                 any descendants)
     """
 
     if skip is None:
@@ -5773,70 +5825,37 @@ def pr_descendants(pe_ids, skip=None, root=True):
 
     s3db = current.s3db
     etable = s3db.pr_pentity
-    rtable = s3db.pr_role
-    atable = s3db.pr_affiliation
+    table = pr_ancestry_table()
 
-    q = (rtable.pe_id.belongs(pe_ids)) \
-        if len(pe_ids) > 1 else (rtable.pe_id == list(pe_ids)[0])
+    q = (table.ancestor_pe_id.belongs(pe_ids)) \
+        if len(pe_ids) > 1 else (table.ancestor_pe_id == list(pe_ids)[0])
 
-    query = (q & (rtable.role_type == OU) & (rtable.deleted != True)) & \
-            ((atable.role_id == rtable.id) & (atable.deleted != True)) & \
-            (etable.pe_id == atable.pe_id)
-
-    rows = current.db(query).select(rtable.pe_id,
-                                    atable.pe_id,
-                                    etable.instance_type)
-    r = rtable._tablename
-    e = etable._tablename
-    a = atable._tablename
+    query = q & (table.role_type == OU) & \
+            (etable.pe_id == table.pe_id) & \
+            (etable.instance_type != "pr_person")
 
-    nodes = set()
-    ogetattr = object.__getattribute__
+    rows = current.db(query).select(table.ancestor_pe_id,
+                                    table.pe_id)
 
     result = dict()
-    
-    skip.update(pe_ids)
     for row in rows:
-
-        parent = ogetattr(ogetattr(row, r), "pe_id")
-        child = ogetattr(ogetattr(row, a), "pe_id")
-        instance_type = ogetattr(ogetattr(row, e), "instance_type")
-        if instance_type != "pr_person":
-            if parent not in result:
-                result[parent] = []
-            result[parent].append(child)
-        if child not in skip:
-            nodes.add(child)
-
-    if nodes:
-        descendants = pr_descendants(nodes, skip=skip, root=False)
-        for child, nodes in descendants.iteritems():
-            for parent, children in result.iteritems():
-                if child in children:
-                    for node in nodes:
-                        if node not in children:
-                            children.append(node)
-    if root:
-        for child, nodes in result.iteritems():
-            for parent, children in result.iteritems():
-                if child in children:
-                    for node in nodes:
-                        if node not in children and node != parent:
-                            children.append(node)
-
+        parent = row.ancestor_pe_id
+        if parent in result:
+            result[parent].append(row.pe_id)
+        else:
+            result[parent] = [row.pe_id]
     return result
 
 # =============================================================================
 def pr_get_descendants(pe_ids, entity_types=None, skip=None, ids=True):
     """
         Find descendant entities of a person entity in the OU hierarchy
-        (performs a real search, not a path lookup).
+        (performs a lookup in the ancestry table).
 
         @param pe_ids: person entity ID or list of IDs
         @param entity_types: optional filter to a specific entity_type
+        @param skip: not used (retained for backwards-compatibility)
         @param ids: whether to return a list of ids or nodes (internal)
-        @param skip: list of person entity IDs to skip during
-                     descending (internal)
 
         @return: a list of PE-IDs
     """
@@ -5850,45 +5869,26 @@ def pr_get_descendants(pe_ids, entity_types=None, skip=None, ids=True):
     db = current.db
     s3db = current.s3db
     etable = s3db.pr_pentity
-    rtable = db.pr_role
-    atable = db.pr_affiliation
-
-    if skip is None:
-        skip = set()
-    skip.update(pe_ids)
+    table = pr_ancestry_table()
 
     if len(pe_ids) > 1:
-        q = (rtable.pe_id.belongs(pe_ids))
+        q = (table.ancestor_pe_id.belongs(pe_ids))
     else:
-        q = (rtable.pe_id == list(pe_ids)[0])
+        q = (table.ancestor_pe_id == list(pe_ids)[0])
 
-    query = ((rtable.deleted != True) & q & (rtable.role_type == OU)) & \
-            ((atable.deleted != True) & (atable.role_id == rtable.id))
+    query = q & (table.role_type == OU)
 
     if entity_types is not None:
-        query &= (etable.pe_id == atable.pe_id)
+        query &= (etable.pe_id == table.pe_id)
         rows = db(query).select(etable.pe_id, etable.instance_type)
         # We still need to support Py 2.6
         #result = {(r.pe_id, r.instance_type) for r in rows}
         result = set((r.pe_id, r.instance_type) for r in rows)
-        # We still need to support Py 2.6
-        #node_ids = {i for i, t in result if i not in skip}
-        node_ids = set(i for i, t in result if i not in skip)
     else:
-        rows = db(query).select(atable.pe_id)
+        rows = db(query).select(table.pe_id)
         # We still need to support Py 2.6
         #result = {r.pe_id for r in rows}
         result = set(r.pe_id for r in rows)
-        # We still need to support Py 2.6
-        #node_ids = {i for i in result if i not in skip}
-        node_ids = set(i for i in result if i not in skip)
-    # Recurse
-    if node_ids:
-        descendants = pr_get_descendants(node_ids,
-                                         skip=skip,
-                                         entity_types=entity_types,
-                                         ids=False)
-        result.update(descendants)
 
     if ids:
         if entity_types is not None:
@@ -5998,6 +5998,220 @@ def pr_role_rebuild_path(role_id, skip=[], clear=False):
 
     return path
 
+# =============================================================================
+# Ancestry (closure table of the OU hierarchy)
+# =============================================================================
+#
+def pr_ancestry_table():
+    """
+        Get the ancestry table, build it if it has not been built yet
+
+        @return: the pr_ancestry Table
+    """
+
+    pr_ancestry_check()
+    return current.s3db.pr_ancestry
+
+# =============================================================================
+def pr_ancestry_check():
+    """
+        Check whether the ancestry table has been built, and build it
+        if not (checked once per request)
+
+        @return: True if the table has been built now, otherwise False
+    """
+
+    s3 = current.response.s3
+    if s3.pr_ancestry_built:
+        return False
+
+    table = current.s3db.pr_ancestry
+
+    # The marker row is inserted as last step of the rebuild
+    query = (table.pe_id == 0) & \
+            (table.role_type == 0)
+    if current.db(query).select(table.id, limitby=(0, 1)).first():
+        s3.pr_ancestry_built = True
+        return False
+
+    pr_rebuild_ancestry()
+    return True
+
+# =============================================================================
+def pr_ou_parents(pe_ids=None):
+    """
+        Get the immediate OU parents of person entities
+
+        @param pe_ids: list of PE-IDs, None for all entities
+
+        @return: dict {pe_id: set of parent pe_ids}
+    """
+
+    s3db = current.s3db
+    atable = s3db.pr_affiliation
+    rtable = s3db.pr_role
+
+    query = (atable.deleted != True) & \
+            (atable.role_id == rtable.id) & \
+            (rtable.deleted != True) & \
+            (rtable.role_type == OU)
+    if pe_ids is not None:
+        query &= (atable.pe_id.belongs(pe_ids))
+    rows = current.db(query).select(atable.pe_id, rtable.pe_id)
+
+    a = atable._tablename
+    r = rtable._tablename
+
+    parents = {}
+    for row in rows:
+        child = row[a].pe_id
+        parent = row[r].pe_id
+        if child in parents:
+            parents[child].add(parent)
+        else:
+            parents[child] = set([parent])
+    return parents
+
+# =============================================================================
+def pr_compute_ancestry(nodes, parents, known):
+    """
+        Compute the ancestries of person entities from their OU parents
+
+        @param nodes: the PE-IDs to compute the ancestries for
+        @param parents: dict {pe_id: set of parent pe_ids} for (at least)
+                        the nodes and all their ancestors which are not
+                        in known
+        @param known: dict {pe_id: {ancestor_pe_id: depth}} of entities
+                      with known ancestries (will be extended)
+
+        @return: dict {pe_id: {ancestor_pe_id: depth}} for the nodes
+
+        @note: cycles in the hierarchy are cut at the first repeated node
+    """
+
+    def ancestry(node, stack):
+
+        if node in known:
+            return known[node]
+        if node in stack:
+            # Cycle
+            return {}
+        stack.add(node)
+
+        result = {}
+        for parent in parents.get(node, ()):
+            if parent == node:
+                continue
+            result[parent] = 1
+            for ancestor, depth in ancestry(parent, stack).items():
+                if ancestor == node:
+                    continue
+                depth += 1
+                if result.get(ancestor, depth) >= depth:
+                    result[ancestor] = depth
+
+        stack.discard(node)
+        known[node] = result
+        return result
+
+    return dict((node, ancestry(node, set())) for node in nodes)
+
+# =============================================================================
+def pr_update_ancestry(pe_ids):
+    """
+        Update the ancestry of person entities and all their descendants
+        after their OU affiliations have changed
+
+        @param pe_ids: PE-ID or list of PE-IDs
+    """
+
+    if not pe_ids:
+        return
+    if not isinstance(pe_ids, (list, tuple, set)):
+        pe_ids = [pe_ids]
+
+    db = current.db
+    table = current.s3db.pr_ancestry
+
+    if pr_ancestry_check():
+        # Table has just been built, which includes this update
+        return
+
+    # The descendants of the entities are affected as well (changes of
+    # the affiliations of an entity do not change its descendants, so
+    # these can be taken from the current ancestry table)
+    query = (table.ancestor_pe_id.belongs(pe_ids)) & \
+            (table.role_type == OU)
+    rows = db(query).select(table.pe_id)
+    affected = set(int(pe_id) for pe_id in pe_ids)
+    affected.update(row.pe_id for row in rows)
+
+    # OU parents of all affected entities
+    parents = pr_ou_parents(affected)
+
+    # Unaffected parents retain their ancestries
+    outside = set()
+    for nodes in parents.values():
+        outside.update(nodes)
+    outside -= affected
+    known = dict((pe_id, {}) for pe_id in outside)
+    if outside:
+        query = (table.pe_id.belongs(outside)) & \
+                (table.role_type == OU)
+        rows = db(query).select(table.pe_id,
+                                table.ancestor_pe_id,
+                                table.depth)
+        for row in rows:
+            known[row.pe_id][row.ancestor_pe_id] = row.depth
+
+    ancestries = pr_compute_ancestry(affected, parents, known)
+
+    query = (table.pe_id.belongs(affected)) & \
+            (table.role_type == OU)
+    db(query).delete()
+    items = [{"pe_id": pe_id,
+              "ancestor_pe_id": ancestor,
+              "depth": depth,
+              "role_type": OU,
+              }
+             for pe_id, ancestry in ancestries.items()
+             for ancestor, depth in ancestry.items()]
+    if items:
+        table.bulk_insert(items)
+    return
+
+# =============================================================================
+def pr_rebuild_ancestry():
+    """
+        Rebuild the ancestry table for all person entities (e.g. after
+        migration, or after affiliations have been modified without
+        using the pr_*_affiliation and pr_*_role functions)
+    """
+
+    db = current.db
+    table = current.s3db.pr_ancestry
+
+    parents = pr_ou_parents()
+    ancestries = pr_compute_ancestry(parents.keys(), parents, {})
+
+    db(table.id > 0).delete()
+    items = [{"pe_id": pe_id,
+              "ancestor_pe_id": ancestor,
+              "depth": depth,
+              "role_type": OU,
+              }
+             for pe_id, ancestry in ancestries.items()
+             for ancestor, depth in ancestry.items()]
+    # Marker for the built table
+    items.append({"pe_id": 0,
+                  "ancestor_pe_id": 0,
+                  "depth": 0,
+                  "role_type": 0,
+                  })
+    table.bulk_insert(items)
+    current.response.s3.pr_ancestry_built = True
+    return
+
 # =============================================================================
 def pr_image_represent(image_name,
                        format = None,
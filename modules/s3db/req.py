@@ -39,6 +39,9 @@ __all__ = ["S3RequestModel",
            "S3CommitSkillModel",
            "req_item_onaccept",
            "req_update_status",
+           "req_update_status_defer",
+           "req_update_status_flush",
+           "req_update_statuses",
            "req_rheader",
            "req_match",
            "req_add_from_template",
@@ -3318,45 +3321,110 @@ def req_update_status(req_id):
         None => quantity = 0 for ALL items
         Partial => some items have quantity > 0
         Complete => quantity_x = quantity(requested) for ALL items
+
+        If status updates are deferred (req_update_status_defer), then
+        the request is only marked for update, and its status updated
+        once by req_update_status_flush.
+    """
+
+    deferred = current.response.s3.req_update_status_deferred
+    if deferred is not None:
+        deferred.add(int(req_id))
+    else:
+        req_update_statuses([req_id])
+
+# =============================================================================
+def req_update_status_defer():
+    """
+        Defer request status updates until req_update_status_flush,
+        e.g. while processing all items of a shipment or commitment
+
+        @return: True if this call started the deferral (i.e. the caller
+                 is responsible for flushing), else False
+    """
+
+    s3 = current.response.s3
+    if s3.req_update_status_deferred is None:
+        s3.req_update_status_deferred = set()
+        return True
+    return False
+
+# =============================================================================
+def req_update_status_flush():
+    """
+        End the deferral of request status updates, and update the
+        status of all requests marked for update in the meantime
+    """
+
+    s3 = current.response.s3
+    req_ids = s3.req_update_status_deferred
+    s3.req_update_status_deferred = None
+    if req_ids:
+        req_update_statuses(list(req_ids))
+
+# =============================================================================
+def req_update_statuses(req_ids):
+    """
+        Update the status of multiple requests with one query for all
+        their items, and write only changed statuses
+
+        @param req_ids: list of req_req record IDs
     """
 
     db = current.db
     s3db = current.s3db
     table = s3db.req_req_item
-    is_none = dict(commit = True,
-                   transit = True,
-                   fulfil = True)
+    rtable = s3db.req_req
 
-    is_complete = dict(commit = True,
-                       transit = True,
-                       fulfil = True)
-    # Must check all items in the req
-    query = (table.req_id == req_id) & \
+    req_ids = [int(req_id) for req_id in req_ids]
+    status_types = ("commit", "transit", "fulfil")
+
+    # Per-request aggregates
+    is_none = {}
+    is_complete = {}
+    for req_id in req_ids:
+        is_none[req_id] = dict((t, True) for t in status_types)
+        is_complete[req_id] = dict((t, True) for t in status_types)
+
+    # Must check all items in the reqs
+    query = (table.req_id.belongs(req_ids)) & \
             (table.deleted == False )
-    req_items = db(query).select(table.quantity,
+    req_items = db(query).select(table.req_id,
+                                 table.quantity,
                                  table.quantity_commit,
                                  table.quantity_transit,
                                  table.quantity_fulfil)
 
     for req_item in req_items:
+        req_id = req_item.req_id
         quantity = req_item.quantity
-        for status_type in ["commit", "transit", "fulfil"]:
+        none = is_none[req_id]
+        complete = is_complete[req_id]
+        for status_type in status_types:
             if req_item["quantity_%s" % status_type] < quantity:
-                is_complete[status_type] = False
+                complete[status_type] = False
             if req_item["quantity_%s" % status_type]:
-                is_none[status_type] = False
-
-    status_update = {}
-    for status_type in ["commit", "transit", "fulfil"]:
-        if is_complete[status_type]:
-            status_update["%s_status" % status_type] = REQ_STATUS_COMPLETE
-        elif is_none[status_type]:
-            status_update["%s_status" % status_type] = REQ_STATUS_NONE
-        else:
-            status_update["%s_status" % status_type] = REQ_STATUS_PARTIAL
-
-    rtable = s3db.req_req
-    db(rtable.id == req_id).update(**status_update)
+                none[status_type] = False
+
+    rows = db(rtable.id.belongs(req_ids)).select(rtable.id,
+                                                 rtable.commit_status,
+                                                 rtable.transit_status,
+                                                 rtable.fulfil_status)
+    for row in rows:
+        req_id = row.id
+        status_update = {}
+        for status_type in status_types:
+            if is_complete[req_id][status_type]:
+                status = REQ_STATUS_COMPLETE
+            elif is_none[req_id][status_type]:
+                status = REQ_STATUS_NONE
+            else:
+                status = REQ_STATUS_PARTIAL
+            fieldname = "%s_status" % status_type
+            if row[fieldname] != status:
+                status_update[fieldname] = status
+        if status_update:
+            db(rtable.id == req_id).update(**status_update)
 
 # =============================================================================
 def req_skill_onaccept(form):
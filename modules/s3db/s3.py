@@ -27,7 +27,11 @@
     OTHER DEALINGS IN THE SOFTWARE.
 """
 
-__all__ = ["S3HierarchyModel"]
+__all__ = ["S3HierarchyModel",
+           "S3FilterIndexModel",
+           "S3NameIndexModel",
+           "S3WidgetCacheModel",
+           ]
 
 from gluon import *
 from ..s3 import *
@@ -65,4 +69,131 @@ class S3HierarchyModel(S3Model):
         return {}
 
 
+# =============================================================================
+class S3FilterIndexModel(S3Model):
+    """ Model for stored filter options indexes """
+
+    names = ["s3_filter_index"]
+
+    def model(self):
+
+        define_table = self.define_table
+
+        # -------------------------------------------------------------------------
+        # Stored Filter Options Index
+        #
+        tablename = "s3_filter_index"
+        define_table(tablename,
+                     Field("tablename",
+                           length=64),
+                     # Widget type + field selector
+                     Field("selector",
+                           length=255),
+                     # Tables the index depends on
+                     Field("tables", "list:string"),
+                     Field("dirty", "boolean",
+                           default=False),
+                     # List of [value, realm_entity, count]
+                     Field("options", "json"),
+                     *s3_timestamp())
+
+        self.configure(tablename,
+                       track_writes = False,
+                       )
+
+        # ---------------------------------------------------------------------
+        # Return global names to s3.*
+        #
+        return {}
+
+    # -------------------------------------------------------------------------
+    def defaults(self):
+        """ Safe defaults if module is disabled """
+
+        return {}
+
+# =============================================================================
+class S3NameIndexModel(S3Model):
+    """ Model for the name search index """
+
+    names = ["s3_name_index"]
+
+    def model(self):
+
+        define_table = self.define_table
+
+        # -------------------------------------------------------------------------
+        # Name Search Index
+        #
+        tablename = "s3_name_index"
+        define_table(tablename,
+                     Field("tablename",
+                           length=64),
+                     Field("record_id", "integer"),
+                     # Index key (see S3NameIndex.keys)
+                     Field("term",
+                           length=64),
+                     )
+
+        self.configure(tablename,
+                       indexes = [("tablename", "term")],
+                       track_writes = False,
+                       )
+
+        # ---------------------------------------------------------------------
+        # Return global names to s3.*
+        #
+        return {}
+
+    # -------------------------------------------------------------------------
+    def defaults(self):
+        """ Safe defaults if module is disabled """
+
+        return {}
+
+# =============================================================================
+class S3WidgetCacheModel(S3Model):
+    """ Model for the render cache of summary/profile page widgets """
+
+    names = ["s3_widget_cache"]
+
+    def model(self):
+
+        define_table = self.define_table
+
+        # -------------------------------------------------------------------------
+        # Widget Render Cache (see S3WidgetCache)
+        #
+        tablename = "s3_widget_cache"
+        define_table(tablename,
+                     # Hash of the request, widget, user and language
+                     Field("cache_key",
+                           length=64),
+                     # Tables the output depends on
+                     Field("tables", "list:string"),
+                     # Rendered HTML
+                     Field("output", "text"),
+                     # Additions to response.s3 and session.s3
+                     Field("effects", "json"),
+                     # Hash of output and effects (=ETag)
+                     Field("version",
+                           length=64),
+                     *s3_timestamp())
+
+        self.configure(tablename,
+                       indexes = ["cache_key"],
+                       track_writes = False,
+                       )
+
+        # ---------------------------------------------------------------------
+        # Return global names to s3.*
+        #
+        return {}
+
+    # -------------------------------------------------------------------------
+    def defaults(self):
+        """ Safe defaults if module is disabled """
+
+        return {}
+
 # END =========================================================================
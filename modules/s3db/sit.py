@@ -123,6 +123,11 @@ class S3SituationModel(S3Model):
                                 ),
                           *s3_meta_fields())
 
+        configure(tablename,
+                  # Latest presence per trackable (see S3Trackable)
+                  indexes = [("track_id", "timestmp")],
+                  )
+
         # ---------------------------------------------------------------------
         # Pass names back to global scope (s3.*)
         #
@@ -41,6 +41,7 @@ __all__ = ["S3SupplyModel",
            "supply_ItemRepresent",
            #"supply_ItemCategoryRepresent",
            "supply_get_shipping_code",
+           "supply_item_pack_quantities",
            ]
 
 import re
@@ -2579,4 +2580,31 @@ def supply_get_shipping_code(type, site_id, field):
 
     return "%s%06d" % (code, number+1)
 
+# =============================================================================
+def supply_item_pack_quantities(pack_ids):
+    """
+        Get the quantities of item packs, kept in a per-request map so
+        that processing many track/request items requires only one
+        lookup per distinct pack
+
+        @param pack_ids: list of supply_item_pack record IDs
+        @return: dict {pack_id: quantity}
+    """
+
+    s3 = current.response.s3
+    packs = s3.supply_item_pack_quantities
+    if packs is None:
+        packs = s3.supply_item_pack_quantities = {}
+
+    missing = [pack_id for pack_id in set(pack_ids)
+               if pack_id and pack_id not in packs]
+    if missing:
+        table = current.s3db.supply_item_pack
+        rows = current.db(table.id.belongs(missing)).select(table.id,
+                                                            table.quantity)
+        for row in rows:
+            packs[row.id] = row.quantity
+
+    return dict((pack_id, packs.get(pack_id)) for pack_id in pack_ids)
+
 # END =========================================================================
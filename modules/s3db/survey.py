@@ -53,12 +53,15 @@ __all__ = ["S3SurveyTemplateModel",
            "survey_getAllSectionsForSeries",
            "survey_getAllSectionsForTemplate",
            "survey_getQuestionFromCode",
+           "survey_getQuestionCodeIndex",
            "survey_getAllQuestionsForTemplate",
            "survey_getAllQuestionsForSeries",
            "survey_getAllQuestionsForComplete",
            "survey_save_answers_for_series",
+           "survey_importAnswers",
            "survey_updateMetaData",
            "survey_getAllAnswersForQuestionInSeries",
+           "survey_getSeriesAnswers",
            "survey_getQstnLayoutRules",
            "survey_getSeries",
            "survey_getSeriesName",
@@ -89,6 +92,7 @@ from ..s3 import *
 from s3chart import S3Chart
 from s3survey import survey_question_type, \
                      survey_analysis_type, \
+                     S3SurveyAnswerList, \
                      _debug
 
 # =============================================================================
@@ -1172,6 +1176,67 @@ def survey_getQuestionFromCode(code, series_id=None):
         question["posn"] = record.survey_question_list.posn
     return question
 
+# =============================================================================
+def survey_getQuestionCodeIndex(template_id):
+    """
+        Get an index of the questions in a template by their code,
+        cached until questions in the template are added, changed or
+        removed
+
+        @param template_id: the template ID
+        @return: dict {code: (question_id, question_type)}
+    """
+
+    db = current.db
+    s3db = current.s3db
+    q_ltable = s3db.survey_question_list
+    qsntable = s3db.survey_question
+
+    query = (q_ltable.template_id == template_id) & \
+            (q_ltable.question_id == qsntable.id) & \
+            (q_ltable.deleted != True)
+
+    # Version of the question list
+    count = q_ltable.id.count()
+    list_modified = q_ltable.modified_on.max()
+    qstn_modified = qsntable.modified_on.max()
+    row = db(query).select(count, list_modified, qstn_modified).first()
+    version = "%s-%s-%s" % (row[count], row[list_modified], row[qstn_modified])
+
+    def build():
+        rows = db(query).select(qsntable.id,
+                                qsntable.code,
+                                qsntable.type)
+        return dict((row.code, (row.id, row.type)) for row in rows)
+
+    # Copy, since the cached dict is shared between threads
+    key = "survey_question_codes_%s" % template_id
+    return dict(survey_cache(key, version, build))
+
+# =============================================================================
+def survey_cache(key, version, build):
+    """
+        Get a versioned entry from the RAM cache, and replace it if it
+        has a different version (=only one entry per key, rather than
+        a new key for every version which would never be removed)
+
+        @param key: the cache key
+        @param version: the current version of the data
+        @param build: function to build the data (no arguments)
+
+        @return: the data (shared between threads, do not modify)
+    """
+
+    cache = current.cache.ram
+    build_entry = lambda: (version, build())
+
+    entry = cache(key, build_entry, time_expire=3600)
+    if entry[0] != version:
+        # Outdated => replace
+        cache(key, None)
+        entry = cache(key, build_entry, time_expire=3600)
+    return entry[1]
+
 # =============================================================================
 def survey_getAllQuestionsForTemplate(template_id):
     """
@@ -2439,6 +2504,31 @@ def survey_save_answers_for_series(series_id, complete_id, vars):
     questions = survey_getAllQuestionsForSeries(series_id)
     return saveAnswers(questions, series_id, complete_id, vars)
 
+# =============================================================================
+def survey_importAnswers(complete_ids):
+    """
+        (Re-)Import the answers of multiple completes from their
+        answer_lists into survey_answer, e.g. after a bulk upload
+        or synchronization of completes
+
+        @param complete_ids: list of survey_complete record IDs
+    """
+
+    table = current.s3db.survey_complete
+    query = (table.id.belongs(complete_ids)) & \
+            (table.deleted != True)
+    rows = current.db(query).select(table.id,
+                                    table.series_id,
+                                    table.answer_list)
+    answer_lists = dict((row.id, row.answer_list) for row in rows)
+    S3SurveyCompleteModel.importAnswerLists(answer_lists)
+
+    # Extract the locations from the imported answers
+    importLocation = S3SurveyCompleteModel.importLocation
+    for row in rows:
+        if row.series_id:
+            importLocation(row.id, row.series_id)
+
 # =============================================================================
 def saveAnswers(questions, series_id, complete_id, vars):
     """
@@ -2609,6 +2699,7 @@ class S3SurveyCompleteModel(S3Model):
         configure(tablename,
                   deduplicate = self.survey_complete_duplicate,
                   onaccept = self.complete_onaccept,
+                  onimport = self.complete_onimport,
                   onvalidation = self.complete_onvalidate,
                   )
 
@@ -2717,10 +2808,29 @@ class S3SurveyCompleteModel(S3Model):
         if form.vars.id:
             S3SurveyCompleteModel.completeOnAccept(form.vars.id)
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def complete_onimport(import_job):
+        """
+            Import the answers of all completes which have been
+            imported in this job, in one go (completeOnAccept defers
+            the answers during bulk imports)
+
+            @param import_job: the S3ImportJob
+        """
+
+        s3 = current.response.s3
+        complete_ids = s3.survey_answers_deferred
+        s3.survey_answers_deferred = None
+        if complete_ids and not import_job.failed:
+            survey_importAnswers(list(complete_ids))
+
     # -------------------------------------------------------------------------
     @staticmethod
     def completeOnAccept(complete_id):
         """
+            During bulk imports, the answers are only marked for import,
+            and then imported for all completes by complete_onimport
         """
 
         # Get the basic data that is needed
@@ -2733,11 +2843,26 @@ class S3SurveyCompleteModel(S3Model):
         S3Chart.purgeCache(purgePrefix)
         if series_id == None:
             return
+        s3 = current.response.s3
+        if s3.bulk:
+            if s3.survey_answers_deferred is None:
+                s3.survey_answers_deferred = set()
+            s3.survey_answers_deferred.add(int(complete_id))
+            return
         # Save all the answers from answerList in the survey_answer table
         answerList = record.answer_list
         S3SurveyCompleteModel.importAnswers(complete_id, answerList)
-        # Extract the default template location question and save the
-        # answer in the location field
+        S3SurveyCompleteModel.importLocation(complete_id, series_id)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def importLocation(complete_id, series_id):
+        """
+            Extract the default template location question and save the
+            answer in the location field
+        """
+
+        rtable = current.s3db.survey_complete
         templateRec = survey_getTemplateFromSeries(series_id)
         locDetails = templateRec["location_detail"]
         if not locDetails:
@@ -2756,41 +2881,120 @@ class S3SurveyCompleteModel(S3Model):
             survey_complete into answer records held in survey_answer
         """
 
+        S3SurveyCompleteModel.importAnswerLists({id: list})
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def importAnswerLists(answer_lists):
+        """
+            Save the answer_lists of multiple completes into answer
+            records held in survey_answer, in one go
+
+            - question codes are looked up in the cached code index of
+              the template of the series, unknown codes are skipped
+            - existing answers for the same complete and question are
+              updated, all others bulk-inserted
+
+            @param answer_lists: dict {complete_id: answer_list}
+        """
+
+        if not answer_lists:
+            return
+
         import csv
-        import os
         try:
             from cStringIO import StringIO    # Faster, where available
         except:
             from StringIO import StringIO
 
-        strio = StringIO()
-        strio.write(list)
-        strio.seek(0)
-        answer = []
-        append = answer.append
-        reader = csv.reader(strio)
-        for row in reader:
-            if row != None:
-                row.insert(0, id)
-                append(row)
+        db = current.db
+        s3db = current.s3db
+        ctable = s3db.survey_complete
+        stable = s3db.survey_series
+        atable = s3db.survey_answer
 
-        from tempfile import TemporaryFile
-        csvfile = TemporaryFile()
-        writer = csv.writer(csvfile)
-        writerow = writer.writerow
-        writerow(["complete_id", "question_code", "value"])
-        for row in answer:
-            writerow(row)
-        csvfile.seek(0)
-        xsl = os.path.join("applications",
-                           current.request.application,
-                           "static",
-                           "formats",
-                           "s3csv",
-                           "survey",
-                           "answer.xsl")
-        resource = current.s3db.resource("survey_answer")
-        resource.import_xml(csvfile, stylesheet = xsl, format="csv",)
+        complete_ids = answer_lists.keys()
+
+        # Templates of the completes
+        query = (ctable.id.belongs(complete_ids)) & \
+                (stable.id == ctable.series_id)
+        rows = db(query).select(ctable.id, stable.template_id)
+        templates = dict((row[ctable.id], row[stable.template_id])
+                         for row in rows)
+
+        # Existing answers
+        query = (atable.complete_id.belongs(complete_ids)) & \
+                (atable.deleted != True)
+        rows = db(query).select(atable.id,
+                                atable.complete_id,
+                                atable.question_id,
+                                atable.value)
+        existing = dict(((row.complete_id, row.question_id), row)
+                        for row in rows)
+
+        indexes = {}
+        widgets = {}
+        items = []
+        append = items.append
+        for complete_id, answer_list in answer_lists.items():
+            template_id = templates.get(complete_id)
+            if not template_id or not answer_list:
+                continue
+            if template_id in indexes:
+                index = indexes[template_id]
+            else:
+                index = indexes[template_id] = \
+                        survey_getQuestionCodeIndex(template_id)
+
+            strio = StringIO()
+            strio.write(answer_list)
+            strio.seek(0)
+            for row in csv.reader(strio):
+                if not row or len(row) < 2:
+                    continue
+                code, value = row[0], row[1]
+                if code not in index:
+                    continue
+                question_id, question_type = index[code]
+
+                # Some question types need to format the value
+                if question_id in widgets:
+                    widget = widgets[question_id]
+                else:
+                    widget = widgets[question_id] = \
+                             survey_question_type[question_type](question_id)
+                value = widget.onaccept(value)
+
+                answer = existing.get((complete_id, question_id))
+                if answer is not None:
+                    if answer.value != value:
+                        answer.update_record(value = value)
+                else:
+                    append({"complete_id": complete_id,
+                            "question_id": question_id,
+                            "value": value,
+                            })
+        if items:
+            # Set the record owner and realm like s3_set_record_owner
+            # does for any other insert, but only look them up once
+            auth = current.auth
+            owner = {}
+            if "owned_by_user" in atable.fields and \
+               auth.s3_logged_in() and auth.user:
+                owner["owned_by_user"] = auth.user.id
+            if "owned_by_group" in atable.fields:
+                handler = current.s3db.get_config(atable, "owner_group")
+                if callable(handler):
+                    owner["owned_by_group"] = handler(atable, Storage())
+                elif handler:
+                    owner["owned_by_group"] = handler
+            if "realm_entity" in atable.fields:
+                owner["realm_entity"] = auth.get_realm_entity(atable,
+                                                              Storage())
+            if owner:
+                for item in items:
+                    item.update(owner)
+            atable.bulk_insert(items)
 
     # -------------------------------------------------------------------------
     @staticmethod
@@ -3028,22 +3232,72 @@ def survey_getAllAnswersForQuestionInSeries(question_id, series_id):
         from with a specified series
     """
 
+    answers = survey_getSeriesAnswers(series_id)
+    return answers.get(int(question_id), S3SurveyAnswerList())
+
+# =============================================================================
+def survey_getSeriesAnswers(series_id):
+    """
+        Get all answers in a series, grouped by question, retrieved in a
+        single query and cached until new responses are added to the
+        series (or existing responses are updated or deleted)
+
+        @param series_id: the series ID
+        @return: dict {question_id: S3SurveyAnswerList} with the answers
+                 as dicts with answer_id, value and complete_id
+    """
+
+    db = current.db
     s3db = current.s3db
     ctable = s3db.survey_complete
     atable = s3db.survey_answer
-    query = (atable.question_id == question_id) & \
-            (atable.complete_id == ctable.id) & \
-            (ctable.series_id == series_id)
-    rows = current.db(query).select(atable.id,
-                                    atable.value,
-                                    atable.complete_id)
-    answers = []
-    for row in rows:
-        answer = {}
-        answer["answer_id"] = row.id
-        answer["value"] = row.value
-        answer["complete_id"] = row.complete_id
-        answers.append(answer)
+
+    query = (atable.complete_id == ctable.id) & \
+            (ctable.series_id == series_id) & \
+            (ctable.deleted != True)
+
+    # Version of the answers in this series
+    count = atable.id.count()
+    modified_on = atable.modified_on.max()
+    row = db(query).select(count, modified_on).first()
+    version = "%s-%s" % (row[count], row[modified_on])
+
+    # Per-request memo (analysis and map views look up many questions)
+    s3 = current.response.s3
+    memo = s3.survey_series_answers
+    if memo is None:
+        memo = s3.survey_series_answers = {}
+    key = "survey_series_answers_%s" % series_id
+    memo_key = "%s_%s" % (key, version)
+    if memo_key in memo:
+        return memo[memo_key]
+
+    def build():
+        # Immutable, since the cached matrix is shared between threads
+        rows = db(query).select(atable.id,
+                                atable.question_id,
+                                atable.value,
+                                atable.complete_id)
+        matrix = {}
+        for row in rows:
+            question_id = row.question_id
+            item = (row.id, row.value, row.complete_id)
+            if question_id in matrix:
+                matrix[question_id].append(item)
+            else:
+                matrix[question_id] = [item]
+        return dict((question_id, tuple(items))
+                    for question_id, items in matrix.iteritems())
+
+    # Answer lists for this request
+    answers = {}
+    for question_id, items in survey_cache(key, version, build).iteritems():
+        answers[question_id] = S3SurveyAnswerList(
+                                    {"answer_id": answer_id,
+                                     "value": value,
+                                     "complete_id": complete_id,
+                                     } for answer_id, value, complete_id in items)
+    memo[memo_key] = answers
     return answers
 
 # =============================================================================
@@ -3102,24 +3356,29 @@ def buildCompletedList(series_id, question_id_list):
     db = current.db
     qtable = current.s3db.survey_question
 
+    # All questions and answers at once
+    question_ids = [int(question_id) for question_id in question_id_list]
+    rows = db(qtable.id.belongs(question_ids)).select(qtable.id,
+                                                      qtable.name,
+                                                      qtable.type)
+    questions = dict((row.id, row) for row in rows)
+    matrix = survey_getSeriesAnswers(series_id)
+
     headers = []
     happend = headers.append
     types = []
     items = []
     qstn_posn = 0
-    rowLen = len(question_id_list)
+    rowLen = len(question_ids)
     complete_lookup = {}
-    for question_id in question_id_list:
-        answers = survey_getAllAnswersForQuestionInSeries(question_id,
-                                                          series_id)
-        widgetObj = survey_getWidgetFromQuestion(question_id)
+    for question_id in question_ids:
+        question = questions[question_id]
+        widgetObj = survey_question_type[question.type](question_id)
 
-        question = db(qtable.id == question_id).select(qtable.name,
-                                                       limitby=(0, 1)).first()
         happend(question.name)
         types.append(widgetObj.db_type())
 
-        for answer in answers:
+        for answer in matrix.get(question_id, ()):
             complete_id = answer["complete_id"]
             if complete_id in complete_lookup:
                 row = complete_lookup[complete_id]
@@ -2713,6 +2713,22 @@ class S3QuestionTypeGridChildWidget(S3QuestionTypeAbstractWidget):
 ###    will work with a list of answers for the same question
 ###############################################################################
 
+class S3SurveyAnswerList(list):
+    """
+        List of answers for a single question (dicts with answer_id,
+        value and complete_id), which also keeps the values as cast by
+        the analysis classes, so that the raw answers need to be cast
+        only once per question and analysis type.
+
+        See survey_getSeriesAnswers() in modules/s3db/survey.py
+    """
+
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self.values = {}
+
+# =============================================================================
+
 # Analysis Types
 def analysis_stringType(question_id, answerList):
     return S3StringAnalysis("String", question_id, answerList)
@@ -2861,8 +2877,12 @@ class S3AbstractAnalysis():
         qstnWidget     - The question Widget for this question
         priorityGroup  - The type of priority group to use in the map
         priorityGroups - The priority data used to colour the markers on the map
+        cacheable      - The cast values can be kept with the answer list
+                         (False if they are database records)
     """
 
+    cacheable = True
+
     def __init__(self,
                  type,
                  question_id,
@@ -2878,17 +2898,32 @@ class S3AbstractAnalysis():
         self.priorityGroups = {"default" : [-1, -0.5, 0, 0.5, 1],
                                "standard" : [-2, -1, 0, 1, 2],
                                }
+
+        # Re-use the values if already cast for this answer list
+        values = None
+        if self.cacheable and isinstance(answerList, S3SurveyAnswerList):
+            values = answerList.values
+            key = self.__class__.__name__
+            if key in values:
+                self.valueList = list(values[key])
+                self.basicResults()
+                return
+
+        valid = self.valid
+        cast = self.castRawAnswer
+        append = self.valueList.append
         for answer in self.answerList:
-            if self.valid(answer):
+            if valid(answer):
                 try:
-                    cast = self.castRawAnswer(answer["complete_id"],
-                                              answer["value"])
-                    if cast != None:
-                        self.valueList.append(cast)
+                    value = cast(answer["complete_id"], answer["value"])
+                    if value != None:
+                        append(value)
                 except:
                     if DEBUG:
                         raise
                     pass
+        if values is not None:
+            values[key] = tuple(self.valueList)
 
         self.basicResults()
 
@@ -3447,6 +3482,8 @@ class S3LocationAnalysis(S3AbstractAnalysis):
         are using the same local name.
     """
 
+    cacheable = False
+
     # -------------------------------------------------------------------------
     def castRawAnswer(self, complete_id, answer):
         """
@@ -1,17 +1,25 @@
 from unit_tests.s3.s3aaa import *
 from unit_tests.s3.s3cfg import *
+from unit_tests.s3.s3codecs import *
 from unit_tests.s3.s3crud import *
 from unit_tests.s3.s3datatable import *
 from unit_tests.s3.s3fields import *
 from unit_tests.s3.s3filter import *
+from unit_tests.s3.s3forms import *
+from unit_tests.s3.s3gis import *
 from unit_tests.s3.s3hierarchy import *
 from unit_tests.s3.s3import import *
+from unit_tests.s3.s3index import *
+from unit_tests.s3.s3instrument import *
 from unit_tests.s3.s3model import *
 from unit_tests.s3.s3msg import *
+from unit_tests.s3.s3nameindex import *
 from unit_tests.s3.s3resource import *
 from unit_tests.s3.s3rest import *
 from unit_tests.s3.s3sync import *
 from unit_tests.s3.s3timeplot import *
+from unit_tests.s3.s3track import *
 from unit_tests.s3.s3validators import *
+from unit_tests.s3.s3widgetcache import *
 from unit_tests.s3.s3widgets import *
 from unit_tests.s3.s3xml import *
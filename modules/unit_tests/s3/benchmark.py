@@ -5,6 +5,18 @@
 # To run this script use:
 # python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/benchmark.py
 #
+# Options (environment variables):
+#
+# EDEN_BENCHMARK_SIZE       number of records in the generated datasets
+#                           (default 1000, up to 1000000)
+# EDEN_BENCHMARK_RESULTS    file to write the results to (JSON), default
+#                           private/benchmark/results.json
+# EDEN_BENCHMARK_BASELINE   baseline file to compare the results with, default
+#                           private/benchmark/baseline.json
+# EDEN_BENCHMARK_SAVE       set to 1 to store the results as new baseline
+# EDEN_BENCHMARK_TOLERANCE  relative slow-down above which a result is
+#                           reported as regression (default 0.2 = 20%)
+#
 # Note:
 #
 # These tests represent the performance of specific server-side core
@@ -14,37 +26,214 @@
 # The results of these tests depend on many variables (e.g. hardware
 # configuration, software stack etc.), thus, to compare the results
 # in order to optimize code or detect newly introduced bottlenecks the
-# tests must be run on always the same environment.
-#
-# When running these tests in order to optimize the environment, you can
-# use these benchmarks as a rough guideline for what you can expect:
+# tests must be run on always the same environment (and with the same
+# dataset size) - i.e. store a baseline with EDEN_BENCHMARK_SAVE=1 before
+# the change, then run the benchmarks again after the change to get a
+# comparison report.
 #
-# S3Model.configure = 2.90979003906 µs
-# S3Model.get_config = 2.2715420723 µs
-# S3Model.table(non-table) = 2.13528013229 µs
-# S3Model.get(non-table) = 2.0619969368 µs
-# S3Model.__getattr__(non-table) = 4.12402009964 µs
-# S3Model.__getitem__(non-table) = 4.24327015877 µs
-# S3Model.table = 2.91769790649 µs
-# S3Model.__getattr__ = 4.959856987 µs
-# S3Model.__getitem__ = 5.19830703735 µs
-# S3Resource.import_xml = 12.0009431839 ms (=83 rec/sec)
-# S3Resource.export (incl. DB extraction) = 3.75156188011 ms (=266 rec/sec)
-# S3Resource.export (w/o DB extraction) = 1.7192029953 ms (=581 rec/sec)
-# S3Resource.__init__ = 2.65161395073 ms
-# S3Resource.load = 5.55664610863 ms
-#
-# If you cannot achieve approximately these or even better results, then
-# it is recommendable to put effort into the optimization of the environment
-# in order to run Sahana Eden with acceptable performance. Typically you would
-# try to deploy Eden in an enviroment that allows 2-10 times better performance
-# than that.
+# The dataset benchmarks generate their data in the database of the
+# instance (a SQLite test instance is recommended), and remove them
+# again afterwards.
 #
 # If you get FAIL messages, then the overall performance of Sahana Eden in
 # your enviroment is likely to be completely unacceptable.
 #
-import unittest
+import datetime
+import json
+import os
+import platform
+import random
+import sys
 import timeit
+import unittest
+
+from gluon import *
+from gluon.storage import Storage
+
+SIZE = int(os.environ.get("EDEN_BENCHMARK_SIZE", 1000))
+
+# =============================================================================
+class Benchmark(object):
+    """ Collector for benchmark results, and comparison with baselines """
+
+    results = {}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def measure(cls, name, func, number=1, repeat=3, records=None):
+        """
+            Measure the execution time of a function (best of repeat)
+
+            @param name: the name of the benchmark
+            @param func: the function
+            @param number: number of calls per repetition
+            @param repeat: number of repetitions
+            @param records: number of records processed per call
+
+            @return: the time per call in seconds
+        """
+
+        timer = timeit.Timer(func)
+        seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+        cls.record(name, seconds, records=records)
+        return seconds
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def record(cls, name, seconds, records=None):
+        """
+            Record a benchmark result
+
+            @param name: the name of the benchmark
+            @param seconds: the time per call in seconds
+            @param records: number of records processed per call
+        """
+
+        result = {"time": seconds}
+        if records:
+            result["records"] = records
+            result["rate"] = records / seconds if seconds else None
+        cls.results[name] = result
+
+        if records:
+            info = "%.3f ms (=%s rec/sec)" % (seconds * 1000, int(records / seconds))
+        elif seconds < 0.001:
+            info = "%.3f µs" % (seconds * 1000000)
+        else:
+            info = "%.3f ms" % (seconds * 1000)
+        sys.stderr.write("%s = %s\n" % (name, info))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def path(variable, filename):
+        """
+            Get the path of a results file
+
+            @param variable: the name of the environment variable
+            @param filename: the default file name in private/benchmark
+        """
+
+        path = os.environ.get(variable)
+        if not path:
+            path = os.path.join(current.request.folder,
+                                "private", "benchmark", filename)
+        return path
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def save(cls, path):
+        """
+            Write the results to a JSON file
+
+            @param path: the file path
+        """
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        data = {"timestamp": datetime.datetime.utcnow().isoformat(),
+                "size": SIZE,
+                "db": current.db._dbname,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": cls.results,
+                }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def load(path):
+        """
+            Load results from a JSON file
+
+            @param path: the file path
+            @return: the results data, or None if the file doesn't exist
+        """
+
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def compare(cls, baseline, tolerance=0.2):
+        """
+            Compare the results with a baseline
+
+            @param baseline: the baseline data (as returned from load())
+            @param tolerance: the relative slow-down above which a
+                              result is flagged as regression
+
+            @return: list of tuples (name, baseline, time, ratio, status),
+                     status being "REGRESSION", "IMPROVED", "OK" or "NEW"
+        """
+
+        previous = baseline.get("results", {})
+
+        report = []
+        for name in sorted(cls.results):
+            seconds = cls.results[name]["time"]
+            base = previous.get(name)
+            if not base or not base.get("time"):
+                report.append((name, None, seconds, None, "NEW"))
+                continue
+            base = base["time"]
+            ratio = seconds / base
+            if ratio > 1 + tolerance:
+                status = "REGRESSION"
+            elif ratio < 1 - tolerance:
+                status = "IMPROVED"
+            else:
+                status = "OK"
+            report.append((name, base, seconds, ratio, status))
+        return report
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def finish(cls):
+        """
+            Store the results, compare them with the baseline and
+            write the comparison report
+
+            @return: the number of regressions
+        """
+
+        if not cls.results:
+            return 0
+
+        env = os.environ
+
+        cls.save(cls.path("EDEN_BENCHMARK_RESULTS", "results.json"))
+
+        baseline_path = cls.path("EDEN_BENCHMARK_BASELINE", "baseline.json")
+        baseline = cls.load(baseline_path)
+
+        regressions = 0
+        write = sys.stderr.write
+        if baseline:
+            if baseline.get("size") != SIZE:
+                write("\nWARNING: baseline dataset size (%s) differs from "
+                      "current dataset size (%s)\n" % (baseline.get("size"), SIZE))
+            tolerance = float(env.get("EDEN_BENCHMARK_TOLERANCE", 0.2))
+            write("\nComparison with baseline of %s:\n\n" % baseline.get("timestamp"))
+            for name, base, seconds, ratio, status in cls.compare(baseline, tolerance):
+                if status == "NEW":
+                    write("%-10s %s: %.3f ms\n" % (status, name, seconds * 1000))
+                    continue
+                if status == "REGRESSION":
+                    regressions += 1
+                write("%-10s %s: %.3f ms => %.3f ms (%+.1f%%)\n" %
+                      (status, name, base * 1000, seconds * 1000, (ratio - 1) * 100))
+            write("\n%s regression(s)\n" % regressions)
+
+        if env.get("EDEN_BENCHMARK_SAVE") or not baseline:
+            cls.save(baseline_path)
+            write("\nBaseline saved as %s\n" % baseline_path)
+
+        return regressions
 
 # =============================================================================
 #@unittest.skip("Comment or remove this line in modules/unit_tests/eden/benchmark.py to activate this test")
@@ -56,7 +245,6 @@ class S3PerformanceTests(unittest.TestCase):
         db = current.db
         s3db = current.s3db
 
-        print ""
         table = s3db.table("pr_person")
         x = lambda: [(row.first_name, row.last_name)
                      for row in db(table.id > 0).select(table.id,
@@ -65,7 +253,7 @@ class S3PerformanceTests(unittest.TestCase):
                                                         limitby=(0, 50))]
         n = len(x())
         mlt = timeit.Timer(x).timeit(number = int(100/n))
-        print "db.select = %s ms/record (=%s rec/sec)" % (mlt * 10.0, int(100/mlt))
+        Benchmark.record("db.select (per record)", mlt / 100.0)
 
         x = lambda: [[(row.first_name, row.last_name)
                       for row in db(table.id < i).select(table.id,
@@ -73,93 +261,88 @@ class S3PerformanceTests(unittest.TestCase):
                                                          table.last_name)]
                      for i in xrange(n)]
         mlt = timeit.Timer(x).timeit(number = 10) * (100/n)
-        print "db.select = %s ms/query (=%s q/sec)" % (mlt, int(1000/mlt))
+        Benchmark.record("db.select (per query)", mlt / 1000.0)
 
     def testS3ModelTable(self):
 
         s3db = current.s3db
 
-        print ""
         table = s3db.table("pr_person")
         if table is not None:
             x = lambda: s3db.table("pr_person")
             mlt = timeit.Timer(x).timeit()
-            print "S3Model.table = %s µs" % mlt
+            Benchmark.record("S3Model.table", mlt / 1000000.0)
             self.assertTrue(mlt<10)
 
             x = lambda: s3db.pr_person
             mlt = timeit.Timer(x).timeit()
-            print "S3Model.__getattr__ = %s µs" % mlt
+            Benchmark.record("S3Model.__getattr__", mlt / 1000000.0)
             self.assertTrue(mlt<10)
 
             x = lambda: s3db["pr_person"]
             mlt = timeit.Timer(x).timeit()
-            print "S3Model.__getitem__ = %s µs" % mlt
+            Benchmark.record("S3Model.__getitem__", mlt / 1000000.0)
             self.assertTrue(mlt<10)
 
     def testS3ModelName(self):
 
         s3db = current.s3db
 
-        print ""
         func = s3db.get("pr_person_represent")
         if func is not None:
             x = lambda: s3db.table("pr_person_represent")
             mlt = timeit.Timer(x).timeit()
-            print "S3Model.table(non-table) = %s µs" % mlt
+            Benchmark.record("S3Model.table(non-table)", mlt / 1000000.0)
             self.assertTrue(mlt<10)
 
             x = lambda: s3db.get("pr_person_represent")
             mlt = timeit.Timer(x).timeit()
-            print "S3Model.get(non-table) = %s µs" % mlt
+            Benchmark.record("S3Model.get(non-table)", mlt / 1000000.0)
             self.assertTrue(mlt<10)
 
             x = lambda: s3db.pr_person_represent
             mlt = timeit.Timer(x).timeit()
-            print "S3Model.__getattr__(non-table) = %s µs" % mlt
+            Benchmark.record("S3Model.__getattr__(non-table)", mlt / 1000000.0)
             self.assertTrue(mlt<10)
 
             x = lambda: s3db["pr_person_represent"]
             mlt = timeit.Timer(x).timeit()
-            print "S3Model.__getitem__(non-table) = %s µs" % mlt
+            Benchmark.record("S3Model.__getitem__(non-table)", mlt / 1000000.0)
             self.assertTrue(mlt<10)
 
     def testS3ModelConfigure(self):
 
         s3db = current.s3db
 
-        print ""
         configure = s3db.configure
         x = lambda: configure("pr_person", testconfig = "Test")
         mlt = timeit.Timer(x).timeit()
-        print "S3Model.configure = %s µs" % mlt
+        Benchmark.record("S3Model.configure", mlt / 1000000.0)
         self.assertTrue(mlt<10)
 
         get_config = s3db.get_config
         x = lambda: get_config("pr_person", "testconfig")
         mlt = timeit.Timer(x).timeit()
-        print "S3Model.get_config = %s µs" % mlt
+        Benchmark.record("S3Model.get_config", mlt / 1000000.0)
         self.assertTrue(mlt<10)
 
     def testS3ResourceInit(self):
 
-        print ""
         current.auth.override = True
         current.s3db.resource("pr_person")
         x = lambda: current.s3db.resource("pr_person")
         mlt = timeit.Timer(x).timeit(number=1000)
-        print "S3Resource.__init__ = %s ms" % mlt
+        Benchmark.record("S3Resource.__init__", mlt / 1000.0)
         self.assertTrue(mlt<10)
         current.auth.override = False
 
     def testS3ResourceLoad(self):
 
-        print ""
         current.auth.override = True
         resource = current.s3db.resource("pr_person")
         x = lambda: resource.load(limit=1)
         mlt = timeit.Timer(x).timeit(number=1000)
-        print "S3Resource.load = %s ms" % mlt
+        Benchmark.record("S3Resource.load", mlt / 1000.0)
         self.assertTrue(mlt<10)
         current.auth.override = False
 
@@ -237,7 +420,6 @@ class S3PerformanceTests(unittest.TestCase):
         current.auth.override = True
         current.db.rollback()
 
-        print ""
         resource = current.s3db.resource("org_organisation")
         x = lambda: resource.import_xml(tree)
         mlt = 0
@@ -245,7 +427,7 @@ class S3PerformanceTests(unittest.TestCase):
             mlt += timeit.Timer(x).timeit(number=1)
             current.db.rollback()
         mlt *= 10
-        print "S3Resource.import_xml = %s ms (=%s rec/sec)" % (mlt, int(1000/mlt))
+        Benchmark.record("S3Resource.import_xml", mlt / 1000.0)
         self.assertTrue(mlt<30)
 
         resource = current.s3db.resource("pr_person")
@@ -258,7 +440,7 @@ class S3PerformanceTests(unittest.TestCase):
                                             parent=parent,
                                             export_map=Storage())
         mlt = timeit.Timer(x).timeit(number=1000)
-        print "S3Resource.export (incl. DB extraction) = %s ms (=%s rec/sec)" % (mlt, int(1000/mlt))
+        Benchmark.record("S3Resource.export (incl. DB extraction)", mlt / 1000.0)
         self.assertTrue(mlt<10)
 
         resource = current.s3db.resource("pr_person")
@@ -272,11 +454,355 @@ class S3PerformanceTests(unittest.TestCase):
                                             parent=parent,
                                             export_map=Storage())
         mlt = timeit.Timer(x).timeit(number=1000)
-        print "S3Resource.export (w/o DB extraction) = %s ms (=%s rec/sec)" % (mlt, int(1000/mlt))
+        Benchmark.record("S3Resource.export (w/o DB extraction)", mlt / 1000.0)
         self.assertTrue(mlt<10)
 
         current.auth.override = False
 
+    def testCSVTransform(self):
+        """ CSV import transformation: XSLT vs. column mapping """
+
+        from StringIO import StringIO
+
+        xml = current.xml
+
+        number = min(SIZE, 10000)
+        rows = ["Name,Comments"] + ["Type %s,Comment %s" % (i, i)
+                                    for i in xrange(number)]
+        tree = xml.csv2tree(StringIO("\n".join(rows)))
+
+        path = os.path.join(current.request.folder,
+                            "static", "formats", "s3csv", "org",
+                            "facility_type.%s")
+        xsl = path % "xsl"
+        with open(xsl, "r") as f:
+            source = f.read()
+
+        # Parse and compile the stylesheet for every transformation
+        x = lambda: xml.transform(tree, StringIO(source))
+        Benchmark.measure("S3XML.transform (XSLT, uncached)", x,
+                          records=number)
+
+        x = lambda: xml.transform(tree, xsl)
+        Benchmark.measure("S3XML.transform (XSLT, cached)", x,
+                          records=number)
+
+        x = lambda: xml.transform(tree, path % "json")
+        Benchmark.measure("S3XML.transform (column mapping)", x,
+                          records=number)
+
+# =============================================================================
+class S3DatasetBenchmarks(unittest.TestCase):
+    """
+        Benchmarks of core functions against generated datasets of
+        EDEN_BENCHMARK_SIZE human resource records (with persons,
+        organisations and a location hierarchy)
+    """
+
+    # Tables of the generated dataset, in order of insertion
+    TABLES = ("org_organisation",
+              "gis_location",
+              "pr_person",
+              "hrm_human_resource",
+              )
+
+    # Chunk size for bulk inserts
+    CHUNK_SIZE = 10000
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+        s3db = current.s3db
+
+        current.auth.override = True
+
+        # Remember the current maximum ID per table for cleanup
+        cls.max_ids = {}
+        for tablename in cls.TABLES:
+            table = s3db.table(tablename)
+            max_id = table.id.max()
+            cls.max_ids[tablename] = db().select(max_id).first()[max_id] or 0
+
+        rand = random.Random(SIZE)
+        insert = cls.bulk_insert
+
+        # Organisations
+        org_ids = insert("org_organisation",
+                         ({"name": "Benchmark Organisation %s" % i,
+                           "acronym": "BO%s" % i,
+                           } for i in xrange(max(10, SIZE / 100))))
+
+        # Location hierarchy L1 => L2 => L3
+        l1 = insert("gis_location",
+                    ({"name": "Benchmark L1-%s" % i,
+                      "level": "L1",
+                      "L1": "Benchmark L1-%s" % i,
+                      } for i in xrange(10)))
+        l2 = insert("gis_location",
+                    ({"name": "Benchmark L2-%s" % i,
+                      "level": "L2",
+                      "parent": l1[i % 10],
+                      "L1": "Benchmark L1-%s" % (i % 10),
+                      "L2": "Benchmark L2-%s" % i,
+                      } for i in xrange(100)))
+        l3 = insert("gis_location",
+                    ({"name": "Benchmark L3-%s" % i,
+                      "level": "L3",
+                      "parent": l2[i % 100],
+                      "L1": "Benchmark L1-%s" % (i % 10),
+                      "L2": "Benchmark L2-%s" % (i % 100),
+                      "L3": "Benchmark L3-%s" % i,
+                      "lat": rand.uniform(-60, 60),
+                      "lon": rand.uniform(-180, 180),
+                      } for i in xrange(max(100, SIZE / 10))))
+
+        # Persons
+        first_names = ("Anna", "Bruno", "Chona", "David", "Eva",
+                       "Farid", "Grace", "Hiro", "Ines", "Jamal")
+        last_names = ("Alinsub", "Brown", "Chen", "Diaz", "Ekwueme",
+                      "Fischer", "Garcia", "Haddad", "Ivanova", "Jones")
+        person_ids = insert("pr_person",
+                            ({"first_name": rand.choice(first_names),
+                              "last_name": "%s %s" % (rand.choice(last_names), i),
+                              } for i in xrange(SIZE)))
+
+        # Human resources
+        hr_ids = insert("hrm_human_resource",
+                        ({"person_id": person_id,
+                          "organisation_id": rand.choice(org_ids),
+                          "location_id": rand.choice(l3),
+                          "type": rand.choice((1, 2)),
+                          } for person_id in person_ids))
+
+        # Commit, so that benchmarks can roll back their own changes
+        db.commit()
+
+        cls.org_ids = org_ids
+        cls.location_ids = l3
+        cls.person_ids = person_ids
+        cls.hr_ids = hr_ids
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        s3db = current.s3db
+
+        db.rollback()
+        for tablename in reversed(cls.TABLES):
+            table = s3db.table(tablename)
+            db(table.id > cls.max_ids[tablename]).delete()
+        db.commit()
+
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def bulk_insert(cls, tablename, records):
+        """
+            Insert records in chunks
+
+            @param tablename: the table name
+            @param records: iterable of dicts
+
+            @return: list of record IDs
+        """
+
+        table = current.s3db.table(tablename)
+        chunk_size = cls.CHUNK_SIZE
+
+        ids = []
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                ids.extend(table.bulk_insert(chunk))
+                chunk = []
+        if chunk:
+            ids.extend(table.bulk_insert(chunk))
+        return ids
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testResourceSelect(self):
+        """ S3Resource.select """
+
+        resource = current.s3db.resource("hrm_human_resource")
+        fields = ["person_id$first_name",
+                  "person_id$last_name",
+                  "organisation_id",
+                  "location_id$L1",
+                  "location_id$L2",
+                  ]
+
+        x = lambda: resource.select(fields,
+                                    limit=25,
+                                    count=True,
+                                    represent=True)
+        Benchmark.measure("S3Resource.select (page, represent)", x,
+                          records=25)
+
+        limit = min(SIZE, 10000)
+        x = lambda: resource.select(fields, limit=limit, raw_data=True)
+        Benchmark.measure("S3Resource.select (raw)", x, records=limit)
+
+    # -------------------------------------------------------------------------
+    def testResourceDatatable(self):
+        """ S3Resource.datatable """
+
+        resource = current.s3db.resource("hrm_human_resource")
+        fields = ["id",
+                  "person_id",
+                  "organisation_id",
+                  "location_id",
+                  "type",
+                  ]
+
+        x = lambda: resource.datatable(fields=fields, start=0, limit=25)
+        Benchmark.measure("S3Resource.datatable", x, records=25)
+
+    # -------------------------------------------------------------------------
+    def testResourcePivottable(self):
+        """ S3Resource.pivottable """
+
+        resource = current.s3db.resource("hrm_human_resource")
+
+        x = lambda: resource.pivottable("organisation_id",
+                                        "location_id$L1",
+                                        [("id", "count")])
+        Benchmark.measure("S3Resource.pivottable", x, records=SIZE)
+
+    # -------------------------------------------------------------------------
+    def testResourceImportXML(self):
+        """ S3Resource.import_xml """
+
+        from lxml import etree
+
+        number = min(SIZE, 100)
+        root = etree.Element("s3xml")
+        for i in xrange(number):
+            person = etree.SubElement(root, "resource", name="pr_person")
+            for fieldname, value in (("first_name", "Import"),
+                                     ("last_name", "Person %s" % i)):
+                data = etree.SubElement(person, "data", field=fieldname)
+                data.text = value
+        tree = etree.ElementTree(root)
+
+        db = current.db
+        resource = current.s3db.resource("pr_person")
+
+        def x():
+            resource.import_xml(tree)
+            db.rollback()
+        Benchmark.measure("S3Resource.import_xml (bulk)", x, records=number)
+
+    # -------------------------------------------------------------------------
+    def testResourceExportTree(self):
+        """ S3Resource.export_tree """
+
+        resource = current.s3db.resource("hrm_human_resource")
+
+        number = min(SIZE, 1000)
+        x = lambda: resource.export_tree(start=0, limit=number)
+        Benchmark.measure("S3Resource.export_tree", x, records=number)
+
+    # -------------------------------------------------------------------------
+    def testRepresentBulk(self):
+        """ S3Represent.bulk """
+
+        table = current.s3db.hrm_human_resource
+
+        org_ids = self.org_ids
+        represent = table.organisation_id.represent
+        if hasattr(represent, "bulk"):
+            def x():
+                # Bypass the lookup cache
+                represent.theset = {}
+                represent.rows = {}
+                represent.bulk(org_ids)
+            Benchmark.measure("S3Represent.bulk (organisations)", x,
+                              records=len(org_ids))
+
+        person_ids = self.person_ids[:1000]
+        represent = table.person_id.represent
+        if hasattr(represent, "bulk"):
+            def x():
+                # Bypass the lookup cache
+                represent.theset = {}
+                represent.rows = {}
+                represent.bulk(person_ids)
+            Benchmark.measure("S3Represent.bulk (persons)", x,
+                              records=len(person_ids))
+
+    # -------------------------------------------------------------------------
+    def testPermissionCheck(self):
+        """ ACL checks (for a non-admin user, with table ACLs) """
+
+        auth = current.auth
+        permission = auth.permission
+        table = current.s3db.hrm_human_resource
+        record_id = self.hr_ids[0]
+
+        # Test role which can read all and update own human resources
+        ROLE = "BENCHMARKTESTROLE"
+        role_id = auth.s3_create_role(ROLE, uid=ROLE)
+        permission.update_acl(role_id,
+                              t="hrm_human_resource",
+                              uacl=permission.READ,
+                              oacl=permission.READ | permission.UPDATE)
+
+        auth.override = False
+        try:
+            auth.s3_impersonate("normaluser@example.com")
+            auth.s3_assign_role(auth.user.id, role_id)
+            has_permission = auth.s3_has_permission
+            x = lambda: has_permission("update", table, record_id=record_id)
+            Benchmark.measure("S3Permission.has_permission", x, number=100)
+
+            accessible_query = auth.s3_accessible_query
+            x = lambda: accessible_query("read", table)
+            Benchmark.measure("S3Permission.accessible_query", x, number=100)
+        finally:
+            auth.s3_impersonate(None)
+            auth.s3_delete_role(role_id)
+            auth.override = True
+
+    # -------------------------------------------------------------------------
+    def testGISLocationData(self):
+        """ GIS location data for map layers """
+
+        gis = current.gis
+        resource = current.s3db.resource("hrm_human_resource")
+
+        number = min(SIZE, 1000)
+        resource.load(start=0, limit=number)
+
+        x = lambda: gis.get_location_data(resource)
+        Benchmark.measure("GIS.get_location_data", x, records=number)
+
+    # -------------------------------------------------------------------------
+    def testFilterOptions(self):
+        """ Filter widget options """
+
+        from s3 import S3OptionsFilter
+
+        resource = current.s3db.resource("hrm_human_resource")
+
+        widget = S3OptionsFilter("organisation_id")
+        x = lambda: widget.ajax_options(resource)
+        Benchmark.measure("S3OptionsFilter.options (organisation)", x)
+
+        widget = S3OptionsFilter("location_id$L2")
+        x = lambda: widget.ajax_options(resource)
+        Benchmark.measure("S3OptionsFilter.options (location)", x)
+
 # =============================================================================
 def run_suite(*test_classes):
     """ Run the test suite """
@@ -294,6 +820,8 @@ if __name__ == "__main__":
 
     run_suite(
         S3PerformanceTests,
+        S3DatasetBenchmarks,
     )
+    Benchmark.finish()
 
 # END ========================================================================
@@ -9,7 +9,7 @@ import unittest
 
 from gluon import *
 from gluon.storage import Storage
-from s3.s3aaa import S3EntityRoleManager, S3Permission
+from s3.s3aaa import S3Audit, S3EntityRoleManager, S3Permission, S3RealmUpdate
 from s3.s3fields import s3_meta_fields
 
 # =============================================================================
@@ -1579,6 +1579,52 @@ class HasPermissionTests(unittest.TestCase):
         assertFalse(permitted)
         auth.s3_withdraw_role(auth.user.id, self.editor)
 
+    # -------------------------------------------------------------------------
+    def testPagePermissionCache(self):
+        """ Test caching of page permissions for navigation items """
+
+        auth = current.auth
+        settings = current.deployment_settings
+
+        settings.security.policy = 5
+        auth.permission = S3Permission(auth)
+
+        menu_cache = settings.ui.get("menu_cache")
+        settings.ui.menu_cache = 60
+        try:
+            page_permitted = auth.permission.page_permitted
+            c = "org"
+            f = "permission_test"
+
+            # Anonymous
+            auth.s3_impersonate(None)
+            self.assertFalse(page_permitted("read", c=c, f=f))
+            cache = auth.permission.page_permissions()
+            self.assertEqual(cache[("read", c, f, None)], False)
+
+            # Role change => different cache
+            auth.s3_impersonate("normaluser@example.com")
+            auth.s3_assign_role(auth.user.id, self.reader)
+            self.assertTrue(page_permitted("read", c=c, f=f))
+            self.assertFalse(page_permitted("update", c=c, f=f))
+            cache = auth.permission.page_permissions()
+            self.assertEqual(cache[("read", c, f, None)], True)
+
+            # ACL change => cache invalidated
+            acl = auth.permission
+            acl.update_acl("TESTREADER", c=c, f=f,
+                           uacl=acl.READ|acl.CREATE|acl.UPDATE,
+                           oacl=acl.READ|acl.CREATE|acl.UPDATE)
+            self.assertTrue(page_permitted("update", c=c, f=f))
+
+            auth.s3_withdraw_role(auth.user.id, self.reader)
+        finally:
+            if menu_cache is None:
+                settings.ui.pop("menu_cache", None)
+            else:
+                settings.ui.menu_cache = menu_cache
+            auth.permission.clear_page_permissions()
+
     # -------------------------------------------------------------------------
     def testPolicy6(self):
         """ Test permission check with policy 6 """
@@ -3796,6 +3842,58 @@ class RealmEntityTests(unittest.TestCase):
         site = stable[site_id]
         self.assertEqual(site["realm_entity"], row["realm_entity"])
 
+    # -------------------------------------------------------------------------
+    def testRealmUpdateCascade(self):
+        """ Test bulk realm update with the standard lookup cascade """
+
+        s3db = current.s3db
+
+        ftable = s3db.org_office
+        stable = s3db.org_site
+
+        office = ftable[self.office_id]
+        office.update_record(realm_entity=None)
+
+        # Offices are person entities => their own realm
+        pe_id = office.pe_id
+        query = (ftable.id == self.office_id)
+        updated = S3RealmUpdate(ftable)(query)
+        self.assertEqual(updated, 1)
+        office = ftable[self.office_id]
+        self.assertEqual(office.realm_entity, pe_id)
+        self.assertEqual(stable[office.site_id].realm_entity, pe_id)
+
+        # Records with realm are skipped unless forced
+
+        self.assertEqual(S3RealmUpdate(ftable)(query), 0)
+
+        # Progress reporting
+        report = []
+        progress = lambda done, total: report.append((done, total))
+        updated = S3RealmUpdate(ftable, entity=4, force_update=True)(
+                                                query, progress=progress)
+        self.assertEqual(updated, 1)
+        self.assertEqual(report, [(1, 1)])
+        self.assertEqual(ftable[self.office_id].realm_entity, 4)
+
+    # -------------------------------------------------------------------------
+    def testRealmUpdatePeIDs(self):
+        """ Test bulk lookup of PE-IDs """
+
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        ftable = s3db.org_office
+
+        pe_ids = S3RealmUpdate.pe_ids("org_organisation", [self.org_id])
+        self.assertEqual(pe_ids,
+                         {self.org_id: s3db.pr_get_pe_id(otable, self.org_id)})
+
+        site_id = ftable[self.office_id].site_id
+        pe_ids = S3RealmUpdate.pe_ids("org_site", [site_id])
+        self.assertEqual(pe_ids,
+                         {site_id: s3db.pr_get_pe_id(ftable, self.office_id)})
+
     # -------------------------------------------------------------------------
     def realm_entity(self, table, row):
         """ Dummy method for hook testing """
@@ -4144,6 +4242,183 @@ class EntityRoleManagerTests(unittest.TestCase):
     def tearDownClass(cls):
         pass
 
+# =============================================================================
+class AuditTests(unittest.TestCase):
+    """ Tests for buffered audit writes """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        security = current.deployment_settings.security
+        self.settings = dict(security)
+        security.audit_read = True
+        security.audit_write = True
+        security.audit_queue = 0
+        security.audit_log = None
+
+        self.audit = S3Audit()
+        self.audit.buffered = True
+        self.table = current.db.s3_audit
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        security = current.deployment_settings.security
+        security.clear()
+        security.update(self.settings)
+
+        timer = S3Audit._timer
+        if timer is not None:
+            timer.cancel()
+        S3Audit._timer = None
+        S3Audit._queue = []
+        S3Audit._queue_start = None
+        S3Audit._queue_target = None
+
+        db = current.db
+        db.rollback()
+
+        # Queued events are committed separately
+        table = self.table
+        db(table.tablename == "audit_test").delete()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def count(self, tablename="audit_test"):
+        """ Count the audit records for a table """
+
+        table = self.table
+        return current.db(table.tablename == tablename).count()
+
+    # -------------------------------------------------------------------------
+    def testRequestBuffer(self):
+        """ Test buffering of audit events within a request """
+
+        audit = self.audit
+
+        audit("list", "audit", "test", representation="html")
+        audit("read", "audit", "test", record=1, representation="html")
+        self.assertEqual(self.count(), 0)
+        self.assertEqual(len(audit.buffer), 2)
+
+        audit.flush()
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(audit.buffer, [])
+
+        # Buffer is written when full
+        size = S3Audit.BUFFER_SIZE
+        try:
+            S3Audit.BUFFER_SIZE = 3
+            for i in xrange(3):
+                audit("read", "audit", "test", record=i + 1)
+            self.assertEqual(self.count(), 5)
+        finally:
+            S3Audit.BUFFER_SIZE = size
+
+    # -------------------------------------------------------------------------
+    def testQueue(self):
+        """ Test queuing of audit events across requests """
+
+        security = current.deployment_settings.security
+        security.audit_queue = 3
+
+        audit = self.audit
+        audit("read", "audit", "test", record=1)
+        audit.flush()
+        self.assertEqual(self.count(), 0)
+
+        # Next request
+        audit = S3Audit()
+        audit.buffered = True
+        audit("read", "audit", "test", record=2)
+        audit("read", "audit", "test", record=3)
+        audit.flush()
+        self.assertEqual(self.count(), 3)
+        self.assertEqual(S3Audit._queue, [])
+
+        # Time limit
+        security.audit_queue_time = 0
+        audit("read", "audit", "test", record=4)
+        audit.flush()
+        self.assertEqual(self.count(), 4)
+
+        # Queue is written in its own transaction
+        current.db.rollback()
+        self.assertEqual(self.count(), 4)
+
+    # -------------------------------------------------------------------------
+    def testQueueTimer(self):
+        """ Test writing of the queue when the time limit expires """
+
+        import time
+
+        security = current.deployment_settings.security
+        security.audit_queue = 10
+        security.audit_queue_time = 0.5
+
+        audit = self.audit
+        audit("read", "audit", "test", record=1)
+        audit.flush()
+        self.assertEqual(self.count(), 0)
+        self.assertNotEqual(S3Audit._timer, None)
+
+        # No further requests
+        time.sleep(1.5)
+        self.assertEqual(S3Audit._queue, [])
+        self.assertEqual(S3Audit._timer, None)
+        self.assertEqual(self.count(), 1)
+
+    # -------------------------------------------------------------------------
+    def testQueueExit(self):
+        """ Test writing of the queue at exit of the process """
+
+        security = current.deployment_settings.security
+        security.audit_queue = 10
+
+        audit = self.audit
+        audit("read", "audit", "test", record=1)
+        audit("read", "audit", "test", record=2)
+        audit.flush()
+        self.assertEqual(self.count(), 0)
+        self.assertTrue(S3Audit._atexit)
+
+        # Registered with atexit
+        S3Audit.flush_queue()
+        self.assertEqual(S3Audit._queue, [])
+        self.assertEqual(self.count(), 2)
+
+    # -------------------------------------------------------------------------
+    def testLogFile(self):
+        """ Test writing to and ingestion of the audit log file """
+
+        import os
+        import tempfile
+
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        os.unlink(path)
+
+        security = current.deployment_settings.security
+        security.audit_log = path
+
+        try:
+            audit = self.audit
+            audit("read", "audit", "test", record=1)
+            audit("update", "audit", "test", record=2)
+            audit.flush()
+            self.assertEqual(self.count(), 0)
+            self.assertTrue(os.path.exists(path))
+
+            self.assertEqual(S3Audit.ingest(), 2)
+            self.assertEqual(self.count(), 2)
+            self.assertFalse(os.path.exists(path))
+
+            # Nothing to ingest
+            self.assertEqual(S3Audit.ingest(), 0)
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
 # =============================================================================
 def run_suite(*test_classes):
     """ Run the test suite """
@@ -4172,6 +4447,7 @@ if __name__ == "__main__":
         RealmEntityTests,
         LinkToPersonTests,
         EntityRoleManagerTests,
+        AuditTests,
     )
 
 # END ========================================================================
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# S3Codec Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3codecs.py
+#
+import datetime
+import unittest
+import zipfile
+
+from cStringIO import StringIO
+
+from gluon import *
+from s3 import S3Codec, S3DateTime, S3FieldSelector
+from s3.codecs import S3XLS, S3XLSX
+
+# =============================================================================
+class S3CodecPaginateTests(unittest.TestCase):
+    """ Tests for paginated exports """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        current.s3db.define_table("test_paginate",
+                                  Field("name"),
+                                  )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        current.db.test_paginate.drop()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        table = current.db.test_paginate
+        self.ids = [table.insert(name=name)
+                    for name in ("Echo", "Alpha", "Delta", "Bravo", "Charlie")]
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testKeysetPages(self):
+        """ Test pagination by record ID """
+
+        ids = self.ids
+        resource = current.s3db.resource("test_paginate")
+
+        pages = []
+        for page, page_ids in S3Codec.paginate(resource, pagesize=2):
+            rows = page.select(["id"], as_rows=True)
+            self.assertEqual(set(row.id for row in rows), set(page_ids))
+            pages.append(page_ids)
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:]])
+
+        # With filter
+        resource = current.s3db.resource("test_paginate")
+        resource.add_filter(S3FieldSelector("name") != "Delta")
+        pages = [page_ids for page, page_ids
+                 in S3Codec.paginate(resource, pagesize=2)]
+        self.assertEqual(pages, [ids[0:2], ids[3:]])
+
+    # -------------------------------------------------------------------------
+    def testOrderedPages(self):
+        """ Test pagination with orderby """
+
+        ids = self.ids
+        resource = current.s3db.resource("test_paginate")
+        table = resource.table
+
+        pages = [page_ids for page, page_ids
+                 in S3Codec.paginate(resource,
+                                     orderby=table.name,
+                                     pagesize=2)]
+        self.assertEqual(pages, [[ids[1], ids[3]],
+                                 [ids[4], ids[2]],
+                                 [ids[0]]])
+
+    # -------------------------------------------------------------------------
+    def testXLSPages(self):
+        """ Test the rows of XLS exports are in order """
+
+        resource = current.s3db.resource("test_paginate")
+        table = resource.table
+
+        rows = S3XLS.pages(resource, ["name"], orderby=~table.name, pagesize=2)
+        self.assertEqual([row["test_paginate.name"] for row in rows],
+                         ["Echo", "Delta", "Charlie", "Bravo", "Alpha"])
+
+# =============================================================================
+class S3XLSXTests(unittest.TestCase):
+    """ Tests for the XLSX codec """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        current.s3db.define_table("test_xlsx",
+                                  Field("name"),
+                                  Field("date", "date",
+                                        represent = lambda v: \
+                                            S3DateTime.date_represent(v),
+                                        ),
+                                  Field("datetime", "datetime",
+                                        represent = lambda v: \
+                                            S3DateTime.datetime_represent(v, utc=True),
+                                        ),
+                                  Field("count", "integer"),
+                                  )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        current.db.test_xlsx.drop()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        try:
+            import xlsxwriter
+        except ImportError:
+            self.skipTest("xlsxwriter not installed")
+
+        current.auth.override = True
+
+        table = current.db.test_xlsx
+        table.insert(name = "XLSX Test",
+                     date = datetime.date(2014, 3, 15),
+                     datetime = datetime.datetime(2014, 3, 15, 12, 0, 0),
+                     count = 42,
+                     )
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testEncode(self):
+        """ Test export of dates, datetimes and numbers as typed cells """
+
+        resource = current.s3db.resource("test_xlsx")
+        output = S3XLSX().encode(resource,
+                                 list_fields = ["name",
+                                                "date",
+                                                "datetime",
+                                                "count",
+                                                ],
+                                 title = "XLSX Test",
+                                 )
+        contents = "".join(output)
+
+        book = zipfile.ZipFile(StringIO(contents))
+        sheet = book.read("xl/worksheets/sheet1.xml")
+
+        # Excel serial numbers for 2014-03-15 and 2014-03-15 12:00
+        self.assertTrue("<v>41713</v>" in sheet)
+        self.assertTrue("<v>41713.5</v>" in sheet)
+        self.assertTrue("<v>42</v>" in sheet)
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3CodecPaginateTests,
+        S3XLSXTests,
+    )
+
+# END ========================================================================
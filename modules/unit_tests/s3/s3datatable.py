@@ -11,7 +11,7 @@ from gluon import *
 from gluon.storage import Storage
 from gluon.dal import Row
 
-from s3.s3data import S3DataTable
+from s3.s3data import S3DataList, S3DataListLayout, S3DataTable
 
 # =============================================================================
 class S3DataTableTests(unittest.TestCase):
@@ -94,6 +94,77 @@ class S3DataTableTests(unittest.TestCase):
 
         current.auth.override = False
 
+# =============================================================================
+class S3DataListTests(unittest.TestCase):
+    """ Tests for S3DataList """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        table = current.s3db.org_organisation
+        self.record_ids = [table.insert(name="DataList Test %s" % i)
+                           for i in xrange(3)]
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def _datalist(self, layout):
+        """ Render a data list of the test records with a layout """
+
+        resource = current.s3db.resource("org_organisation",
+                                         id=self.record_ids)
+        datalist = resource.datalist(fields=["id", "name"],
+                                     start=0,
+                                     limit=None,
+                                     layout=layout)[0]
+        return datalist.html()
+
+    # -------------------------------------------------------------------------
+    def testPrefetch(self):
+        """ Test the prefetch hook of item renderer functions """
+
+        calls = []
+        rendered = []
+
+        def layout(list_id, item_id, resource, rfields, record):
+            rendered.append(record.get("_prefetched"))
+            return DIV(_id=item_id)
+
+        def prefetch(resource, records, rfields):
+            calls.append(len(records))
+            for record in records:
+                # Raw ID (record["org_organisation.id"] is represented)
+                record["_prefetched"] = record["_row"]["org_organisation.id"]
+        layout.prefetch = prefetch
+
+        self._datalist(layout)
+
+        # Called once for all records, before rendering them
+        self.assertEqual(calls, [3])
+        self.assertEqual(sorted(rendered), sorted(self.record_ids))
+
+    # -------------------------------------------------------------------------
+    def testPrefetchLayout(self):
+        """ Test the prefetch hook of S3DataListLayout subclasses """
+
+        class TestLayout(S3DataListLayout):
+
+            def prefetch(self, resource, records, rfields):
+                for record in records:
+                    record["_prefetched"] = "Prefetched"
+
+            def render_body(self, list_id, item_id, resource, rfields, record):
+                return SPAN(record["_prefetched"])
+
+        output = self._datalist(TestLayout()).xml()
+        self.assertEqual(output.count("<span>Prefetched</span>"), 3)
+
 # =============================================================================
 def run_suite(*test_classes):
     """ Run the test suite """
@@ -111,6 +182,7 @@ if __name__ == "__main__":
 
     run_suite(
         S3DataTableTests,
+        S3DataListTests,
     )
 
 # END ========================================================================
\ No newline at end of file
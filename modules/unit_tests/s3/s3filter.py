@@ -7,6 +7,7 @@ import unittest
 
 from gluon import *
 from s3.s3filter import *
+from s3.s3resource import S3FieldSelector
 
 # =============================================================================
 class S3FilterWidgetTests(unittest.TestCase):
@@ -126,6 +127,136 @@ class S3FilterWidgetTests(unittest.TestCase):
         self.assertTrue("2" in values)
         self.assertTrue("3" in values)
 
+# =============================================================================
+class S3FilterIndexTests(unittest.TestCase):
+    """ Tests for the filter options index """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+        db.define_table("filter_index_test",
+                        Field("category"),
+                        Field("deleted", "boolean", default=False))
+        table = db.filter_index_test
+        table.insert(category="A")
+        table.insert(category="A")
+        table.insert(category="B")
+        table.insert(category="C", deleted=True)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.filter_index_test.drop()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testIndexable(self):
+        """ Test that only unfiltered resources are indexable """
+
+        resource = current.s3db.resource("filter_index_test")
+        self.assertTrue(S3FilterIndex.indexable(resource))
+
+        resource.add_filter(S3FieldSelector("category") == "A")
+        self.assertFalse(S3FilterIndex.indexable(resource))
+
+        self.assertFalse(S3FilterIndex.indexable(None))
+
+    # -------------------------------------------------------------------------
+    def testIndexOptions(self):
+        """ Test building and reading of the index """
+
+        widget = S3OptionsFilter("category", index=True)
+        resource = current.s3db.resource("filter_index_test")
+
+        index = widget.index(resource)
+        self.assertNotEqual(index, None)
+        self.assertEqual(index.key, "options:category")
+        self.assertTrue("filter_index_test" in index.tables)
+
+        options = index.options()
+        self.assertEqual(options, {"A": 2, "B": 1})
+
+        # Index entry gets stored
+        itable = current.s3db.s3_filter_index
+        query = (itable.tablename == "filter_index_test") & \
+                (itable.selector == index.key)
+        row = current.db(query).select(itable.dirty,
+                                       limitby=(0, 1)).first()
+        self.assertNotEqual(row, None)
+        self.assertFalse(row.dirty)
+
+    # -------------------------------------------------------------------------
+    def testDirty(self):
+        """ Test invalidation of per-widget indexes after writes """
+
+        settings = current.deployment_settings
+        filter_index = settings.search.get("filter_index")
+        settings.search.filter_index = False
+
+        db = current.db
+        model = current.model
+        try:
+            widget = S3OptionsFilter("category", index=True)
+            resource = current.s3db.resource("filter_index_test")
+            index = widget.index(resource)
+            self.assertEqual(index.options(), {"A": 2, "B": 1})
+
+            itable = current.s3db.s3_filter_index
+            query = (itable.tablename == "filter_index_test") & \
+                    (itable.selector == index.key)
+
+            # Writing to another table => entry stays clean
+            model.pop("filter_index", None)
+            S3FilterIndex.dirty("filter_index_other")
+            row = db(query).select(itable.dirty, limitby=(0, 1)).first()
+            self.assertFalse(row.dirty)
+
+            # Writing to the indexed table => entry gets dirty...
+            db.filter_index_test.insert(category="B")
+            model.pop("filter_index", None)
+            S3FilterIndex.dirty("filter_index_test")
+            row = db(query).select(itable.dirty, limitby=(0, 1)).first()
+            self.assertTrue(row.dirty)
+
+            # ...and gets rebuilt by the refresh
+            current.s3db.configure("filter_index_test",
+                                   filter_widgets = [widget],
+                                   )
+            self.assertEqual(S3FilterIndex.refresh("filter_index_test"), 1)
+            row = db(query).select(itable.dirty, limitby=(0, 1)).first()
+            self.assertFalse(row.dirty)
+        finally:
+            current.s3db.clear_config("filter_index_test", "filter_widgets")
+            settings.search.filter_index = filter_index
+
+    # -------------------------------------------------------------------------
+    def testIndexDisabled(self):
+        """ Test that widgets with fixed options are not indexed """
+
+        resource = current.s3db.resource("filter_index_test")
+
+        widget = S3OptionsFilter("category", index=False)
+        self.assertEqual(widget.index(resource), None)
+
+        widget = S3OptionsFilter("category",
+                                 index=True,
+                                 options={"A": "A"})
+        self.assertEqual(widget.index(resource), None)
+
 # =============================================================================
 def run_suite(*test_classes):
     """ Run the test suite """
@@ -143,6 +274,7 @@ if __name__ == "__main__":
 
     run_suite(
         S3FilterWidgetTests,
+        S3FilterIndexTests,
     )
 
 # END ========================================================================
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# S3Forms Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3forms.py
+#
+import unittest
+from gluon import *
+from s3 import S3Permission, S3SQLInlineComponent
+
+# =============================================================================
+class S3SQLInlineComponentTests(unittest.TestCase):
+    """ Tests for S3SQLInlineComponent """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        auth = current.auth
+        auth.override = True
+
+        table = current.s3db.org_organisation
+        self.record_ids = [table.insert(name="Inline Test %s" % i)
+                           for i in xrange(3)]
+
+        auth.override = False
+        self.policy = current.deployment_settings.get_security_policy()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        auth = current.auth
+        current.deployment_settings.security.policy = self.policy
+        auth.permission = S3Permission(auth)
+        auth.s3_impersonate(None)
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testPermittedOverride(self):
+        """ Test bulk permission check with auth override """
+
+        auth = current.auth
+        record_ids = [str(record_id) for record_id in self.record_ids]
+
+        auth.override = True
+        try:
+            permitted = S3SQLInlineComponent._permitted("update",
+                                                        "org_organisation",
+                                                        record_ids)
+        finally:
+            auth.override = False
+        self.assertEqual(permitted, set(record_ids))
+
+        self.assertEqual(S3SQLInlineComponent._permitted("update",
+                                                         "org_organisation",
+                                                         []),
+                         set())
+
+    # -------------------------------------------------------------------------
+    def testPermitted(self):
+        """ Test bulk permission check against per-record checks """
+
+        auth = current.auth
+        settings = current.deployment_settings
+        has_permission = auth.s3_has_permission
+
+        record_ids = self.record_ids
+        for policy in (1, 3, 5):
+            settings.security.policy = policy
+            auth.permission = S3Permission(auth)
+            for user in (None, "admin@example.com"):
+                auth.s3_impersonate(user)
+                for method in ("read", "update", "delete"):
+                    expected = set(record_id for record_id in record_ids
+                                   if has_permission(method,
+                                                     "org_organisation",
+                                                     record_id))
+                    permitted = S3SQLInlineComponent._permitted(method,
+                                                                "org_organisation",
+                                                                record_ids)
+                    self.assertEqual(permitted, expected,
+                                     msg = "%s by %s in policy %s" % \
+                                           (method, user, policy))
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3SQLInlineComponentTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# S3GIS Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3gis.py
+#
+import unittest
+from gluon import *
+from s3 import S3LocationData
+
+# =============================================================================
+class S3LocationDataTests(unittest.TestCase):
+    """ Tests for the precomputed location hierarchy store """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        settings = current.deployment_settings
+        self.location_data_store = settings.gis.get("location_data_store")
+        settings.gis.location_data_store = True
+
+        table = current.s3db.gis_location
+        L0 = table.insert(name="Testland", level="L0")
+        self.L0 = L0
+        self.L1a = table.insert(name="North", level="L1", parent=L0,
+                                lon_min=0, lat_min=0, lon_max=1, lat_max=1)
+        self.L1b = table.insert(name="South", level="L1", parent=L0)
+        self.L2 = table.insert(name="Northtown", level="L2", parent=self.L1a)
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.deployment_settings.gis.location_data_store = \
+                                                self.location_data_store
+
+    # -------------------------------------------------------------------------
+    def testGet(self):
+        """ Test building and reading the children of a parent """
+
+        L0 = self.L0
+
+        data = S3LocationData.children(L0, language="")
+        self.assertEqual(set(data.keys()), set([self.L1a, self.L1b]))
+        north = data[self.L1a]
+        self.assertEqual(north["n"], "North")
+        self.assertEqual(north["l"], 1)
+        self.assertEqual(north["f"], L0)
+        self.assertEqual(north["b"], [0, 0, 1, 1])
+        self.assertFalse("b" in data[self.L1b])
+
+        # Stored
+        output, version = S3LocationData.get(L0, language="")
+        table = current.s3db[S3LocationData.TABLENAME]
+        query = (table.location_id == L0) & (table.language == "")
+        row = current.db(query).select(table.data,
+                                       table.version,
+                                       limitby=(0, 1)).first()
+        self.assertNotEqual(row, None)
+        self.assertEqual(row.data, output)
+        self.assertEqual(row.version, version)
+
+        # Nonexistent parent
+        self.assertEqual(S3LocationData.get(0 - L0, language=""), (None, None))
+
+    # -------------------------------------------------------------------------
+    def testInvalidate(self):
+        """ Test removal of entries after writing locations """
+
+        db = current.db
+        table = current.s3db.gis_location
+        L0, L1a, L1b, L2 = self.L0, self.L1a, self.L1b, self.L2
+
+        version = S3LocationData.get(L0, language="")[1]
+        S3LocationData.get(L1a, language="")
+
+        # Rename a child => new version for the parent
+        db(table.id == L1b).update(name="Southern")
+        S3LocationData.invalidate(L1b)
+        output, new_version = S3LocationData.get(L0, language="")
+        self.assertNotEqual(version, new_version)
+        self.assertTrue("Southern" in output)
+
+        # Move a child => both old and new parent get rebuilt
+        db(table.id == L2).update(parent=L1b)
+        S3LocationData.invalidate(L2)
+        self.assertEqual(S3LocationData.children(L1a, language=""), {})
+        self.assertEqual(S3LocationData.children(L1b, language="").keys(),
+                         [L2])
+
+    # -------------------------------------------------------------------------
+    def testNames(self):
+        """ Test lookup of names from the entries of the parents """
+
+        names = S3LocationData.names([self.L0, self.L2], language="")
+        self.assertEqual(names, {self.L0: "Testland",
+                                 self.L2: "Northtown",
+                                 })
+
+    # -------------------------------------------------------------------------
+    def testServe(self):
+        """ Test serving with ETag """
+
+        request = current.request
+        response = current.response
+
+        output = S3LocationData.serve("n={}\n", "abc")
+        self.assertEqual(output, "n={}\n")
+        self.assertEqual(response.headers["ETag"], '"abc"')
+
+        if_none_match = request.env.http_if_none_match
+        request.env.http_if_none_match = '"abc"'
+        try:
+            with self.assertRaises(HTTP) as cm:
+                S3LocationData.serve("n={}\n", "abc")
+            self.assertEqual(cm.exception.status, 304)
+        finally:
+            request.env.http_if_none_match = if_none_match
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3LocationDataTests,
+    )
+
+# END ========================================================================
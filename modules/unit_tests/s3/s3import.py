@@ -384,6 +384,82 @@ class FailedReferenceTests(unittest.TestCase):
         current.db.rollback()
         current.auth.override = False
 
+# =============================================================================
+class ForeignKeyValidationTests(unittest.TestCase):
+    """ Test set-based validation of foreign keys """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+        table = s3db.org_organisation
+        org = {"name": "FKVTestOrg"}
+        org_id = table.insert(**org)
+        org["id"] = org_id
+        s3db.update_super(table, org)
+        self.org_id = org_id
+
+    # -------------------------------------------------------------------------
+    def testValidKeys(self):
+        """ Test collection and validation of foreign keys in the tree """
+
+        xmlstr = """
+<s3xml>
+    <resource name="org_office">
+        <data field="name">FKVTestOffice1</data>
+        <data field="organisation_id">%(org_id)s</data>
+    </resource>
+    <resource name="org_office">
+        <data field="name">FKVTestOffice2</data>
+        <data field="organisation_id">0</data>
+    </resource>
+</s3xml>""" % {"org_id": self.org_id}
+
+        from lxml import etree
+        tree = etree.ElementTree(etree.fromstring(xmlstr))
+
+        from s3.s3import import S3ImportJob
+        table = current.s3db.org_office
+        job = S3ImportJob(table, tree=tree)
+
+        valid_keys = job.valid_keys(table)
+        self.assertEqual(valid_keys.get("organisation_id"),
+                         set([str(self.org_id)]))
+
+    # -------------------------------------------------------------------------
+    def testInvalidKey(self):
+        """ Test that invalid foreign keys still fail validation """
+
+        xmlstr = """
+<s3xml>
+    <resource name="org_office">
+        <data field="name">FKVTestOffice1</data>
+        <data field="organisation_id">%(org_id)s</data>
+    </resource>
+    <resource name="org_office">
+        <data field="name">FKVTestOffice2</data>
+        <data field="organisation_id">0</data>
+    </resource>
+</s3xml>""" % {"org_id": self.org_id}
+
+        from lxml import etree
+        tree = etree.ElementTree(etree.fromstring(xmlstr))
+
+        resource = current.s3db.resource("org_office")
+        result = resource.import_xml(tree)
+
+        msg = json.loads(result)
+        self.assertEqual(msg["status"], "failed")
+        self.assertTrue("$_org_office" in msg["tree"])
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
 # =============================================================================
 def run_suite(*test_classes):
     """ Run the test suite """
@@ -405,6 +481,7 @@ if __name__ == "__main__":
         ComponentDisambiguationTests,
         PostParseTests,
         FailedReferenceTests,
+        ForeignKeyValidationTests,
     )
 
 # END ========================================================================
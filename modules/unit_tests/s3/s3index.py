@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Database Index Registry/Advisor Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3index.py
+#
+import unittest
+from gluon import *
+from s3 import S3Index, S3IndexAdvisor
+
+# =============================================================================
+class S3IndexTests(unittest.TestCase):
+    """ Tests for the declarative index registry """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        s3db = current.s3db
+
+        s3db.define_table("test_index",
+                          Field("name"),
+                          Field("code"),
+                          Field("type", "integer"),
+                          )
+        s3db.configure("test_index",
+                       indexes = ["name",
+                                  ("type", "code"),
+                                  ],
+                       )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.test_index.drop()
+        current.s3db.clear_config("test_index")
+
+    # -------------------------------------------------------------------------
+    def testDeclarations(self):
+        """ Test parsing of index declarations """
+
+        self.assertEqual(S3Index.parse("name"), (("name",), False))
+        self.assertEqual(S3Index.parse(("type", "code")),
+                         (("type", "code"), False))
+        self.assertEqual(S3Index.parse("lower(name)"), (("name",), True))
+
+        self.assertEqual(S3Index.name("test_index", ("type", "code")),
+                         "test_index_type_code__idx")
+        self.assertEqual(S3Index.name("test_index", "lower(name)"),
+                         "test_index_name_lower__idx")
+        name = S3Index.name("test_index", ("x" * 40, "y" * 40))
+        self.assertTrue(len(name) <= S3Index.MAXLEN)
+
+        self.assertEqual(S3Index.sql("test_index", "lower(name)", "postgres"),
+                         "CREATE INDEX test_index_name_lower__idx ON test_index (LOWER(name));")
+        self.assertEqual(S3Index.sql("test_index", "lower(name)", "mysql"),
+                         "CREATE INDEX test_index_name_lower__idx ON test_index (name);")
+
+        declared = S3Index.declared(["test_index"])
+        self.assertEqual(declared, [("test_index", "name"),
+                                    ("test_index", ("type", "code")),
+                                    ])
+
+    # -------------------------------------------------------------------------
+    def testCreate(self):
+        """ Test creation of missing indexes """
+
+        missing = S3Index.missing(["test_index"])
+        self.assertEqual(len(missing), 2)
+
+        created = S3Index.create(["test_index"])
+        self.assertEqual(set(created), set(["test_index_name__idx",
+                                            "test_index_type_code__idx",
+                                            ]))
+        existing = S3Index.existing("test_index")
+        self.assertEqual(existing.get("test_index_type_code__idx"),
+                         ("type", "code"))
+
+        # Nothing left to create
+        self.assertEqual(S3Index.missing(["test_index"]), [])
+        self.assertEqual(S3Index.create(["test_index"]), [])
+
+        # Leading columns of a composite index are covered
+        self.assertTrue(S3Index.covered(("type",), existing))
+        self.assertFalse(S3Index.covered(("code",), existing))
+
+# =============================================================================
+class S3IndexAdvisorTests(unittest.TestCase):
+    """ Tests for the index advisor """
+
+    # -------------------------------------------------------------------------
+    def testConditions(self):
+        """ Test extraction of condition columns from SQL """
+
+        conditions = S3IndexAdvisor.conditions
+
+        sql = "SELECT pr_person.id, pr_person.first_name FROM pr_person " \
+              "LEFT JOIN pr_contact ON (pr_contact.pe_id = pr_person.pe_id) " \
+              "WHERE ((LOWER(pr_person.last_name) LIKE 'x.y%') AND " \
+              "(pr_person.deleted <> 'T')) ORDER BY pr_person.first_name;"
+        self.assertEqual(conditions(sql),
+                         set([("pr_contact", "pe_id", False),
+                              ("pr_person", "pe_id", False),
+                              ("pr_person", "last_name", True),
+                              ("pr_person", "deleted", False),
+                              ]))
+
+        # Only SELECTs
+        sql = "UPDATE pr_person SET first_name='x' WHERE (pr_person.id = 1);"
+        self.assertEqual(conditions(sql), set())
+
+    # -------------------------------------------------------------------------
+    def testSuggest(self):
+        """ Test suggestions from sampled queries """
+
+        S3IndexAdvisor.suggest(reset=True)
+
+        sql = "SELECT pr_person.id FROM pr_person " \
+              "WHERE ((pr_person.gender = 2) AND (pr_person.deleted <> 'T'));"
+        S3IndexAdvisor.sample([(sql, 0.5), (sql, 0.25)])
+
+        suggestions = S3IndexAdvisor.suggest(reset=True)
+        columns = dict(((s["table"], s["column"]), s) for s in suggestions)
+
+        # Low-selectivity columns are skipped
+        self.assertFalse(("pr_person", "deleted") in columns)
+
+        suggestion = columns.get(("pr_person", "gender"))
+        if S3Index.covered(("gender",), S3Index.existing("pr_person")):
+            self.assertEqual(suggestion, None)
+        else:
+            self.assertNotEqual(suggestion, None)
+            self.assertEqual(suggestion["queries"], 2)
+            self.assertEqual(suggestion["time"], 0.75)
+            self.assertFalse(suggestion["declared"])
+
+        # Samples have been reset
+        self.assertEqual(S3IndexAdvisor.suggest(), [])
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3IndexTests,
+        S3IndexAdvisorTests,
+    )
+
+# END ========================================================================
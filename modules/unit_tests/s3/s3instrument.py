@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# Request Instrumentation Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3instrument.py
+#
+import time
+import unittest
+from gluon import *
+from s3 import S3Instrument
+
+# =============================================================================
+class S3InstrumentTests(unittest.TestCase):
+    """ Tests for the request instrumentation """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        s3 = current.response.s3
+        self.instrument = s3.instrument
+        s3.instrument = {"start": time.time(),
+                         "mark": None,
+                         "stack": [],
+                         "queries": [],
+                         "spans": {},
+                         }
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.response.s3.instrument = self.instrument
+
+    # -------------------------------------------------------------------------
+    def testInactive(self):
+        """ Test that traced functions work without instrumentation """
+
+        current.response.s3.instrument = None
+
+        traced = S3Instrument.trace("test")(lambda x: x + 1)
+        self.assertEqual(traced(1), 2)
+        self.assertEqual(S3Instrument.report(), None)
+
+    # -------------------------------------------------------------------------
+    def testSpans(self):
+        """ Test recording of spans and attribution of queries """
+
+        state = current.response.s3.instrument
+
+        def query(sql):
+            # Simulate a query as recorded by the instrumented adapter
+            stack = state["stack"]
+            state["queries"].append((sql, 0.01, stack[-1] if stack else None))
+
+        @S3Instrument.trace("outer")
+        def outer():
+            query("SELECT 1;")
+            inner()
+            with S3Instrument.span("outer"):
+                query("SELECT 2;")
+
+        @S3Instrument.trace("inner")
+        def inner():
+            query("SELECT 3;")
+
+        outer()
+        query("SELECT 4;")
+
+        report = S3Instrument.report()
+        components = report["components"]
+
+        self.assertEqual(report["queries"], 4)
+        self.assertEqual(components["outer"]["calls"], 2)
+        self.assertEqual(components["outer"]["queries"], 2)
+        self.assertEqual(components["inner"]["calls"], 1)
+        self.assertEqual(components["inner"]["queries"], 1)
+        self.assertEqual(components["other"]["queries"], 1)
+        self.assertEqual(len(report["top_queries"]), 4)
+        self.assertEqual(state["stack"], [])
+
+    # -------------------------------------------------------------------------
+    def testMarks(self):
+        """ Test recording of marks """
+
+        S3Instrument.mark("models")
+        S3Instrument.mark("controller")
+
+        spans = current.response.s3.instrument["spans"]
+        self.assertTrue("models" in spans)
+        self.assertTrue("controller" in spans)
+
+    # -------------------------------------------------------------------------
+    def testStats(self):
+        """ Test aggregation of process-wide counters """
+
+        S3Instrument.stats(reset=True)
+
+        with S3Instrument.span("test"):
+            pass
+        S3Instrument.finish()
+
+        self.assertEqual(current.response.s3.instrument, None)
+
+        stats = S3Instrument.stats(reset=True)
+        self.assertEqual(stats["requests"], 1)
+        self.assertEqual(stats["components"]["test"]["calls"], 1)
+        self.assertTrue("view" in stats["components"] or
+                        "controller+view" in stats["components"])
+
+        stats = S3Instrument.stats()
+        self.assertEqual(stats["requests"], 0)
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3InstrumentTests,
+    )
+
+# END ========================================================================
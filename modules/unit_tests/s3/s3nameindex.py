@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# Name Search Index Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/tests/unit_tests/modules/s3/s3nameindex.py
+#
+import unittest
+from gluon import *
+from s3 import S3NameIndex
+
+# =============================================================================
+class S3NameIndexTests(unittest.TestCase):
+    """ Tests for the name search index """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        s3db = current.s3db
+
+        s3db.define_table("test_name_index",
+                          Field("first_name"),
+                          Field("last_name"),
+                          )
+        s3db.configure("test_name_index",
+                       name_index = ["first_name", "last_name"],
+                       )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.test_name_index.drop()
+        current.s3db.clear_config("test_name_index")
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        db = current.db
+        table = db.test_name_index
+        self.ids = {"maria": table.insert(first_name=u"María",
+                                          last_name="Smith"),
+                    "mark": table.insert(first_name="Mark",
+                                         last_name="Maria-Jones"),
+                    "john": table.insert(first_name="John",
+                                         last_name="Marsh"),
+                    }
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testTokens(self):
+        """ Test normalization and tokenization of names """
+
+        tokens = S3NameIndex.tokens(u"María Maria-Jones")
+        self.assertEqual(tokens, ["maria", "maria", "jones"])
+
+        self.assertEqual(S3NameIndex.tokens(None), [])
+
+    # -------------------------------------------------------------------------
+    def testKeys(self):
+        """ Test generation of index keys """
+
+        keys = S3NameIndex.keys(["john"])
+        self.assertEqual(keys, set(["w:john",
+                                    "p:jo", "p:joh", "p:john",
+                                    "g:joh", "g:ohn",
+                                    ]))
+
+    # -------------------------------------------------------------------------
+    def testPrefixLookup(self):
+        """ Test prefix lookup with ranking """
+
+        ids = self.ids
+        index = S3NameIndex("test_name_index")
+        index.build()
+
+        result = index.lookup("mar")
+        self.assertEqual(set(result.keys()),
+                         set([ids["maria"], ids["mark"], ids["john"]]))
+
+        result = index.lookup("maria")
+        self.assertEqual(set(result.keys()),
+                         set([ids["maria"], ids["mark"]]))
+        self.assertEqual(result[ids["maria"]], 1)
+
+        result = index.lookup("mar smi")
+        self.assertEqual(result.keys(), [ids["maria"]])
+
+        self.assertEqual(index.lookup("xyz"), {})
+
+        # Tokens below the minimum length are ignored
+        result = index.lookup("maria s")
+        self.assertEqual(set(result.keys()),
+                         set([ids["maria"], ids["mark"]]))
+        self.assertEqual(index.lookup("m"), None)
+
+    # -------------------------------------------------------------------------
+    def testNotBuilt(self):
+        """ Test that the index is not built in lookups """
+
+        index = S3NameIndex("test_name_index")
+        self.assertEqual(index.lookup("mar"), None)
+
+        itable = current.s3db[S3NameIndex.TABLENAME]
+        query = (itable.tablename == "test_name_index")
+        self.assertEqual(current.db(query).count(), 0)
+
+    # -------------------------------------------------------------------------
+    def testInfixLookup(self):
+        """ Test infix lookup """
+
+        ids = self.ids
+        index = S3NameIndex("test_name_index")
+        index.build()
+
+        result = index.lookup("ars", infix=True)
+        self.assertEqual(result.keys(), [ids["john"]])
+
+        # Too short for infix lookup
+        self.assertEqual(index.lookup("ar", infix=True), None)
+
+    # -------------------------------------------------------------------------
+    def testUpdate(self):
+        """ Test update of the index entries for a record """
+
+        db = current.db
+        ids = self.ids
+        index = S3NameIndex("test_name_index")
+        index.build()
+
+        record_id = ids["john"]
+        db(db.test_name_index.id == record_id).update(last_name="Taylor")
+        index.update(record_id)
+
+        self.assertEqual(index.lookup("marsh"), {})
+        self.assertEqual(index.lookup("tay").keys(), [record_id])
+
+    # -------------------------------------------------------------------------
+    def testWriteTracking(self):
+        """ Test update of the index after raw DAL writes """
+
+        db = current.db
+        ids = self.ids
+        settings = current.deployment_settings
+        name_index = settings.search.get("name_index")
+        settings.search.name_index = True
+        try:
+            index = S3NameIndex("test_name_index")
+            index.build()
+
+            # Renamed with a raw update (e.g. by IS_ADD_PERSON_WIDGET)
+            record_id = ids["john"]
+            db(db.test_name_index.id == record_id).update(last_name="Taylor")
+            current.s3db.onwrite_flush()
+            self.assertEqual(index.lookup("marsh"), {})
+            self.assertEqual(index.lookup("tay").keys(), [record_id])
+
+            # Inserted with a raw insert
+            record_id = db.test_name_index.insert(first_name="Marvin",
+                                                  last_name="Brown")
+            current.s3db.onwrite_flush()
+            self.assertEqual(index.lookup("brow").keys(), [record_id])
+        finally:
+            settings.search.name_index = name_index
+
+    # -------------------------------------------------------------------------
+    def testUnindexed(self):
+        """ Test that records inserted after the build are not lost """
+
+        db = current.db
+        ids = self.ids
+        settings = current.deployment_settings
+        name_index = settings.search.get("name_index")
+        settings.search.name_index = True
+        try:
+            S3NameIndex("test_name_index").build()
+
+            # Inserted without updating the index
+            table = db.test_name_index
+            record_id = table.bulk_insert([{"first_name": "Marvin",
+                                            "last_name": "Brown",
+                                            }])[0]
+            itable = current.s3db[S3NameIndex.TABLENAME]
+            query = (itable.tablename == "test_name_index") & \
+                    (itable.record_id == record_id)
+            db(query).delete()
+
+            resource = current.s3db.resource("test_name_index")
+            ranks = S3NameIndex.apply(resource, "smith")
+            self.assertEqual(ranks.keys(), [ids["maria"]])
+            rows = resource.select(["id"], as_rows=True)
+            self.assertEqual(set(row.id for row in rows),
+                             set([ids["maria"], record_id]))
+
+            # Rebuild includes the new record
+            self.assertEqual(S3NameIndex.rebuild("test_name_index"), 1)
+            index = S3NameIndex("test_name_index")
+            self.assertEqual(index.lookup("marv").keys(), [record_id])
+            self.assertEqual(index.built, record_id)
+        finally:
+            settings.search.name_index = name_index
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3NameIndexTests,
+    )
+
+# END ========================================================================
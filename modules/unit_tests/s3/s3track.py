@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# S3Track Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3track.py
+#
+import datetime
+import unittest
+
+from gluon import *
+from gluon.storage import Storage
+from s3.s3track import S3Trackable
+
+# =============================================================================
+class S3TrackableTests(unittest.TestCase):
+    """ Tests for S3Trackable """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        s3db = current.s3db
+
+        ltable = s3db.gis_location
+        self.location1 = ltable.insert(name="Track Test 1", lat=10, lon=20)
+        self.location2 = ltable.insert(name="Track Test 2", lat=30, lon=40)
+
+        ptable = s3db.pr_person
+        person_ids = []
+        for name in ("Track", "Check", "Nowhere"):
+            person = Storage(first_name = name,
+                             last_name = "TrackTest",
+                             )
+            person_id = ptable.insert(**person)
+            person.update(id=person_id)
+            s3db.update_super(ptable, person)
+            person_ids.append(person_id)
+        self.person_ids = person_ids
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testGetLocation(self):
+        """ Test bulk resolution of current locations """
+
+        ptable = current.s3db.pr_person
+        person1, person2, person3 = self.person_ids
+
+        now = current.request.utcnow
+        earlier = now - datetime.timedelta(hours=2)
+        later = now - datetime.timedelta(hours=1)
+
+        trackable = S3Trackable(ptable, record_id=person1)
+        trackable.set_location(self.location1, timestmp=earlier)
+        trackable.set_location(self.location2, timestmp=later)
+
+        # Person 2 is checked-in to person 1
+        trackable = S3Trackable(ptable, record_id=person2)
+        trackable.check_in(ptable, person1, timestmp=later)
+
+        trackable = S3Trackable(ptable, record_ids=self.person_ids)
+        locations = trackable.get_location()
+        self.assertEqual(len(locations), 3)
+        self.assertEqual(locations[0].id, self.location2)
+        self.assertEqual(locations[1].id, self.location2)
+        self.assertEqual(locations[2].lat, None)
+
+        # At an earlier time
+        timestmp = later - datetime.timedelta(minutes=30)
+        locations = trackable.get_location(timestmp=timestmp)
+        self.assertEqual(locations[0].id, self.location1)
+        self.assertEqual(locations[1].lat, None)
+
+    # -------------------------------------------------------------------------
+    def testCheckInFallback(self):
+        """ Test fallback to the base location when checked-in to nowhere """
+
+        db = current.db
+        ptable = current.s3db.pr_person
+        person2, person3 = self.person_ids[1:]
+
+        # Person 2 has a base location, but is checked-in to person 3
+        # who has no location
+        db(ptable.id == person2).update(location_id=self.location1)
+        now = current.request.utcnow
+        S3Trackable(ptable, record_id=person2).check_in(ptable, person3,
+                                                        timestmp=now)
+
+        trackable = S3Trackable(ptable, record_ids=[person2, person3])
+        locations = trackable.get_location()
+        self.assertEqual(locations[0].id, self.location1)
+        self.assertEqual(locations[1].lat, None)
+
+    # -------------------------------------------------------------------------
+    def testCircularCheckIn(self):
+        """ Test resolution of circular check-ins """
+
+        ptable = current.s3db.pr_person
+        person1, person2 = self.person_ids[:2]
+
+        now = current.request.utcnow
+        S3Trackable(ptable, record_id=person1).check_in(ptable, person2,
+                                                        timestmp=now)
+        S3Trackable(ptable, record_id=person2).check_in(ptable, person1,
+                                                        timestmp=now)
+
+        trackable = S3Trackable(ptable, record_ids=[person1, person2])
+        locations = trackable.get_location(_fields=[current.s3db.gis_location.lat])
+        self.assertEqual([l.lat for l in locations], [None, None])
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3TrackableTests,
+    )
+
+# END ========================================================================
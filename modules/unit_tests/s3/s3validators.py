@@ -5,6 +5,7 @@
 # To run this script use:
 # python web2py.py -S eden -M -R applications/eden/tests/unit_tests/modules/s3/s3validators.py
 #
+import datetime
 import unittest
 from gluon import current
 from gluon.dal import Query
@@ -136,6 +137,140 @@ class ISONEOFLazyRepresentationTests(unittest.TestCase):
         current.auth.override = False
         current.db.rollback()
 
+# =============================================================================
+class ISONEOFLazyOptionsTests(unittest.TestCase):
+    """ Tests for the lazy options mode of IS_ONE_OF """
+
+    def setUp(self):
+
+        s3db = current.s3db
+        current.auth.override = True
+
+        ids = []
+        table = s3db.org_organisation
+        for i in xrange(5):
+            org = Storage(name="LAZYOPT%s" % i)
+            org_id = table.insert(**org)
+            org["id"] = org_id
+            s3db.update_super(table, org)
+            ids.append(org_id)
+        self.ids = ids
+
+    # -------------------------------------------------------------------------
+    def testOptions(self):
+        """ Test that lazy validators do not build the option set """
+
+        db = current.db
+        table = current.s3db.org_organisation
+        validator = IS_ONE_OF(db(table.id.belongs(self.ids)),
+                              "org_organisation.id",
+                              "%(name)s",
+                              lazy=True)
+
+        cache_max = IS_ONE_OF.CACHE_MAX
+        try:
+            IS_ONE_OF.CACHE_MAX = 0
+            self.assertTrue(validator.is_lazy())
+            self.assertEqual(validator.options(), [("", "")])
+            self.assertEqual(validator.theset, None)
+        finally:
+            IS_ONE_OF.CACHE_MAX = cache_max
+
+        # Small table => all options
+        validator = IS_ONE_OF(db(table.id.belongs(self.ids)),
+                              "org_organisation.id",
+                              "%(name)s",
+                              lazy=True)
+        if validator.is_lazy():
+            self.skipTest("too many organisations in the database")
+        options = validator.options()
+        self.assertEqual(len(options), 6)
+
+    # -------------------------------------------------------------------------
+    def testCacheKey(self):
+        """ Test that the cache key includes the joined tables """
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.org_organisation
+        ttable = s3db.org_organisation_type
+        type_id = ttable.insert(name="LAZYOPT")
+        db(table.id.belongs(self.ids)).update(organisation_type_id=type_id)
+
+        left = [ttable.on(ttable.id == table.organisation_type_id)]
+        validator = IS_ONE_OF(db(table.id.belongs(self.ids)),
+                              "org_organisation.id",
+                              "%(name)s (%(organisation_type_id)s)",
+                              left=left)
+
+        fields = validator.lookup_fields(table)
+        dd = {}
+        query, left = validator.lookup_query(table, fields, dd)
+        dbset = db(table.id.belongs(self.ids))(query)
+        self.assertTrue("left" in dd)
+
+        key = validator.cache_key(table, dbset, fields, dd)
+        self.assertNotEqual(key, None)
+
+        # Modification of the joined table => new key
+        modified_on = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        db(ttable.id == type_id).update(modified_on=modified_on)
+        self.assertNotEqual(validator.cache_key(table, dbset, fields, dd), key)
+
+    # -------------------------------------------------------------------------
+    def testLookup(self):
+        """ Test page-wise and search lookup of options """
+
+        db = current.db
+        table = current.s3db.org_organisation
+        validator = IS_ONE_OF(db(table.id.belongs(self.ids)),
+                              "org_organisation.id",
+                              "%(name)s",
+                              lazy=True)
+
+        items = validator.lookup(limit=2)
+        self.assertEqual(len(items), 2)
+
+        items = validator.lookup(search="lazyopt3")
+        self.assertEqual(items, [(str(self.ids[3]), "LAZYOPT3")])
+
+        items = validator.lookup(search="nonexistent")
+        self.assertEqual(items, [])
+
+    # -------------------------------------------------------------------------
+    def testValidation(self):
+        """ Test validation by key lookup """
+
+        db = current.db
+        table = current.s3db.org_organisation
+        validator = IS_ONE_OF(db(table.id.belongs(self.ids)),
+                              "org_organisation.id",
+                              "%(name)s",
+                              filterby="name",
+                              filter_opts=["LAZYOPT1", "LAZYOPT2"],
+                              lazy=True)
+
+        value, error = validator(self.ids[1])
+        self.assertEqual(error, None)
+
+        value, error = validator(self.ids[0])
+        self.assertNotEqual(error, None)
+        self.assertEqual(validator.theset, None)
+
+        validator.multiple = True
+        value, error = validator([self.ids[1], self.ids[2]])
+        self.assertEqual(error, None)
+
+        value, error = validator([self.ids[1], self.ids[3]])
+        self.assertNotEqual(error, None)
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.auth.override = False
+        current.db.rollback()
+
 # =============================================================================
 class IS_PHONE_NUMBER_Tests(unittest.TestCase):
     """ Test IS_PHONE_NUMBER single phone number validator """
@@ -276,6 +411,7 @@ if __name__ == "__main__":
         ISLatTest,
         ISLonTest,
         ISONEOFLazyRepresentationTests,
+        ISONEOFLazyOptionsTests,
         IS_PHONE_NUMBER_Tests,
     )
 
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+#
+# S3WidgetCache Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3widgetcache.py
+#
+import unittest
+from gluon import *
+from gluon.storage import Storage
+from s3 import S3Request, S3WidgetCache
+
+# =============================================================================
+class S3WidgetCacheTests(unittest.TestCase):
+    """ Tests for the summary/profile widget render cache """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        settings = current.deployment_settings
+        self.widget_cache = settings.ui.get("widget_cache")
+        settings.ui.widget_cache = True
+
+        r = S3Request(prefix="org",
+                      name="organisation",
+                      c="org",
+                      f="organisation",
+                      args=["summary"],
+                      vars=Storage(w="summary-0"))
+        r.http = "GET"
+        self.r = r
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.deployment_settings.ui.widget_cache = self.widget_cache
+
+    # -------------------------------------------------------------------------
+    def testEnabled(self):
+        """ Test which widgets can be cached """
+
+        r = self.r
+        enabled = S3WidgetCache.enabled
+
+        self.assertTrue(enabled(r, "datatable"))
+        self.assertTrue(enabled(r, "report", {}))
+        self.assertFalse(enabled(r, "map"))
+        self.assertFalse(enabled(r, "form"))
+        self.assertFalse(enabled(r, "datalist", {"cache": False}))
+
+        current.deployment_settings.ui.widget_cache = False
+        self.assertFalse(enabled(r, "datatable"))
+
+    # -------------------------------------------------------------------------
+    def testKey(self):
+        """ Test that keys differ by widget and request vars """
+
+        r = self.r
+        key = S3WidgetCache(r, "summary-0", "datatable").key
+        self.assertEqual(S3WidgetCache(r, "summary-0", "datatable").key, key)
+        self.assertNotEqual(S3WidgetCache(r, "summary-1", "datatable").key, key)
+        self.assertNotEqual(S3WidgetCache(r, "summary-0", "datatable",
+                                          visible=False).key, key)
+
+        r.get_vars["~.name__like"] = "A*"
+        self.assertNotEqual(S3WidgetCache(r, "summary-0", "datatable").key, key)
+
+    # -------------------------------------------------------------------------
+    def testKeyACL(self):
+        """ Test that keys differ by user and ACL version """
+
+        auth = current.auth
+        permission = auth.permission
+        r = self.r
+
+        ROLE = "WIDGETCACHETESTROLE"
+        role_id = auth.s3_create_role(ROLE, uid=ROLE)
+        try:
+            auth.s3_impersonate("normaluser@example.com")
+            key = S3WidgetCache(r, "summary-0", "datatable").key
+
+            permission.update_acl(role_id,
+                                  t="org_organisation",
+                                  uacl=permission.READ,
+                                  oacl=permission.ALL)
+            self.assertNotEqual(S3WidgetCache(r, "summary-0", "datatable").key,
+                                key)
+
+            auth.s3_impersonate("admin@example.com")
+            self.assertNotEqual(S3WidgetCache(r, "summary-0", "datatable").key,
+                                key)
+        finally:
+            auth.s3_impersonate(None)
+            auth.s3_delete_role(role_id)
+
+    # -------------------------------------------------------------------------
+    def testRender(self):
+        """ Test rendering, serving from the cache and invalidation """
+
+        r = self.r
+        s3 = current.response.s3
+        calls = []
+
+        def renderer():
+            calls.append(True)
+            s3.jquery_ready.append("widgetCacheTest()")
+            return DIV("Widget %s" % len(calls))
+
+        cache = S3WidgetCache(r, "summary-0", "datatable",
+                              config={"list_fields": ["name"]})
+        output = cache.render(renderer).xml()
+        self.assertEqual(output, "<div>Widget 1</div>")
+        self.assertEqual(len(calls), 1)
+
+        # Served from the cache, including the script
+        s3.jquery_ready.remove("widgetCacheTest()")
+        self.assertEqual(cache.render(renderer).xml(), output)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue("widgetCacheTest()" in s3.jquery_ready)
+        s3.jquery_ready.remove("widgetCacheTest()")
+
+        # Writing to an unrelated table => still cached
+        S3WidgetCache.invalidate("pr_person")
+        cache.render(renderer)
+        self.assertEqual(len(calls), 1)
+        s3.jquery_ready.remove("widgetCacheTest()")
+
+        # Writing to the widget table => rendered again
+        S3WidgetCache.invalidate("org_organisation")
+        self.assertEqual(cache.render(renderer).xml(), "<div>Widget 2</div>")
+        self.assertEqual(len(calls), 2)
+        s3.jquery_ready.remove("widgetCacheTest()")
+
+    # -------------------------------------------------------------------------
+    def testEffects(self):
+        """ Test capturing and replaying of response.s3/session.s3 additions """
+
+        s3 = current.response.s3
+        session_s3 = current.session.s3
+        filter_vars = session_s3.filter
+
+        try:
+            before = S3WidgetCache.snapshot()
+            s3.scripts.append("/widget_cache_test.js")
+            session_s3.filter = Storage(test="1")
+            effects = S3WidgetCache.effects(before)
+
+            self.assertEqual(effects["response"]["append"]["scripts"],
+                             ["/widget_cache_test.js"])
+            self.assertEqual(effects["session"]["set"]["filter"],
+                             {"test": "1"})
+
+            # Replay does not duplicate list items
+            S3WidgetCache.replay(effects)
+            self.assertEqual(s3.scripts.count("/widget_cache_test.js"), 1)
+
+            # Effects which can't be stored => not cacheable
+            before = S3WidgetCache.snapshot()
+            s3.widget_cache_test = object()
+            self.assertEqual(S3WidgetCache.effects(before), None)
+        finally:
+            s3.scripts.remove("/widget_cache_test.js")
+            s3.pop("widget_cache_test", None)
+            session_s3.filter = filter_vars
+
+    # -------------------------------------------------------------------------
+    def testTables(self):
+        """ Test dependencies on tables of list fields and references """
+
+        cache = S3WidgetCache(self.r, "summary-0", "datatable",
+                              config={"list_fields": ["name",
+                                                      "organisation_type_id",
+                                                      ],
+                                      "cache_tables": ["cms_post"],
+                                      })
+        tables = cache.tables()
+        self.assertTrue("org_organisation" in tables)
+        self.assertTrue("org_organisation_type" in tables)
+        self.assertTrue("cms_post" in tables)
+
+    # -------------------------------------------------------------------------
+    def testLayoutTables(self):
+        """ Test dependencies on tables declared by datalist layouts """
+
+        r = self.r
+
+        def layout(list_id, item_id, resource, rfields, record):
+            return DIV()
+
+        # Undeclared => not cached
+        cache = S3WidgetCache(r, "summary-0", "datalist",
+                              config={"list_layout": layout})
+        self.assertEqual(cache.layout_tables(), None)
+        self.assertEqual(cache.render(lambda: DIV("uncached")).xml(),
+                         DIV("uncached").xml())
+        self.assertEqual(cache.get(), None)
+
+        # Declared
+        layout.cache_tables = ["pr_image"]
+        cache = S3WidgetCache(r, "summary-0", "datalist",
+                              config={"list_layout": layout})
+        self.assertEqual(cache.layout_tables(), ["pr_image"])
+        self.assertTrue("pr_image" in cache.tables())
+
+        # Not relevant for other widgets
+        cache = S3WidgetCache(r, "summary-0", "datatable",
+                              config={"list_layout": DIV})
+        self.assertEqual(cache.layout_tables(), [])
+
+    # -------------------------------------------------------------------------
+    def testServe(self):
+        """ Test ETag revalidation for Ajax-refreshes """
+
+        request = current.request
+
+        S3WidgetCache.serve("abc")
+        self.assertEqual(current.response.headers["ETag"], '"abc"')
+
+        if_none_match = request.env.http_if_none_match
+        request.env.http_if_none_match = '"abc"'
+        try:
+            with self.assertRaises(HTTP) as cm:
+                S3WidgetCache.serve("abc")
+            self.assertEqual(cm.exception.status, 304)
+        finally:
+            request.env.http_if_none_match = if_none_match
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        S3WidgetCacheTests,
+    )
+
+# END ========================================================================
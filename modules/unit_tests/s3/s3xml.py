@@ -5,6 +5,9 @@
 # To run this script use:
 # python web2py.py -S eden -M -R applications/eden/tests/unit_tests/modules/s3/s3xml.py
 #
+import os
+import tempfile
+import time
 import unittest
 from gluon import *
 from gluon.contrib import simplejson as json
@@ -16,7 +19,7 @@ except:
 
 from lxml import etree
 
-from s3.s3xml import S3XMLFormat
+from s3.s3xml import S3CSVMapping, S3XMLFormat
 
 # =============================================================================
 class S3TreeBuilderTests(unittest.TestCase):
@@ -263,6 +266,263 @@ class S3XMLFormatTests(unittest.TestCase):
         self.assertEqual(len(root), 0)
         self.assertEqual(root.text, "Test")
 
+# =============================================================================
+class S3CSVBatchTests(unittest.TestCase):
+    """ Test batch-wise conversion of CSV sources """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        rows = ["Name,Code"] + ["Name%s,%s" % (i, i) for i in xrange(7)]
+        self.source = "\n".join(rows)
+
+    # -------------------------------------------------------------------------
+    def testSingleTree(self):
+        """ Test conversion into a single tree """
+
+        xml = current.xml
+
+        tree = xml.csv2tree(StringIO(self.source), resourcename="test")
+        root = tree.getroot()
+        self.assertEqual(root.get(xml.ATTRIBUTE.name), "test")
+        self.assertEqual(len(root), 7)
+
+    # -------------------------------------------------------------------------
+    def testBatches(self):
+        """ Test conversion into batches """
+
+        xml = current.xml
+
+        trees = list(xml.csv2trees(StringIO(self.source), batch_size=3))
+        self.assertEqual([len(t.getroot()) for t in trees], [3, 3, 1])
+
+        row = trees[2].getroot()[0]
+        cols = dict((col.get(xml.ATTRIBUTE.field), col.text) for col in row)
+        self.assertEqual(cols, {"Name": "Name6", "Code": "6"})
+
+    # -------------------------------------------------------------------------
+    def testEmptySource(self):
+        """ Test that an empty source still produces one tree """
+
+        trees = list(current.xml.csv2trees(StringIO("Name,Code"),
+                                           batch_size=3))
+        self.assertEqual(len(trees), 1)
+        self.assertEqual(len(trees[0].getroot()), 0)
+
+# =============================================================================
+class S3StylesheetCacheTests(unittest.TestCase):
+    """ Test caching of compiled stylesheets """
+
+    STYLESHEET = """<?xml version="1.0"?>
+<xsl:stylesheet
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+    <xsl:output method="xml"/>
+    <xsl:template match="/">
+        <test>%s</test>
+    </xsl:template>
+</xsl:stylesheet>"""
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        handle, path = tempfile.mkstemp(suffix=".xsl")
+        os.close(handle)
+        self.path = path
+        self.write("First")
+
+        self.tree = etree.ElementTree(etree.fromstring("<s3xml/>"))
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        os.remove(self.path)
+
+    # -------------------------------------------------------------------------
+    def write(self, text):
+        """ Write the stylesheet file """
+
+        with open(self.path, "w") as f:
+            f.write(self.STYLESHEET % text)
+
+    # -------------------------------------------------------------------------
+    def testCache(self):
+        """ Test reuse of the compiled stylesheet until the file changes """
+
+        xml = current.xml
+        path = self.path
+
+        transformer = xml.cached(path, "xslt", xml.compile)
+        self.assertTrue(isinstance(transformer, etree.XSLT))
+        self.assertTrue(xml.cached(path, "xslt", xml.compile) is transformer)
+
+        result = xml.transform(self.tree, path)
+        self.assertEqual(result.getroot().text, "First")
+
+        # Change the file => recompiled
+        self.write("Second")
+        mtime = os.path.getmtime(path) + 10
+        os.utime(path, (time.time(), mtime))
+
+        result = xml.transform(self.tree, path)
+        self.assertEqual(result.getroot().text, "Second")
+        self.assertFalse(xml.cached(path, "xslt", xml.compile) is transformer)
+
+    # -------------------------------------------------------------------------
+    def testInvalidStylesheet(self):
+        """ Test that invalid stylesheets are not cached """
+
+        xml = current.xml
+        path = self.path
+
+        with open(path, "w") as f:
+            f.write("<xsl:stylesheet")
+
+        self.assertEqual(xml.transform(self.tree, path), None)
+        self.assertNotEqual(xml.error, None)
+        self.assertEqual(xml.cached(path, "xslt", xml.compile), None)
+
+# =============================================================================
+class S3CSVMappingTests(unittest.TestCase):
+    """ Test CSV import with column mappings """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        rows = ["Name,Comments,UUID",
+                "First,Some comment,test-uuid-1",
+                "Second,,",
+                ]
+        self.tree = current.xml.csv2tree(StringIO("\n".join(rows)))
+
+    # -------------------------------------------------------------------------
+    def testTransform(self):
+        """ Test transformation of a CSV tree """
+
+        xml = current.xml
+        FIELD = xml.ATTRIBUTE.field
+
+        mapping = S3CSVMapping("org_facility_type",
+                               [("Name", "name"),
+                                ("Comments", "comments"),
+                                ("UUID", "uuid"),
+                                ("Missing", "missing"),
+                                ],
+                               defaults = {"comments": "Default"},
+                               )
+        root = mapping.transform(self.tree).getroot()
+        self.assertEqual(root.tag, xml.TAG.root)
+        self.assertEqual(len(root), 2)
+
+        first, second = root
+        self.assertEqual(first.get(xml.ATTRIBUTE.name), "org_facility_type")
+        self.assertEqual(first.get(xml.UID), "test-uuid-1")
+        self.assertEqual(dict((d.get(FIELD), d.text) for d in first),
+                         {"name": "First", "comments": "Some comment"})
+
+        self.assertEqual(second.get(xml.UID), None)
+        self.assertEqual(dict((d.get(FIELD), d.text) for d in second),
+                         {"name": "Second", "comments": "Default"})
+
+    # -------------------------------------------------------------------------
+    def testMappingFile(self):
+        """ Test that a mapping file gives the same result as XSLT """
+
+        xml = current.xml
+        FIELD = xml.ATTRIBUTE.field
+
+        path = os.path.join(current.request.folder,
+                            "static", "formats", "s3csv", "org",
+                            "facility_type.%s")
+
+        data = lambda tree: [dict((d.get(FIELD), d.text or "")
+                                  for d in resource)
+                             for resource in tree.getroot()]
+
+        mapped = xml.transform(self.tree, path % "json")
+        transformed = xml.transform(self.tree, path % "xsl")
+        self.assertEqual(data(mapped), data(transformed))
+
+        # Invalid mapping file
+        self.assertEqual(xml.transform(self.tree, path % "invalid.json"), None)
+        self.assertNotEqual(xml.error, None)
+
+    # -------------------------------------------------------------------------
+    def testBatchImport(self):
+        """ Test batch-wise import with a mapping file """
+
+        db = current.db
+        s3db = current.s3db
+
+        path = os.path.join(current.request.folder,
+                            "static", "formats", "s3csv", "org",
+                            "facility_type.json")
+        source = StringIO("Name,Comments\n"
+                          "Mapping Test 1,\n"
+                          "Mapping Test 2,\n"
+                          "Mapping Test 3,\n")
+        try:
+            resource = s3db.resource("org_facility_type")
+            resource.import_xml(source,
+                                format="csv",
+                                stylesheet=path,
+                                batch_size=2)
+            self.assertEqual(resource.error, None)
+            self.assertEqual(resource.import_count, 3)
+
+            table = s3db.org_facility_type
+            query = (table.name.like("Mapping Test %"))
+            self.assertEqual(db(query).count(), 3)
+        finally:
+            db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testBatchReferences(self):
+        """ Test resolution of tuid references across batches """
+
+        db = current.db
+        s3db = current.s3db
+
+        first = etree.fromstring("""
+            <s3xml>
+                <resource name="org_organisation" tuid="BATCHORG">
+                    <data field="name">Batch Reference Test</data>
+                </resource>
+            </s3xml>""")
+        second = etree.fromstring("""
+            <s3xml>
+                <resource name="org_office">
+                    <data field="name">Batch Reference Test</data>
+                    <reference field="organisation_id"
+                               resource="org_organisation"
+                               tuid="BATCHORG"/>
+                </resource>
+            </s3xml>""")
+
+        auth = current.auth
+        auth.override = True
+        try:
+            directory = {}
+
+            resource = s3db.resource("org_organisation")
+            resource.import_tree(None, first, directory=directory)
+            self.assertEqual(resource.error, None)
+            self.assertEqual(len(directory), 1)
+
+            resource = s3db.resource("org_office")
+            resource.import_tree(None, second, directory=directory)
+            self.assertEqual(resource.error, None)
+
+            otable = s3db.org_organisation
+            ftable = s3db.org_office
+            query = (ftable.name == "Batch Reference Test") & \
+                    (ftable.organisation_id == otable.id)
+            row = db(query).select(otable.name, limitby=(0, 1)).first()
+            self.assertNotEqual(row, None)
+            self.assertEqual(row.name, "Batch Reference Test")
+        finally:
+            auth.override = False
+            db.rollback()
+
 # =============================================================================
 def run_suite(*test_classes):
     """ Run the test suite """
@@ -282,6 +542,9 @@ if __name__ == "__main__":
         S3TreeBuilderTests,
         S3JSONMessageTests,
         S3XMLFormatTests,
+        S3CSVBatchTests,
+        S3StylesheetCacheTests,
+        S3CSVMappingTests,
     )
 
 # END ========================================================================
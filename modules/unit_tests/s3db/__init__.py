@@ -1,3 +1,9 @@
 from pr import *
 from org import *
 from vulnerability import *
+from doc import *
+from cms import *
+from deploy import *
+from budget import *
+from survey import *
+from req import *
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# Budget Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3db/budget.py
+#
+import unittest
+
+from gluon import *
+from gluon.storage import Storage
+
+from s3db.budget import budget_update_totals, budget_update_totals_flush
+
+# =============================================================================
+class BudgetUpdateTotalsTests(unittest.TestCase):
+    """ Tests for the propagation of budget totals """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+
+        item_id = s3db.budget_item.insert(category_type = 1,
+                                          code = "BUDGETTEST",
+                                          description = "Budget Test Item",
+                                          cost_type = 1,
+                                          unit_cost = 10.0,
+                                          monthly_cost = 2.0,
+                                          )
+        self.kit_id = s3db.budget_kit.insert(code = "BUDGETTEST")
+        s3db.budget_kit_item.insert(kit_id = self.kit_id,
+                                    item_id = item_id,
+                                    quantity = 3,
+                                    )
+        self.bundle_id = s3db.budget_bundle.insert(name = "Budget Test")
+        s3db.budget_bundle_kit.insert(bundle_id = self.bundle_id,
+                                      kit_id = self.kit_id,
+                                      quantity = 2,
+                                      )
+        self.budget_id = s3db.budget_budget.insert(name = "Budget Test")
+        s3db.budget_budget_bundle.insert(budget_id = self.budget_id,
+                                         bundle_id = self.bundle_id,
+                                         quantity = 1,
+                                         months = 3,
+                                         )
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.response.s3.bulk = False
+        current.response.s3.budget_update_totals_deferred = None
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def assertTotals(self, kit, bundle, budget):
+        """ Check the totals of the kit, bundle and budget """
+
+        s3db = current.s3db
+
+        record = s3db.budget_kit[self.kit_id]
+        self.assertEqual((record.total_unit_cost,
+                          record.total_monthly_cost), kit)
+
+        record = s3db.budget_bundle[self.bundle_id]
+        self.assertEqual((record.total_unit_cost,
+                          record.total_monthly_cost), bundle)
+
+        record = s3db.budget_budget[self.budget_id]
+        self.assertEqual((record.total_onetime_costs,
+                          record.total_recurring_costs), budget)
+
+    # -------------------------------------------------------------------------
+    def testUpdateTotals(self):
+        """ Test propagation of totals from kits to bundles to budgets """
+
+        budget_update_totals(kit_ids=[self.kit_id])
+        self.assertTotals((30.0, 6.0), (60.0, 12.0), (60.0, 36.0))
+
+    # -------------------------------------------------------------------------
+    def testDeferred(self):
+        """ Test deferral of totals during imports """
+
+        s3 = current.response.s3
+        s3.bulk = True
+
+        budget_update_totals(kit_ids=[self.kit_id])
+        record = current.s3db.budget_kit[self.kit_id]
+        self.assertFalse(record.total_unit_cost)
+
+        budget_update_totals_flush(Storage(failed=False))
+        self.assertEqual(s3.budget_update_totals_deferred, None)
+        self.assertTotals((30.0, 6.0), (60.0, 12.0), (60.0, 36.0))
+
+    # -------------------------------------------------------------------------
+    def testDeferredFailed(self):
+        """ Test that deferred totals are discarded if the import fails """
+
+        s3 = current.response.s3
+        s3.bulk = True
+
+        budget_update_totals(kit_ids=[self.kit_id])
+        budget_update_totals_flush(Storage(failed=True))
+        self.assertEqual(s3.budget_update_totals_deferred, None)
+
+        record = current.s3db.budget_kit[self.kit_id]
+        self.assertFalse(record.total_unit_cost)
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        BudgetUpdateTotalsTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# CMS Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3db/cms.py
+#
+import unittest
+
+from gluon import *
+
+from s3db.cms import cms_post_list_prefetch
+
+# =============================================================================
+class CMSPostListPrefetchTests(unittest.TestCase):
+    """ Tests for the prefetch of cms_post_list_layout """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        settings = current.deployment_settings
+        self.bookmarks = settings.cms.get("bookmarks")
+        settings.cms.bookmarks = True
+
+        auth = current.auth
+        auth.s3_impersonate("admin@example.com")
+
+        s3db = current.s3db
+        ptable = s3db.cms_post
+        self.post_ids = [ptable.insert(body="Prefetch Test %s" % i)
+                         for i in xrange(2)]
+
+        # Bookmark the first post
+        s3db.cms_post_user.insert(post_id=self.post_ids[0],
+                                  user_id=auth.user.id)
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.s3_impersonate(None)
+        current.deployment_settings.cms.bookmarks = self.bookmarks
+
+    # -------------------------------------------------------------------------
+    def testBookmarks(self):
+        """ Test the lookup of the user's bookmarks """
+
+        resource = current.s3db.resource("cms_post", id=self.post_ids)
+        data = resource.select(["id",
+                                "body",
+                                "created_by",
+                                "created_by$organisation_id",
+                                ],
+                               represent=True,
+                               raw_data=True)
+        records = data["rows"]
+        self.assertEqual(len(records), 2)
+
+        cms_post_list_prefetch(resource, records, data["rfields"])
+
+        bookmarked = dict((record["_row"]["cms_post.id"],
+                           record["_bookmarked"]) for record in records)
+        self.assertEqual(bookmarked, {self.post_ids[0]: True,
+                                      self.post_ids[1]: False,
+                                      })
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        CMSPostListPrefetchTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# Deploy Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3db/deploy.py
+#
+import unittest
+
+from gluon import *
+
+from s3db.deploy import deploy_MissionProfileLayout
+
+# =============================================================================
+class DeployMissionProfileLayoutTests(unittest.TestCase):
+    """ Tests for the prefetch of deploy_MissionProfileLayout """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+
+        organisation_id = s3db.org_organisation.insert(name="Deploy Test Org")
+        hrtable = s3db.hrm_human_resource
+        human_resource_ids = []
+        for i in xrange(2):
+            person_id = s3db.pr_person.insert(first_name="Deploy",
+                                              last_name="Test %s" % i)
+            human_resource_id = hrtable.insert(person_id=person_id,
+                                               organisation_id=organisation_id)
+            human_resource_ids.append(human_resource_id)
+
+        atable = s3db.deploy_alert
+        rtable = s3db.deploy_alert_recipient
+        alert_ids = []
+        for i in xrange(2):
+            alert_id = atable.insert(subject="Deploy Test Alert %s" % i)
+            alert_ids.append(alert_id)
+        # Two recipients for the first alert, none for the second
+        for human_resource_id in human_resource_ids:
+            rtable.insert(alert_id=alert_ids[0],
+                          human_resource_id=human_resource_id)
+        self.alert_ids = alert_ids
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testPrefetchRecipients(self):
+        """ Test the lookup of the recipients of all alerts at once """
+
+        alert_ids = self.alert_ids
+
+        resource = current.s3db.resource("deploy_alert", id=alert_ids)
+        data = resource.select(["id", "subject"],
+                               represent=True,
+                               raw_data=True)
+        records = data["rows"]
+        self.assertEqual(len(records), 2)
+
+        deploy_MissionProfileLayout().prefetch(resource,
+                                               records,
+                                               data["rfields"])
+
+        recipients = dict((record["_row"]["deploy_alert.id"],
+                           sum(item[2] for item in record["_recipients"]))
+                          for record in records)
+        self.assertEqual(recipients, {alert_ids[0]: 2,
+                                      alert_ids[1]: 0,
+                                      })
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        DeployMissionProfileLayoutTests,
+    )
+
+# END ========================================================================
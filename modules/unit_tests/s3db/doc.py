@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Doc Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3db/doc.py
+#
+import unittest
+
+from gluon import *
+
+from s3db.doc import doc_LocalIndex
+
+# =============================================================================
+class DocLocalIndexTests(unittest.TestCase):
+    """ Tests for the built-in full-text index """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        index = doc_LocalIndex()
+        index.add("doc_document", 1,
+                  u"The quick brown fox jumps over the lazy dog",
+                  {"name": "Fox Report"})
+        index.add("doc_document", 2,
+                  u"A lazy brown dog sleeps, the fox is quick",
+                  {"name": "Dog Report"})
+        index.add("doc_image", 3, None,
+                  {"name": "Brown Fox", "comments": "Photo of a fox"})
+        self.index = index
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testTerms(self):
+        """ Test normalization of terms """
+
+        terms = self.index.terms(u"Ärger mit dem Büro")
+        self.assertEqual(terms, ["arger", "mit", "dem", "buro"])
+
+    # -------------------------------------------------------------------------
+    def testSearch(self):
+        """ Test search with ranking """
+
+        index = self.index
+
+        results = index.search("fox")
+        keys = [(tn, record_id) for tn, record_id, rank in results]
+        self.assertEqual(set(keys), set([("doc_document", 1),
+                                         ("doc_document", 2),
+                                         ("doc_image", 3),
+                                         ]))
+
+        # All terms must match
+        results = index.search("fox sleeps")
+        self.assertEqual([r[1] for r in results], [2])
+
+        # Restrict to tables
+        results = index.search("fox", tablenames=["doc_image"])
+        self.assertEqual([r[1] for r in results], [3])
+
+        self.assertEqual(index.search("unicorn"), [])
+        self.assertEqual(index.search(""), [])
+
+    # -------------------------------------------------------------------------
+    def testPhraseSearch(self):
+        """ Test phrase matching """
+
+        index = self.index
+
+        # Phrase matches rank higher
+        results = index.search("quick brown")
+        self.assertEqual(results[0][1], 1)
+        self.assertTrue(results[0][2] > results[1][2])
+
+        # Quoted = exact phrase only
+        results = index.search('"quick brown"')
+        self.assertEqual([r[1] for r in results], [1])
+
+    # -------------------------------------------------------------------------
+    def testUpdateDelete(self):
+        """ Test re-indexing and removal of records """
+
+        index = self.index
+
+        index.add("doc_document", 1, u"Nothing to see here")
+        results = index.search("fox", tablenames=["doc_document"])
+        self.assertEqual([r[1] for r in results], [2])
+
+        index.delete("doc_document", 2)
+        self.assertEqual(index.search("fox", tablenames=["doc_document"]), [])
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        DocLocalIndexTests,
+    )
+
+# END ========================================================================
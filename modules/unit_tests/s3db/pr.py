@@ -140,6 +140,64 @@ class PRTests(unittest.TestCase):
         users = s3db.pr_realm_users(None)
         self.assertTrue(all([u in users for u in all_users]))
 
+    # -------------------------------------------------------------------------
+    def testAncestry(self):
+        """ Test maintenance and lookup of the OU ancestry """
+
+        db = current.db
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        org3 = Storage(name="Test PR Organisation 3")
+        org3_id = otable.insert(**org3)
+        org3.update(id=org3_id)
+        s3db.update_super(otable, org3)
+
+        org1 = self.org1
+        org2 = self.org2
+        org3 = s3db.pr_get_pe_id("org_organisation", org3_id)
+
+        # Hierarchy org1 > org2 > org3
+        s3db.pr_add_affiliation(org2, org3, role="TestOrgUnit")
+        s3db.pr_add_affiliation(org1, org2, role="TestOrgUnit")
+
+        self.assertEqual(s3db.pr_get_ancestors(org3), [str(org2), str(org1)])
+        ancestors = s3db.pr_ancestors([org2, org3])
+        self.assertEqual(ancestors[org2], [str(org1)])
+        self.assertEqual(ancestors[org3], [str(org2), str(org1)])
+
+        descendants = s3db.pr_descendants([org1, org3])
+        self.assertEqual(set(descendants[org1]), set([org2, org3]))
+        self.assertFalse(org3 in descendants)
+        descendants = s3db.pr_get_descendants(org1,
+                                              entity_types="org_organisation")
+        self.assertEqual(set(descendants), set([org2, org3]))
+
+        # Depth is the shortest distance
+        table = s3db.pr_ancestry
+        query = (table.pe_id == org3) & (table.ancestor_pe_id == org1)
+        row = db(query).select(table.depth, limitby=(0, 1)).first()
+        self.assertEqual(row.depth, 2)
+
+        # Non-OU roles are not part of the hierarchy
+        s3db.pr_add_affiliation(org3, org1, role="TestPartners", role_type=9)
+        self.assertEqual(s3db.pr_get_ancestors(org1), [])
+
+        # Removing an affiliation updates all descendants
+        s3db.pr_remove_affiliation(org1, org2, role="TestOrgUnit")
+        self.assertEqual(s3db.pr_get_ancestors(org3), [str(org2)])
+        self.assertEqual(s3db.pr_descendants([org1]), {})
+
+        # Rebuild gives the same result as the incremental updates
+        query = (table.pe_id.belongs((org1, org2, org3)))
+        fields = (table.pe_id, table.ancestor_pe_id, table.depth)
+        incremental = set(tuple(row[f.name] for f in fields)
+                          for row in db(query).select(*fields))
+        s3db.pr_rebuild_ancestry()
+        rebuilt = set(tuple(row[f.name] for f in fields)
+                      for row in db(query).select(*fields))
+        self.assertEqual(incremental, rebuilt)
+
     # -------------------------------------------------------------------------
     def tearDown(self):
 
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Req Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3db/req.py
+#
+import unittest
+
+from gluon import *
+
+from s3db.req import REQ_STATUS_NONE, \
+                     REQ_STATUS_PARTIAL, \
+                     REQ_STATUS_COMPLETE, \
+                     req_update_status, \
+                     req_update_status_defer, \
+                     req_update_status_flush
+from s3db.supply import supply_item_pack_quantities
+
+# =============================================================================
+class ReqUpdateStatusTests(unittest.TestCase):
+    """ Tests for the (deferred) update of request statuses """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+
+        self.req_id = s3db.req_req.insert(type = 1)
+        ritable = s3db.req_req_item
+        self.item_ids = [ritable.insert(req_id = self.req_id,
+                                        quantity = 10,
+                                        quantity_commit = 10,
+                                        ),
+                         ritable.insert(req_id = self.req_id,
+                                        quantity = 5,
+                                        quantity_commit = 2,
+                                        ),
+                         ]
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.response.s3.req_update_status_deferred = None
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def assertStatus(self, commit, transit, fulfil):
+        """ Check the statuses of the request """
+
+        record = current.s3db.req_req[self.req_id]
+        self.assertEqual((record.commit_status,
+                          record.transit_status,
+                          record.fulfil_status), (commit, transit, fulfil))
+
+    # -------------------------------------------------------------------------
+    def testUpdateStatus(self):
+        """ Test the update of the request status from its items """
+
+        req_update_status(self.req_id)
+        self.assertStatus(REQ_STATUS_PARTIAL, REQ_STATUS_NONE, REQ_STATUS_NONE)
+
+        db = current.db
+        ritable = current.s3db.req_req_item
+        db(ritable.id == self.item_ids[1]).update(quantity_commit = 5)
+
+        req_update_status(self.req_id)
+        self.assertStatus(REQ_STATUS_COMPLETE, REQ_STATUS_NONE, REQ_STATUS_NONE)
+
+    # -------------------------------------------------------------------------
+    def testDeferred(self):
+        """ Test the deferral of status updates """
+
+        # Only the first call starts the deferral
+        self.assertTrue(req_update_status_defer())
+        self.assertFalse(req_update_status_defer())
+
+        req_update_status(self.req_id)
+        record = current.s3db.req_req[self.req_id]
+        self.assertNotEqual(record.commit_status, REQ_STATUS_PARTIAL)
+
+        req_update_status_flush()
+        self.assertEqual(current.response.s3.req_update_status_deferred, None)
+        self.assertStatus(REQ_STATUS_PARTIAL, REQ_STATUS_NONE, REQ_STATUS_NONE)
+
+# =============================================================================
+class SupplyItemPackQuantitiesTests(unittest.TestCase):
+    """ Tests for the per-request map of item pack quantities """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+        current.response.s3.supply_item_pack_quantities = None
+
+        s3db = current.s3db
+
+        item_id = s3db.supply_item.insert(name = "Pack Quantities Test",
+                                          um = "pc",
+                                          )
+        ptable = s3db.supply_item_pack
+        self.pack_ids = [ptable.insert(item_id = item_id,
+                                       name = "pc",
+                                       quantity = 1,
+                                       ),
+                         ptable.insert(item_id = item_id,
+                                       name = "box",
+                                       quantity = 12,
+                                       ),
+                         ]
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.response.s3.supply_item_pack_quantities = None
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testPackQuantities(self):
+        """ Test lookup of pack quantities """
+
+        pc, box = self.pack_ids
+
+        quantities = supply_item_pack_quantities([pc, box, box])
+        self.assertEqual(quantities, {pc: 1, box: 12})
+
+        # Unknown packs
+        quantities = supply_item_pack_quantities([box, None])
+        self.assertEqual(quantities, {box: 12, None: None})
+
+        # Kept in the per-request map
+        db = current.db
+        ptable = current.s3db.supply_item_pack
+        db(ptable.id == box).update(quantity = 24)
+        self.assertEqual(supply_item_pack_quantities([box]), {box: 12})
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        ReqUpdateStatusTests,
+        SupplyItemPackQuantitiesTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Survey Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3db/survey.py
+#
+import unittest
+
+from gluon import *
+
+from s3db.survey import survey_cache, \
+                        survey_getAllAnswersForQuestionInSeries, \
+                        survey_getSeriesAnswers
+
+# =============================================================================
+class SurveySeriesAnswersTests(unittest.TestCase):
+    """ Tests for the answer matrix of survey series """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+
+        template_id = s3db.survey_template.insert(name = "Series Answers Test")
+        self.series_id = s3db.survey_series.insert(name = "Series Answers Test",
+                                                   template_id = template_id,
+                                                   )
+        qtable = s3db.survey_question
+        self.question_ids = [qtable.insert(name = "Question %s" % i,
+                                           code = "SAT-%s" % i,
+                                           type = "String",
+                                           )
+                             for i in xrange(2)]
+
+        self.complete_ids = []
+        for i in xrange(2):
+            self.add_complete(["A%s" % i, "B%s" % i])
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def add_complete(self, values):
+        """ Add a completed questionnaire with answers """
+
+        s3db = current.s3db
+
+        complete_id = s3db.survey_complete.insert(series_id = self.series_id)
+        atable = s3db.survey_answer
+        for question_id, value in zip(self.question_ids, values):
+            atable.insert(complete_id = complete_id,
+                          question_id = question_id,
+                          value = value,
+                          )
+        self.complete_ids.append(complete_id)
+        return complete_id
+
+    # -------------------------------------------------------------------------
+    def testSeriesAnswers(self):
+        """ Test retrieval of all answers of a series by question """
+
+        question_ids = self.question_ids
+        complete_ids = self.complete_ids
+
+        answers = survey_getSeriesAnswers(self.series_id)
+        self.assertEqual(set(answers.keys()), set(question_ids))
+
+        items = sorted(answers[question_ids[1]],
+                       key=lambda item: item["complete_id"])
+        self.assertEqual([(item["complete_id"], item["value"])
+                          for item in items],
+                         [(complete_ids[0], "B0"), (complete_ids[1], "B1")])
+
+        values = survey_getAllAnswersForQuestionInSeries(question_ids[0],
+                                                         self.series_id)
+        self.assertEqual(sorted(item["value"] for item in values),
+                         ["A0", "A1"])
+
+        # No answers for this question in the series
+        values = survey_getAllAnswersForQuestionInSeries(0, self.series_id)
+        self.assertEqual(len(values), 0)
+
+    # -------------------------------------------------------------------------
+    def testNewResponses(self):
+        """ Test that new responses are included after caching """
+
+        question_id = self.question_ids[0]
+
+        values = survey_getAllAnswersForQuestionInSeries(question_id,
+                                                         self.series_id)
+        self.assertEqual(len(values), 2)
+
+        self.add_complete(["A2", "B2"])
+
+        values = survey_getAllAnswersForQuestionInSeries(question_id,
+                                                         self.series_id)
+        self.assertEqual(sorted(item["value"] for item in values),
+                         ["A0", "A1", "A2"])
+
+# =============================================================================
+class SurveyCacheTests(unittest.TestCase):
+    """ Tests for the versioned RAM cache """
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.cache.ram("survey_cache_test", None)
+
+    # -------------------------------------------------------------------------
+    def testVersion(self):
+        """ Test that outdated entries are replaced, not added """
+
+        key = "survey_cache_test"
+        builds = []
+
+        def build(data):
+            def builder():
+                builds.append(data)
+                return data
+            return builder
+
+        self.assertEqual(survey_cache(key, 1, build("first")), "first")
+        self.assertEqual(survey_cache(key, 1, build("other")), "first")
+        self.assertEqual(builds, ["first"])
+
+        self.assertEqual(survey_cache(key, 2, build("second")), "second")
+        self.assertEqual(builds, ["first", "second"])
+
+        # Only one entry per key
+        entry = current.cache.ram(key, lambda: None)
+        self.assertEqual(entry, (2, "second"))
+
+# =============================================================================
+def run_suite(*test_classes):
+    """ Run the test suite """
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for test_class in test_classes:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    if suite is not None:
+        unittest.TextTestRunner(verbosity=2).run(suite)
+    return
+
+if __name__ == "__main__":
+
+    run_suite(
+        SurveySeriesAnswersTests,
+        SurveyCacheTests,
+    )
+
+# END ========================================================================
@@ -81,6 +81,13 @@ settings.base.debug = False
 # Uncomment to get detailed caller information
 #settings.log.caller_info = True
 
+# Uncomment to record DB queries and timings of core components per request
+# (shown in the developer toolbar, aggregated counters in admin/instrument)
+#settings.base.instrument = True
+# Log requests taking longer than this (seconds) with their top queries
+# (as warnings, so requires settings.log.level)
+#settings.base.instrument_slow = 2.0
+
 # Uncomment to use Content Delivery Networks to speed up Internet-facing sites
 #settings.base.cdn = True
 
@@ -181,6 +188,14 @@ settings.frontpage.rss = [
 # NB Auditing (especially Reads) slows system down & consumes diskspace
 #settings.security.audit_write = False
 #settings.security.audit_read = False
+# Audit events are written in bulk at the end of each request, they can
+# also be queued across requests (NB events in the queue are lost if the
+# process terminates) - number of events and maximum time (seconds):
+#settings.security.audit_queue = 200
+#settings.security.audit_queue_time = 60
+# Write audit events to a log file instead, ingested into the database
+# periodically by the audit_ingest task:
+#settings.security.audit_log = "private/audit.log"
 
 # Performance Options
 # Maximum number of search results for an Autocomplete Widget
@@ -41,6 +41,11 @@ settings = current.deployment_settings
 # Enable Guided Tours
 settings.base.guided_tour = True
 
+# Import large CSV/XLS files in batches of this number of rows
+# (all batches are still imported within the same transaction;
+#  tuid references can only refer to rows in the same or previous batches)
+#settings.base.import_batch_size = 1000
+
 # Authentication settings
 # These settings should be changed _after_ the 1st (admin) user is
 # registered in order to secure the deployment
@@ -273,6 +278,10 @@ settings.L10n.decimal_separator = "."
 #settings.gis.scaleline = False
 # Uncomment to modify the Simplify Tolerance
 #settings.gis.simplify_tolerance = 0.001
+# Uncomment to cache the GeoJSON of Feature Layers (for 1 hour)
+#settings.gis.feature_cache = 3600
+# Uncomment to serve the Location Selector/Filter hierarchy from a precomputed store
+#settings.gis.location_data_store = True
 # Uncomment to Hide the Toolbar from the main Map
 #settings.gis.toolbar = False
 # Uncomment to hide the Zoom control
@@ -312,6 +321,10 @@ settings.L10n.decimal_separator = "."
 # NB Auditing (especially Reads) slows system down & consumes diskspace
 #settings.security.audit_read = True
 #settings.security.audit_write = True
+# Queue audit events across requests (number of events)
+#settings.security.audit_queue = 200
+# Write audit events to a log file, ingested by the audit_ingest task
+#settings.security.audit_log = "private/audit.log"
 
 # Lock-down access to Map Editing
 #settings.security.map = True
@@ -349,6 +362,12 @@ settings.L10n.decimal_separator = "."
 #settings.ui.use_button_glyphicons = True
 # Uncomment to use S3MultiSelectWidget on all dropdowns (currently the Auth Registration page & LocationSelectorWidget2 listen to this)
 #settings.ui.multiselect_widget = True
+# Uncomment to cache the option lists of dropdowns for small lookup tables (seconds)
+#settings.ui.options_cache = 300
+# Uncomment to disable caching of the permissions for menu items (or set the expiry time in seconds)
+#settings.ui.menu_cache = 0
+# Uncomment to cache the rendered data widgets of summary and profile pages (for 10 minutes)
+#settings.ui.widget_cache = 600
 
 # -----------------------------------------------------------------------------
 # CMS
@@ -376,6 +395,13 @@ settings.L10n.decimal_separator = "."
 # Uncomment to use person_id instead of created_by in Newsfeed
 #settings.cms.person = "person_id"
 
+# -----------------------------------------------------------------------------
+# Documents
+# Uncomment to use the built-in full-text index for documents (instead of Solr)
+#settings.doc.index_backend = "local"
+# Number of parallel workers for text extraction when building the index
+#settings.doc.index_workers = 4
+
 # -----------------------------------------------------------------------------
 # Events
 # Make Event Types Hierarchical
@@ -685,6 +711,11 @@ settings.L10n.decimal_separator = "."
 # -----------------------------------------------------------------------------
 # Filter Manager
 #settings.search.filter_manager = False
+# Uncomment this to use a stored index of filter options (for large tables)
+#settings.search.filter_index = True
+# Uncomment this to use a stored name index for autocomplete searches
+# (built by the scheduler, requires a running worker)
+#settings.search.name_index = True
 
 # if you want to have videos appearing in /default/video
 #settings.base.youtube_id = [dict(id = "introduction",
@@ -428,6 +428,8 @@
                 var url = S3.Ap.concat('/gis/hdata/' + id);
                 $.ajaxS3({
                     async: false,
+                    // Allow the browser to cache (server sends ETags)
+                    cache: true,
                     url: url,
                     dataType: 'script',
                     success: function(data) {
@@ -626,6 +628,8 @@
         var url = S3.Ap.concat('/gis/ldata/' + id);
         $.ajaxS3({
             async: false,
+            // Allow the browser to cache (server sends ETags)
+            cache: true,
             url: url,
             dataType: 'script',
             success: function(data) {
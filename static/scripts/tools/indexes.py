@@ -9,31 +9,16 @@
 #
 # - normally run from fabfile.py as part of the upgrade cycle for instances
 #
+# - indexes are declared in the models, e.g.:
+#       configure(tablename, indexes=["name", ("tablename", "term"), "lower(name)"])
+#   only missing indexes get created
+#
 
-tablename = "pr_person"
-field = "first_name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
-field = "middle_name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
-field = "last_name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
+# Load all models to get all index declarations
+s3db.load_all_models()
 
-tablename = "gis_location"
-field = "name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
+created = s3base.S3Index.create()
+if created:
+    print "Created indexes: %s" % ", ".join(created)
+else:
+    print "All indexes present"